@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+批量智能评分（batch_ai_grade）及其进度接口是异步视图，在 ASGI 服务器下运行时，
+一个进程可以同时保持大量评分接口请求而不为每个请求占用线程，评分期间其他请求不受影响。例如：
+    uvicorn NJUP.asgi:application --host 0.0.0.0 --port 8000 --workers 4
 """
 
 import os
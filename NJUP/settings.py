@@ -10,9 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import json
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,13 +48,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "users.middleware.RequestIDMiddleware",  # 为请求分配请求 ID，附加到日志中
+    "users.middleware.MetricsMiddleware",  # 按视图统计耗时和查询数，放在最前面
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "users.middleware.PrincipalMiddleware",  # 解析当前登录主体，挂载 request.principal
     "django.contrib.messages.middleware.MessageMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -87,14 +92,75 @@ LOGIN_URL = "login"  # 使用命名的URL模式名称
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# SQLite 的默认（DEFERRED）事务先读后写，并发写入时升级写锁失败会直接报 database is locked，不会等待；
+# IMMEDIATE 在事务开始时即获取写锁，其他写事务排队等待，最长等待 timeout 秒
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# 通过环境变量 NJUP_CACHE_BACKEND 选择缓存后端：
+#   locmem    进程内存缓存（默认），仅适用于单进程部署
+#   file      文件缓存，同一台机器上的多个进程共享，NJUP_CACHE_LOCATION 为缓存目录
+#   memcached 本地 memcached，多进程共享，NJUP_CACHE_LOCATION 可为 unix socket 或 host:port
+#             需另行安装 pymemcache（pip install pymemcache）
+# 多进程部署（如 gunicorn 多 worker）必须使用共享缓存，否则登录主体缓存等无法跨进程失效
+
+CACHE_BACKEND = os.environ.get("NJUP_CACHE_BACKEND", "locmem")
+
+_CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "njup",
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get(
+            "NJUP_CACHE_LOCATION", os.path.join(BASE_DIR, "cache")
+        ),
+    },
+    "memcached": {
+        "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+        "LOCATION": os.environ.get("NJUP_CACHE_LOCATION", "unix:/tmp/memcached.sock"),
+    },
+}
+
+if CACHE_BACKEND not in _CACHE_BACKENDS:
+    raise ImproperlyConfigured(
+        f"NJUP_CACHE_BACKEND 须为 {'、'.join(_CACHE_BACKENDS)} 之一，当前为 {CACHE_BACKEND!r}"
+    )
+
+CACHES = {
+    "default": {
+        **_CACHE_BACKENDS[CACHE_BACKEND],
+        "TIMEOUT": 300,
+        "KEY_PREFIX": "njup",
+    }
+}
+
+# 登录主体缓存的有效期（秒，见 users/principal.py）。locmem 缓存只能在本进程内失效，
+# 误用于多进程部署时，其他进程最长在该时间内沿用过期的姓名和课程归属，因此缩短为 30 秒
+PRINCIPAL_CACHE_TIMEOUT = 30 if CACHE_BACKEND == "locmem" else 300
+
+# Sessions
+# https://docs.djangoproject.com/en/5.1/topics/http/sessions/
+# 默认使用 cached_db：读会话走缓存，只有写会话时才访问数据库，避免每个请求都读写 django_session 表
+# 也可设置为 django.contrib.sessions.backends.signed_cookies，完全不访问数据库
+
+SESSION_ENGINE = os.environ.get(
+    "NJUP_SESSION_ENGINE", "django.contrib.sessions.backends.cached_db"
+)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -113,6 +179,143 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# https://docs.djangoproject.com/en/5.1/topics/auth/passwords/
+# 通过环境变量 NJUP_PASSWORD_HASHER 选择新密码使用的哈希算法：
+#   pbkdf2（默认，迭代次数由 NJUP_PBKDF2_ITERATIONS 调节）、argon2（需安装 argon2-cffi）、scrypt
+# 列表中的其他哈希器用于校验已有的旧哈希，用户登录成功后自动升级为首选算法
+
+PASSWORD_HASHER = os.environ.get("NJUP_PASSWORD_HASHER", "pbkdf2")
+
+_PASSWORD_HASHERS = {
+    "pbkdf2": "users.hashers.TunablePBKDF2PasswordHasher",
+    "argon2": "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "scrypt": "django.contrib.auth.hashers.ScryptPasswordHasher",
+}
+
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher
+    for hasher in (
+        *_PASSWORD_HASHERS.values(),
+        "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    )
+    if hasher != _PASSWORD_HASHERS[PASSWORD_HASHER]
+]
+
+PBKDF2_ITERATIONS = int(os.environ.get("NJUP_PBKDF2_ITERATIONS", 0)) or None
+
+# 登录限流：同一账号/同一 IP 在 WINDOW 秒内失败次数达到上限后暂时拒绝登录
+LOGIN_THROTTLE = {
+    "ACCOUNT_LIMIT": 5,
+    "IP_LIMIT": 20,
+    "WINDOW": 300,
+}
+
+# 操作日志在事务提交后放入内存缓冲区，由后台线程批量写入（见 users/services/audit.py）
+AUDIT_LOG = {
+    "ASYNC": os.environ.get("NJUP_AUDIT_LOG_ASYNC", "1") != "0",
+    "BUFFER_SIZE": 10000,
+    "BATCH_SIZE": 200,
+    "FLUSH_INTERVAL": 1.0,
+    "DIFF_THRESHOLD": 200,
+    "SHUTDOWN_TIMEOUT": 10,
+}
+
+# 批量智能评分前的本地关键词预评分（见 users/services/prescore.py）
+PRESCORE = {
+    "ENABLED": os.environ.get("NJUP_PRESCORE", "1") != "0",
+    # 离题/完整答案直接采用预评分结果，不再调用大模型；关闭时只把预评分结果作为提示附在 Prompt 中
+    "SKIP_LLM": os.environ.get("NJUP_PRESCORE_SKIP_LLM", "0") == "1",
+    "DECIDE_OFF_TOPIC": True,
+    "DECIDE_FULL": True,
+    "ATTACH_HINTS": True,
+    "COVERAGE_THRESHOLD": 0.5,
+    "MIN_LENGTH": 2,
+}
+
+# 评分时从课程资料中检索相关片段附在 Prompt 中（见 users/services/materials.py）
+MATERIAL_RETRIEVAL = {
+    "ENABLED": os.environ.get("NJUP_MATERIAL_RETRIEVAL", "1") != "0",
+    "INDEX_DIR": os.environ.get(
+        "NJUP_MATERIAL_INDEX_DIR", str(BASE_DIR / "material_index")
+    ),
+    "TOP_K": 3,  # 每份答案最多附上的片段数
+    "MAX_CHARS": 1500,  # 附上的片段总长度上限，单位：字符
+}
+
+# 模拟评分接口（API Key 的模型名称以 mock 开头时使用，见 users/services/judge_mock.py），
+# 供 bench_grading 基准测试和本地演示使用，默认只在 DEBUG 模式下可用
+MOCK_JUDGE = {
+    "ENABLED": os.environ.get("NJUP_MOCK_JUDGE", "1" if DEBUG else "0") == "1",
+    "LATENCY_MS": int(os.environ.get("NJUP_MOCK_JUDGE_LATENCY_MS", 0)),
+    "FAILURE_RATE": float(os.environ.get("NJUP_MOCK_JUDGE_FAILURE_RATE", 0)),
+}
+
+# 评分接口调用（见 users/services/judge.py）：限流、网关错误和连接失败时的重试，以及 OpenAI 兼容接口的地址
+JUDGE = {
+    "MAX_RETRIES": int(os.environ.get("NJUP_JUDGE_MAX_RETRIES", 2)),
+    "RETRY_BACKOFF": float(os.environ.get("NJUP_JUDGE_RETRY_BACKOFF", 1.0)),  # 单位：秒
+    # {接口名: [{"NAME", "BASE_URL", "PATH", "HEADERS", "WEIGHT", "DELAY"}, ...]}，按权重和健康状况选择地址，
+    # 见 users/services/judge_endpoints.py。例如把评分分配到两个 vLLM 服务器，另有一个本地 llama.cpp 备用：
+    # NJUP_JUDGE_ENDPOINTS='{"openai": [{"NAME": "vllm-a", "BASE_URL": "http://10.0.0.5:8000/v1", "WEIGHT": 3},
+    #   {"NAME": "vllm-b", "BASE_URL": "http://10.0.0.6:8000/v1"},
+    #   {"NAME": "llama-cpp", "BASE_URL": "http://127.0.0.1:8080/v1", "WEIGHT": 0}]}'
+    "ENDPOINTS": json.loads(os.environ.get("NJUP_JUDGE_ENDPOINTS", "{}")),
+    # 批量评分时一个批次同时进行的评分接口调用数（见 users/services/batch_grading.py）
+    "CONCURRENCY": int(os.environ.get("NJUP_JUDGE_CONCURRENCY", 16)),
+    # 异步评分共用的 HTTP 连接池（见 users/services/async_http.py），一个进程内所有批次共用
+    "MAX_CONNECTIONS": int(os.environ.get("NJUP_JUDGE_MAX_CONNECTIONS", 200)),
+    "MAX_KEEPALIVE": 50,
+    "TIMEOUT": 120,  # 单位：秒
+}
+
+# 按视图统计的请求指标（见 users/services/metrics.py），管理员可在 /metrics/ 查看 Prometheus 格式的结果
+METRICS = {
+    "ENABLED": os.environ.get("NJUP_METRICS", "1") != "0",
+    # 记录数据库查询数、查询耗时和最慢 SQL 的请求比例
+    "SAMPLE_RATE": float(os.environ.get("NJUP_METRICS_SAMPLE_RATE", 0.1)),
+    "WINDOW": 600,  # 滚动窗口（进程内分位数估算和最慢 SQL），单位：秒
+    "SLOTS": 10,
+    "SERVER_TIMING": True,
+    # Prometheus 抓取时使用的令牌（Authorization: Bearer <令牌>），为空时只有登录的管理员可以访问
+    "TOKEN": os.environ.get("NJUP_METRICS_TOKEN", ""),
+    # 最慢 SQL 在指标中只以哈希标识，耗时达到该值（秒）时把哈希和 SQL 原文写入日志
+    "SLOW_SQL_LOG": 0.1,
+}
+
+# 日志：users 应用的日志以 JSON 行输出到标准错误，由后台线程写出（见 users/structured_logging.py）
+# 通过环境变量 NJUP_LOG_LEVEL 调整级别（DEBUG 时包含评分接口的原始返回内容）
+LOG_LEVEL = os.environ.get("NJUP_LOG_LEVEL", "INFO").upper()
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        "context": {"()": "users.structured_logging.ContextFilter"},
+    },
+    "formatters": {
+        "json": {"()": "users.structured_logging.JsonFormatter"},
+    },
+    "handlers": {
+        "json": {
+            "()": "users.structured_logging.AsyncHandler",
+            "stream": "ext://sys.stderr",
+            "maxsize": 10000,
+            "formatter": "json",
+            "filters": ["context"],
+        },
+    },
+    "loggers": {
+        "users": {"handlers": ["json"], "level": LOG_LEVEL, "propagate": False},
+    },
+}
+
+# 操作日志保留天数，更早的日志由 archive_operation_logs 命令按月归档到 OPERATION_LOG_ARCHIVE_DIR
+OPERATION_LOG_RETENTION_DAYS = int(os.environ.get("NJUP_LOG_RETENTION_DAYS", 180))
+OPERATION_LOG_ARCHIVE_DIR = os.environ.get(
+    "NJUP_LOG_ARCHIVE_DIR", str(BASE_DIR / "archive" / "operation_logs")
+)
+
 AUTH_USER_MODEL = "users.User"  # 指定使用自定义用户模型
 
 MEDIA_URL = "/media/"
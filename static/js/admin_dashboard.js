@@ -0,0 +1,169 @@
+// static/js/admin_dashboard.js
+
+document.addEventListener('DOMContentLoaded', function () {
+    const pageSize = JSON.parse(document.getElementById('page-size').textContent);
+
+    // 转义 HTML 特殊字符，防止姓名等字段中的内容被当作标签渲染
+    function escapeHtml(value) {
+        const div = document.createElement('div');
+        div.textContent = value === null || value === undefined ? '' : String(value);
+        return div.innerHTML;
+    }
+
+    // 各表格的行渲染函数
+    const tables = {
+        teachers: {
+            emptyText: '暂无教师',
+            renderRow: item => `
+                <tr>
+                    <td><input type="checkbox" name="teacher_ids" class="teacher-checkbox" value="${item.id}"></td>
+                    <td>${item.id}</td>
+                    <td>${escapeHtml(item.name)}</td>
+                    <td>${escapeHtml(item.email || '无')}</td>
+                    <td><a href="${item.edit_url}" class="btn btn-sm edit-btn">编辑</a></td>
+                </tr>`,
+        },
+        students: {
+            emptyText: '暂无学生',
+            renderRow: item => `
+                <tr>
+                    <td><input type="checkbox" name="student_ids" class="student-checkbox" value="${item.id}"></td>
+                    <td>${item.id}</td>
+                    <td>${escapeHtml(item.name)}</td>
+                    <td>${escapeHtml(item.email || '无')}</td>
+                    <td><a href="${item.edit_url}" class="btn btn-sm edit-btn">编辑</a></td>
+                </tr>`,
+        },
+        questions: {
+            emptyText: '暂无试题',
+            renderRow: item => `
+                <tr>
+                    <td>${item.id}</td>
+                    <td>${escapeHtml(item.course)}</td>
+                    <td>${escapeHtml(item.title)}</td>
+                    <td>${item.is_open ? '已公开' : '未公开'}</td>
+                    <td><a href="${item.edit_url}" class="btn btn-sm edit-btn">编辑 Prompt</a></td>
+                </tr>`,
+        },
+    };
+
+    // 每个表格当前的搜索词、页码，以及最近一次请求的序号（丢弃过期的响应）
+    const state = {};
+
+    function loadTable(name, page) {
+        const table = tables[name];
+        const current = state[name];
+        const requestId = ++current.requestId;
+        const params = new URLSearchParams({ q: current.query, page: page, per_page: pageSize });
+        const url = document.getElementById(`${name}-tbody`).dataset.url;
+
+        fetch(`${url}?${params.toString()}`)
+            .then(response => response.json())
+            .then(data => {
+                if (requestId !== current.requestId) {
+                    return;
+                }
+                current.page = data.page;
+                const tbody = document.getElementById(`${name}-tbody`);
+                tbody.innerHTML = data.results.length
+                    ? data.results.map(table.renderRow).join('')
+                    : `<tr><td colspan="5">${current.query ? '没有匹配的记录' : table.emptyText}</td></tr>`;
+                renderPager(name, data);
+                resetSelectAll(name);
+            })
+            .catch(() => {
+                document.getElementById(`${name}-tbody`).innerHTML =
+                    '<tr><td colspan="5">加载失败，请刷新页面重试</td></tr>';
+            });
+    }
+
+    function renderPager(name, data) {
+        const pager = document.getElementById(`${name}-pager`);
+        pager.innerHTML = '';
+        if (data.page <= 1 && !data.has_next) {
+            return;
+        }
+        const prev = document.createElement('button');
+        prev.type = 'button';
+        prev.className = 'btn btn-sm btn-secondary';
+        prev.innerText = '上一页';
+        prev.disabled = data.page <= 1;
+        prev.addEventListener('click', () => loadTable(name, data.page - 1));
+
+        const label = document.createElement('span');
+        label.innerText = `第 ${data.page} 页`;
+
+        const next = document.createElement('button');
+        next.type = 'button';
+        next.className = 'btn btn-sm btn-secondary';
+        next.innerText = '下一页';
+        next.disabled = !data.has_next;
+        next.addEventListener('click', () => loadTable(name, data.page + 1));
+
+        pager.append(prev, label, next);
+    }
+
+    // 全选/取消全选：行是动态加载的，复选框事件通过 tbody 委托处理
+    function setupCheckboxLogic(name, selectAllId, checkboxClass) {
+        const selectAllCheckbox = document.getElementById(selectAllId);
+        const tbody = document.getElementById(`${name}-tbody`);
+
+        selectAllCheckbox.addEventListener('change', function () {
+            tbody.querySelectorAll('.' + checkboxClass).forEach(checkbox => {
+                checkbox.checked = selectAllCheckbox.checked;
+            });
+        });
+
+        tbody.addEventListener('change', function (event) {
+            if (!event.target.classList.contains(checkboxClass)) {
+                return;
+            }
+            const checkboxes = Array.from(tbody.querySelectorAll('.' + checkboxClass));
+            selectAllCheckbox.checked = checkboxes.every(checkbox => checkbox.checked);
+        });
+    }
+
+    function resetSelectAll(name) {
+        const selectAll = document.getElementById(`select-all-${name}`);
+        if (selectAll) {
+            selectAll.checked = false;
+        }
+    }
+
+    setupCheckboxLogic('teachers', 'select-all-teachers', 'teacher-checkbox');
+    setupCheckboxLogic('students', 'select-all-students', 'student-checkbox');
+
+    // 搜索框：停止输入 300ms 后从第一页重新加载
+    document.querySelectorAll('.table-search').forEach(input => {
+        let timer = null;
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(() => {
+                const name = input.dataset.table;
+                state[name].query = input.value.trim();
+                loadTable(name, 1);
+            }, 300);
+        });
+    });
+
+    // 表格滚动到可见区域时才加载第一页
+    const observer = 'IntersectionObserver' in window
+        ? new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    observer.unobserve(entry.target);
+                    loadTable(entry.target.dataset.table, 1);
+                }
+            });
+        })
+        : null;
+
+    Object.keys(tables).forEach(name => {
+        state[name] = { query: '', page: 1, requestId: 0 };
+        if (observer) {
+            observer.observe(document.getElementById(`${name}-tbody`));
+        } else {
+            loadTable(name, 1);
+        }
+    });
+});
@@ -39,6 +39,21 @@ document.addEventListener('DOMContentLoaded', function () {
         let params = new URLSearchParams();
         selectedAnswers.forEach(id => params.append('answer_ids[]', id));
         params.append('model_choice', modelChoice);  // 这里传递的是 API Key 的 ID
+        // 批次 ID 由前端生成，评分进行期间据此查询进度
+        let jobId = Date.now().toString(36) + Math.random().toString(36).slice(2, 10);
+        params.append('job_id', jobId);
+        let batchBtn = this;
+        let progressTimer = setInterval(function () {
+            fetch(`/grading_jobs/${jobId}/`)
+                .then(response => response.json())
+                .then(data => {
+                    let job = data.job;
+                    if (job && job.state === 'running' && batchBtn.disabled) {
+                        batchBtn.innerText = `评分中... ${job.done}/${job.total}`;
+                    }
+                })
+                .catch(() => {});  // 查询进度失败不影响评分
+        }, 1000);
 
         // 发送 AJAX 请求进行批量评分
         fetch(`/teacher_course/${course_id}/question/${question_id}/batch_ai_grade/`, {
@@ -55,6 +70,7 @@ document.addEventListener('DOMContentLoaded', function () {
         })
         .then(response => response.json())
         .then(data => {
+            clearInterval(progressTimer);
             if (data.status === 'success') {
                 // 遍历评分结果并更新界面上的评价状态
                 for (let answer_id in data.results) {
@@ -83,6 +99,7 @@ document.addEventListener('DOMContentLoaded', function () {
             batchBtn.innerText = '批量智能评分';
         })
         .catch(error => {
+            clearInterval(progressTimer);
             console.error('错误:', error);
             alert('批量智能评分过程中发生错误。');
 
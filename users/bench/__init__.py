@@ -0,0 +1,76 @@
+# users/bench/__init__.py
+
+"""
+性能基准测试的公共工具。
+基准测试在独立的临时数据库中运行（不会读写项目自带的 db.sqlite3），
+测试数据由本包中的函数生成。
+"""
+
+import os
+import resource
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def isolated_database(verbosity=0):
+    """
+    创建一个临时的 SQLite 文件数据库并完成迁移，退出时删除。
+    使用文件而不是内存数据库，使测得的读写开销与实际部署一致。
+    """
+    old_name = connection.settings_dict["NAME"]
+    old_test_name = connection.settings_dict["TEST"].get("NAME")
+    fd, path = tempfile.mkstemp(prefix="njup_bench_", suffix=".sqlite3")
+    os.close(fd)
+    connection.settings_dict["TEST"]["NAME"] = path
+    setup_test_environment()
+    try:
+        connection.creation.create_test_db(
+            verbosity=verbosity, autoclobber=True, serialize=False
+        )
+        yield path
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        connection.settings_dict["TEST"]["NAME"] = old_test_name
+        teardown_test_environment()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def percentile(values, pct):
+    # 最近秩法计算百分位数，values 为空时返回 0
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies):
+    # 汇总一组耗时（秒），返回毫秒为单位的统计结果
+    total = sum(latencies)
+    return {
+        "count": len(latencies),
+        "throughput": len(latencies) / total if total else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def peak_rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def stopwatch(latencies):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        latencies.append(time.perf_counter() - start)
@@ -0,0 +1,161 @@
+# users/bench/data.py
+
+"""
+基准测试数据生成器。
+生成一门合成课程：教师、选课学生、若干带评分标准的试题，以及每名学生对每道试题的答案。
+答案由得分点文本和填充句子拼成，覆盖了哪些得分点是已知的，因此每份答案都带有“标准分”（golden），
+可用来检查评分流程改动后结果是否仍与预期一致。
+数据用 bulk_create 批量写入（不触发信号），写入后统一重建统计、近似答案簇和全文索引。
+"""
+
+import random
+
+from django.contrib.auth.hashers import make_password
+
+from users.models import (
+    Course,
+    Question,
+    Student,
+    StudentAnswer,
+    StudentCourse,
+    Teacher,
+)
+
+BENCH_PASSWORD = "bench"
+BENCH_TEACHER_EMAIL = "bench_teacher@example.com"
+BENCH_STUDENT_EMAIL = "bench_student{}@example.com"  # 按学生序号填充
+
+TERMS = [
+    "变质作用", "重结晶作用", "交代作用", "接触变质", "区域变质", "动力变质", "混合岩化",
+    "片理构造", "板状构造", "千枚状构造", "片麻状构造", "变晶结构", "变质矿物", "红柱石",
+    "蓝晶石", "夕线石", "石榴子石", "蓝闪石", "矽卡岩", "大理岩", "石英岩", "角岩",
+    "糜棱岩", "碎裂岩", "化学活动性流体", "定向压力", "静压力", "温度升高", "原岩成分",
+    "变质相", "变质带", "双变质带", "俯冲带", "岩浆侵入", "围岩", "固态转变",
+]
+TEMPLATES = [
+    "{a}会引起{b}",
+    "{a}的结果是形成{b}",
+    "{a}与{b}密切相关",
+    "{a}常见于{b}环境",
+    "{a}以{b}为主要特征",
+]
+# 填充句子由三部分随机组合，避免不同学生的答案因填充内容相同而被判为近似重复
+FILLER_SUBJECTS = [
+    "野外露头", "显微镜下", "这块样品", "该地区剖面", "教材插图", "实验结果", "我的笔记", "老师讲解",
+]
+FILLER_VERBS = [
+    "清楚地显示了", "可以说明", "让我注意到", "进一步证明了", "大致反映了", "能够帮助理解",
+    "提醒我们关注", "补充说明了",
+]
+FILLER_OBJECTS = [
+    "岩层的产状", "颗粒的排列方式", "颜色的变化", "野外工作的重要性", "观察记录的细节",
+    "样品采集的位置", "地质年代的先后", "整体的分布规律",
+]
+
+
+def _point_text(rng):
+    a, b = rng.sample(TERMS, 2)
+    return rng.choice(TEMPLATES).format(a=a, b=b)
+
+
+def _filler(rng, length):
+    parts = []
+    while sum(map(len, parts)) < length:
+        parts.append(
+            rng.choice(FILLER_SUBJECTS)
+            + rng.choice(FILLER_VERBS)
+            + rng.choice(FILLER_OBJECTS)
+            + "。"
+        )
+    return "".join(parts)[:length]
+
+
+def seed_grading_course(
+    students=50, questions=5, answer_length=200, seed=1, answer_ratio=1.0
+):
+    """
+    生成合成课程，返回 {"teacher", "course", "students": [学生ID...], "questions": [试题ID...],
+    "golden": {AnswerID: 标准分}}。
+    每道试题 2~4 个得分点、每点 1~3 分；答案中约 5% 为空白、5% 离题，其余随机覆盖部分得分点。
+    answer_ratio 为已提交答案的比例，小于 1 时部分学生的部分试题尚未作答。
+    """
+    from users.services.answer_search import ANSWER_INDEX, rebuild_search_indexes
+    from users.services.near_duplicates import rebuild_answer_clusters
+    from users.services.question_stats import rebuild_question_stats
+
+    rng = random.Random(seed)
+    password = make_password(BENCH_PASSWORD)
+    teacher = Teacher.objects.create(
+        Name="bench_teacher", Email=BENCH_TEACHER_EMAIL, Password=password
+    )
+    course = Course.objects.create(TeacherID=teacher, Name="基准测试课程")
+    student_objs = Student.objects.bulk_create(
+        Student(Name=f"学生{i}", Email=BENCH_STUDENT_EMAIL.format(i), Password=password)
+        for i in range(students)
+    )
+    StudentCourse.objects.bulk_create(
+        StudentCourse(StudentID=student, CourseID=course) for student in student_objs
+    )
+
+    rubrics = []
+    question_objs = []
+    for number in range(1, questions + 1):
+        points = [(_point_text(rng), rng.randint(1, 3)) for _ in range(rng.randint(2, 4))]
+        criteria = "\n".join(f"- {text}（{value}分）" for text, value in points)
+        total = sum(value for _text, value in points)
+        content = f"（{total}分）请简述{rng.choice(TERMS)}的形成条件及其特征。"
+        prompt = (
+            "你是一名专业的评分员，请根据评分标准对考生的答案打分，"
+            '并以 {"score": 分数, "reason": "原因"} 的格式回答。\n\n'
+            f"**试题内容**\n{content}\n\n**评分标准**\n{criteria}\n\n"
+            f"**提示词**\n{'、'.join(sorted({text[:4] for text, _value in points}))}"
+        )
+        question_objs.append(
+            Question(
+                CourseID=course,
+                Title=f"基准试题{number}",
+                Content=content,
+                ScoringCriteria=criteria,
+                Prompt=prompt,
+                IsOpen=True,
+            )
+        )
+        rubrics.append(points)
+    question_objs = Question.objects.bulk_create(question_objs)
+
+    answers, expected = [], []
+    for question, points in zip(question_objs, rubrics):
+        for student in student_objs:
+            if answer_ratio < 1 and rng.random() >= answer_ratio:
+                continue
+            roll = rng.random()
+            if roll < 0.05:
+                content, score = "", 0
+            elif roll < 0.10:
+                content, score = _filler(rng, answer_length), 0
+            else:
+                covered = [point for point in points if rng.random() < 0.6]
+                body = "；".join(text for text, _value in covered)
+                content = body + "。" + _filler(rng, max(0, answer_length - len(body)))
+                score = sum(value for _text, value in covered)
+            answers.append(
+                StudentAnswer(QuestionID=question, StudentID=student, Content=content)
+            )
+            expected.append(score)
+    answers = StudentAnswer.objects.bulk_create(answers, batch_size=1000)
+
+    question_ids = [question.QuestionID for question in question_objs]
+    rebuild_question_stats(question_ids)
+    rebuild_answer_clusters(question_ids)
+    if ANSWER_INDEX.available():
+        rebuild_search_indexes()
+
+    return {
+        "teacher": teacher,
+        "course": course,
+        "students": [student.StudentID for student in student_objs],
+        "questions": question_ids,
+        "golden": {
+            answer.AnswerID: score for answer, score in zip(answers, expected)
+        },
+    }
@@ -0,0 +1,112 @@
+# users/bench/openai_stub.py
+
+"""
+OpenAI 兼容（/v1/chat/completions）的本地模拟服务器，代替 llama.cpp、vLLM 等本地模型服务器做离线测试。
+评分逻辑与模拟评分接口相同（见 users/services/judge_mock.py 的 mock_score），返回内容为 {"score", "reason"} JSON；
+latency_ms 模拟推理耗时，failure_rate 按比例随机返回 503，用于测试地址路由和故障转移。
+"""
+
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from users.services.judge_mock import mock_score
+
+ANSWER_MARKER = "\n#### 考生的答案\n"  # 与 judge_gpt 拼接 Prompt 和答案的方式一致
+
+
+class StubStats:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def add(self, failed):
+        with self._lock:
+            self.requests += 1
+            self.failures += 1 if failed else 0
+
+
+def _message_text(content):
+    # content 可以是字符串，也可以是 [{"type": "text", "text": ...}, ...]
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _make_handler(latency_ms, failure_rate, stats, rng):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, data):
+            body = json.dumps(data, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": "not found"}})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length))
+                text = _message_text(payload["messages"][-1]["content"])
+            except (ValueError, KeyError, IndexError, TypeError):
+                self.send_json(400, {"error": {"message": "invalid request"}})
+                return
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            failed = rng.random() < failure_rate
+            stats.add(failed)
+            if failed:
+                self.send_json(503, {"error": {"message": "模拟服务不可用"}})
+                return
+            prompt, _marker, answer = text.rpartition(ANSWER_MARKER)
+            score, reason = mock_score(prompt, answer)
+            content = json.dumps({"score": score, "reason": reason}, ensure_ascii=False)
+            self.send_json(
+                200,
+                {
+                    "object": "chat.completion",
+                    "model": payload.get("model", ""),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": len(text),
+                        "completion_tokens": len(content),
+                        "total_tokens": len(text) + len(content),
+                    },
+                },
+            )
+
+    return Handler
+
+
+@contextmanager
+def openai_stub(latency_ms=0, failure_rate=0.0, seed=None, host="127.0.0.1"):
+    """
+    启动模拟服务器，返回 (基础地址, StubStats)，基础地址形如 http://127.0.0.1:8123/v1，退出时关闭。
+    """
+    stats = StubStats()
+    handler = _make_handler(latency_ms, failure_rate, stats, random.Random(seed))
+    server = ThreadingHTTPServer((host, 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_port}/v1", stats
+    finally:
+        server.shutdown()
+        server.server_close()
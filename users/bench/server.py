@@ -0,0 +1,133 @@
+# users/bench/server.py
+
+"""
+页面级压力测试用的本地 HTTP 服务器和客户端。
+服务器在后台线程中运行（多线程 WSGI 服务器，与 runserver 相同），连接的是 isolated_database 创建的临时数据库；
+每个响应带有 X-Bench-Queries 头，为处理该请求执行的数据库查询数。
+客户端通过真实的 HTTP 连接访问服务器，自行保存 Cookie 并在 POST 中带上 CSRF token，不自动跟随重定向。
+"""
+
+import http.cookiejar
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import modify_settings
+from django.test.testcases import LiveServerThread
+
+QUERY_COUNT_HEADER = "X-Bench-Queries"
+
+
+class QueryCountingApp:
+    # WSGI 包装：统计处理每个请求执行的数据库查询数，写入响应头
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        def counting_start_response(status, headers, exc_info=None):
+            # Django 在调用 start_response 前已生成完整响应，此时计数已是最终结果
+            headers = list(headers) + [(QUERY_COUNT_HEADER, str(count[0]))]
+            return start_response(status, headers, exc_info)
+
+        with connection.execute_wrapper(counter):
+            return self.app(environ, counting_start_response)
+
+
+@contextmanager
+def live_server(host="127.0.0.1", port=0):
+    """
+    启动本地 HTTP 服务器，返回其根地址（如 http://127.0.0.1:8123），退出时关闭。
+    须在 isolated_database() 内使用，服务器线程会连接临时数据库。
+    """
+    # 测试环境下 ALLOWED_HOSTS 只包含 testserver，需加入服务器地址
+    with modify_settings(ALLOWED_HOSTS={"append": host}):
+        server = LiveServerThread(host, QueryCountingApp, port=port)
+        server.daemon = True
+        server.start()
+        server.is_ready.wait()
+        if server.error:
+            raise server.error
+        try:
+            yield f"http://{host}:{server.port}"
+        finally:
+            server.terminate()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class PageResult:
+    def __init__(self, status, elapsed, queries, location=""):
+        self.status = status
+        self.elapsed = elapsed  # 单位：秒
+        self.queries = queries  # 未知时为 None
+        self.location = location
+
+
+class PageClient:
+    """
+    模拟一个浏览器会话。get/post 返回 PageResult；连接失败时 status 为 0。
+    """
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect
+        )
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == "csrftoken":
+                return cookie.value
+        return ""
+
+    def get(self, path):
+        return self.request(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data):
+        data = {"csrfmiddlewaretoken": self.csrf_token(), **data}
+        return self.request(
+            urllib.request.Request(
+                self.base_url + path,
+                data=urllib.parse.urlencode(data, doseq=True).encode(),
+            )
+        )
+
+    def request(self, request):
+        start = time.perf_counter()
+        try:
+            response = self.opener.open(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            # 4xx/5xx 以及未跟随的重定向
+            response = e
+        except OSError:
+            return PageResult(0, time.perf_counter() - start, None)
+        with response:
+            response.read()
+            elapsed = time.perf_counter() - start
+            queries = response.headers.get(QUERY_COUNT_HEADER)
+            return PageResult(
+                response.status,
+                elapsed,
+                int(queries) if queries is not None else None,
+                response.headers.get("Location", ""),
+            )
+
+    def login(self, role, email, password):
+        self.get("/login/")  # 取得 csrftoken Cookie
+        return self.post(
+            "/login/", {"role": role, "email": email, "password": password}
+        )
@@ -18,13 +18,33 @@ from .models import (
     Question,
     StudentAnswer,
     ScoringFeedback,
+    PromptTemplate,
     # KnowledgeWeaknessAnalysis,
 )
 from django.forms import ModelForm
+from django.core.validators import URLValidator
 from django.contrib.auth.hashers import make_password
+from django.template import TemplateSyntaxError
+from .services.materials import MATERIAL_EXTENSIONS
+from .services.prompt_templates import compile_body
+
+
+# 密码哈希混入类
+# 在表单校验阶段（即视图的数据库事务开始之前）完成耗时的密码哈希，save() 时只做赋值，
+# 避免在事务内做哈希计算、长时间占用数据库写锁
+class PasswordHashMixin:
+    # 保存明文密码的表单字段名
+    password_field = "password"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        raw_password = cleaned_data.get(self.password_field)
+        self.password_hash = make_password(raw_password) if raw_password else None
+        return cleaned_data
+
 
 # 定义一个 AddTeacherForm 表单类，继承自 ModelForm
-class AddTeacherForm(ModelForm):
+class AddTeacherForm(PasswordHashMixin, ModelForm):
     # 手动定义一个密码字段，使用 PasswordInput 小部件，输入内容会被隐藏
     password = forms.CharField(widget=forms.PasswordInput, label="密码")
 
@@ -53,8 +73,8 @@ class AddTeacherForm(ModelForm):
         # 调用父类的 save 方法，并不立即提交到数据库（commit=False）
         teacher = super().save(commit=False)
         
-        # 使用 make_password 对用户输入的密码进行哈希加密
-        teacher.Password = make_password(self.cleaned_data["password"])
+        # 使用校验阶段已计算好的哈希值（见 PasswordHashMixin）
+        teacher.Password = self.password_hash
         
         # 如果 commit 为 True，则将对象保存到数据库
         if commit:
@@ -64,7 +84,7 @@ class AddTeacherForm(ModelForm):
         return teacher
 
 # 定义一个 AddStudentForm 表单类，继承自 ModelForm，类似上面的 AddTeacherForm
-class AddStudentForm(ModelForm):
+class AddStudentForm(PasswordHashMixin, ModelForm):
     password = forms.CharField(widget=forms.PasswordInput, label="密码")
 
     class Meta:
@@ -78,14 +98,15 @@ class AddStudentForm(ModelForm):
 
     def save(self, commit=True):
         student = super().save(commit=False)
-        student.Password = make_password(self.cleaned_data["password"])
+        student.Password = self.password_hash
         if commit:
             student.save()
         return student
 
 
 # 定义一个名为 EditTeacherForm 的表单类，用于编辑教师信息，继承自 ModelForm
-class EditTeacherForm(ModelForm):
+class EditTeacherForm(PasswordHashMixin, ModelForm):
+    password_field = "Password"
 
     # 被注释掉的密码字段定义：
     # 可以让用户在编辑页面选择是否输入新密码（设置 required=False 表示非必填）
@@ -119,12 +140,9 @@ class EditTeacherForm(ModelForm):
         # 先调用父类的 save 方法，但不立即提交到数据库（commit=False）
         teacher = super().save(commit=False)
 
-        # 从 cleaned_data 中获取用户输入的密码，如果未填写则返回 None
-        password = self.cleaned_data.get("Password")
-
-        # 如果用户输入了新密码，则进行哈希加密并赋值给 teacher.Password
-        if password:
-            teacher.Password = make_password(password)
+        # 如果用户输入了新密码，使用校验阶段已计算好的哈希值赋值给 teacher.Password
+        if self.password_hash:
+            teacher.Password = self.password_hash
 
         # 如果 commit 参数为 True，将修改保存到数据库
         if commit:
@@ -134,7 +152,8 @@ class EditTeacherForm(ModelForm):
         return teacher
 
 
-class EditStudentForm(ModelForm):
+class EditStudentForm(PasswordHashMixin, ModelForm):
+    password_field = "Password"
     # password = forms.CharField(widget=forms.PasswordInput, label="密码", required=False)
 
     class Meta:
@@ -148,14 +167,26 @@ class EditStudentForm(ModelForm):
 
     def save(self, commit=True):
         student = super().save(commit=False)
-        password = self.cleaned_data.get("password")
-        if password:
-            student.Password = make_password(password)
+        if self.password_hash:
+            student.Password = self.password_hash
         if commit:
             student.save()
         return student
 
 
+ENDPOINT_PLACEHOLDER = "可选，OpenAI 兼容接口地址，如 http://127.0.0.1:8080/v1；留空使用默认地址"
+
+
+def clean_endpoint(value):
+    # 接口地址须为 http/https 地址，允许 localhost 和 IP 地址
+    value = (value or "").strip()
+    if value:
+        try:
+            URLValidator(schemes=["http", "https"])(value)
+        except forms.ValidationError:
+            raise forms.ValidationError("请输入有效的 http/https 接口地址。")
+    return value
+
 
 # 定义一个名为 AddAPIKeyForm 的表单类，继承自 ModelForm
 class AddAPIKeyForm(ModelForm):
@@ -166,7 +197,7 @@ class AddAPIKeyForm(ModelForm):
         model = APIKey
 
         # 指定要在表单中包含的字段（这些字段必须存在于 APIKey 模型中）
-        fields = ["TeacherID", "Model", "Version", "KeyValue", "Status"]
+        fields = ["TeacherID", "Model", "Version", "KeyValue", "Endpoint", "Status"]
 
         # 为每个字段指定前端渲染时使用的 HTML 小部件（widget）和属性
         widgets = {
@@ -183,22 +214,36 @@ class AddAPIKeyForm(ModelForm):
             # KeyValue 字段表示 API Key 的值，使用普通文本输入框，带相同样式
             "KeyValue": forms.TextInput(attrs={"class": "form-control"}),
 
+            # Endpoint 字段为可选的接口地址，留空时使用系统配置的地址
+            "Endpoint": forms.TextInput(
+                attrs={"class": "form-control", "placeholder": ENDPOINT_PLACEHOLDER}
+            ),
+
             # Status 字段是一个布尔类型（True/False），使用复选框控件，并使用 form-check-input 类适配 Bootstrap 的表单组样式
             "Status": forms.CheckboxInput(attrs={"class": "form-check-input"}),
         }
 
+    def clean_Endpoint(self):
+        return clean_endpoint(self.cleaned_data.get("Endpoint"))
+
 
 class EditAPIKeyForm(ModelForm):
     class Meta:
         model = APIKey
-        fields = ["TeacherID", "Model", "Version", "KeyValue"]
+        fields = ["TeacherID", "Model", "Version", "KeyValue", "Endpoint"]
         widgets = {
             "TeacherID": forms.Select(attrs={"class": "form-control"}),
             "Model": forms.TextInput(attrs={"class": "form-control"}),
             "Version": forms.TextInput(attrs={"class": "form-control"}),
             "KeyValue": forms.TextInput(attrs={"class": "form-control"}),
+            "Endpoint": forms.TextInput(
+                attrs={"class": "form-control", "placeholder": ENDPOINT_PLACEHOLDER}
+            ),
         }
 
+    def clean_Endpoint(self):
+        return clean_endpoint(self.cleaned_data.get("Endpoint"))
+
 
 class AddQuestionForm(forms.ModelForm):
     class Meta:
@@ -237,6 +282,25 @@ class EditPromptForm(forms.ModelForm):
         return prompt
 
 
+class PromptTemplateForm(forms.ModelForm):
+    class Meta:
+        model = PromptTemplate
+        fields = ["SystemPrompt", "Body"]
+        widgets = {
+            "SystemPrompt": forms.Textarea(attrs={"class": "form-control", "rows": 15}),
+            "Body": forms.Textarea(attrs={"class": "form-control", "rows": 10}),
+        }
+        labels = {"SystemPrompt": "系统提示", "Body": "排版"}
+
+    def clean_Body(self):
+        body = self.cleaned_data.get("Body")
+        try:
+            compile_body(body)
+        except TemplateSyntaxError as e:
+            raise forms.ValidationError(f"模板语法错误：{e}")
+        return body
+
+
 class CourseForm(ModelForm):
     class Meta:
         model = Course
@@ -309,6 +373,58 @@ class SubmitAnswerForm(forms.ModelForm):
 
         return cleaned_data
 
+# 学生名单导入表单
+class RosterImportForm(forms.Form):
+    File = forms.FileField(
+        label="名单文件",
+        help_text="支持 csv、xlsx 文件，包含“姓名”和“邮箱”两列，第一行可以是表头。",
+        widget=forms.ClearableFileInput(
+            attrs={"class": "form-control-file", "accept": ".csv,.xlsx"}
+        ),
+    )
+
+    def clean_File(self):
+        file = self.cleaned_data.get("File")
+        if file:
+            import os
+
+            ext = os.path.splitext(file.name)[1].lower()
+            if ext not in [".csv", ".xlsx"]:
+                raise forms.ValidationError("仅支持csv、xlsx格式的名单文件。")
+        return file
+
+
+class MaterialUploadForm(forms.Form):
+    Title = forms.CharField(
+        label="资料名称",
+        max_length=200,
+        required=False,
+        help_text="留空时使用文件名。试题 Prompt 中引用的教材名（如《第五章教材.md》）应与此一致。",
+        widget=forms.TextInput(attrs={"class": "form-control"}),
+    )
+    File = forms.FileField(
+        label="资料文件",
+        help_text="支持 UTF-8 编码的 md、txt 文件。",
+        widget=forms.ClearableFileInput(
+            attrs={"class": "form-control-file", "accept": ".md,.markdown,.txt"}
+        ),
+    )
+
+    def clean_File(self):
+        file = self.cleaned_data.get("File")
+        if file:
+            import os
+
+            ext = os.path.splitext(file.name)[1].lower()
+            if ext not in MATERIAL_EXTENSIONS:
+                raise forms.ValidationError("仅支持md、txt格式的资料文件。")
+            try:
+                self.cleaned_data["Content"] = file.read().decode("utf-8-sig")
+            except UnicodeDecodeError:
+                raise forms.ValidationError("资料文件需为 UTF-8 编码。")
+        return file
+
+
 # 定义一个基于模型的表单：GradeAnswerForm
 class GradeAnswerForm(forms.ModelForm):
     """
@@ -0,0 +1,20 @@
+# users/hashers.py
+
+"""
+可按部署调节的密码哈希器。
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    迭代次数可通过 settings.PBKDF2_ITERATIONS 配置的 PBKDF2 哈希器。
+    算法名与 Django 默认的 pbkdf2_sha256 相同，因此可以直接校验已有的密码哈希；
+    迭代次数不一致的旧哈希会在用户下次登录成功后自动按新配置重新哈希。
+    """
+
+    iterations = (
+        getattr(settings, "PBKDF2_ITERATIONS", None) or PBKDF2PasswordHasher.iterations
+    )
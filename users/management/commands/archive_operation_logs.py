@@ -0,0 +1,66 @@
+# users/management/commands/archive_operation_logs.py
+
+"""
+将超过保留期限的操作日志按月归档为压缩文件，并从数据库删除。
+用法：
+    python manage.py archive_operation_logs
+    python manage.py archive_operation_logs --days 90 --output /data/njup/log_archive
+    python manage.py archive_operation_logs --dry-run
+可通过 cron 定期运行。
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from users.services.audit import AUDIT_LOGGER
+from users.services.operation_logs import (
+    ARCHIVE_BATCH_SIZE,
+    archive_operation_logs,
+    archive_path,
+)
+
+
+class Command(BaseCommand):
+    help = "按月归档超过保留期限的操作日志（operation_logs_YYYY-MM.jsonl.gz）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.OPERATION_LOG_RETENTION_DAYS,
+            help="数据库中保留最近多少天的日志",
+        )
+        parser.add_argument(
+            "--output",
+            default=settings.OPERATION_LOG_ARCHIVE_DIR,
+            help="归档文件目录",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="每批处理的日志数"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="只统计将被归档的日志，不写文件也不删除"
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 0:
+            raise CommandError("--days 不能为负数")
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        AUDIT_LOGGER.flush()  # 先写入本进程缓冲区中的日志
+
+        counts = archive_operation_logs(
+            cutoff,
+            options["output"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        if not counts:
+            self.stdout.write(f"没有早于 {cutoff:%Y-%m-%d %H:%M} 的日志需要归档")
+            return
+        for month, count in sorted(counts.items()):
+            target = "（预览）" if options["dry_run"] else archive_path(options["output"], month)
+            self.stdout.write(f"{month}: {count} 条 -> {target}")
+        self.stdout.write(self.style.SUCCESS(f"共归档 {sum(counts.values())} 条日志"))
@@ -0,0 +1,337 @@
+# users/management/commands/bench_grading.py
+
+"""
+智能批量评分的端到端基准测试。
+在临时数据库中生成合成课程（见 users/bench/data.py），以教师身份登录后按批次请求 batch_ai_grade，
+评分接口使用模拟接口（users/services/judge_mock.py），不访问网络。
+指定 --endpoints 时改用 OpenAI 兼容接口：启动若干本地模拟服务器（users/bench/openai_stub.py），
+按 settings.JUDGE["ENDPOINTS"] 的规则在它们之间路由（见 users/services/judge_endpoints.py），并报告各地址分到的请求数。
+报告吞吐量（答案/秒）、每个请求的 p50/p95/p99 延迟、每个请求的数据库查询数、峰值内存、
+SQLite 写锁等待（估算），以及评分结果与标准分（golden）的一致率。
+用法：
+    python manage.py bench_grading
+    python manage.py bench_grading --students 200 --questions 10 --answer-length 400
+    python manage.py bench_grading --workers 4 --latency-ms 50 --json bench_grading.json
+    python manage.py bench_grading --endpoints 20 200 50:0.3 --workers 4
+"""
+
+import json
+import queue
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from users.bench import isolated_database, peak_rss_mb, stopwatch, summarize
+from users.bench.data import BENCH_PASSWORD, BENCH_TEACHER_EMAIL, seed_grading_course
+from users.bench.openai_stub import openai_stub
+from users.models import APIKey, ScoringFeedback, StudentAnswer
+from users.services.provider_telemetry import PROVIDER_TELEMETRY
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "BEGIN", "REPLACE")
+# 写语句耗时超过该值时，超出部分计为等待 SQLite 写锁的时间
+LOCK_WAIT_THRESHOLD = 0.01  # 单位：秒
+
+
+class LockWaitRecorder:
+    """
+    作为 connection.execute_wrapper 使用，累计写语句中超出 LOCK_WAIT_THRESHOLD 的耗时。
+    SQLite 在拿不到写锁时会在语句内部等待（busy timeout），因此写语句的异常耗时主要来自锁等待。
+    """
+
+    def __init__(self):
+        self.wait = 0.0
+        self.locked_errors = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(WRITE_PREFIXES):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except Exception as e:
+            if "locked" in str(e):
+                with self._lock:
+                    self.locked_errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed > LOCK_WAIT_THRESHOLD:
+                with self._lock:
+                    self.wait += elapsed - LOCK_WAIT_THRESHOLD
+
+
+class Command(BaseCommand):
+    help = "在临时数据库中用模拟评分接口端到端测试 batch_ai_grade 的吞吐量和延迟"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=50, help="学生数")
+        parser.add_argument("--questions", type=int, default=5, help="试题数")
+        parser.add_argument(
+            "--answer-length", type=int, default=200, help="答案长度（字符）"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=20, help="每个评分请求包含的答案数"
+        )
+        parser.add_argument("--workers", type=int, default=1, help="并发请求的线程数")
+        parser.add_argument(
+            "--latency-ms", type=int, default=0, help="模拟评分接口的延迟（毫秒）"
+        )
+        parser.add_argument(
+            "--failure-rate", type=float, default=0.0, help="模拟评分接口的失败比例"
+        )
+        parser.add_argument(
+            "--endpoints",
+            nargs="+",
+            metavar="LATENCY_MS[:FAILURE_RATE[:WEIGHT]]",
+            help="改用 OpenAI 兼容接口，为每一项启动一个模拟服务器（延迟、503 比例、路由权重）",
+        )
+        parser.add_argument("--seed", type=int, default=1, help="数据生成的随机种子")
+        parser.add_argument("--json", help="同时把结果写入该 JSON 文件")
+
+    def parse_endpoints(self, specs):
+        # ["20", "200:0.3", "50:0:2"] -> [(延迟, 失败比例, 权重), ...]
+        endpoints = []
+        for spec in specs or []:
+            parts = spec.split(":")
+            try:
+                latency = int(parts[0])
+                failure_rate = float(parts[1]) if len(parts) > 1 else 0.0
+                weight = float(parts[2]) if len(parts) > 2 else 1
+            except (ValueError, IndexError):
+                raise CommandError(f"无效的 --endpoints 参数：{spec}")
+            endpoints.append((latency, failure_rate, weight))
+        return endpoints
+
+    def handle(self, *args, **options):
+        mock = {
+            "ENABLED": True,
+            "LATENCY_MS": options["latency_ms"],
+            "FAILURE_RATE": options["failure_rate"],
+        }
+        endpoint_specs = self.parse_endpoints(options["endpoints"])
+        with ExitStack() as stack:
+            stubs = []  # [(地址配置, StubStats), ...]
+            for i, (latency, failure_rate, weight) in enumerate(endpoint_specs):
+                base_url, stats = stack.enter_context(
+                    openai_stub(latency, failure_rate, seed=options["seed"] + i)
+                )
+                config = {"NAME": f"stub-{i}", "BASE_URL": base_url, "WEIGHT": weight, "DELAY": 0}
+                stubs.append((config, stats))
+            if stubs:
+                judge = {
+                    **getattr(settings, "JUDGE", {}),
+                    "RETRY_BACKOFF": 0,
+                    "ENDPOINTS": {"openai": [config for config, _stats in stubs]},
+                }
+                stack.enter_context(override_settings(JUDGE=judge))
+                PROVIDER_TELEMETRY.reset()
+            stack.enter_context(isolated_database())
+            stack.enter_context(override_settings(MOCK_JUDGE=mock))
+
+            start = time.perf_counter()
+            data = seed_grading_course(
+                students=options["students"],
+                questions=options["questions"],
+                answer_length=options["answer_length"],
+                seed=options["seed"],
+            )
+            seed_time = time.perf_counter() - start
+            key = APIKey.objects.create(
+                TeacherID=data["teacher"],
+                Model="openai" if stubs else "mock",
+                Version="stub-1" if stubs else "mock-1",
+                KeyValue="bench",
+            )
+            batches = self.make_batches(data, options["batch_size"])
+            result = self.run(data["course"].CourseID, key.KeyID, batches, options)
+            result["golden"] = self.compare_golden(data["golden"])
+            if stubs:
+                result["endpoints"] = [
+                    {
+                        "name": config["NAME"],
+                        "latency_ms": latency,
+                        "failure_rate": failure_rate,
+                        "weight": weight,
+                        "requests": stats.requests,
+                        "failures": stats.failures,
+                    }
+                    for (config, stats), (latency, failure_rate, weight) in zip(
+                        stubs, endpoint_specs
+                    )
+                ]
+        result.update(
+            seed_seconds=seed_time,
+            peak_rss_mb=peak_rss_mb(),
+            options={
+                name: options[name]
+                for name in (
+                    "students",
+                    "questions",
+                    "answer_length",
+                    "batch_size",
+                    "workers",
+                    "latency_ms",
+                    "failure_rate",
+                    "endpoints",
+                    "seed",
+                )
+            },
+        )
+        self.report(result)
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+
+    def make_batches(self, data, batch_size):
+        # 按试题分批：[(试题ID, [答案ID, ...]), ...]
+        grouped = {}
+        for answer_id, question_id in (
+            StudentAnswer.objects.filter(QuestionID_id__in=data["questions"])
+            .order_by("AnswerID")
+            .values_list("AnswerID", "QuestionID_id")
+        ):
+            grouped.setdefault(question_id, []).append(answer_id)
+        return [
+            (question_id, answer_ids[i : i + batch_size])
+            for question_id, answer_ids in grouped.items()
+            for i in range(0, len(answer_ids), batch_size)
+        ]
+
+    def run(self, course_id, key_id, batches, options):
+        pending = queue.Queue()
+        for batch in batches:
+            pending.put(batch)
+        latencies, query_counts, errors = [], [], []
+        answer_errors = [0]  # 评分失败的答案数（空白答案也计入）
+        recorder = LockWaitRecorder()
+        lock = threading.Lock()
+
+        def worker():
+            client = Client()
+            client.post(
+                "/login/",
+                {
+                    "role": "teacher",
+                    "email": BENCH_TEACHER_EMAIL,
+                    "password": BENCH_PASSWORD,
+                },
+            )
+            try:
+                with connection.execute_wrapper(recorder):
+                    while True:
+                        try:
+                            question_id, answer_ids = pending.get_nowait()
+                        except queue.Empty:
+                            return
+                        url = (
+                            f"/teacher_course/{course_id}/question/{question_id}"
+                            "/batch_ai_grade/"
+                        )
+                        elapsed = []
+                        with CaptureQueriesContext(connection) as queries:
+                            with stopwatch(elapsed):
+                                try:
+                                    response = client.post(
+                                        url,
+                                        {
+                                            "answer_ids[]": answer_ids,
+                                            "model_choice": key_id,
+                                        },
+                                    )
+                                    results = response.json().get("results", {})
+                                    failed = response.status_code != 200
+                                except Exception:
+                                    results, failed = {}, True
+                        with lock:
+                            latencies.extend(elapsed)
+                            query_counts.append(len(queries))
+                            if failed:
+                                errors.append(question_id)
+                            answer_errors[0] += sum(
+                                1
+                                for item in results.values()
+                                if item.get("status") == "error"
+                            )
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=worker) for _ in range(max(1, options["workers"]))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        answers = sum(len(answer_ids) for _question_id, answer_ids in batches)
+        stats = summarize(latencies)
+        return {
+            "answers": answers,
+            "requests": len(latencies),
+            "errors": len(errors),
+            "answer_errors": answer_errors[0],
+            "elapsed_seconds": elapsed,
+            "answers_per_second": answers / elapsed if elapsed else 0.0,
+            "request_p50_ms": stats["p50_ms"],
+            "request_p95_ms": stats["p95_ms"],
+            "request_p99_ms": stats["p99_ms"],
+            "queries_per_request": sum(query_counts) / len(query_counts)
+            if query_counts
+            else 0.0,
+            "queries_per_answer": sum(query_counts) / answers if answers else 0.0,
+            "lock_wait_ms": recorder.wait * 1000,
+            "locked_errors": recorder.locked_errors,
+        }
+
+    def compare_golden(self, golden):
+        # 每份答案取最新的一条评分与标准分比较
+        latest = {}
+        for answer_id, score in (
+            ScoringFeedback.objects.filter(AnswerID_id__in=list(golden))
+            .order_by("AnswerID_id", "CreatedAt", "FeedbackID")
+            .values_list("AnswerID_id", "Score")
+        ):
+            latest[answer_id] = score
+        graded = [answer_id for answer_id in golden if answer_id in latest]
+        exact = sum(1 for answer_id in graded if latest[answer_id] == golden[answer_id])
+        error = sum(abs(latest[answer_id] - golden[answer_id]) for answer_id in graded)
+        return {
+            "graded": len(graded),
+            "missing": len(golden) - len(graded),
+            "exact_match_rate": exact / len(graded) if graded else 0.0,
+            "mean_abs_error": error / len(graded) if graded else 0.0,
+        }
+
+    def report(self, result):
+        golden = result["golden"]
+        lines = [
+            f"答案数 {result['answers']}，请求数 {result['requests']}，"
+            f"失败请求 {result['errors']}，评分失败的答案 {result['answer_errors']}，用时 {result['elapsed_seconds']:.2f} 秒"
+            f"（生成数据 {result['seed_seconds']:.2f} 秒）",
+            f"吞吐量：{result['answers_per_second']:.1f} 答案/秒",
+            f"请求延迟：p50 {result['request_p50_ms']:.1f} ms，"
+            f"p95 {result['request_p95_ms']:.1f} ms，p99 {result['request_p99_ms']:.1f} ms",
+            f"数据库查询：{result['queries_per_request']:.1f} 次/请求，"
+            f"{result['queries_per_answer']:.1f} 次/答案",
+            f"峰值内存：{result['peak_rss_mb']:.1f} MB",
+            f"SQLite 写锁等待（估算）：{result['lock_wait_ms']:.1f} ms，"
+            f"database is locked 错误 {result['locked_errors']} 次",
+            f"与标准分一致：{golden['exact_match_rate']:.1%}（平均绝对误差 "
+            f"{golden['mean_abs_error']:.2f}，未评分 {golden['missing']} 份）",
+        ]
+        for endpoint in result.get("endpoints", []):
+            lines.append(
+                f"{endpoint['name']}（延迟 {endpoint['latency_ms']} ms，503 比例 {endpoint['failure_rate']:.0%}，"
+                f"权重 {endpoint['weight']:g}）：请求 {endpoint['requests']} 次，失败 {endpoint['failures']} 次"
+            )
+        for line in lines:
+            self.stdout.write(line)
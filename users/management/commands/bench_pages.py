@@ -0,0 +1,287 @@
+# users/management/commands/bench_pages.py
+
+"""
+学生和教师高频页面的压力测试。
+在临时数据库中生成合成课程（见 users/bench/data.py），启动本地 HTTP 服务器（见 users/bench/server.py），
+用多个线程模拟以下场景，通过真实的 HTTP 请求访问页面：
+- deadline_burst：截止前集中提交。每名学生登录后打开课程页（student_course_detail）、
+  打开试题（view_question）、提交或更新答案，再回到课程页
+- grading_session：教师评阅。打开答案列表（grade_answers），逐份打开答案（view_and_grade_answer）并确认评分
+按“场景 + 页面”统计请求数、错误率（状态码不符合预期或连接失败）、p50/p95/p99 延迟和每个请求的数据库查询数，
+结果可写入 JSON 文件；用 --baseline 指定上一版本的结果文件，可直接对比 p95 延迟和查询数的变化。
+客户端与服务器在同一进程中运行，延迟中包含客户端线程的开销，适合比较不同版本，不代表生产环境的绝对数值。
+用法：
+    python manage.py bench_pages
+    python manage.py bench_pages --students 200 --workers 16 --json pages.json
+    python manage.py bench_pages --scenarios grading_session --reviews 50 --baseline pages.json
+"""
+
+import json
+import queue
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.bench import isolated_database, peak_rss_mb, summarize
+from users.bench.data import (
+    BENCH_PASSWORD,
+    BENCH_STUDENT_EMAIL,
+    BENCH_TEACHER_EMAIL,
+    seed_grading_course,
+)
+from users.bench.server import PageClient, live_server
+from users.models import StudentAnswer
+
+SCENARIOS = ("deadline_burst", "grading_session")
+
+
+class Recorder:
+    # 线程安全地收集 (页面, 结果, 是否出错)
+    def __init__(self):
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def add(self, view, result, expected):
+        failed = result.status != expected
+        with self._lock:
+            self.rows.setdefault(view, []).append((result, failed))
+        return not failed
+
+    def views(self):
+        summary = {}
+        for view, rows in sorted(self.rows.items()):
+            stats = summarize([result.elapsed for result, _failed in rows])
+            queries = [result.queries for result, _failed in rows if result.queries is not None]
+            errors = sum(1 for _result, failed in rows if failed)
+            status_codes = {}
+            for result, _failed in rows:
+                status_codes[str(result.status)] = status_codes.get(str(result.status), 0) + 1
+            summary[view] = {
+                "requests": len(rows),
+                "errors": errors,
+                "error_rate": errors / len(rows),
+                "p50_ms": stats["p50_ms"],
+                "p95_ms": stats["p95_ms"],
+                "p99_ms": stats["p99_ms"],
+                "queries_mean": sum(queries) / len(queries) if queries else 0.0,
+                "queries_max": max(queries, default=0),
+                "status_codes": status_codes,
+            }
+        return summary
+
+
+class Command(BaseCommand):
+    help = "启动本地服务器，模拟截止前集中提交和教师评阅，测试高频页面的延迟、查询数和错误率"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=50, help="学生数")
+        parser.add_argument("--questions", type=int, default=5, help="试题数")
+        parser.add_argument(
+            "--answer-length", type=int, default=200, help="答案长度（字符）"
+        )
+        parser.add_argument(
+            "--answer-ratio",
+            type=float,
+            default=0.7,
+            help="生成数据时已提交答案的比例（其余在 deadline_burst 中首次提交）",
+        )
+        parser.add_argument("--workers", type=int, default=8, help="并发的学生会话数")
+        parser.add_argument("--graders", type=int, default=2, help="并发的教师评阅会话数")
+        parser.add_argument(
+            "--reviews", type=int, default=20, help="每道试题评阅的答案数"
+        )
+        parser.add_argument(
+            "--scenarios",
+            nargs="+",
+            default=list(SCENARIOS),
+            choices=SCENARIOS,
+            help="要运行的场景",
+        )
+        parser.add_argument("--seed", type=int, default=1, help="数据生成的随机种子")
+        parser.add_argument("--json", help="同时把结果写入该 JSON 文件")
+        parser.add_argument("--baseline", help="与该 JSON 结果文件（上一版本）对比")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"], encoding="utf-8") as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"无法读取对比文件：{e}")
+
+        result = {"scenarios": {}}
+        with isolated_database():
+            start = time.perf_counter()
+            data = seed_grading_course(
+                students=options["students"],
+                questions=options["questions"],
+                answer_length=options["answer_length"],
+                seed=options["seed"],
+                answer_ratio=options["answer_ratio"],
+            )
+            result["seed_seconds"] = time.perf_counter() - start
+            with live_server() as base_url:
+                for scenario in options["scenarios"]:
+                    run = getattr(self, scenario)
+                    recorder = Recorder()
+                    start = time.perf_counter()
+                    run(base_url, data, recorder, options)
+                    elapsed = time.perf_counter() - start
+                    views = recorder.views()
+                    requests = sum(view["requests"] for view in views.values())
+                    result["scenarios"][scenario] = {
+                        "elapsed_seconds": elapsed,
+                        "requests": requests,
+                        "requests_per_second": requests / elapsed if elapsed else 0.0,
+                        "views": views,
+                    }
+        result.update(
+            peak_rss_mb=peak_rss_mb(),
+            options={
+                name: options[name]
+                for name in (
+                    "students",
+                    "questions",
+                    "answer_length",
+                    "answer_ratio",
+                    "workers",
+                    "graders",
+                    "reviews",
+                    "scenarios",
+                    "seed",
+                )
+            },
+        )
+        self.report(result, baseline)
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+
+    def run_workers(self, count, jobs, work):
+        # 用 count 个线程并发处理 jobs 中的任务，每个线程有自己的会话
+        pending = queue.Queue()
+        for job in jobs:
+            pending.put(job)
+
+        def worker():
+            while True:
+                try:
+                    job = pending.get_nowait()
+                except queue.Empty:
+                    return
+                work(job)
+
+        threads = [threading.Thread(target=worker) for _ in range(max(1, count))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def deadline_burst(self, base_url, data, recorder, options):
+        course_id = data["course"].CourseID
+        question_id = data["questions"][-1]  # 所有学生都赶在截止前提交同一道题
+        course_url = f"/student_course/{course_id}/"
+        question_url = f"/student_course/{course_id}/question/{question_id}/"
+
+        def student_session(number):
+            client = PageClient(base_url)
+            login = client.login(
+                "student", BENCH_STUDENT_EMAIL.format(number), BENCH_PASSWORD
+            )
+            if not recorder.add("login", login, 302):
+                return
+            recorder.add("student_course_detail", client.get(course_url), 200)
+            recorder.add("view_question", client.get(question_url), 200)
+            recorder.add(
+                "view_question (POST)",
+                client.post(question_url, {"Content": f"学生{number}在截止前提交的答案。"}),
+                302,
+            )
+            recorder.add("student_course_detail", client.get(course_url), 200)
+
+        self.run_workers(
+            options["workers"], range(len(data["students"])), student_session
+        )
+
+    def grading_session(self, base_url, data, recorder, options):
+        course_id = data["course"].CourseID
+        golden = data["golden"]
+        # 每个评阅会话负责一道试题：[(试题ID, [答案ID, ...]), ...]
+        jobs = []
+        for question_id in data["questions"]:
+            answer_ids = list(
+                StudentAnswer.objects.filter(QuestionID_id=question_id)
+                .order_by("AnswerID")
+                .values_list("AnswerID", flat=True)[: options["reviews"]]
+            )
+            jobs.append((question_id, answer_ids))
+
+        def grader_session(job):
+            question_id, answer_ids = job
+            client = PageClient(base_url)
+            login = client.login("teacher", BENCH_TEACHER_EMAIL, BENCH_PASSWORD)
+            if not recorder.add("login", login, 302):
+                return
+            question_url = f"/teacher_course/{course_id}/question/{question_id}"
+            recorder.add("grade_answers", client.get(f"{question_url}/grade/"), 200)
+            for answer_id in answer_ids:
+                answer_url = f"{question_url}/answer/{answer_id}/view_grade/"
+                recorder.add("view_and_grade_answer", client.get(answer_url), 200)
+                recorder.add(
+                    "view_and_grade_answer (POST)",
+                    client.post(
+                        answer_url,
+                        {"Score": golden.get(answer_id, 0), "Feedback": "评阅确认"},
+                    ),
+                    302,
+                )
+
+        self.run_workers(options["graders"], jobs, grader_session)
+
+    def report(self, result, baseline=None):
+        header = (
+            f"{'scenario':<18}{'view':<30}{'requests':>9}{'errors':>8}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}"
+        )
+        if baseline:
+            header += f"{'Δp95':>10}{'Δqueries':>10}{'Δerrors':>10}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for scenario, summary in result["scenarios"].items():
+            old_views = (
+                baseline.get("scenarios", {}).get(scenario, {}).get("views", {})
+                if baseline
+                else {}
+            )
+            for view, row in summary["views"].items():
+                line = (
+                    f"{scenario:<18}{view:<30}{row['requests']:>9}{row['errors']:>8}"
+                    f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+                    f"{row['queries_mean']:>9.1f}"
+                )
+                old = old_views.get(view)
+                if old:
+                    line += (
+                        f"{row['p95_ms'] - old['p95_ms']:>+10.1f}"
+                        f"{row['queries_mean'] - old['queries_mean']:>+10.1f}"
+                        f"{row['errors'] - old['errors']:>+10}"
+                    )
+                self.stdout.write(line)
+            self.stdout.write(
+                f"{scenario}：用时 {summary['elapsed_seconds']:.2f} 秒，"
+                f"{summary['requests_per_second']:.1f} 请求/秒"
+            )
+            # 出错的请求单独列出错误率和状态码，避免只看延迟而忽略失败（如提交答案时数据库被锁）
+            for view, row in summary["views"].items():
+                if row["errors"]:
+                    self.stdout.write(
+                        self.style.ERROR(
+                            f"{scenario}：{view} 有 {row['errors']}/{row['requests']} 个请求出错"
+                            f"（错误率 {row['error_rate']:.1%}，状态码 {row['status_codes']}）"
+                        )
+                    )
+        self.stdout.write(
+            f"生成数据 {result['seed_seconds']:.2f} 秒，峰值内存 {result['peak_rss_mb']:.1f} MB"
+        )
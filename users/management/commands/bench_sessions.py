@@ -0,0 +1,112 @@
+# users/management/commands/bench_sessions.py
+
+"""
+登录与主页吞吐量基准测试，用于比较不同会话后端的开销。
+用法：
+    python manage.py bench_sessions --requests 200
+    python manage.py bench_sessions --engines db cached_db signed_cookies
+"""
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from users.bench import isolated_database, stopwatch, summarize
+from users.models import Course, Student, StudentCourse, Teacher
+
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}
+
+
+class Command(BaseCommand):
+    help = "在临时数据库中测试登录和主页的吞吐量，比较不同会话后端（db 为改动前的默认配置）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=100, help="每个场景的请求次数"
+        )
+        parser.add_argument(
+            "--courses", type=int, default=10, help="测试用户拥有/加入的课程数"
+        )
+        parser.add_argument(
+            "--engines",
+            nargs="+",
+            default=["db", "cached_db", "signed_cookies"],
+            choices=sorted(SESSION_ENGINES),
+            help="参与比较的会话后端",
+        )
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            self.seed(options["courses"])
+            rows = []
+            for engine in options["engines"]:
+                with override_settings(SESSION_ENGINE=SESSION_ENGINES[engine]):
+                    cache.clear()
+                    rows.extend(self.run_engine(engine, options["requests"]))
+        self.report(rows)
+
+    def seed(self, course_count):
+        password = make_password("bench")
+        teacher = Teacher.objects.create(
+            Name="bench_teacher", Email="bench_teacher@example.com", Password=password
+        )
+        student = Student.objects.create(
+            Name="bench_student", Email="bench_student@example.com", Password=password
+        )
+        courses = Course.objects.bulk_create(
+            Course(TeacherID=teacher, Name=f"课程{i}") for i in range(course_count)
+        )
+        StudentCourse.objects.bulk_create(
+            StudentCourse(StudentID=student, CourseID=course) for course in courses
+        )
+
+    def run_engine(self, engine, n):
+        rows = []
+        for role in ("teacher", "student"):
+            client = Client()  # 新的 Client 会按当前 SESSION_ENGINE 初始化中间件
+            login_data = {
+                "role": role,
+                "email": f"bench_{role}@example.com",
+                "password": "bench",
+            }
+            dashboard_url = f"/{role}_dashboard/"
+
+            for name, request in (
+                ("login", lambda: client.post("/login/", login_data)),
+                ("dashboard", lambda: client.get(dashboard_url)),
+            ):
+                latencies = []
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(n):
+                        with stopwatch(latencies):
+                            response = request()
+                        if response.status_code not in (200, 302):
+                            self.stderr.write(
+                                f"{engine} {role} {name} 返回 {response.status_code}"
+                            )
+                stats = summarize(latencies)
+                stats.update(
+                    engine=engine,
+                    scenario=f"{role} {name}",
+                    queries=len(queries) / n,
+                )
+                rows.append(stats)
+        return rows
+
+    def report(self, rows):
+        header = f"{'engine':<16}{'scenario':<20}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'queries/req':>14}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for row in rows:
+            self.stdout.write(
+                f"{row['engine']:<16}{row['scenario']:<20}{row['throughput']:>10.1f}"
+                f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['queries']:>14.1f}"
+            )
@@ -0,0 +1,63 @@
+# users/management/commands/cluster_answers.py
+
+"""
+按得分点对答案分组（离线执行，仅使用 CPU）。
+用法：
+    python manage.py cluster_answers --questions 3 5 8
+    python manage.py cluster_answers --all
+    python manage.py cluster_answers --all --incremental   # 只归类拟合后新提交或修改的答案
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import Question, QuestionClustering
+from users.services.answer_clustering import (
+    ClusteringError,
+    assign_new_answers,
+    fit_question_clusters,
+)
+
+
+class Command(BaseCommand):
+    help = "按评分标准中的得分点对试题的答案分组，供教师按组评阅"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", nargs="+", type=int, help="试题ID")
+        parser.add_argument("--all", action="store_true", help="处理全部试题")
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="使用已拟合的词表归类新答案，不重新拟合（未拟合的试题跳过）",
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            questions = Question.objects.all()
+            if options["incremental"]:
+                questions = questions.filter(
+                    QuestionID__in=QuestionClustering.objects.values("QuestionID")
+                )
+        elif options["questions"]:
+            questions = Question.objects.filter(QuestionID__in=options["questions"])
+        else:
+            raise CommandError("请通过 --questions 指定试题，或使用 --all")
+
+        start = time.perf_counter()
+        total = 0
+        try:
+            for question in questions.order_by("QuestionID"):
+                if options["incremental"]:
+                    count = assign_new_answers(question)
+                else:
+                    count = fit_question_clusters(question)
+                total += count
+                self.stdout.write(f"试题 {question.QuestionID}：{count} 份答案")
+        except ClusteringError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"共处理 {total} 份答案，用时 {time.perf_counter() - start:.2f} 秒"
+            )
+        )
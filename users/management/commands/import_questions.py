@@ -0,0 +1,53 @@
+# users/management/commands/import_questions.py
+
+"""
+从题库 Markdown 文件批量导入一章的试题（重复导入只更新有变化的试题）。
+用法：
+    python manage.py import_questions "第5章 变质作用与变质岩 习题及答案.markdown" --course 1
+    python manage.py import_questions 题库.markdown --course 1 --open
+    python manage.py import_questions 题库.markdown --course 1 --dry-run   # 只统计，不写入
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import Course
+from users.services.question_bank import import_question_bank
+
+
+class Command(BaseCommand):
+    help = "从题库 Markdown 文件导入试题内容、评分标准和 Prompt"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="题库文件路径")
+        parser.add_argument("--course", type=int, required=True, help="课程ID")
+        parser.add_argument(
+            "--open", action="store_true", help="新建的试题立即开放作答"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="只统计将新建/更新的试题数，不写入"
+        )
+
+    def handle(self, *args, **options):
+        course = Course.objects.filter(CourseID=options["course"]).first()
+        if course is None:
+            raise CommandError(f"课程 {options['course']} 不存在")
+
+        start = time.perf_counter()
+        try:
+            with open(options["path"], encoding="utf-8") as lines:
+                result = import_question_bank(
+                    course, lines, is_open=options["open"], dry_run=options["dry_run"]
+                )
+        except OSError as e:
+            raise CommandError(f"无法读取题库文件：{e}")
+
+        prefix = "（未写入）" if options["dry_run"] else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix}新建 {result['created']} 道、更新 {result['updated']} 道、"
+                f"未变化 {result['unchanged']} 道试题，"
+                f"用时 {time.perf_counter() - start:.2f} 秒"
+            )
+        )
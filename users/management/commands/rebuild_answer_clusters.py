@@ -0,0 +1,36 @@
+# users/management/commands/rebuild_answer_clusters.py
+
+"""
+重新计算答案的 MinHash 签名、LSH 分桶和近似重复簇。
+增量维护不会拆分簇，答案大量修改或删除后可运行本命令修正。
+用法：
+    python manage.py rebuild_answer_clusters
+    python manage.py rebuild_answer_clusters --questions 3 5 8
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.services.near_duplicates import rebuild_answer_clusters
+
+
+class Command(BaseCommand):
+    help = "重建答案近似重复索引（MinHash 签名、LSH 分桶和簇）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--questions",
+            nargs="+",
+            type=int,
+            help="只重建指定试题ID的答案，默认重建全部试题",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_answer_clusters(options["questions"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"已重建 {count} 个答案的近似重复索引，用时 {time.perf_counter() - start:.2f} 秒"
+            )
+        )
@@ -0,0 +1,49 @@
+# users/management/commands/rebuild_material_index.py
+
+"""
+重建课程资料的检索索引。
+上传或删除资料时会自动重建，通常无需运行；更换服务器、清理索引目录或直接修改数据库后用于修复。
+用法：
+    python manage.py rebuild_material_index --courses 1 3
+    python manage.py rebuild_material_index --all
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import CourseMaterial
+from users.services.materials import MaterialIndexError, rebuild_material_index
+
+
+class Command(BaseCommand):
+    help = "根据课程资料片段重建 BM25 检索索引"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--courses", nargs="+", type=int, help="课程ID")
+        parser.add_argument("--all", action="store_true", help="处理全部有资料的课程")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            course_ids = sorted(
+                set(CourseMaterial.objects.values_list("CourseID_id", flat=True))
+            )
+        elif options["courses"]:
+            course_ids = options["courses"]
+        else:
+            raise CommandError("请通过 --courses 指定课程，或使用 --all")
+
+        start = time.perf_counter()
+        total = 0
+        try:
+            for course_id in course_ids:
+                count = rebuild_material_index(course_id)
+                total += count
+                self.stdout.write(f"课程 {course_id}：{count} 个片段")
+        except MaterialIndexError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"共索引 {total} 个片段，用时 {time.perf_counter() - start:.2f} 秒"
+            )
+        )
@@ -0,0 +1,35 @@
+# users/management/commands/rebuild_question_stats.py
+
+"""
+根据评分记录重新计算试题评分统计（QuestionStats）。
+用法：
+    python manage.py rebuild_question_stats
+    python manage.py rebuild_question_stats --questions 3 5 8
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.services.question_stats import rebuild_question_stats
+
+
+class Command(BaseCommand):
+    help = "从评分记录重建试题评分统计，用于修复统计缺失或不一致"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--questions",
+            nargs="+",
+            type=int,
+            help="只重建指定试题ID的统计，默认重建全部试题",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_question_stats(options["questions"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"已重建 {count} 道试题的统计，用时 {time.perf_counter() - start:.2f} 秒"
+            )
+        )
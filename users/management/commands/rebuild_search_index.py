@@ -0,0 +1,42 @@
+# users/management/commands/rebuild_search_index.py
+
+"""
+重建全文索引（课程、学生答案、评分反馈）。
+索引由信号实时同步，通常无需运行；绕过模型直接修改数据库（如 update()、原始 SQL）后用于修复。
+用法：
+    python manage.py rebuild_search_index
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users.models import Course
+from users.services.answer_search import ANSWER_INDEX, rebuild_search_indexes
+from users.services.course_search import COURSE_INDEX, course_index_values
+
+
+class Command(BaseCommand):
+    help = "清空并重建课程、答案和评分反馈的全文索引"
+
+    def handle(self, *args, **options):
+        if not (COURSE_INDEX.available() and ANSWER_INDEX.available()):
+            raise CommandError("全文索引表不存在（数据库不支持 FTS5 或尚未执行迁移）")
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            COURSE_INDEX.clear()
+            COURSE_INDEX.bulk_insert(
+                (course_id, course_index_values(name, description))
+                for course_id, name, description in Course.objects.values_list(
+                    "CourseID", "Name", "Description"
+                )
+            )
+            answer_count, feedback_count = rebuild_search_indexes()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"已重建全文索引：{Course.objects.count()} 门课程，{answer_count} 个答案，"
+                f"{feedback_count} 条评分反馈，用时 {time.perf_counter() - start:.2f} 秒"
+            )
+        )
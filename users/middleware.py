@@ -0,0 +1,148 @@
+# users/middleware.py
+
+"""
+项目自定义中间件。
+各中间件同时支持同步和异步请求：在 ASGI 服务器下，异步视图（如 batch_ai_grade）的整条处理链都保持异步，
+不会因为某个只支持同步的中间件而退回到线程中执行。
+"""
+
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connection
+from django.utils.functional import SimpleLazyObject
+
+from .principal import resolve_principal
+from .services.metrics import (
+    METRICS,
+    UNRESOLVED_VIEW,
+    QueryRecorder,
+    metrics_settings,
+    server_timing,
+)
+from .structured_logging import REQUEST_ID_HEADER, log_context, request_id_from
+
+
+class PrincipalMiddleware:
+    """
+    为每个请求挂载 request.principal（当前登录主体）。
+    采用惰性求值：只有视图或模板真正访问时才解析会话和读取缓存。
+    必须放在 SessionMiddleware 之后。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.principal = SimpleLazyObject(lambda: resolve_principal(request.session))
+        # 异步请求时 get_response 返回协程，直接交给调用方等待
+        return self.get_response(request)
+
+
+class RequestIDMiddleware:
+    """
+    为每个请求分配请求 ID（沿用上游传入的 X-Request-ID），请求处理期间记录的日志都带有该 ID，
+    并在响应头中返回，便于把用户反馈的问题与日志对应起来。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.request_id = request_id_from(request)
+        with log_context(request_id=request.request_id):
+            response = self.get_response(request)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        request.request_id = request_id_from(request)
+        with log_context(request_id=request.request_id):
+            response = await self.get_response(request)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+
+class MetricsMiddleware:
+    """
+    按视图记录请求耗时、响应大小和状态码，抽样记录数据库查询统计（见 users/services/metrics.py），
+    并在响应中添加 Server-Timing 头。放在中间件列表的最前面，耗时包含其余中间件。
+    异步请求（ASGI 下的全部请求）中，同步视图和 sync_to_async 中的数据库查询都在该请求专用的线程中执行，
+    抽样时在该线程的数据库连接上安装 QueryRecorder，统计方式与同步请求相同。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = metrics_settings()
+        if not config["ENABLED"]:
+            return self.get_response(request)
+
+        recorder = QueryRecorder() if METRICS.should_sample(config) else None
+        start = time.perf_counter()
+        if recorder is not None:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        latency = time.perf_counter() - start
+        return self.record(request, response, config, start, latency, recorder)
+
+    async def __acall__(self, request):
+        config = metrics_settings()
+        if not config["ENABLED"]:
+            return await self.get_response(request)
+
+        recorder = QueryRecorder() if METRICS.should_sample(config) else None
+        if recorder is not None:
+            await _install_recorder(recorder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            latency = time.perf_counter() - start
+            if recorder is not None:
+                await _remove_recorder(recorder)
+        return self.record(request, response, config, start, latency, recorder)
+
+    def record(self, request, response, config, start, latency, recorder=None):
+        match = request.resolver_match
+        view = (match.view_name if match else "") or UNRESOLVED_VIEW
+        size = None if response.streaming else len(response.content)
+        METRICS.observe(view, response.status_code, latency, size, recorder, config)
+        if config["SERVER_TIMING"]:
+            response["Server-Timing"] = server_timing(latency, recorder)
+        overhead = time.perf_counter() - start - latency
+        METRICS.add_overhead(overhead + (recorder.overhead if recorder else 0.0))
+        return response
+
+
+# 须经 sync_to_async（thread_sensitive）调用，connection 才是该请求的同步代码所用线程的数据库连接
+@sync_to_async
+def _install_recorder(recorder):
+    connection.execute_wrappers.append(recorder)
+
+
+@sync_to_async
+def _remove_recorder(recorder):
+    connection.execute_wrappers.remove(recorder)
@@ -0,0 +1,71 @@
+# 课程全文索引（SQLite FTS5 虚拟表），由 users.services.course_search 维护
+# 建表语句和分词规则按本迁移编写时的版本固定在此，不引用 users.services，
+# 以后修改服务代码不影响在新数据库上执行迁移
+
+import re
+
+from django.db import migrations
+
+CREATE_COURSE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS course_fts "
+    "USING fts5(name, description, title UNINDEXED, "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+DROP_COURSE_INDEX = "DROP TABLE IF EXISTS course_fts"
+INSERT_COURSE = (
+    "INSERT INTO course_fts (rowid, name, description, title) VALUES (%s, %s, %s, %s)"
+)
+# 分词规则同编写本迁移时的 users/services/cjk.py index_text：汉字切分为单字和相邻双字，字母数字按单词切分并转为小写
+TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9A-Za-z]+")
+
+
+def index_text(text):
+    tokens = []
+    for run in TOKEN_RE.findall(text or ""):
+        if not run[0].isascii():
+            tokens.extend(run)
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return " ".join(tokens)
+
+
+def fts5_available(connection):
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return "ENABLE_FTS5" in {row[0] for row in cursor.fetchall()}
+
+
+def create_course_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if not fts5_available(connection):
+        return  # 不支持 FTS5 时课程检索退回普通查询
+    schema_editor.execute(CREATE_COURSE_INDEX)
+    Course = apps.get_model("users", "Course")
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            INSERT_COURSE,
+            [
+                (course_id, index_text(name), index_text(description), name)
+                for course_id, name, description in Course.objects.using(
+                    connection.alias
+                ).values_list("CourseID", "Name", "Description")
+            ],
+        )
+
+
+def drop_course_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(DROP_COURSE_INDEX)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0005_alter_administrator_password_alter_student_password_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_course_index, drop_course_index),
+    ]
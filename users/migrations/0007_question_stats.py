@@ -0,0 +1,118 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# 统计规则按本迁移编写时的 users/services/question_stats.py 固定在此，不引用 users.services，
+# 以后修改服务代码不影响在新数据库上执行迁移
+HISTOGRAM_BIN_WIDTH = 10
+HISTOGRAM_BINS = 20
+BATCH_SIZE = 200
+
+
+def build_question_stats(apps, schema_editor):
+    # 已有的未确认评分均来自 AI，补齐 AIScore 后按评分记录计算统计
+    Question = apps.get_model("users", "Question")
+    StudentAnswer = apps.get_model("users", "StudentAnswer")
+    ScoringFeedback = apps.get_model("users", "ScoringFeedback")
+    QuestionStats = apps.get_model("users", "QuestionStats")
+    ScoringFeedback.objects.filter(IsFinal=False).update(AIScore=models.F("Score"))
+
+    question_ids = list(
+        Question.objects.order_by("QuestionID").values_list("QuestionID", flat=True)
+    )
+    for start in range(0, len(question_ids), BATCH_SIZE):
+        chunk = question_ids[start : start + BATCH_SIZE]
+        stats = {
+            question_id: QuestionStats(
+                QuestionID_id=question_id, Histogram=[0] * HISTOGRAM_BINS
+            )
+            for question_id in chunk
+        }
+        answers = {}  # AnswerID -> (QuestionID, [(Score, AIScore, IsFinal), ...] 从新到旧)
+        for answer_id, question_id in StudentAnswer.objects.filter(
+            QuestionID_id__in=chunk
+        ).values_list("AnswerID", "QuestionID_id"):
+            answers[answer_id] = (question_id, [])
+            stats[question_id].AnswerCount += 1
+        for answer_id, score, ai_score, is_final in (
+            ScoringFeedback.objects.filter(AnswerID__QuestionID_id__in=chunk)
+            .order_by("AnswerID", "-CreatedAt", "-FeedbackID")
+            .values_list("AnswerID_id", "Score", "AIScore", "IsFinal")
+        ):
+            answers[answer_id][1].append((score, ai_score, is_final))
+
+        updated = []
+        for answer_id, (question_id, rows) in answers.items():
+            # 快照：最新的最终评分和最新的 AI 评分
+            final_score = next((score for score, _, final in rows if final), None)
+            ai_score = next((ai for _, ai, _ in rows if ai is not None), None)
+            updated.append(
+                StudentAnswer(AnswerID=answer_id, FinalScore=final_score, AIScore=ai_score)
+            )
+            question_stats = stats[question_id]
+            if ai_score is not None:
+                question_stats.AIGradedCount += 1
+            if final_score is not None:
+                question_stats.ConfirmedCount += 1
+                question_stats.ScoreSum += final_score
+                question_stats.ScoreSumSq += final_score * final_score
+                histogram_bin = max(
+                    0, min(int(final_score // HISTOGRAM_BIN_WIDTH), HISTOGRAM_BINS - 1)
+                )
+                question_stats.Histogram[histogram_bin] += 1
+                if ai_score is not None:
+                    delta = final_score - ai_score
+                    question_stats.DeltaCount += 1
+                    question_stats.DeltaSum += delta
+                    question_stats.DeltaAbsSum += abs(delta)
+
+        StudentAnswer.objects.bulk_update(
+            updated, ["FinalScore", "AIScore"], batch_size=BATCH_SIZE
+        )
+        QuestionStats.objects.bulk_create(stats.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_course_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('QuestionID', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='users.question')),
+                ('AnswerCount', models.IntegerField(default=0)),
+                ('AIGradedCount', models.IntegerField(default=0)),
+                ('ConfirmedCount', models.IntegerField(default=0)),
+                ('ScoreSum', models.FloatField(default=0)),
+                ('ScoreSumSq', models.FloatField(default=0)),
+                ('Histogram', models.JSONField(default=list)),
+                ('DeltaCount', models.IntegerField(default=0)),
+                ('DeltaSum', models.FloatField(default=0)),
+                ('DeltaAbsSum', models.FloatField(default=0)),
+                ('UpdatedAt', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'QuestionStats',
+            },
+        ),
+        migrations.AddField(
+            model_name='scoringfeedback',
+            name='AIScore',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='studentanswer',
+            name='AIScore',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='studentanswer',
+            name='FinalScore',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(build_question_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_question_stats'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='operationlog',
+            name='idx_log_timestamp',
+        ),
+        migrations.AddIndex(
+            model_name='operationlog',
+            index=models.Index(fields=['Timestamp', 'LogID'], name='idx_log_time_id'),
+        ),
+        migrations.AddIndex(
+            model_name='operationlog',
+            index=models.Index(fields=['AdminID', 'Timestamp', 'LogID'], name='idx_log_admin_time'),
+        ),
+        migrations.AddIndex(
+            model_name='operationlog',
+            index=models.Index(fields=['Operation', 'Timestamp', 'LogID'], name='idx_log_operation_time'),
+        ),
+    ]
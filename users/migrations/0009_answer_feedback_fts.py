@@ -0,0 +1,118 @@
+# 答案与评分反馈全文索引（SQLite FTS5 虚拟表），由 users.services.answer_search 维护
+# 建表语句和分词规则按本迁移编写时的版本固定在此，不引用 users.services，
+# 以后修改服务代码不影响在新数据库上执行迁移
+
+import re
+
+from django.db import migrations
+
+TOKENIZE = "tokenize='unicode61 remove_diacritics 2'"
+CREATE_INDEXES = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS answer_fts "
+    f"USING fts5(content, course_id UNINDEXED, question_id UNINDEXED, {TOKENIZE})",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS feedback_fts "
+    "USING fts5(feedback, course_id UNINDEXED, question_id UNINDEXED, "
+    f"answer_id UNINDEXED, {TOKENIZE})",
+]
+DROP_INDEXES = [
+    "DROP TABLE IF EXISTS answer_fts",
+    "DROP TABLE IF EXISTS feedback_fts",
+]
+INSERT_ANSWER = (
+    "INSERT INTO answer_fts (rowid, content, course_id, question_id) "
+    "VALUES (%s, %s, %s, %s)"
+)
+INSERT_FEEDBACK = (
+    "INSERT INTO feedback_fts (rowid, feedback, course_id, question_id, answer_id) "
+    "VALUES (%s, %s, %s, %s, %s)"
+)
+BATCH_SIZE = 2000
+
+# 分词规则同编写本迁移时的 users/services/cjk.py index_text：汉字切分为单字和相邻双字，字母数字按单词切分并转为小写
+TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9A-Za-z]+")
+
+
+def index_text(text):
+    tokens = []
+    for run in TOKEN_RE.findall(text or ""):
+        if not run[0].isascii():
+            tokens.extend(run)
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return " ".join(tokens)
+
+
+def fts5_available(connection):
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return "ENABLE_FTS5" in {row[0] for row in cursor.fetchall()}
+
+
+def _insert_batches(connection, sql, rows):
+    batch = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+def create_answer_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if not fts5_available(connection):
+        return  # 不支持 FTS5 时答案检索退回普通查询
+    for sql in CREATE_INDEXES:
+        schema_editor.execute(sql)
+
+    StudentAnswer = apps.get_model("users", "StudentAnswer")
+    ScoringFeedback = apps.get_model("users", "ScoringFeedback")
+    _insert_batches(
+        connection,
+        INSERT_ANSWER,
+        (
+            (answer_id, index_text(content), course_id, question_id)
+            for answer_id, content, course_id, question_id in StudentAnswer.objects.using(
+                connection.alias
+            ).values_list(
+                "AnswerID", "Content", "QuestionID__CourseID_id", "QuestionID_id"
+            )
+        ),
+    )
+    _insert_batches(
+        connection,
+        INSERT_FEEDBACK,
+        (
+            (feedback_id, index_text(feedback), course_id, question_id, answer_id)
+            for feedback_id, feedback, course_id, question_id, answer_id in (
+                ScoringFeedback.objects.using(connection.alias).values_list(
+                    "FeedbackID",
+                    "Feedback",
+                    "AnswerID__QuestionID__CourseID_id",
+                    "AnswerID__QuestionID_id",
+                    "AnswerID_id",
+                )
+            )
+        ),
+    )
+
+
+def drop_answer_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in DROP_INDEXES:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0008_operation_log_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_answer_indexes, drop_answer_indexes),
+    ]
@@ -0,0 +1,159 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:48
+
+import hashlib
+import random
+import re
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# 签名、分桶和聚类规则按本迁移编写时的 users/services/near_duplicates.py 固定在此，不引用 users.services，
+# 以后修改服务代码不影响在新数据库上执行迁移（参数须与服务代码一致，增量维护才能与这里写入的签名比较）
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 8
+ROWS_PER_BAND = NUM_PERM // BANDS
+SIMILARITY_THRESHOLD = 0.8
+BATCH_SIZE = 500
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(20240901)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+_IGNORED_RE = re.compile(r"[\W_]+")
+
+
+def minhash_signature(text):
+    normalized = _IGNORED_RE.sub("", (text or "").lower())
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized} if normalized else set()
+    else:
+        shingles = {
+            normalized[i : i + SHINGLE_SIZE]
+            for i in range(len(normalized) - SHINGLE_SIZE + 1)
+        }
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingles]
+    if not hashes:
+        return None
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_hashes(signature):
+    result = []
+    for band in range(BANDS):
+        values = signature[band * ROWS_PER_BAND : (band + 1) * ROWS_PER_BAND]
+        raw = f"{band}:{','.join(map(str, values))}".encode()
+        digest = hashlib.blake2b(raw, digest_size=8).digest()
+        result.append(int.from_bytes(digest, "big", signed=True))
+    return result
+
+
+def estimated_similarity(left, right):
+    return sum(1 for a, b in zip(left, right) if a == b) / NUM_PERM
+
+
+def build_answer_clusters(apps, schema_editor):
+    Question = apps.get_model("users", "Question")
+    StudentAnswer = apps.get_model("users", "StudentAnswer")
+    AnswerFingerprint = apps.get_model("users", "AnswerFingerprint")
+    AnswerLSHBucket = apps.get_model("users", "AnswerLSHBucket")
+
+    for question_id in Question.objects.order_by("QuestionID").values_list(
+        "QuestionID", flat=True
+    ):
+        signatures = {}
+        buckets = {}  # 分桶哈希 -> [AnswerID, ...]
+        parent = {}  # 并查集，根为簇内最小的 AnswerID
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for answer_id, content in (
+            StudentAnswer.objects.filter(QuestionID_id=question_id)
+            .order_by("AnswerID")
+            .values_list("AnswerID", "Content")
+        ):
+            signature = minhash_signature(content)
+            if signature is None:
+                continue
+            signatures[answer_id] = signature
+            parent[answer_id] = answer_id
+            for bucket in band_hashes(signature):
+                for other_id in buckets.setdefault(bucket, []):
+                    root, other_root = find(answer_id), find(other_id)
+                    if root != other_root and (
+                        estimated_similarity(signature, signatures[other_id])
+                        >= SIMILARITY_THRESHOLD
+                    ):
+                        parent[max(root, other_root)] = min(root, other_root)
+                buckets[bucket].append(answer_id)
+
+        AnswerFingerprint.objects.bulk_create(
+            [
+                AnswerFingerprint(
+                    AnswerID_id=answer_id,
+                    QuestionID_id=question_id,
+                    Signature=signature,
+                    ClusterID=find(answer_id),
+                )
+                for answer_id, signature in signatures.items()
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        AnswerLSHBucket.objects.bulk_create(
+            [
+                AnswerLSHBucket(
+                    AnswerID_id=answer_id, QuestionID_id=question_id, BucketHash=bucket
+                )
+                for bucket, answer_ids in buckets.items()
+                for answer_id in answer_ids
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_answer_feedback_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerFingerprint',
+            fields=[
+                ('AnswerID', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='users.studentanswer')),
+                ('Signature', models.JSONField(default=list)),
+                ('ClusterID', models.IntegerField()),
+                ('QuestionID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='users.question')),
+            ],
+            options={
+                'db_table': 'AnswerFingerprint',
+                'indexes': [models.Index(fields=['QuestionID', 'ClusterID'], name='idx_fingerprint_cluster')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AnswerLSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('BucketHash', models.BigIntegerField()),
+                ('AnswerID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='users.studentanswer')),
+                ('QuestionID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.question')),
+            ],
+            options={
+                'db_table': 'AnswerLSHBucket',
+                'indexes': [models.Index(fields=['QuestionID', 'BucketHash'], name='idx_lsh_question_bucket')],
+            },
+        ),
+        migrations.RunPython(build_answer_clusters, migrations.RunPython.noop),
+    ]
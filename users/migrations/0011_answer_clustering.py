@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_answer_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionClustering',
+            fields=[
+                ('QuestionID', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='clustering', serialize=False, to='users.question')),
+                ('Points', models.JSONField(default=list)),
+                ('Vocabulary', models.JSONField(default=list)),
+                ('IDF', models.JSONField(default=list)),
+                ('AnswerCount', models.IntegerField(default=0)),
+                ('FittedAt', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'QuestionClustering',
+            },
+        ),
+        migrations.CreateModel(
+            name='AnswerCoverage',
+            fields=[
+                ('AnswerID', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='coverage', serialize=False, to='users.studentanswer')),
+                ('Coverage', models.JSONField(default=list)),
+                ('ClusterKey', models.CharField(max_length=100)),
+                ('Similarity', models.FloatField(default=0)),
+                ('QuestionID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coverages', to='users.question')),
+            ],
+            options={
+                'db_table': 'AnswerCoverage',
+                'indexes': [models.Index(fields=['QuestionID', 'ClusterKey'], name='idx_coverage_cluster')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_answer_clustering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromptTemplate',
+            fields=[
+                ('CourseID', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='prompt_template', serialize=False, to='users.course')),
+                ('SystemPrompt', models.TextField(blank=True, default='')),
+                ('Body', models.TextField(default='{{ system_prompt }}\n\n**试题内容**\n{{ content }}\n\n**评分标准**\n{{ criteria }}\n\n{{ prompt }}')),
+                ('Version', models.PositiveIntegerField(default=1)),
+                ('UpdatedAt', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'PromptTemplate',
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_prompt_template'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseMaterial',
+            fields=[
+                ('MaterialID', models.AutoField(primary_key=True, serialize=False)),
+                ('Title', models.CharField(max_length=200)),
+                ('Content', models.TextField()),
+                ('UploadedAt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('CourseID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='materials', to='users.course')),
+            ],
+            options={
+                'db_table': 'CourseMaterial',
+            },
+        ),
+        migrations.CreateModel(
+            name='MaterialChunk',
+            fields=[
+                ('ChunkID', models.AutoField(primary_key=True, serialize=False)),
+                ('Position', models.IntegerField()),
+                ('Text', models.TextField()),
+                ('CourseID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='material_chunks', to='users.course')),
+                ('MaterialID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='users.coursematerial')),
+            ],
+            options={
+                'db_table': 'MaterialChunk',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='coursematerial',
+            index=models.Index(fields=['CourseID'], name='idx_material_course'),
+        ),
+        migrations.AddIndex(
+            model_name='materialchunk',
+            index=models.Index(fields=['CourseID', 'ChunkID'], name='idx_chunk_course'),
+        ),
+    ]
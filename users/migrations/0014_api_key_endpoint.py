@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_course_materials'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apikey',
+            name='Endpoint',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -116,7 +116,14 @@ class OperationLog(models.Model):
     class Meta:
         db_table = "OperationLog"
         indexes = [
-            models.Index(fields=["Timestamp"], name="idx_log_timestamp"),
+            # 查看日志时按 (Timestamp, LogID) 键集分页，筛选管理员/操作类型时使用后两个复合索引
+            models.Index(fields=["Timestamp", "LogID"], name="idx_log_time_id"),
+            models.Index(
+                fields=["AdminID", "Timestamp", "LogID"], name="idx_log_admin_time"
+            ),
+            models.Index(
+                fields=["Operation", "Timestamp", "LogID"], name="idx_log_operation_time"
+            ),
         ]
 
     def __str__(self):
@@ -164,6 +171,10 @@ class APIKey(models.Model):
     # Status 字段：布尔类型，默认值为 True。表示该 APIKey 是否处于启用状态
     Status = models.BooleanField(default=True)
 
+    # Endpoint 字段：OpenAI 兼容接口的地址（如本地 llama.cpp、vLLM 服务器 http://127.0.0.1:8080/v1），
+    # 为空时使用 settings.JUDGE["ENDPOINTS"] 中配置的地址（见 users/services/judge_endpoints.py）
+    Endpoint = models.CharField(max_length=255, blank=True, default="")
+
     # Meta 是内部类，用于定义模型的元数据（如数据库表名、索引等）
     class Meta:
         # 指定该模型对应的真实数据库表名为 "APIKey"
@@ -287,6 +298,10 @@ class StudentAnswer(models.Model):
     ConfirmedAt = models.DateTimeField(
         null=True, blank=True
     )  # 该答案的评分与反馈确认时间
+    # 以下两个字段是该答案计入 QuestionStats 的分数快照，由 services/question_stats.py 维护，不要直接修改；
+    # 修改答案的其他字段时请使用 save(update_fields=[...])，以免用内存中的旧值覆盖快照
+    FinalScore = models.FloatField(null=True, blank=True)  # 最新的最终评分
+    AIScore = models.FloatField(null=True, blank=True)  # 最新的 AI 评分
 
     class Meta:
         db_table = "StudentAnswer"
@@ -311,6 +326,8 @@ class ScoringFeedback(models.Model):
     Feedback = models.TextField(null=True, blank=True)
     CreatedAt = models.DateTimeField(default=timezone.now)
     IsFinal = models.BooleanField(default=False)
+    # AI 给出的原始分数。教师确认时会直接修改 Score，该字段保留 AI 分数用于对比
+    AIScore = models.FloatField(null=True, blank=True)
 
     class Meta:
         db_table = "ScoringFeedback"
@@ -323,6 +340,246 @@ class ScoringFeedback(models.Model):
 
     def __str__(self):
         return f"Feedback {self.FeedbackID} for Answer {self.AnswerID.AnswerID}"
+
+
+class QuestionStats(models.Model):
+    """
+    试题评分统计（物化表），每道试题一行。
+    评分反馈新增、确认、删除时由 services/question_stats.py 增量更新，
+    页面展示时只需读取这一行，不必加载该题的全部答案。
+    """
+
+    QuestionID = models.OneToOneField(
+        Question, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    AnswerCount = models.IntegerField(default=0)  # 已提交的答案数
+    AIGradedCount = models.IntegerField(default=0)  # 有 AI 评分的答案数
+    ConfirmedCount = models.IntegerField(default=0)  # 有最终评分的答案数
+    ScoreSum = models.FloatField(default=0)  # 最终评分之和
+    ScoreSumSq = models.FloatField(default=0)  # 最终评分平方和，用于计算标准差
+    Histogram = models.JSONField(default=list)  # 最终评分分布，每档的答案数
+    DeltaCount = models.IntegerField(default=0)  # 同时有 AI 评分和最终评分的答案数
+    DeltaSum = models.FloatField(default=0)  # （最终评分 - AI 评分）之和
+    DeltaAbsSum = models.FloatField(default=0)  # |最终评分 - AI 评分| 之和
+    UpdatedAt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "QuestionStats"
+
+    def __str__(self):
+        return f"Stats for Question {self.QuestionID_id}"
+
+    @property
+    def mean(self):
+        return self.ScoreSum / self.ConfirmedCount if self.ConfirmedCount else None
+
+    @property
+    def stddev(self):
+        if not self.ConfirmedCount:
+            return None
+        mean = self.ScoreSum / self.ConfirmedCount
+        # 增量加减会累积浮点误差，方差可能出现极小的负数
+        return max(self.ScoreSumSq / self.ConfirmedCount - mean * mean, 0.0) ** 0.5
+
+    @property
+    def confirmed_percent(self):
+        return 100 * self.ConfirmedCount / self.AnswerCount if self.AnswerCount else 0
+
+    @property
+    def ai_graded_percent(self):
+        return 100 * self.AIGradedCount / self.AnswerCount if self.AnswerCount else 0
+
+    @property
+    def mean_delta(self):
+        return self.DeltaSum / self.DeltaCount if self.DeltaCount else None
+
+    @property
+    def mean_abs_delta(self):
+        return self.DeltaAbsSum / self.DeltaCount if self.DeltaCount else None
+
+
+class AnswerFingerprint(models.Model):
+    """
+    答案内容的 MinHash 签名及其所属的近似重复簇，由 services/near_duplicates.py 在答案提交时维护。
+    ClusterID 为簇内最小的 AnswerID；没有近似答案时等于自身的 AnswerID。
+    """
+
+    AnswerID = models.OneToOneField(
+        StudentAnswer,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="fingerprint",
+    )
+    QuestionID = models.ForeignKey(
+        Question, on_delete=models.CASCADE, related_name="fingerprints"
+    )  # 冗余保存所属试题，按试题查询簇时无需关联 StudentAnswer
+    Signature = models.JSONField(default=list)  # MinHash 签名
+    ClusterID = models.IntegerField()
+
+    class Meta:
+        db_table = "AnswerFingerprint"
+        indexes = [
+            models.Index(
+                fields=["QuestionID", "ClusterID"], name="idx_fingerprint_cluster"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Fingerprint for Answer {self.AnswerID_id}"
+
+
+class AnswerLSHBucket(models.Model):
+    """
+    LSH 分桶：签名按段（band）计算哈希，同一试题中任意一段哈希相同的答案互为候选，
+    查找近似答案时只需按 (试题, 哈希) 索引查询，不必与该题的全部答案比较。
+    """
+
+    AnswerID = models.ForeignKey(
+        StudentAnswer, on_delete=models.CASCADE, related_name="lsh_buckets"
+    )
+    QuestionID = models.ForeignKey(Question, on_delete=models.CASCADE)
+    BucketHash = models.BigIntegerField()  # 段序号与该段签名值共同计算的哈希
+
+    class Meta:
+        db_table = "AnswerLSHBucket"
+        indexes = [
+            models.Index(
+                fields=["QuestionID", "BucketHash"], name="idx_lsh_question_bucket"
+            ),
+        ]
+
+
+class QuestionClustering(models.Model):
+    """
+    试题答案按得分点聚类的模型参数，由 services/answer_clustering.py 离线拟合。
+    保存拟合时的得分点、字符 n-gram 词表及其 IDF，新提交的答案可直接按同一词表增量归类。
+    """
+
+    QuestionID = models.OneToOneField(
+        Question, on_delete=models.CASCADE, primary_key=True, related_name="clustering"
+    )
+    Points = models.JSONField(default=list)  # [[得分点文本, 分值], ...]
+    Vocabulary = models.JSONField(default=list)  # 字符 n-gram 列表
+    IDF = models.JSONField(default=list)  # 与 Vocabulary 一一对应
+    AnswerCount = models.IntegerField(default=0)  # 拟合时的答案数
+    FittedAt = models.DateTimeField()
+
+    class Meta:
+        db_table = "QuestionClustering"
+
+    def __str__(self):
+        return f"Clustering for Question {self.QuestionID_id}"
+
+
+class AnswerCoverage(models.Model):
+    """
+    答案对各得分点的覆盖度及所属的分组。
+    ClusterKey 为覆盖的得分点序号（如 "0,2"），覆盖相同得分点的答案属于同一组；
+    评分标准中没有可解析的得分点时，按答案文本相似度分组，ClusterKey 为 "s" 加组内代表答案ID。
+    """
+
+    AnswerID = models.OneToOneField(
+        StudentAnswer,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="coverage",
+    )
+    QuestionID = models.ForeignKey(
+        Question, on_delete=models.CASCADE, related_name="coverages"
+    )
+    Coverage = models.JSONField(default=list)  # 各得分点的覆盖度，0~1
+    ClusterKey = models.CharField(max_length=100)
+    Similarity = models.FloatField(default=0)  # 与组中心的余弦相似度，用于选出代表答案
+
+    class Meta:
+        db_table = "AnswerCoverage"
+        indexes = [
+            models.Index(
+                fields=["QuestionID", "ClusterKey"], name="idx_coverage_cluster"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Coverage for Answer {self.AnswerID_id}"
+
+
+DEFAULT_PROMPT_BODY = """{{ system_prompt }}
+
+**试题内容**
+{{ content }}
+
+**评分标准**
+{{ criteria }}
+
+{{ prompt }}"""
+
+
+class PromptTemplate(models.Model):
+    """
+    课程级评分提示模板，由 services/prompt_templates.py 编译并渲染。
+    SystemPrompt 为课程内各试题共用的系统提示；Body 为 Django 模板语法的排版，
+    可用变量 system_prompt、title、content、criteria、prompt（试题自己的 Prompt，如提示词、参考教材原话）。
+    每次修改 Version 加一，渲染结果的缓存以 Version 为键，旧版本的缓存自然失效。
+    """
+
+    CourseID = models.OneToOneField(
+        Course, on_delete=models.CASCADE, primary_key=True, related_name="prompt_template"
+    )
+    SystemPrompt = models.TextField(blank=True, default="")
+    Body = models.TextField(default=DEFAULT_PROMPT_BODY)
+    Version = models.PositiveIntegerField(default=1)
+    UpdatedAt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "PromptTemplate"
+
+    def __str__(self):
+        return f"Prompt template v{self.Version} for Course {self.CourseID_id}"
+
+
+class CourseMaterial(models.Model):
+    """
+    课程参考资料（如教材），评分时检索与试题和答案相关的片段附在 Prompt 中。
+    文本由 services/materials.py 切分为 MaterialChunk 并建立检索索引。
+    """
+
+    MaterialID = models.AutoField(primary_key=True)
+    CourseID = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="materials"
+    )
+    Title = models.CharField(max_length=200)
+    Content = models.TextField()
+    UploadedAt = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "CourseMaterial"
+        indexes = [
+            models.Index(fields=["CourseID"], name="idx_material_course"),
+        ]
+
+    def __str__(self):
+        return self.Title
+
+
+class MaterialChunk(models.Model):
+    ChunkID = models.AutoField(primary_key=True)
+    MaterialID = models.ForeignKey(
+        CourseMaterial, on_delete=models.CASCADE, related_name="chunks"
+    )
+    CourseID = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="material_chunks"
+    )  # 冗余保存课程ID，建立索引时只需按课程查询片段
+    Position = models.IntegerField()  # 片段在资料中的序号
+    Text = models.TextField()
+
+    class Meta:
+        db_table = "MaterialChunk"
+        indexes = [
+            models.Index(fields=["CourseID", "ChunkID"], name="idx_chunk_course"),
+        ]
+
+    def __str__(self):
+        return f"Chunk {self.Position} of Material {self.MaterialID_id}"
     
     
 
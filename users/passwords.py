@@ -0,0 +1,40 @@
+# users/passwords.py
+
+"""
+密码相关的公共函数。
+"""
+
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+# 批量添加学生、默认管理员等场景使用的初始密码，可后续通知用户更改
+DEFAULT_PASSWORD = "123456"
+
+
+@lru_cache(maxsize=None)
+def default_password_hash():
+    """
+    初始密码的哈希值。
+    初始密码对所有人公开，共用同一个哈希不会泄露额外信息，
+    因此每个进程只计算一次；也可通过 settings.DEFAULT_PASSWORD_HASH 直接提供预先计算好的哈希。
+    """
+    return getattr(settings, "DEFAULT_PASSWORD_HASH", None) or make_password(
+        DEFAULT_PASSWORD
+    )
+
+
+def check_account_password(account, raw_password):
+    """
+    校验 Administrator/Teacher/Student 的密码。
+    若存储的哈希使用的算法或参数与当前配置不一致，校验成功后自动升级为新哈希。
+    """
+    if not account.Password:
+        return False
+
+    def setter(password):
+        account.Password = make_password(password)
+        account.save(update_fields=["Password"])
+
+    return check_password(raw_password, account.Password, setter)
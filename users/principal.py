@@ -0,0 +1,170 @@
+# users/principal.py
+
+"""
+当前登录主体（管理员/教师/学生）的解析与缓存。
+会话中只保存 admin_id / teacher_id / student_id，本模块根据会话解析出主体的角色、姓名，
+以及教师拥有的课程ID、学生已加入的课程ID，并将结果缓存起来，
+视图通过 request.principal 直接判断权限和课程归属，避免每个请求重复查询 Teacher/Student/Course 表。
+缓存在主体信息或选课关系变化时由 signals.py 中的信号处理函数失效。
+失效只作用于当前进程可见的缓存：多进程部署须使用共享缓存后端（见 settings.py 中的 NJUP_CACHE_BACKEND），
+使用进程内存缓存（locmem）时其他进程要等缓存过期（PRINCIPAL_CACHE_TIMEOUT）才能看到变化。
+"""
+
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.shortcuts import redirect
+from django.utils.functional import cached_property
+
+# 角色与会话键的对应关系，顺序即解析优先级
+ROLE_SESSION_KEYS = (
+    ("admin", "admin_id"),
+    ("teacher", "teacher_id"),
+    ("student", "student_id"),
+)
+
+PRINCIPAL_CACHE_TIMEOUT = getattr(settings, "PRINCIPAL_CACHE_TIMEOUT", 300)  # 单位：秒
+
+
+def principal_cache_key(role, pk):
+    return f"principal:{role}:{pk}"
+
+
+class Principal:
+    """
+    已解析的登录主体。
+    未登录时 role 为 None，course_ids 为空集合。
+    """
+
+    def __init__(self, role=None, pk=None, name="", course_ids=()):
+        self.role = role
+        self.pk = pk
+        self.name = name
+        self.course_ids = frozenset(course_ids)
+
+    def __repr__(self):
+        return f"<Principal {self.role}:{self.pk}>"
+
+    @property
+    def is_authenticated(self):
+        return self.role is not None
+
+    @property
+    def is_admin(self):
+        return self.role == "admin"
+
+    @property
+    def is_teacher(self):
+        return self.role == "teacher"
+
+    @property
+    def is_student(self):
+        return self.role == "student"
+
+    def has_course(self, course_id):
+        # 教师：是否拥有该课程；学生：是否已加入该课程
+        try:
+            return int(course_id) in self.course_ids
+        except (TypeError, ValueError):
+            return False
+
+    @cached_property
+    def instance(self):
+        # 需要完整模型对象时才查询数据库，同一请求内只查询一次
+        from .models import Administrator, Student, Teacher
+
+        model = {"admin": Administrator, "teacher": Teacher, "student": Student}.get(
+            self.role
+        )
+        if model is None:
+            return None
+        return model.objects.filter(pk=self.pk).first()
+
+
+ANONYMOUS = Principal()
+
+
+def _load_principal_data(role, pk):
+    # 缓存未命中时从数据库加载主体信息：一次查询姓名，一次查询课程ID
+    from .models import Administrator, Course, Student, StudentCourse, Teacher
+
+    if role == "admin":
+        name = Administrator.objects.filter(AdminID=pk).values_list("Name", flat=True)
+        course_ids = []
+    elif role == "teacher":
+        name = Teacher.objects.filter(TeacherID=pk).values_list("Name", flat=True)
+        course_ids = Course.objects.filter(TeacherID_id=pk).values_list(
+            "CourseID", flat=True
+        )
+    else:
+        name = Student.objects.filter(StudentID=pk).values_list("Name", flat=True)
+        course_ids = StudentCourse.objects.filter(StudentID_id=pk).values_list(
+            "CourseID_id", flat=True
+        )
+
+    name = name.first()
+    if name is None:  # 主体已被删除，会话中的ID失效
+        return None
+    return {"name": name, "course_ids": list(course_ids)}
+
+
+def load_principal(role, pk):
+    key = principal_cache_key(role, pk)
+    data = cache.get(key)
+    if data is None:
+        data = _load_principal_data(role, pk)
+        if data is None:
+            return ANONYMOUS
+        cache.set(key, data, PRINCIPAL_CACHE_TIMEOUT)
+    return Principal(role, pk, data["name"], data["course_ids"])
+
+
+def resolve_principal(session):
+    for role, session_key in ROLE_SESSION_KEYS:
+        pk = session.get(session_key)
+        if pk:
+            return load_principal(role, pk)
+    return ANONYMOUS
+
+
+def invalidate_principal(role, pk):
+    if pk is not None:
+        cache.delete(principal_cache_key(role, pk))
+
+
+def invalidate_principals(role, pks):
+    # 批量失效，用于 bulk_create 等不会触发信号的批量操作
+    cache.delete_many([principal_cache_key(role, pk) for pk in pks if pk is not None])
+
+
+def role_required(role, message="无权限访问"):
+    """
+    视图装饰器：要求当前登录主体具有指定角色，否则提示错误并跳转到登录页。
+    """
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            # 异步视图：解析主体可能读取会话和数据库，须在线程中执行
+            @wraps(view_func)
+            async def _wrapped_async_view(request, *args, **kwargs):
+                principal_role = await sync_to_async(lambda: request.principal.role)()
+                if principal_role != role:
+                    messages.error(request, message)
+                    return redirect("login")
+                return await view_func(request, *args, **kwargs)
+
+            return _wrapped_async_view
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.principal.role != role:
+                messages.error(request, message)
+                return redirect("login")
+            return view_func(request, *args, **kwargs)
+
+        return _wrapped_view
+
+    return decorator
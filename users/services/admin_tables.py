@@ -0,0 +1,126 @@
+# users/services/admin_tables.py
+
+"""
+管理员主页的数据表格与统计数字。
+- 教师、学生、试题表格由前端按页请求 JSON 数据（支持搜索），页面本身不再渲染全部记录
+- 分页通过多取一条判断是否有下一页，不执行 COUNT 查询
+- 各表的总数缓存起来，在增删记录时由 signals.py 失效，主页加载时间与人数无关
+"""
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.urls import reverse
+
+from ..models import Question, Student, Teacher
+
+ADMIN_TABLE_PAGE_SIZE = 50
+ADMIN_TABLE_MAX_PAGE_SIZE = 200
+ADMIN_COUNTS_CACHE_KEY = "admin-dashboard:counts"
+ADMIN_COUNTS_CACHE_TIMEOUT = 3600  # 单位：秒；信号失效之外的兜底过期时间
+
+
+def _person_filter(query):
+    condition = Q(Name__icontains=query) | Q(Email__icontains=query)
+    if query.isdigit():
+        condition |= Q(pk=int(query))
+    return condition
+
+
+def _question_filter(query):
+    condition = Q(Title__icontains=query) | Q(CourseID__Name__icontains=query)
+    if query.isdigit():
+        condition |= Q(pk=int(query))
+    return condition
+
+
+def _teacher_row(teacher_id, name, email):
+    return {
+        "id": teacher_id,
+        "name": name,
+        "email": email,
+        "edit_url": reverse("edit_teacher", args=[teacher_id]),
+    }
+
+
+def _student_row(student_id, name, email):
+    return {
+        "id": student_id,
+        "name": name,
+        "email": email,
+        "edit_url": reverse("edit_student", args=[student_id]),
+    }
+
+
+def _question_row(question_id, course_name, title, is_open):
+    return {
+        "id": question_id,
+        "course": course_name,
+        "title": title,
+        "is_open": is_open,
+        "edit_url": reverse("edit_question_prompt", args=[question_id]),
+    }
+
+
+# 表名 -> (模型, 查询字段, 排序, 搜索条件, 行格式化函数)
+ADMIN_TABLES = {
+    "teachers": (
+        Teacher,
+        ("TeacherID", "Name", "Email"),
+        ("TeacherID",),
+        _person_filter,
+        _teacher_row,
+    ),
+    "students": (
+        Student,
+        ("StudentID", "Name", "Email"),
+        ("StudentID",),
+        _person_filter,
+        _student_row,
+    ),
+    "questions": (
+        Question,
+        ("QuestionID", "CourseID__Name", "Title", "IsOpen"),
+        ("-CreatedAt", "-QuestionID"),
+        _question_filter,
+        _question_row,
+    ),
+}
+
+
+def admin_table_page(table, query="", page=1, per_page=ADMIN_TABLE_PAGE_SIZE):
+    """
+    返回 {"results": [...], "page": 页码, "has_next": 是否有下一页}。
+    table 不在 ADMIN_TABLES 中时抛出 KeyError。
+    """
+    model, fields, ordering, build_filter, format_row = ADMIN_TABLES[table]
+    page = max(1, page)
+    per_page = max(1, min(per_page, ADMIN_TABLE_MAX_PAGE_SIZE))
+
+    queryset = model.objects.order_by(*ordering)
+    query = (query or "").strip()
+    if query:
+        queryset = queryset.filter(build_filter(query))
+
+    offset = (page - 1) * per_page
+    rows = list(queryset.values_list(*fields)[offset : offset + per_page + 1])
+    return {
+        "results": [format_row(*row) for row in rows[:per_page]],
+        "page": page,
+        "has_next": len(rows) > per_page,
+    }
+
+
+def dashboard_counts():
+    # 返回 {"teachers": 教师数, "students": 学生数, "questions": 试题数}
+    counts = cache.get(ADMIN_COUNTS_CACHE_KEY)
+    if counts is None:
+        counts = {
+            table: model.objects.count()
+            for table, (model, *_rest) in ADMIN_TABLES.items()
+        }
+        cache.set(ADMIN_COUNTS_CACHE_KEY, counts, ADMIN_COUNTS_CACHE_TIMEOUT)
+    return counts
+
+
+def invalidate_dashboard_counts():
+    cache.delete(ADMIN_COUNTS_CACHE_KEY)
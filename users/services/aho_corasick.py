@@ -0,0 +1,64 @@
+# users/services/aho_corasick.py
+
+"""
+Aho-Corasick 多模式字符串匹配。
+对全部关键词构建一个自动机，扫描一遍文本即可找出所有出现的关键词，
+耗时与文本长度和命中次数成正比，与关键词数量无关。
+"""
+
+from collections import deque
+
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        """
+        patterns：关键词列表（区分大小写，调用方需自行统一大小写），空字符串会被忽略。
+        """
+        self.patterns = list(dict.fromkeys(pattern for pattern in patterns if pattern))
+        self._goto = [{}]  # 每个状态的转移表
+        self._fail = [0]
+        self._output = [[]]  # 每个状态结束的关键词下标（含通过失败链接可达的）
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(index)
+
+        # 按层（BFS）计算失败链接：指向当前状态对应字符串的最长真后缀所在的状态
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[self._fail[next_state]]
+                )
+
+    def iter(self, text):
+        """
+        依次生成 (结束位置, 关键词)，结束位置为关键词最后一个字符之后的下标。
+        """
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for index in self._output[state]:
+                yield position + 1, self.patterns[index]
+
+    def find_all(self, text):
+        # 文本中出现过的关键词集合
+        return {pattern for _, pattern in self.iter(text)}
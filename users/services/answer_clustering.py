@@ -0,0 +1,392 @@
+# users/services/answer_clustering.py
+
+"""
+按得分点对试题的答案分组，教师逐组评阅代表答案并批量确认评分。
+- 答案和得分点去掉空白和标点后切分为 2~3 字符的 n-gram，按全部答案计算 IDF，得到 TF-IDF 向量
+- 答案对得分点的覆盖度 = 得分点的双字片段中出现在答案里的部分按 IDF 加权的占比，
+  全部答案一次矩阵乘法算出（答案数 × 得分点数），达到 COVERAGE_THRESHOLD 视为覆盖
+- 覆盖的得分点相同的答案为一组；组内与中心余弦相似度最高的答案作为代表答案
+- 评分标准中没有可解析的得分点时，按 TF-IDF 余弦相似度做单遍聚类（与已有组的首个答案相似度达到
+  TEXT_SIMILARITY_THRESHOLD 即归入该组）
+拟合（fit_question_clusters）由 cluster_answers 命令或按组评阅页面的“重新分组”按钮离线执行；
+拟合后新提交或修改的答案由 assign_new_answers() 使用保存的词表和 IDF 增量归类，不重新拟合；
+增量归类同样由 cluster_answers --incremental 或按组评阅页面的“归入新答案”按钮触发，查看页面不写数据库。
+"""
+
+import math
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import (
+    AnswerCoverage,
+    QuestionClustering,
+    ScoringFeedback,
+    StudentAnswer,
+)
+from .rubric import RubricPoint, parse_rubric
+
+NGRAM_SIZES = (2, 3)
+COVERAGE_NGRAM_SIZE = 2  # 覆盖度只按双字计算，三字片段对同义改写过于敏感
+MIN_DF = 2  # 只出现在一个答案中的 n-gram 不计入词表（得分点中的 n-gram 除外）
+MAX_FEATURES = 4096
+COVERAGE_THRESHOLD = 0.6
+TEXT_SIMILARITY_THRESHOLD = 0.5
+
+_IGNORED_RE = re.compile(r"[\W_]+")
+
+
+class ClusteringError(Exception):
+    pass
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ClusteringError("服务器未安装 numpy，无法对答案分组。")
+    return numpy
+
+
+def char_ngrams(text):
+    normalized = _IGNORED_RE.sub("", (text or "").lower())
+    return Counter(
+        normalized[i : i + n]
+        for n in NGRAM_SIZES
+        for i in range(len(normalized) - n + 1)
+    )
+
+
+# =====================
+# 向量化
+# =====================
+
+
+def build_vocabulary(answer_ngrams, point_grams):
+    """
+    根据答案的 n-gram 计数构建词表，返回 (词表, IDF)。
+    得分点中的 n-gram 始终保留，其余按文档频率从高到低取至多 MAX_FEATURES 个。
+    """
+    df = Counter()
+    for counts in answer_ngrams:
+        df.update(counts.keys())
+    required = set().union(*point_grams) if point_grams else set()
+    frequent = [
+        gram
+        for gram, count in df.most_common()
+        if count >= MIN_DF and gram not in required
+    ][: max(0, MAX_FEATURES - len(required))]
+    vocabulary = sorted(required) + frequent
+    total = len(answer_ngrams)
+    idf = [math.log((1 + total) / (1 + df[gram])) + 1 for gram in vocabulary]
+    return vocabulary, idf
+
+
+def tfidf_matrix(answer_ngrams, vocabulary, idf):
+    # 返回 (L2 归一化的 TF-IDF 矩阵, 0/1 出现矩阵)，形状均为 答案数 × 词表大小
+    np = _numpy()
+    index = {gram: i for i, gram in enumerate(vocabulary)}
+    tf = np.zeros((len(answer_ngrams), len(vocabulary)), dtype=np.float32)
+    for row, counts in enumerate(answer_ngrams):
+        for gram, count in counts.items():
+            column = index.get(gram)
+            if column is not None:
+                tf[row, column] = 1 + math.log(count)  # 次数取对数，避免重复堆砌的词占比过高
+    present = (tf > 0).astype(np.float32)
+    vectors = tf * np.asarray(idf, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12), present
+
+
+def point_weights(point_grams, vocabulary, idf):
+    # 词表大小 × 得分点数：每列为该得分点各 n-gram 的 IDF 占比，列和为 1
+    np = _numpy()
+    index = {gram: i for i, gram in enumerate(vocabulary)}
+    weights = np.zeros((len(vocabulary), len(point_grams)), dtype=np.float32)
+    for column, grams in enumerate(point_grams):
+        for gram in grams:
+            weights[index[gram], column] = idf[index[gram]]
+        total = weights[:, column].sum()
+        if total:
+            weights[:, column] /= total
+    return weights
+
+
+def point_ngrams(points):
+    return [
+        {gram for gram in char_ngrams(point.text) if len(gram) == COVERAGE_NGRAM_SIZE}
+        for point in points
+    ]
+
+
+def coverage_keys(coverage):
+    np = _numpy()
+    covered = coverage >= COVERAGE_THRESHOLD
+    return [",".join(str(j) for j in np.flatnonzero(row)) for row in covered]
+
+
+def _centroid_similarity(vectors, keys):
+    # 每个答案与所在组中心（组内向量均值）的余弦相似度
+    np = _numpy()
+    similarity = np.zeros(len(keys), dtype=np.float32)
+    groups = {}
+    for row, key in enumerate(keys):
+        groups.setdefault(key, []).append(row)
+    for rows in groups.values():
+        centroid = vectors[rows].mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        if norm:
+            similarity[rows] = vectors[rows] @ (centroid / norm)
+    return similarity
+
+
+def _leader_keys(answer_ids, vectors, leaders=()):
+    """
+    单遍聚类：依次将答案归入相似度最高且达到阈值的已有组，否则新建一组。
+    leaders 为已有组的 [(组键, 首个答案的向量), ...]，返回 (组键列表, 与组首答案的相似度列表)。
+    """
+    np = _numpy()
+    leader_keys = [key for key, _ in leaders]
+    leader_vectors = [vector for _, vector in leaders]
+    keys, similarity = [], []
+    for answer_id, vector in zip(answer_ids, vectors):
+        if leader_vectors:
+            scores = np.asarray(leader_vectors) @ vector
+            best = int(scores.argmax())
+            if scores[best] >= TEXT_SIMILARITY_THRESHOLD:
+                keys.append(leader_keys[best])
+                similarity.append(float(scores[best]))
+                continue
+        leader_keys.append(f"s{answer_id}")
+        leader_vectors.append(vector)
+        keys.append(leader_keys[-1])
+        similarity.append(1.0)
+    return keys, similarity
+
+
+# =====================
+# 拟合与增量归类
+# =====================
+
+
+def _answers(question):
+    return StudentAnswer.objects.filter(QuestionID=question).exclude(
+        Q(Content__isnull=True) | Q(Content="")
+    )
+
+
+def _answer_rows(question, answer_filter=None):
+    answers = _answers(question)
+    if answer_filter is not None:
+        answers = answers.filter(answer_filter)
+    return list(answers.order_by("AnswerID").values_list("AnswerID", "Content"))
+
+
+def _pending_filter(clustering):
+    # 尚未归类的答案，以及拟合或上次增量归类后修改过的答案
+    return Q(coverage__isnull=True) | Q(SubmittedAt__gt=clustering.FittedAt)
+
+
+def pending_answer_count(question, clustering):
+    """
+    返回等待增量归类的答案数（只读）。
+    """
+    return _answers(question).filter(_pending_filter(clustering)).count()
+
+
+def fit_question_clusters(question):
+    """
+    根据试题当前的评分标准和全部答案重新拟合并分组，返回分组的答案数。
+    """
+    np = _numpy()
+    # 拟合时间取读取答案之前的时间，读取期间提交的答案留给下次增量归类
+    fitted_at = timezone.now()
+    points = parse_rubric(question.ScoringCriteria)
+    rows = _answer_rows(question)
+    answer_ids = [answer_id for answer_id, _ in rows]
+    answer_ngrams = [char_ngrams(content) for _, content in rows]
+    point_grams = point_ngrams(points)
+
+    vocabulary, idf = build_vocabulary(answer_ngrams, point_grams)
+    coverage = np.zeros((len(rows), len(points)), dtype=np.float32)
+    if rows and vocabulary:
+        vectors, present = tfidf_matrix(answer_ngrams, vocabulary, idf)
+        if points:
+            coverage = present @ point_weights(point_grams, vocabulary, idf)
+            keys = coverage_keys(coverage)
+            similarity = _centroid_similarity(vectors, keys).tolist()
+        else:
+            keys, similarity = _leader_keys(answer_ids, vectors)
+    else:
+        keys = [f"s{answer_id}" for answer_id in answer_ids]
+        similarity = [1.0] * len(rows)
+
+    with transaction.atomic():
+        QuestionClustering.objects.update_or_create(
+            QuestionID=question,
+            defaults={
+                "Points": [list(point) for point in points],
+                "Vocabulary": vocabulary,
+                "IDF": idf,
+                "AnswerCount": len(rows),
+                "FittedAt": fitted_at,
+            },
+        )
+        AnswerCoverage.objects.filter(QuestionID=question).delete()
+        AnswerCoverage.objects.bulk_create(
+            [
+                AnswerCoverage(
+                    AnswerID_id=answer_id,
+                    QuestionID=question,
+                    Coverage=[round(value, 3) for value in coverage[row].tolist()],
+                    ClusterKey=keys[row],
+                    Similarity=similarity[row],
+                )
+                for row, answer_id in enumerate(answer_ids)
+            ],
+            batch_size=500,
+        )
+    return len(rows)
+
+
+def assign_new_answers(question):
+    """
+    用已拟合的词表和 IDF 为拟合后新提交或修改的答案计算覆盖度并归入分组，返回归类的答案数。
+    试题尚未拟合时返回 0。增量归类的答案与组中心的相似度记为 0，不会替换已选出的代表答案。
+    """
+    clustering = QuestionClustering.objects.filter(QuestionID=question).first()
+    if clustering is None:
+        return 0
+    fitted_at = timezone.now()
+    rows = _answer_rows(question, _pending_filter(clustering))
+    if not rows:
+        return 0
+
+    np = _numpy()
+    points = [RubricPoint(*point) for point in clustering.Points]
+    answer_ids = [answer_id for answer_id, _ in rows]
+    answer_ngrams = [char_ngrams(content) for _, content in rows]
+    vectors, present = tfidf_matrix(answer_ngrams, clustering.Vocabulary, clustering.IDF)
+    if points:
+        coverage = present @ point_weights(
+            point_ngrams(points), clustering.Vocabulary, clustering.IDF
+        )
+        keys, similarity = coverage_keys(coverage), [0.0] * len(rows)
+    else:
+        coverage = np.zeros((len(rows), 0), dtype=np.float32)
+        leader_ids = {
+            int(key[1:]): key
+            for key in AnswerCoverage.objects.filter(QuestionID=question)
+            .exclude(AnswerID_id__in=answer_ids)
+            .values_list("ClusterKey", flat=True)
+            .distinct()
+        }
+        leader_rows = [
+            (leader_ids[answer_id], char_ngrams(content))
+            for answer_id, content in StudentAnswer.objects.filter(
+                AnswerID__in=leader_ids
+            ).values_list("AnswerID", "Content")
+        ]
+        leader_vectors, _ = tfidf_matrix(
+            [counts for _, counts in leader_rows], clustering.Vocabulary, clustering.IDF
+        )
+        keys, _ = _leader_keys(
+            answer_ids,
+            vectors,
+            [(key, vector) for (key, _), vector in zip(leader_rows, leader_vectors)],
+        )
+        similarity = [0.0] * len(rows)
+
+    with transaction.atomic():
+        AnswerCoverage.objects.filter(AnswerID_id__in=answer_ids).delete()
+        AnswerCoverage.objects.bulk_create(
+            [
+                AnswerCoverage(
+                    AnswerID_id=answer_id,
+                    QuestionID=question,
+                    Coverage=[round(value, 3) for value in coverage[row].tolist()],
+                    ClusterKey=keys[row],
+                    Similarity=similarity[row],
+                )
+                for row, answer_id in enumerate(answer_ids)
+            ]
+        )
+        # 更新为读取答案之前的时间：已归类的修改不会被重复处理，读取期间提交的答案下次仍会归类
+        QuestionClustering.objects.filter(QuestionID=question).update(
+            FittedAt=fitted_at
+        )
+    return len(rows)
+
+
+# =====================
+# 分组展示
+# =====================
+
+
+def question_groups(question, clustering):
+    """
+    返回分组列表（按答案数从多到少）：
+    [{"key", "points": 覆盖的得分点, "suggested_score", "size", "confirmed",
+      "representative": 代表答案, "feedback": 代表答案最新的评分反馈, "member_ids"}, ...]
+    """
+    points = [RubricPoint(*point) for point in clustering.Points]
+    groups = {}
+    coverages = (
+        AnswerCoverage.objects.filter(QuestionID=question)
+        .select_related("AnswerID__StudentID")
+        .order_by("-Similarity", "AnswerID_id")
+    )
+    for coverage in coverages:
+        group = groups.get(coverage.ClusterKey)
+        if group is None:
+            # 按相似度降序遍历，每组第一个答案即代表答案
+            group = groups[coverage.ClusterKey] = {
+                "key": coverage.ClusterKey,
+                "representative": coverage.AnswerID,
+                "member_ids": [],
+                "confirmed": 0,
+            }
+        group["member_ids"].append(coverage.AnswerID_id)
+        if coverage.AnswerID.FinalScore is not None:
+            group["confirmed"] += 1
+
+    latest = {}
+    representatives = [group["representative"].AnswerID for group in groups.values()]
+    for feedback in ScoringFeedback.objects.filter(
+        AnswerID_id__in=representatives
+    ).order_by("AnswerID_id", "-CreatedAt", "-FeedbackID"):
+        latest.setdefault(feedback.AnswerID_id, feedback)
+
+    for group in groups.values():
+        group["size"] = len(group["member_ids"])
+        group["feedback"] = latest.get(group["representative"].AnswerID)
+        covered = (
+            [points[int(i)] for i in group["key"].split(",")]
+            if points and group["key"]
+            else []
+        )
+        group["points"] = covered
+        group["suggested_score"] = (
+            sum(point.points for point in covered)
+            if points and all(point.points is not None for point in covered)
+            else None
+        )
+    return sorted(groups.values(), key=lambda group: (-group["size"], group["key"]))
+
+
+def group_member_ids(question, key):
+    return list(
+        AnswerCoverage.objects.filter(QuestionID=question, ClusterKey=key).values_list(
+            "AnswerID_id", flat=True
+        )
+    )
+
+
+def rubric_changed(question, clustering):
+    # 评分标准在拟合后被修改时需要重新分组
+    return [list(point) for point in parse_rubric(question.ScoringCriteria)] != (
+        clustering.Points
+    )
@@ -0,0 +1,203 @@
+# users/services/answer_search.py
+
+"""
+学生答案与评分反馈的全文检索。
+- answer_fts：rowid 为 AnswerID，检索答案内容，附带课程ID/试题ID用于限定范围
+- feedback_fts：rowid 为 FeedbackID，检索评分反馈文本
+两张索引表由信号处理函数在记录保存/删除时同步（见 users/signals.py），
+中文按单字/双字切分（见 cjk.py），检索结果按 bm25 相关度排序并分页（多取一条判断是否有下一页）。
+索引表不可用时退回包含匹配。
+"""
+
+from ..models import ScoringFeedback, StudentAnswer
+from .cjk import build_match_query, highlight_snippet, index_text
+from .fts import FTSIndex
+
+ANSWER_INDEX = FTSIndex(
+    "answer_fts", ["content"], unindexed=["course_id", "question_id"]
+)
+FEEDBACK_INDEX = FTSIndex(
+    "feedback_fts", ["feedback"], unindexed=["course_id", "question_id", "answer_id"]
+)
+
+SEARCH_PAGE_SIZE = 20
+SNIPPET_WIDTH = 120  # 摘要长度，单位：字符
+
+
+def answer_index_values(content, course_id, question_id):
+    return {
+        "content": index_text(content),
+        "course_id": course_id,
+        "question_id": question_id,
+    }
+
+
+def feedback_index_values(feedback, course_id, question_id, answer_id):
+    return {
+        "feedback": index_text(feedback),
+        "course_id": course_id,
+        "question_id": question_id,
+        "answer_id": answer_id,
+    }
+
+
+def index_answer(answer):
+    ANSWER_INDEX.upsert(
+        answer.AnswerID,
+        answer_index_values(
+            answer.Content, answer.QuestionID.CourseID_id, answer.QuestionID_id
+        ),
+    )
+
+
+def unindex_answer(answer_id):
+    ANSWER_INDEX.delete(answer_id)
+
+
+def index_feedback(feedback):
+    question = feedback.AnswerID.QuestionID
+    FEEDBACK_INDEX.upsert(
+        feedback.FeedbackID,
+        feedback_index_values(
+            feedback.Feedback,
+            question.CourseID_id,
+            question.QuestionID,
+            feedback.AnswerID_id,
+        ),
+    )
+
+
+def unindex_feedback(feedback_id):
+    FEEDBACK_INDEX.delete(feedback_id)
+
+
+def rebuild_search_indexes():
+    """
+    清空并重新写入答案和评分反馈索引，返回 (答案数, 评分反馈数)。
+    调用前应确认索引表可用（ANSWER_INDEX.available()）。
+    """
+    ANSWER_INDEX.clear()
+    answers = StudentAnswer.objects.values_list(
+        "AnswerID", "Content", "QuestionID__CourseID_id", "QuestionID_id"
+    ).iterator(chunk_size=2000)
+    answer_count = _bulk_insert(
+        ANSWER_INDEX,
+        (
+            (answer_id, answer_index_values(content, course_id, question_id))
+            for answer_id, content, course_id, question_id in answers
+        ),
+    )
+
+    FEEDBACK_INDEX.clear()
+    feedbacks = ScoringFeedback.objects.values_list(
+        "FeedbackID",
+        "Feedback",
+        "AnswerID__QuestionID__CourseID_id",
+        "AnswerID__QuestionID_id",
+        "AnswerID_id",
+    ).iterator(chunk_size=2000)
+    feedback_count = _bulk_insert(
+        FEEDBACK_INDEX,
+        ((row[0], feedback_index_values(*row[1:])) for row in feedbacks),
+    )
+    return answer_count, feedback_count
+
+
+def _bulk_insert(index, rows, batch_size=2000):
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index.bulk_insert(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        index.bulk_insert(batch)
+        count += len(batch)
+    return count
+
+
+# =====================
+# 检索
+# =====================
+
+
+def _page_result(items, page, per_page):
+    return {"results": items[:per_page], "page": page, "has_next": len(items) > per_page}
+
+
+def search_answers(
+    query, course_ids, question_id=None, page=1, per_page=SEARCH_PAGE_SIZE
+):
+    """
+    在指定课程范围内检索答案内容。
+    返回 {"results": [(答案, 高亮摘要), ...], "page": 页码, "has_next": 是否有下一页}。
+    """
+    query = (query or "").strip()
+    page = max(1, page)
+    match = build_match_query(query)
+    course_ids = list(course_ids)
+    if match is None or not course_ids:
+        return _page_result([], page, per_page)
+
+    offset = (page - 1) * per_page
+    queryset = StudentAnswer.objects.select_related("StudentID", "QuestionID")
+    if ANSWER_INDEX.available():
+        filters = {"course_id": course_ids}
+        if question_id:
+            filters["question_id"] = question_id
+        answer_ids = [
+            row[0]
+            for row in ANSWER_INDEX.search(match, per_page + 1, offset, filters=filters)
+        ]
+        by_id = queryset.in_bulk(answer_ids)
+        answers = [by_id[answer_id] for answer_id in answer_ids if answer_id in by_id]
+    else:
+        queryset = queryset.filter(
+            QuestionID__CourseID_id__in=course_ids, Content__icontains=query
+        )
+        if question_id:
+            queryset = queryset.filter(QuestionID_id=question_id)
+        answers = list(queryset.order_by("-AnswerID")[offset : offset + per_page + 1])
+
+    results = [
+        (answer, highlight_snippet(answer.Content, query, SNIPPET_WIDTH))
+        for answer in answers
+    ]
+    return _page_result(results, page, per_page)
+
+
+def search_feedback(query, page=1, per_page=SEARCH_PAGE_SIZE):
+    """
+    检索全部评分反馈文本（管理员使用）。
+    返回 {"results": [(评分反馈, 高亮摘要), ...], "page": 页码, "has_next": 是否有下一页}。
+    """
+    query = (query or "").strip()
+    page = max(1, page)
+    match = build_match_query(query)
+    if match is None:
+        return _page_result([], page, per_page)
+
+    offset = (page - 1) * per_page
+    queryset = ScoringFeedback.objects.select_related(
+        "AnswerID__StudentID", "AnswerID__QuestionID__CourseID"
+    )
+    if FEEDBACK_INDEX.available():
+        feedback_ids = [
+            row[0] for row in FEEDBACK_INDEX.search(match, per_page + 1, offset)
+        ]
+        by_id = queryset.in_bulk(feedback_ids)
+        feedbacks = [by_id[pk] for pk in feedback_ids if pk in by_id]
+    else:
+        feedbacks = list(
+            queryset.filter(Feedback__icontains=query).order_by("-FeedbackID")[
+                offset : offset + per_page + 1
+            ]
+        )
+
+    results = [
+        (feedback, highlight_snippet(feedback.Feedback, query, SNIPPET_WIDTH))
+        for feedback in feedbacks
+    ]
+    return _page_result(results, page, per_page)
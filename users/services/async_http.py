@@ -0,0 +1,80 @@
+# users/services/async_http.py
+
+"""
+评分接口共用的异步 HTTP 客户端（httpx.AsyncClient）。
+客户端按事件循环各建一个：在 ASGI 服务器中每个进程只有一个事件循环，进程内所有异步评分请求共用同一个连接池，
+可以同时保持数百个请求而不需要为每个请求占用一个线程。
+同步代码（WSGI、管理命令）经 async_to_sync 调用时每次调用有自己的临时事件循环，客户端不会随事件循环关闭，
+这类调用须用 async_http_scope(long_lived=False) 包住，结束时关闭客户端并释放连接。
+连接数上限和超时见 settings.JUDGE。
+httpx 只在调用异步评分时才导入，未安装时其余功能（包括同步评分）照常可用。
+"""
+
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+
+ASYNC_HTTP_DEFAULTS = {
+    "MAX_CONNECTIONS": 200,  # 同时打开的连接数上限
+    "MAX_KEEPALIVE": 50,  # 保持的空闲连接数上限
+    "TIMEOUT": 120,  # 单位：秒
+}
+
+_clients = weakref.WeakKeyDictionary()  # 事件循环 -> httpx.AsyncClient
+
+
+class AsyncHTTPClientError(Exception):
+    pass
+
+
+def _httpx():
+    try:
+        import httpx
+    except ImportError:
+        raise AsyncHTTPClientError("服务器未安装 httpx，无法并发调用评分接口。")
+    return httpx
+
+
+def async_http_settings():
+    judge = getattr(settings, "JUDGE", {})
+    return {key: judge.get(key, value) for key, value in ASYNC_HTTP_DEFAULTS.items()}
+
+
+def async_http_client():
+    # 返回当前事件循环的共享客户端，须在协程中调用；未安装 httpx 时抛出 AsyncHTTPClientError
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        httpx = _httpx()
+        config = async_http_settings()
+        client = _clients[loop] = httpx.AsyncClient(
+            timeout=config["TIMEOUT"],
+            limits=httpx.Limits(
+                max_connections=config["MAX_CONNECTIONS"],
+                max_keepalive_connections=config["MAX_KEEPALIVE"],
+            ),
+        )
+    return client
+
+
+async def close_async_http_client():
+    # 关闭当前事件循环的共享客户端（ASGI 服务器关闭或测试结束时调用）
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+@asynccontextmanager
+async def async_http_scope(long_lived):
+    """
+    包住一次使用共享客户端的处理过程（如一个批量评分请求）。
+    long_lived 为 False 表示当前事件循环是临时的（WSGI 下异步视图由 async_to_sync 运行），退出时关闭其客户端；
+    ASGI 服务器的事件循环长期存在，客户端留给之后的请求复用。
+    """
+    try:
+        yield
+    finally:
+        if not long_lived:
+            await close_async_http_client()
@@ -0,0 +1,326 @@
+# users/services/audit.py
+
+"""
+操作日志（OperationLog）的异步批量写入。
+视图调用 log_operation() 记录管理员操作：日志在业务事务提交后才放入内存缓冲区
+（事务回滚时不会记录），由后台线程攒批后用 bulk_create 写入，管理员请求不再等待日志写入。
+缓冲区有上限，写满时退回为在当前线程同步写入。数据库暂时不可用（如 SQLite 被锁）时重试，
+多次重试仍失败的日志内容记录到错误日志中；进程正常退出时等待后台线程写完已取出的批次和缓冲区中的日志。
+进程被强制结束（如 SIGKILL）时，缓冲区中尚未写入的日志会丢失，需要保证不丢失时可设置 ASYNC=False 同步写入。
+修改前后的内容通过 changes 参数传入，由后台线程生成紧凑的差异描述，
+较长的文本（如试题 Prompt）只记录改动的片段，而不是完整的新旧全文。
+"""
+
+import atexit
+import difflib
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()  # 放入缓冲区，通知后台线程退出
+
+AUDIT_LOG_DEFAULTS = {
+    "ASYNC": True,  # False 时在事务提交后同步写入（测试或单次运行的管理命令）
+    "BUFFER_SIZE": 10000,  # 内存缓冲区最多容纳的日志条数
+    "BATCH_SIZE": 200,  # 每次 bulk_create 写入的最大条数
+    "FLUSH_INTERVAL": 1.0,  # 攒批的最长等待时间，单位：秒
+    "DIFF_THRESHOLD": 200,  # 新旧内容总长度超过该值时只记录差异
+    "SHUTDOWN_TIMEOUT": 10,  # 进程退出时等待后台线程写完日志的最长时间，单位：秒
+}
+WRITE_RETRIES = 3  # 数据库暂时不可用时的写入次数
+RETRY_DELAY = 0.5  # 第 n 次重试前等待 n * RETRY_DELAY 秒
+
+DIFF_CONTEXT = 15  # 单行文本差异两侧保留的上下文字符数
+
+
+def audit_settings():
+    return {**AUDIT_LOG_DEFAULTS, **getattr(settings, "AUDIT_LOG", {})}
+
+
+# =====================
+# 差异描述
+# =====================
+
+
+def _clip(text, keep_start):
+    # 截取上下文：keep_start 为 True 时保留开头，否则保留结尾
+    if len(text) <= DIFF_CONTEXT:
+        return text
+    return text[:DIFF_CONTEXT] + "…" if keep_start else "…" + text[-DIFF_CONTEXT:]
+
+
+def compact_diff(old, new):
+    """
+    生成紧凑的差异描述。
+    多行文本按行输出 unified diff（每处改动保留一行上下文）；
+    单行文本按字符比较，删除的内容记为 [-...-]，新增的内容记为 {+...+}。
+    """
+    old, new = old or "", new or ""
+    old_lines, new_lines = old.splitlines(), new.splitlines()
+    if len(old_lines) > 2 or len(new_lines) > 2:
+        lines = difflib.unified_diff(old_lines, new_lines, n=1, lineterm="")
+        return "\n".join(line for line in lines if not line.startswith(("---", "+++")))
+
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    opcodes = matcher.get_opcodes()
+    parts = []
+    for index, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == "equal":
+            text = old[i1:i2]
+            if index == 0:
+                parts.append(_clip(text, keep_start=False))
+            elif index == len(opcodes) - 1:
+                parts.append(_clip(text, keep_start=True))
+            elif len(text) > 2 * DIFF_CONTEXT:
+                parts.append(text[:DIFF_CONTEXT] + "…" + text[-DIFF_CONTEXT:])
+            else:
+                parts.append(text)
+            continue
+        if i2 > i1:
+            parts.append(f"[-{old[i1:i2]}-]")
+        if j2 > j1:
+            parts.append(f"{{+{new[j1:j2]}+}}")
+    return "".join(parts)
+
+
+def format_changes(changes):
+    """
+    将 {字段名: (旧值, 新值)} 格式化为描述文本，只包含发生变化的字段。
+    """
+    threshold = audit_settings()["DIFF_THRESHOLD"]
+    lines = []
+    for field, (old, new) in changes.items():
+        old = "" if old is None else str(old)
+        new = "" if new is None else str(new)
+        if old == new:
+            continue
+        if len(old) + len(new) <= threshold:
+            lines.append(f'{field}："{old}" -> "{new}"')
+        else:
+            lines.append(f"{field}（差异）：\n{compact_diff(old, new)}")
+    return "\n".join(lines) if lines else "无字段变化"
+
+
+# =====================
+# 批量写入
+# =====================
+
+
+def _build_log(entry):
+    from ..models import OperationLog
+
+    details = entry["details"]
+    if entry["changes"] is not None:
+        details = f"{details}\n{format_changes(entry['changes'])}"
+    return OperationLog(
+        AdminID_id=entry["admin_id"],
+        Operation=entry["operation"],
+        Details=details,
+        Timestamp=entry["timestamp"],
+    )
+
+
+def write_logs(entries):
+    """
+    写入一批日志，返回因数据库暂时不可用（如 SQLite 被锁）未能写入的日志，由调用方重试。
+    """
+    from ..models import OperationLog
+
+    if not entries:
+        return []
+    logs = [_build_log(entry) for entry in entries]
+    try:
+        with transaction.atomic():
+            OperationLog.objects.bulk_create(
+                logs, batch_size=audit_settings()["BATCH_SIZE"]
+            )
+        return []
+    except OperationalError:
+        return list(entries)
+    except Exception:
+        # 整批失败（例如某条日志的管理员已被删除）时逐条写入，尽量保留其余日志
+        failed = []
+        for entry, log in zip(entries, logs):
+            log.pk = None
+            try:
+                log.save()
+            except OperationalError:
+                failed.append(entry)
+            except Exception:
+                logger.exception("写入操作日志失败：%s", log.Operation)
+        return failed
+
+
+def write_logs_with_retry(entries):
+    # 数据库暂时不可用时按递增间隔重试；仍未写入的日志内容记录到错误日志中，以便人工补录
+    for attempt in range(1, WRITE_RETRIES + 1):
+        entries = write_logs(entries)
+        if not entries:
+            return
+        if attempt < WRITE_RETRIES:
+            time.sleep(RETRY_DELAY * attempt)
+    logger.error(
+        "操作日志写入失败，%d 条未写入",
+        len(entries),
+        extra={
+            "unwritten_logs": [
+                {
+                    "admin_id": entry["admin_id"],
+                    "operation": entry["operation"],
+                    "details": entry["details"],
+                    "timestamp": entry["timestamp"].isoformat(),
+                }
+                for entry in entries
+            ]
+        },
+    )
+
+
+class AuditLogger:
+    """
+    带上限的内存缓冲区 + 后台写入线程。
+    后台线程在首次记录日志时启动；进程 fork 后会在子进程中重新创建。
+    同一时间只有一个线程写入（_write_lock）：flush() 会等待后台线程写完已取出的批次；
+    进程退出时 shutdown() 通知后台线程写完剩余日志后退出，并等待其结束。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            config = audit_settings()
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=config["BUFFER_SIZE"])
+                self._write_lock = threading.Lock()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="audit-log-writer", daemon=True
+            )
+            self._thread.start()
+
+    def enqueue(self, entry):
+        if not audit_settings()["ASYNC"]:
+            write_logs_with_retry([entry])
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            # 缓冲区已满说明写入跟不上，退回同步写入以形成背压
+            write_logs_with_retry([entry])
+
+    def _take_batch(self, batch_size, flush_interval):
+        # 返回 (日志列表, 是否收到退出通知)
+        item = self._queue.get()  # 阻塞等待第一条
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + flush_interval
+        while len(batch) < batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            config = audit_settings()
+            batch, stop = self._take_batch(
+                config["BATCH_SIZE"], config["FLUSH_INTERVAL"]
+            )
+            close_old_connections()
+            try:
+                with self._write_lock:
+                    write_logs_with_retry(batch)
+            except Exception:
+                logger.exception("批量写入操作日志失败，%d 条未写入", len(batch))
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """
+        立即在当前线程写入缓冲区中的全部日志，并等待后台线程写完已取出的批次（查看日志页面时调用）。
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return
+        entries = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:  # 退出通知已被取出，后台线程不会再处理之后的日志
+                self._queue.task_done()
+                continue
+            entries.append(entry)
+        try:
+            with self._write_lock:
+                write_logs_with_retry(entries)
+        finally:
+            for _ in entries:
+                self._queue.task_done()
+
+    def shutdown(self, timeout=None):
+        """
+        进程退出时调用：通知后台线程写完已取出的批次和缓冲区中的日志后退出，最多等待 timeout 秒，
+        之后在当前线程写入仍留在缓冲区中的日志。
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return
+        timeout = audit_settings()["SHUTDOWN_TIMEOUT"] if timeout is None else timeout
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.error("操作日志后台线程未能在 %s 秒内写完", timeout)
+        self.flush()
+
+
+AUDIT_LOGGER = AuditLogger()
+atexit.register(AUDIT_LOGGER.shutdown)
+
+
+def log_operation(admin_id, operation, details="", changes=None):
+    """
+    记录一条管理员操作日志。
+    changes 为 {字段名: (旧值, 新值)}，只记录变化的字段，较长的内容记录为差异。
+    在事务中调用时，日志在事务提交后才进入缓冲区。
+    """
+    entry = {
+        "admin_id": admin_id,
+        "operation": operation,
+        "details": details,
+        "changes": changes,
+        "timestamp": timezone.now(),
+    }
+    transaction.on_commit(lambda: AUDIT_LOGGER.enqueue(entry))
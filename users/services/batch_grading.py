@@ -0,0 +1,232 @@
+# users/services/batch_grading.py
+
+"""
+智能批量评分（batch_ai_grade 视图）。分三步进行，调用评分接口期间不占用数据库事务：
+1. prepare_batch（同步）：读取答案；空白答案、本地预评分已判定的答案直接得出结果，其余答案生成 Prompt
+2. grade_batch（异步）：并发调用评分接口（judge_answer_async），同时进行的调用数不超过 JUDGE["CONCURRENCY"]；
+   同一近似答案簇内的答案依次处理，簇内有一份评分成功后，其余答案沿用该结果，不再调用评分接口
+3. save_batch（同步）：在一个事务中写入全部评分记录
+评分进度保存在缓存中（键为教师 ID + 批次 ID，批次 ID 由前端生成，其他教师使用相同的 ID 也不会覆盖），
+评分请求进行期间前端可以轮询或订阅进度；
+缓存后端为进程内存（默认的 LocMemCache）时，只有处理评分请求的进程能读到进度。
+"""
+
+import asyncio
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from ..structured_logging import log_context, new_id
+from .judge import judge_answer_async
+
+BATCH_GRADING_DEFAULTS = {
+    "CONCURRENCY": 16,  # 一个批次中同时进行的评分接口调用数
+}
+PROGRESS_TIMEOUT = 3600  # 进度在缓存中的保存时间，单位：秒
+PROGRESS_INTERVAL = 0.5  # 评分进行中写入进度的最小间隔，单位：秒
+PROGRESS_EVENTS_INTERVAL = 1  # 进度推送（Server-Sent Events）检查进度的间隔，单位：秒
+PROGRESS_EVENTS_TIMEOUT = 600  # 进度推送的最长时间，单位：秒
+_JOB_ID_RE = re.compile(r"^[\w-]{1,64}$")
+
+logger = logging.getLogger(__name__)
+
+
+def batch_grading_settings():
+    judge = getattr(settings, "JUDGE", {})
+    return {key: judge.get(key, value) for key, value in BATCH_GRADING_DEFAULTS.items()}
+
+
+def job_id_from(value):
+    # 沿用前端生成的批次 ID（评分请求返回前即可查询进度），格式不合法时重新生成
+    return value if value and _JOB_ID_RE.match(value) else new_id()
+
+
+def progress_cache_key(teacher_id, job_id):
+    return f"grading_job:{teacher_id}:{job_id}"
+
+
+class BatchItem:
+    """
+    批次中的一份答案。key 为前端提交的答案 ID（字符串），结果按它返回。
+    """
+
+    def __init__(self, key, answer=None):
+        self.key = key
+        self.answer = answer
+        self.content = ""
+        self.prompt = None  # 需要调用评分接口时的 Prompt
+        self.cluster = None  # 近似答案簇 ID
+        self.feedback = None  # (分数, 反馈)，由 save_batch 写入 ScoringFeedback
+        self.result = None  # {"status": ..., "message": ...}
+
+    def resolve(self, status, message, feedback=None):
+        self.result = {"status": status, "message": message}
+        if feedback is not None:
+            self.feedback = feedback
+
+
+class GradingProgress:
+    """
+    批次的评分进度，保存在缓存中：
+    {"job_id", "teacher_id", "question_id", "state": running/finished, "total", "done", "succeeded", "failed"}
+    """
+
+    def __init__(self, job_id, teacher_id, question_id, items):
+        self.data = {
+            "job_id": job_id,
+            "teacher_id": teacher_id,
+            "question_id": question_id,
+            "state": "running",
+            "total": len(items),
+            "done": 0,
+            "succeeded": 0,
+            "failed": 0,
+        }
+        for item in items:
+            if item.result is not None:
+                self._count(item)
+        self._saved = 0.0
+
+    def _count(self, item):
+        self.data["done"] += 1
+        if item.result["status"] == "success":
+            self.data["succeeded"] += 1
+        else:
+            self.data["failed"] += 1
+
+    async def save(self, force=False):
+        now = time.monotonic()
+        if force or now - self._saved >= PROGRESS_INTERVAL:
+            self._saved = now
+            await cache.aset(
+                progress_cache_key(self.data["teacher_id"], self.data["job_id"]),
+                dict(self.data),
+                PROGRESS_TIMEOUT,
+            )
+
+    async def advance(self, item):
+        self._count(item)
+        await self.save()
+
+    async def finish(self):
+        self.data["state"] = "finished"
+        await self.save(force=True)
+
+
+async def get_progress(teacher_id, job_id):
+    # 只能读到该教师自己的批次，其他教师的批次视为不存在
+    return await cache.aget(progress_cache_key(teacher_id, job_id))
+
+
+def prepare_batch(question, answer_keys, prompt_for, prescore_for):
+    """
+    读取所选答案并完成不需要调用评分接口的部分，返回 [BatchItem, ...]（与 answer_keys 顺序相同）。
+    prompt_for(答案内容, 预评分结果) 生成评分 Prompt；prescore_for(答案内容) 返回本地预评分结果，
+    结果为 (预评分, 是否直接采用)，未启用时为 (None, False)。
+    """
+    from ..models import StudentAnswer
+    from .near_duplicates import answer_clusters
+
+    answer_ids = [int(key) for key in answer_keys if str(key).isdigit()]
+    answers = {
+        str(answer.AnswerID): answer
+        for answer in StudentAnswer.objects.filter(
+            QuestionID=question, AnswerID__in=answer_ids
+        )
+    }
+    clusters = answer_clusters(question.QuestionID)
+
+    items = []
+    for key in answer_keys:
+        item = BatchItem(key, answers.get(str(key)))
+        items.append(item)
+        if item.answer is None:
+            item.resolve("error", "答案不存在。")
+            continue
+        item.content = item.answer.Content or ""
+        if not item.content:
+            # 答案内容为空或无法读取
+            item.resolve("error", "无法读取答案内容。", (0, "无法读取答案内容。"))
+            continue
+        # 本地关键词预评分：空白答案直接判定，离题/完整答案按配置跳过大模型
+        prescore, decided = prescore_for(item.content)
+        if decided:
+            item.resolve("success", prescore.reason, (prescore.score, prescore.reason))
+            continue
+        item.prompt = prompt_for(item.content, prescore)
+        cluster = clusters.get(item.answer.AnswerID)
+        item.cluster = cluster[0] if cluster else None
+    return items
+
+
+async def grade_batch(api_key, items, progress):
+    # 并发调用评分接口，结果写入各 BatchItem
+    semaphore = asyncio.Semaphore(max(1, batch_grading_settings()["CONCURRENCY"]))
+    groups = {}
+    for index, item in enumerate(items):
+        if item.result is None:
+            group = ("cluster", item.cluster) if item.cluster is not None else index
+            groups.setdefault(group, []).append(item)
+
+    async def grade_one(item):
+        try:
+            with log_context(answer_id=item.answer.AnswerID):
+                async with semaphore:
+                    judge_result = await judge_answer_async(api_key, item.content, item.prompt)
+        except Exception:  # 记录异常
+            logger.exception("AI评分出错", extra={"answer_id": item.answer.AnswerID})
+            item.resolve("error", "AI评分过程中发生错误。", (0, "AI评分过程中发生错误。"))
+            return None
+        if judge_result.get("score") is not None:
+            item.resolve(
+                "success", "评分完成。", (judge_result["score"], judge_result["reason"])
+            )
+            return judge_result
+        # API 调用失败
+        item.resolve(
+            "error", "AI评分失败。", (0, judge_result.get("reason", "AI评分失败。"))
+        )
+        return None
+
+    async def grade_group(group_items):
+        # 同一簇内依次评分，有一份成功后其余答案沿用其结果
+        shared = None
+        for item in group_items:
+            if shared is not None:
+                judge_result, source_id = shared
+                item.resolve(
+                    "success",
+                    f"与答案 {source_id} 近似，沿用其评分。",
+                    (judge_result["score"], judge_result["reason"]),
+                )
+            else:
+                judge_result = await grade_one(item)
+                if judge_result is not None and item.cluster is not None:
+                    shared = (judge_result, item.answer.AnswerID)
+            await progress.advance(item)
+
+    await progress.save(force=True)
+    await asyncio.gather(*(grade_group(group_items) for group_items in groups.values()))
+
+
+def save_batch(items):
+    # 在一个事务中写入评分记录（未发布，IsFinal=False）
+    from ..models import ScoringFeedback
+
+    with transaction.atomic():
+        for item in items:
+            if item.feedback is None:
+                continue
+            score, feedback = item.feedback
+            ScoringFeedback.objects.create(
+                AnswerID=item.answer,
+                Score=score,
+                Feedback=feedback,
+                CreatedAt=timezone.now(),
+                IsFinal=False,
+            )
@@ -0,0 +1,105 @@
+# users/services/cjk.py
+
+"""
+面向中英文混合文本的分词。
+SQLite FTS5 自带的 unicode61 分词器会把连续的汉字当作一个词，无法按词检索中文；
+这里把连续汉字切分为单字和相邻双字（unigram + bigram），英文和数字按单词切分并转为小写，
+分词结果以空格连接后写入 FTS5 表，检索时用同样的规则构造查询。
+"""
+
+import re
+
+# 连续的汉字（含扩展A区和兼容区）或连续的字母数字
+TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9A-Za-z]+")
+
+
+def _is_cjk(run):
+    return not run[0].isascii()
+
+
+def index_tokens(text):
+    """
+    生成用于建立索引的词：每个汉字及每对相邻汉字，以及每个英文单词/数字。
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(text or ""):
+        if _is_cjk(run):
+            tokens.extend(run)
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def index_text(text):
+    return " ".join(index_tokens(text))
+
+
+def query_tokens(text):
+    """
+    生成用于检索的词：单个汉字按单字匹配，两个及以上的汉字按相邻双字匹配（要求全部出现）。
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(text or ""):
+        if not _is_cjk(run):
+            tokens.append(run.lower())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def build_match_query(text, prefix=False, column=None):
+    """
+    构造 FTS5 MATCH 表达式，所有词均需出现（AND）。
+    prefix=True 时最后一个词按前缀匹配，用于输入联想；column 限定只在某一列中检索。
+    没有可检索的词时返回 None。
+    """
+    tokens = query_tokens(text)
+    if not tokens:
+        return None
+    terms = ['"%s"' % token.replace('"', '""') for token in dict.fromkeys(tokens)]
+    if prefix:
+        terms[-1] += "*"
+    expression = " AND ".join(terms)
+    if column:
+        expression = f"{column} : ({expression})"
+    return expression
+
+
+def _highlight_pattern(query):
+    # 先匹配查询中的完整词，再匹配切分出的双字/单字，较长的词优先
+    terms = set(query_tokens(query))
+    terms.update(run.lower() if run.isascii() else run for run in TOKEN_RE.findall(query or ""))
+    if not terms:
+        return None
+    alternatives = sorted(terms, key=len, reverse=True)
+    return re.compile("|".join(re.escape(term) for term in alternatives), re.IGNORECASE)
+
+
+def highlight_snippet(text, query, width=120):
+    """
+    从原文中截取包含第一个命中词的片段，并用 <mark> 标出所有命中词，返回可直接输出的 HTML。
+    索引表中保存的是分词后的文本，无法使用 FTS5 的 snippet()，因此在原文上重新定位。
+    """
+    from django.utils.html import escape
+    from django.utils.safestring import mark_safe
+
+    text = text or ""
+    pattern = _highlight_pattern(query)
+    first = pattern.search(text) if pattern else None
+    start = max(0, first.start() - width // 3) if first else 0
+    end = min(len(text), start + width)
+    fragment = text[start:end]
+
+    parts = ["…" if start > 0 else ""]
+    position = 0
+    if pattern:
+        for match in pattern.finditer(fragment):
+            parts.append(escape(fragment[position : match.start()]))
+            parts.append(f"<mark>{escape(match.group())}</mark>")
+            position = match.end()
+    parts.append(escape(fragment[position:]))
+    parts.append("…" if end < len(text) else "")
+    return mark_safe("".join(parts))
@@ -0,0 +1,111 @@
+# users/services/course_search.py
+
+"""
+课程检索。
+- 纯数字查询优先精确匹配课程ID（主键查询）
+- 课程名称和描述通过 FTS5 全文索引检索（中文按单字/双字切分），按 bm25 相关度排序并分页
+- 输入联想只检索课程名称，结果直接取自索引表并短时间缓存
+索引表不可用时（非 SQLite 数据库等）退回名称包含匹配。
+"""
+
+import hashlib
+
+from django.core.cache import cache
+
+from ..models import Course
+from .cjk import build_match_query, index_text
+from .fts import FTSIndex
+
+# title 保存原始课程名称（不参与检索），联想时无需再查询 Course 表
+COURSE_INDEX = FTSIndex(
+    "course_fts", ["name", "description"], unindexed=["title"], weights=[10.0, 1.0]
+)
+
+COURSE_SEARCH_PAGE_SIZE = 20
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_CACHE_TIMEOUT = 60  # 单位：秒
+
+
+def course_index_values(name, description):
+    return {
+        "name": index_text(name),
+        "description": index_text(description),
+        "title": name,
+    }
+
+
+def index_course(course):
+    COURSE_INDEX.upsert(
+        course.CourseID, course_index_values(course.Name, course.Description)
+    )
+
+
+def unindex_course(course_id):
+    COURSE_INDEX.delete(course_id)
+
+
+def search_courses(query, page=1, per_page=COURSE_SEARCH_PAGE_SIZE):
+    """
+    返回 {"courses": [...], "page": 页码, "has_next": 是否有下一页}。
+    通过多取一条判断是否有下一页，不执行 COUNT 查询。
+    """
+    query = (query or "").strip()
+    page = max(1, page)
+    courses = []
+
+    # 课程ID精确匹配，放在第一页最前面
+    exact = None
+    if query.isdigit():
+        exact = (
+            Course.objects.select_related("TeacherID").filter(CourseID=int(query)).first()
+        )
+        if exact and page == 1:
+            courses.append(exact)
+
+    match = build_match_query(query)
+    if match is None:
+        return {"courses": courses, "page": page, "has_next": False}
+
+    offset = (page - 1) * per_page
+    if COURSE_INDEX.available():
+        course_ids = [
+            row[0] for row in COURSE_INDEX.search(match, per_page + 1, offset)
+        ]
+        by_id = Course.objects.select_related("TeacherID").in_bulk(course_ids)
+        ranked = [by_id[course_id] for course_id in course_ids if course_id in by_id]
+    else:
+        ranked = list(
+            Course.objects.select_related("TeacherID")
+            .filter(Name__icontains=query)
+            .order_by("CourseID")[offset : offset + per_page + 1]
+        )
+
+    has_next = len(ranked) > per_page
+    courses.extend(
+        course for course in ranked[:per_page] if exact is None or course != exact
+    )
+    return {"courses": courses, "page": page, "has_next": has_next}
+
+
+def autocomplete_courses(prefix, limit=AUTOCOMPLETE_LIMIT):
+    """
+    课程名称联想，返回 [{"id": 课程ID, "name": 课程名称}, ...]。
+    """
+    prefix = (prefix or "").strip()
+    match = build_match_query(prefix, prefix=True, column="name")
+    if match is None:
+        return []
+
+    digest = hashlib.md5(f"{prefix}:{limit}".encode()).hexdigest()
+    key = f"course-autocomplete:{digest}"
+    results = cache.get(key)
+    if results is None:
+        if COURSE_INDEX.available():
+            rows = COURSE_INDEX.search(match, limit, select=["title"])
+        else:
+            rows = Course.objects.filter(Name__icontains=prefix).values_list(
+                "CourseID", "Name"
+            )[:limit]
+        results = [{"id": course_id, "name": name} for course_id, name in rows]
+        cache.set(key, results, AUTOCOMPLETE_CACHE_TIMEOUT)
+    return results
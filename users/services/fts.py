@@ -0,0 +1,124 @@
+# users/services/fts.py
+
+"""
+SQLite FTS5 全文索引的通用封装。
+索引表是独立于 Django 模型的虚拟表，rowid 与被索引记录的主键一致，
+由信号处理函数在记录保存/删除时同步；非 SQLite 数据库或 SQLite 未编译 FTS5 时 available() 返回 False，
+调用方应退回普通查询。
+"""
+
+from django.db import connection
+
+
+def fts5_available(using=connection):
+    # SQLite 是否编译了 FTS5 扩展（供迁移在建表前判断）
+    if using.vendor != "sqlite":
+        return False
+    with using.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return "ENABLE_FTS5" in {row[0] for row in cursor.fetchall()}
+
+
+class FTSIndex:
+    def __init__(self, table, columns, unindexed=(), weights=None):
+        """
+        table：虚拟表名
+        columns：参与全文检索的列
+        unindexed：只存储、不参与检索的列（可用于过滤或直接返回展示字段）
+        weights：bm25 排序时各检索列的权重，默认均为 1
+        """
+        self.table = table
+        self.columns = list(columns)
+        self.unindexed = list(unindexed)
+        self.weights = weights or [1.0] * len(self.columns)
+        self._available_aliases = set()
+
+    @property
+    def all_columns(self):
+        return self.columns + self.unindexed
+
+    def create_sql(self):
+        columns = self.columns + [f"{name} UNINDEXED" for name in self.unindexed]
+        return (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            f"USING fts5({', '.join(columns)}, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def drop_sql(self):
+        return f"DROP TABLE IF EXISTS {self.table}"
+
+    def available(self, using=connection):
+        if using.alias in self._available_aliases:
+            return True
+        if using.vendor != "sqlite":
+            return False
+        if self.table in using.introspection.table_names():
+            self._available_aliases.add(using.alias)  # 只缓存存在的结果
+            return True
+        return False
+
+    def upsert(self, rowid, values, using=connection):
+        # FTS5 表没有唯一约束，先删除再插入
+        if not self.available(using):
+            return
+        columns = ", ".join(["rowid"] + self.all_columns)
+        placeholders = ", ".join(["%s"] * (len(self.all_columns) + 1))
+        with using.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [rowid])
+            cursor.execute(
+                f"INSERT INTO {self.table} ({columns}) VALUES ({placeholders})",
+                [rowid] + [values.get(name, "") for name in self.all_columns],
+            )
+
+    def bulk_insert(self, rows, using=connection):
+        # rows 为 (rowid, values) 的可迭代对象，用于初次建立索引或重建
+        columns = ", ".join(["rowid"] + self.all_columns)
+        placeholders = ", ".join(["%s"] * (len(self.all_columns) + 1))
+        with using.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} ({columns}) VALUES ({placeholders})",
+                [
+                    [rowid] + [values.get(name, "") for name in self.all_columns]
+                    for rowid, values in rows
+                ],
+            )
+
+    def delete(self, rowid, using=connection):
+        if not self.available(using):
+            return
+        with using.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [rowid])
+
+    def clear(self, using=connection):
+        with using.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(
+        self, match, limit, offset=0, filters=None, select=(), using=connection
+    ):
+        """
+        按 bm25 相关度排序返回 [(rowid, *select 中的列), ...]。
+        filters 为 {未索引列: 值}，用于在匹配结果中进一步过滤（如限定课程）；
+        值为列表/元组/集合时按 IN 过滤。
+        """
+        weights = ", ".join(str(weight) for weight in self.weights)
+        selected = ", ".join(["rowid"] + list(select))
+        where = [f"{self.table} MATCH %s"]
+        params = [match]
+        for column, value in (filters or {}).items():
+            if isinstance(value, (list, tuple, set, frozenset)):
+                values = list(value)
+                if not values:
+                    return []
+                where.append(f"{column} IN ({', '.join(['%s'] * len(values))})")
+                params.extend(values)
+            else:
+                where.append(f"{column} = %s")
+                params.append(value)
+        sql = (
+            f"SELECT {selected} FROM {self.table} WHERE {' AND '.join(where)} "
+            f"ORDER BY bm25({self.table}, {weights}) LIMIT %s OFFSET %s"
+        )
+        with using.cursor() as cursor:
+            cursor.execute(sql, params + [limit, offset])
+            return cursor.fetchall()
@@ -0,0 +1,170 @@
+# users/services/gradebook.py
+
+"""
+课程成绩册导出：每行一名学生，每列一道试题，单元格为最终评分。
+数据只用三次 values_list 查询读取（试题、选课学生、答案的最终评分快照 StudentAnswer.FinalScore），
+再用 NumPy 按学生ID/试题ID的下标一次性填入二维数组，不逐个加载答案和评分反馈对象。
+输出按行流式生成，CSV 直接流式返回；XLSX 由 openpyxl 的 write_only 模式写入临时文件后返回，
+内存占用只与成绩矩阵本身（学生数 × 试题数个浮点数）有关。
+"""
+
+import csv
+import tempfile
+from itertools import islice
+
+from ..models import Question, StudentAnswer, StudentCourse
+
+GRADEBOOK_FORMATS = ("csv", "xlsx")
+GRADEBOOK_FETCH_SIZE = 5000  # 每次从数据库读取的答案行数
+GRADEBOOK_ROW_BATCH = 200  # CSV 每次输出的行数
+
+
+class GradebookExportError(Exception):
+    pass
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise GradebookExportError("服务器未安装 numpy，无法导出成绩册。")
+    return numpy
+
+
+class Gradebook:
+    """
+    课程成绩矩阵。
+    scores[i, j] 为第 i 名学生在第 j 道试题上的最终评分，没有最终评分时为 NaN。
+    """
+
+    def __init__(self, students, questions, scores):
+        self.students = students  # [(学生ID, 姓名, 邮箱), ...]
+        self.questions = questions  # [(试题ID, 标题), ...]
+        self.scores = scores
+
+    def header(self):
+        titles = [f"{title}（{question_id}）" for question_id, title in self.questions]
+        return ["学生ID", "姓名", "邮箱"] + titles + ["已评分题数", "总分"]
+
+    def rows(self):
+        """
+        逐行生成表格数据（不含表头），最后一行为各题平均分。
+        空单元格为 None。
+        """
+        np = _numpy()
+        graded = ~np.isnan(self.scores)
+        graded_counts = graded.sum(axis=1)
+        totals = np.where(graded, self.scores, 0).sum(axis=1)
+        # 分批把数组转换为 Python 列表，避免逐个读取 numpy 标量
+        for start in range(0, len(self.students), GRADEBOOK_ROW_BATCH):
+            stop = start + GRADEBOOK_ROW_BATCH
+            block = self.scores[start:stop].tolist()
+            for offset, cells in enumerate(block):
+                i = start + offset
+                student_id, name, email = self.students[i]
+                cells = [None if cell != cell else cell for cell in cells]  # NaN != NaN
+                yield [student_id, name, email or ""] + cells + [
+                    int(graded_counts[i]),
+                    float(totals[i]),
+                ]
+
+        column_counts = graded.sum(axis=0)
+        column_sums = np.where(graded, self.scores, 0).sum(axis=0)
+        means = [
+            round(total / count, 2) if count else None
+            for total, count in zip(column_sums.tolist(), column_counts.tolist())
+        ]
+        yield ["", "平均分", ""] + means + ["", ""]
+
+
+def load_gradebook(course):
+    np = _numpy()
+
+    questions = list(
+        Question.objects.filter(CourseID=course)
+        .order_by("CreatedAt", "QuestionID")
+        .values_list("QuestionID", "Title")
+    )
+    students = list(
+        StudentCourse.objects.filter(CourseID=course)
+        .order_by("StudentID_id")
+        .values_list("StudentID_id", "StudentID__Name", "StudentID__Email")
+    )
+
+    scores = np.full((len(students), len(questions)), np.nan)
+    if not students or not questions:
+        return Gradebook(students, questions, scores)
+
+    # 学生ID已排序，可直接二分查找行号；试题按创建时间排序，先求出按ID排序的下标映射
+    student_ids = np.fromiter((row[0] for row in students), dtype=np.int64)
+    question_ids = np.fromiter((row[0] for row in questions), dtype=np.int64)
+    question_order = np.argsort(question_ids)
+    sorted_question_ids = question_ids[question_order]
+
+    answers = (
+        StudentAnswer.objects.filter(
+            QuestionID__CourseID=course, FinalScore__isnull=False
+        )
+        .values_list("StudentID_id", "QuestionID_id", "FinalScore")
+        .iterator(chunk_size=GRADEBOOK_FETCH_SIZE)
+    )
+    while True:
+        chunk = list(islice(answers, GRADEBOOK_FETCH_SIZE))
+        if not chunk:
+            break
+        data = np.array(chunk, dtype=np.float64)
+        answer_students = data[:, 0].astype(np.int64)
+        answer_questions = data[:, 1].astype(np.int64)
+
+        rows = np.searchsorted(student_ids, answer_students)
+        rows = np.minimum(rows, len(student_ids) - 1)
+        cols = np.searchsorted(sorted_question_ids, answer_questions)
+        # 已退出课程的学生仍可能留有答案，不在名单中的行丢弃
+        keep = student_ids[rows] == answer_students
+        scores[rows[keep], question_order[cols[keep]]] = data[keep, 2]
+
+    return Gradebook(students, questions, scores)
+
+
+class _Echo:
+    # csv.writer 需要一个带 write 方法的对象，直接返回写入的内容以便流式输出
+    def write(self, value):
+        return value
+
+
+def iter_gradebook_csv(gradebook):
+    writer = csv.writer(_Echo())
+    yield "\ufeff"  # BOM，Excel 打开中文 CSV 时才能正确识别 UTF-8
+    yield writer.writerow(gradebook.header())
+    lines = []
+    for row in gradebook.rows():
+        lines.append(writer.writerow(["" if cell is None else cell for cell in row]))
+        if len(lines) >= GRADEBOOK_ROW_BATCH:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def write_gradebook_xlsx(gradebook):
+    """
+    写入 XLSX 临时文件并返回已定位到开头的文件对象（关闭后自动删除）。
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise GradebookExportError(
+            "服务器未安装 openpyxl，无法导出 xlsx 文件，请改用 csv 格式。"
+        )
+
+    # write_only 模式逐行写出，不在内存中保留单元格对象
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title="成绩册")
+    sheet.append(gradebook.header())
+    for row in gradebook.rows():
+        sheet.append(row)
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
@@ -0,0 +1,54 @@
+# users/services/grading.py
+
+"""
+批量确认评分：把同一份评分与反馈作为最终评价发布到多个答案
+（近似重复答案的簇、按得分点分组的答案等）。
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import ScoringFeedback, StudentAnswer
+
+
+def confirm_grades(answer_ids, score, feedback, overwrite=False):
+    """
+    为答案发布最终评分并更新确认时间，返回确认的答案数。
+    默认跳过已有最终评分的答案；overwrite=True 时改写已有的最终评分（每个答案只保留一条最终评分），
+    没有最终评分的答案新建一条，AI 评分记录保持不变。
+    """
+    answers = StudentAnswer.objects.filter(AnswerID__in=list(answer_ids))
+    if not overwrite:
+        answers = answers.filter(FinalScore__isnull=True)
+    target_ids = list(answers.values_list("AnswerID", flat=True))
+
+    now = timezone.now()
+    with transaction.atomic():
+        finals, duplicate_ids = {}, []
+        for final in ScoringFeedback.objects.filter(
+            AnswerID_id__in=target_ids, IsFinal=True
+        ).order_by("AnswerID", "-CreatedAt", "-FeedbackID"):
+            if final.AnswerID_id in finals:
+                duplicate_ids.append(final.FeedbackID)
+            else:
+                finals[final.AnswerID_id] = final
+        if duplicate_ids:
+            # 重复的最终评分只保留最新一条
+            ScoringFeedback.objects.filter(FeedbackID__in=duplicate_ids).delete()
+
+        for answer_id in target_ids:
+            # 逐条保存以触发评分统计和全文索引的信号
+            final = finals.get(answer_id)
+            if final is None:
+                ScoringFeedback.objects.create(
+                    AnswerID_id=answer_id,
+                    Score=score,
+                    Feedback=feedback,
+                    CreatedAt=now,
+                    IsFinal=True,
+                )
+            else:
+                final.Score, final.Feedback, final.CreatedAt = score, feedback, now
+                final.save(update_fields=["Score", "Feedback", "CreatedAt"])
+        StudentAnswer.objects.filter(AnswerID__in=target_ids).update(ConfirmedAt=now)
+    return len(target_ids)
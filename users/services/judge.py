@@ -0,0 +1,238 @@
+# users/services/judge.py
+
+"""
+按 API Key 的模型名称选择评分接口。
+各接口的签名相同：(答案内容, Prompt, API Key, 模型版本) -> {"score": 分数或 None, "reason": 说明}，
+OpenAI 兼容接口（ROUTED_PROVIDERS）另接收 endpoint 参数，即本次请求使用的接口地址。
+返回值可以附带 "usage"（prompt_tokens/completion_tokens/total_tokens）和
+"meta"（status_code：HTTP 状态码，连接失败为 0；ttfb：首字节时间，单位秒；parse_error：返回内容无法解析）。
+judge_answer 负责：
+- 为 OpenAI 兼容接口选择接口地址（见 users/services/judge_endpoints.py）
+- 遇到限流、网关错误或连接失败（RETRY_STATUSES）时按 JUDGE["MAX_RETRIES"] 重试：还有其他地址时立即换用，
+  否则等待后重试，间隔按 RETRY_BACKOFF 指数增长
+- 记录调用统计（见 users/services/provider_telemetry.py）和结构化日志（见 users/structured_logging.py）
+usage 和 meta 不返回给调用方。
+judge_answer_async 是异步版本：各接口的异步实现见 ASYNC_JUDGE_PROVIDERS，OpenAI 兼容接口使用共享的异步 HTTP 客户端
+（见 users/services/async_http.py），可以在一个事件循环中同时发出大量评分请求。
+"""
+
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+from .judge_endpoints import ROUTED_PROVIDERS, choose_endpoint, endpoints_for
+from .judge_gpt import get_judge_from_gpt, get_judge_from_gpt_async
+from .judge_mock import get_judge_from_mock, get_judge_from_mock_async, mock_settings
+from .judge_qwen import get_judge_from_qwen, get_judge_from_qwen_async
+from .provider_telemetry import PROVIDER_TELEMETRY
+
+# 模型名称前缀 -> 评分接口
+JUDGE_PROVIDERS = {
+    "gpt": get_judge_from_gpt,
+    "openai": get_judge_from_gpt,  # 其他 OpenAI 兼容服务，须配置接口地址
+    "qwen": get_judge_from_qwen,
+    "mock": get_judge_from_mock,
+}
+# 异步版本（judge_answer_async 使用），键与 JUDGE_PROVIDERS 相同
+ASYNC_JUDGE_PROVIDERS = {
+    "gpt": get_judge_from_gpt_async,
+    "openai": get_judge_from_gpt_async,
+    "qwen": get_judge_from_qwen_async,
+    "mock": get_judge_from_mock_async,
+}
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+JUDGE_DEFAULTS = {
+    "MAX_RETRIES": 2,  # 可重试错误的最大重试次数
+    "RETRY_BACKOFF": 1.0,  # 第一次重试前的等待时间，之后每次翻倍，单位：秒
+}
+# 限流、网关错误和连接失败（0）通常是暂时的，可以重试；其余错误重试也不会成功
+RETRY_STATUSES = {0, 429, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+def judge_settings():
+    return {**JUDGE_DEFAULTS, **getattr(settings, "JUDGE", {})}
+
+
+def provider_name(model):
+    # 返回模型名称对应的接口名（JUDGE_PROVIDERS 的键），不支持的模型返回 None
+    model = (model or "").lower()
+    for prefix in JUDGE_PROVIDERS:
+        if model.startswith(prefix):
+            if prefix == "mock" and not mock_settings()["ENABLED"]:
+                return None
+            return prefix
+    return None
+
+
+def judge_provider(model):
+    # 返回模型名称对应的评分接口，不支持的模型返回 None
+    name = provider_name(model)
+    return JUDGE_PROVIDERS[name] if name else None
+
+
+class _JudgeCall:
+    """
+    一次评分（含重试）的状态：选择接口地址、判断是否重试、记录调用统计和日志。
+    judge_answer 和 judge_answer_async 共用，两者只在调用接口和等待的方式上不同。
+    """
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.name = provider_name(api_key.Model)
+        self.error = None
+        if self.name is None:
+            logger.warning("不支持的评分模型", extra={"model": api_key.Model})
+            self.error = {"score": None, "reason": "无效的大模型选择(仅支持GPT和Qwen)"}
+            return
+        self.config = judge_settings()
+        self.fields = {"provider": self.name, "model": api_key.Version, "key_id": api_key.KeyID}
+        self.endpoints = (
+            endpoints_for(self.name, api_key) if self.name in ROUTED_PROVIDERS else None
+        )
+        if self.endpoints == []:
+            logger.warning("未配置评分接口地址", extra=self.fields)
+            self.error = {"score": None, "reason": "AI评分失败：未配置评分接口地址。"}
+        self.failed_endpoints = set()
+        self.retries = 0
+        self.start = time.perf_counter()
+
+    def begin_attempt(self):
+        # 返回本次请求传给评分接口的关键字参数
+        self.endpoint = (
+            choose_endpoint(self.endpoints, self.failed_endpoints) if self.endpoints else None
+        )
+        self.attempt_start = time.perf_counter()
+        if self.endpoint:
+            self.fields["endpoint"] = self.endpoint.name
+            return {"endpoint": self.endpoint}
+        return {}
+
+    def attempt_raised(self):
+        # 评分接口抛出异常（由调用方继续抛出）
+        latency = time.perf_counter() - self.start
+        if self.endpoint:
+            PROVIDER_TELEMETRY.record_endpoint(
+                self.endpoint.name,
+                self.name,
+                time.perf_counter() - self.attempt_start,
+                0,
+                failed=True,
+            )
+        PROVIDER_TELEMETRY.record(
+            self.api_key.KeyID,
+            self.name,
+            self.api_key.Version,
+            latency,
+            0,
+            retries=self.retries,
+            failed=True,
+        )
+        self.fields.update(latency_ms=round(latency * 1000, 1), retries=self.retries)
+        logger.exception("评分接口调用出错", extra=self.fields)
+
+    def retry_delay(self, result):
+        """
+        处理一次请求的结果。需要重试时返回重试前的等待时间（秒，换用其他地址时为 0），否则返回 None。
+        """
+        self.meta = result.pop("meta", None) or {}
+        self.status_code = self.meta.get("status_code", 200)
+        if self.endpoint:
+            PROVIDER_TELEMETRY.record_endpoint(
+                self.endpoint.name,
+                self.name,
+                time.perf_counter() - self.attempt_start,
+                self.status_code,
+                ttfb=self.meta.get("ttfb"),
+                failed=result.get("score") is None,
+            )
+        if (
+            result.get("score") is not None
+            or self.status_code not in RETRY_STATUSES
+            or self.retries >= self.config["MAX_RETRIES"]
+        ):
+            return None
+        logger.warning(
+            "评分接口暂时不可用，稍后重试",
+            extra={**self.fields, "status_code": self.status_code, "retry": self.retries + 1},
+        )
+        if self.endpoint:
+            self.failed_endpoints.add(self.endpoint.name)
+        delay = 0
+        if not self.endpoints or len(self.failed_endpoints) >= len(self.endpoints):
+            # 没有可换用的地址时等待后重试
+            delay = self.config["RETRY_BACKOFF"] * 2**self.retries
+        self.retries += 1
+        return delay
+
+    def finish(self, result):
+        latency = time.perf_counter() - self.start
+        usage = result.pop("usage", None) or {}
+        scored = result.get("score") is not None
+        PROVIDER_TELEMETRY.record(
+            self.api_key.KeyID,
+            self.name,
+            self.api_key.Version,
+            latency,
+            self.status_code,
+            ttfb=self.meta.get("ttfb"),
+            retries=self.retries,
+            parse_error=self.meta.get("parse_error", False),
+            failed=not scored,
+        )
+        self.fields.update((field, usage.get(field)) for field in USAGE_FIELDS)
+        self.fields.update(
+            latency_ms=round(latency * 1000, 1),
+            ttfb_ms=round(self.meta["ttfb"] * 1000, 1)
+            if self.meta.get("ttfb") is not None
+            else None,
+            status_code=self.status_code,
+            retries=self.retries,
+            scored=scored,
+        )
+        logger.info("评分接口调用完成", extra=self.fields)
+        return result
+
+
+def judge_answer(api_key, answer_content, prompt):
+    call = _JudgeCall(api_key)
+    if call.error:
+        return call.error
+    judge = JUDGE_PROVIDERS[call.name]
+    while True:
+        options = call.begin_attempt()
+        try:
+            result = judge(
+                answer_content, prompt, api_key.KeyValue, api_key.Version, **options
+            )
+        except Exception:
+            call.attempt_raised()
+            raise
+        delay = call.retry_delay(result)
+        if delay is None:
+            return call.finish(result)
+        time.sleep(delay)
+
+
+async def judge_answer_async(api_key, answer_content, prompt):
+    # judge_answer 的异步版本，等待评分接口时不占用线程
+    call = _JudgeCall(api_key)
+    if call.error:
+        return call.error
+    judge = ASYNC_JUDGE_PROVIDERS[call.name]
+    while True:
+        options = call.begin_attempt()
+        try:
+            result = await judge(
+                answer_content, prompt, api_key.KeyValue, api_key.Version, **options
+            )
+        except Exception:
+            call.attempt_raised()
+            raise
+        delay = call.retry_delay(result)
+        if delay is None:
+            return call.finish(result)
+        await asyncio.sleep(delay)
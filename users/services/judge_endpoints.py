@@ -0,0 +1,109 @@
+# users/services/judge_endpoints.py
+
+"""
+OpenAI 兼容评分接口（模型名称以 gpt、openai 开头）的接口地址和路由。
+接口地址的来源（优先级从高到低）：
+- API Key 的 Endpoint 字段：只使用这一个地址，便于为某个 Key 指定本地服务器（llama.cpp、vLLM 等）
+- settings.JUDGE["ENDPOINTS"][接口名]：可配置多个地址，每次调用按 WEIGHT 加权随机选择
+选择时参考 PROVIDER_TELEMETRY 中各地址最近的健康状况：异常（unhealthy）的地址不参与选择，
+较慢或偶有失败（degraded）的地址权重乘以 DEGRADED_WEIGHT_FACTOR。异常地址的统计在滚动窗口（METRICS["WINDOW"]）
+过期后清空，之后重新参与选择。WEIGHT 为 0 的地址是备用地址，只在其余地址都异常时使用。
+一次评分中遇到可重试的错误时换用其他地址（故障转移），见 users/services/judge.py。
+"""
+
+import random
+
+from django.conf import settings
+
+from .provider_telemetry import PROVIDER_TELEMETRY
+
+ENDPOINT_DEFAULTS = {
+    "NAME": "",  # 统计和日志中使用的名称，为空时使用完整地址
+    "BASE_URL": "",
+    "PATH": "/chat/completions",
+    "HEADERS": {},  # 额外的请求头
+    "WEIGHT": 1,
+    "DELAY": 0.5,  # 每次请求后的等待时间，避免触发第三方接口的限流，单位：秒
+}
+# settings.JUDGE["ENDPOINTS"] 中没有配置的接口使用这里的地址
+DEFAULT_ENDPOINTS = {
+    "gpt": [{"NAME": "aigptx", "BASE_URL": "https://aigptx.top/v1"}],
+    # 可选地址：
+    # "https://api.ohmygpt.com/v1"
+    # "https://cn2us02.opapi.win/v1"
+    # "https://cfwus02.opapi.win/v1"
+    # "https://c-z0-api-01.hash070.com/v1"
+}
+# 使用 OpenAI Chat Completions 协议、按上述规则选择地址的接口
+ROUTED_PROVIDERS = {"gpt", "openai"}
+DEGRADED_WEIGHT_FACTOR = 0.25
+
+
+class Endpoint:
+    def __init__(self, name, url, headers=None, weight=1, delay=0.0):
+        self.name = name
+        self.url = url
+        self.headers = headers or {}
+        self.weight = weight
+        self.delay = delay
+
+    def __repr__(self):
+        return f"<Endpoint {self.name} {self.url}>"
+
+
+def endpoint_from_config(config):
+    config = {**ENDPOINT_DEFAULTS, **config}
+    url = config["BASE_URL"].rstrip("/") + config["PATH"]
+    return Endpoint(
+        config["NAME"] or url,
+        url,
+        config["HEADERS"],
+        config["WEIGHT"],
+        config["DELAY"],
+    )
+
+
+def api_key_endpoint(value):
+    # API Key 的 Endpoint 字段可以是基础地址（如 http://127.0.0.1:8080/v1），也可以是完整的接口地址
+    value = value.strip().rstrip("/")
+    path = ENDPOINT_DEFAULTS["PATH"]
+    url = value if value.endswith(path) else value + path
+    return Endpoint(url, url, delay=ENDPOINT_DEFAULTS["DELAY"])
+
+
+def configured_endpoints():
+    # {接口名: [地址配置, ...]}
+    return {**DEFAULT_ENDPOINTS, **getattr(settings, "JUDGE", {}).get("ENDPOINTS", {})}
+
+
+def endpoints_for(provider, api_key):
+    # 返回评分时可选的地址列表；没有配置时返回空列表
+    if api_key.Endpoint:
+        return [api_key_endpoint(api_key.Endpoint)]
+    return [
+        endpoint_from_config(config)
+        for config in configured_endpoints().get(provider, [])
+    ]
+
+
+def choose_endpoint(endpoints, exclude=()):
+    """
+    按权重和健康状况选择一个地址。exclude 为本次评分中已失败的地址名称，
+    优先选择其他地址；全部失败过时仍在全部地址中选择。
+    """
+    candidates = [
+        endpoint for endpoint in endpoints if endpoint.name not in exclude
+    ] or endpoints
+    health = PROVIDER_TELEMETRY.endpoint_health()
+    available, weights = [], []
+    for endpoint in candidates:
+        status = health.get(endpoint.name, {}).get("status")
+        if status == "unhealthy":
+            continue
+        available.append(endpoint)
+        factor = DEGRADED_WEIGHT_FACTOR if status == "degraded" else 1
+        weights.append(endpoint.weight * factor)
+    if available and any(weights):
+        return random.choices(available, weights)[0]
+    # 只剩备用地址，或所有地址都异常
+    return random.choice(available or candidates)
@@ -1,20 +1,20 @@
 # users/services/judge_gpt.py
 import requests
+import asyncio
 import json
+import logging
 import time
 
+from .async_http import AsyncHTTPClientError, async_http_client
+
 # =======================
 # Configuration
 # =======================
-API_URL = "https://aigptx.top/v1/chat/completions"
-# 可选API_URL：
-# "https://cn2us02.opapi.win/v1/chat/completions"
-# "https://api.ohmygpt.com/v1/chat/completions"
-# "https://cn2us02.opapi.win/v1/chat/completions"
-# "https://c-z0-api-01.hash070.com/v1/chat/completions"
-# "https://aigptx.top/v1/chat/completions"
-# "https://cfwus02.opapi.win/v1/chat/completions"
-SLEEP_TIME = 0.5  # 休眠时间，单位：秒
+# 接口地址由 judge_answer 按 API Key 和 settings.JUDGE["ENDPOINTS"] 选择（见 judge_endpoints.py），
+# 任何 OpenAI 兼容的服务（含本地的 llama.cpp、vLLM）都可以使用
+REQUEST_TIMEOUT = 120  # 单位：秒
+
+logger = logging.getLogger(__name__)
 
 
 def generate_payload(MODEL, user_prompt):
@@ -23,9 +23,8 @@ def generate_payload(MODEL, user_prompt):
         "messages": [
             {
                 "role": "user",
-                "content": [
-                    {"type": "text", "text": user_prompt},
-                ],
+                # 纯文本形式的 content，各 OpenAI 兼容服务都支持
+                "content": user_prompt,
             },
         ],
         "max_tokens": 300,
@@ -33,32 +32,111 @@ def generate_payload(MODEL, user_prompt):
     return payload
 
 
+def _headers(API_KEY, endpoint):
+    HEADERS = {"Content-Type": "application/json", **endpoint.headers}
+    if API_KEY:
+        # 本地服务器通常不需要 API Key
+        HEADERS["Authorization"] = f"Bearer {API_KEY}"
+    return HEADERS
+
+
+def _connection_failed(endpoint, error):
+    logger.warning(
+        "无法连接 GPT 接口", extra={"endpoint": endpoint.name, "error": str(error)}
+    )
+    return {
+        "score": None,
+        "reason": "AI评分失败：无法连接评分接口。",
+        "meta": {"status_code": 0},
+    }
+
+
+def _parse_response(status_code, text, meta):
+    # 解析接口返回的 HTTP 状态码和响应内容，同步和异步版本共用
+    if status_code >= 400:
+        logger.warning("GPT 接口返回错误", extra={"status_code": status_code})
+        return {"score": None, "reason": "AI评分失败：未收到响应。", "meta": meta}
+    if status_code == 200:
+        try:
+            result = json.loads(text)
+            response_text = (
+                result.get("choices", [{}])[0]
+                .get("message", {})
+                .get("content", "No response generated.")
+            )
+            logger.debug("GPT 接口返回内容", extra={"response_text": response_text})
+            response_data = json.loads(response_text)
+        except (ValueError, AttributeError, IndexError, TypeError):
+            logger.warning("GPT 接口返回内容无法解析", extra={"response_text": text})
+            meta["parse_error"] = True
+            return {"score": None, "reason": "AI评分失败：JSON解析错误。", "meta": meta}
+        if isinstance(response_data, dict):
+            score = response_data.get("score", None)
+            reason = response_data.get("reason", "AI评分失败：未提供评分原因。")
+            return {
+                "score": score,
+                "reason": reason,
+                "usage": result.get("usage"),
+                "meta": meta,
+            }
+        else:
+            meta["parse_error"] = True
+            return {"score": None, "reason": "AI评分失败：格式错误。", "meta": meta}
+    else:
+        return {
+            "score": None,
+            "reason": f"AI评分失败：错误码{status_code}。",
+            "meta": meta,
+        }
+
+
 def get_judge_from_gpt(
-    answer_content: str, PROMPT: str, API_KEY: str, MODEL: str
+    answer_content: str, PROMPT: str, API_KEY: str, MODEL: str, endpoint=None
 ) -> dict:
-    HEADERS = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+    if endpoint is None:
+        return {"score": None, "reason": "AI评分失败：未配置评分接口地址。"}
     payload = generate_payload(MODEL, PROMPT + "\n#### 考生的答案\n" + answer_content)
     # 发送请求
-    response = requests.post(API_URL, headers=HEADERS, json=payload)
-    time.sleep(SLEEP_TIME)
-    print(response)
     try:
-        response.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        return {"score": None, "reason": "AI评分失败：未收到响应。"}
-    if response.status_code == 200:
-        result = response.json()
-        response_text = (
-            result.get("choices", [{}])[0]
-            .get("message", {})
-            .get("content", "No response generated.")
+        response = requests.post(
+            endpoint.url,
+            headers=_headers(API_KEY, endpoint),
+            json=payload,
+            timeout=REQUEST_TIMEOUT,
         )
-        response_data = json.loads(response_text)
-        if isinstance(response_data, dict):
-            score = response_data.get("score", None)
-            reason = response_data.get("reason", "AI评分失败：未提供评分原因。")
-            return {"score": score, "reason": reason}
-        else:
-            return {"score": None, "reason": "AI评分失败：格式错误。"}
-    else:
-        return {"score": None, "reason": "AI评分失败：错误码{response.status_code}。"}
+    except requests.exceptions.RequestException as e:
+        return _connection_failed(endpoint, e)
+    time.sleep(endpoint.delay)
+    # response.elapsed 为发出请求到收到响应头的时间，即首字节时间
+    meta = {
+        "status_code": response.status_code,
+        "ttfb": response.elapsed.total_seconds(),
+    }
+    return _parse_response(response.status_code, response.text, meta)
+
+
+async def get_judge_from_gpt_async(
+    answer_content: str, PROMPT: str, API_KEY: str, MODEL: str, endpoint=None
+) -> dict:
+    # 异步版本，使用共享的异步 HTTP 客户端（见 async_http.py）
+    if endpoint is None:
+        return {"score": None, "reason": "AI评分失败：未配置评分接口地址。"}
+    try:
+        client = async_http_client()
+    except AsyncHTTPClientError as e:
+        return {"score": None, "reason": f"AI评分失败：{e}"}
+    import httpx  # 可选依赖，async_http_client 已确认安装
+
+    payload = generate_payload(MODEL, PROMPT + "\n#### 考生的答案\n" + answer_content)
+    start = time.perf_counter()
+    try:
+        async with client.stream(
+            "POST", endpoint.url, headers=_headers(API_KEY, endpoint), json=payload
+        ) as response:
+            ttfb = time.perf_counter() - start
+            await response.aread()
+    except httpx.HTTPError as e:
+        return _connection_failed(endpoint, e)
+    await asyncio.sleep(endpoint.delay)
+    meta = {"status_code": response.status_code, "ttfb": ttfb}
+    return _parse_response(response.status_code, response.text, meta)
@@ -0,0 +1,99 @@
+# users/services/judge_mock.py
+
+"""
+模拟大模型评分接口，用于基准测试和本地演示，不访问网络。
+按 Prompt 中最后一个“评分标准”段落解析得分点，答案覆盖了得分点一半以上的相邻双字即得该点分数，
+结果只取决于 Prompt 和答案内容。MOCK_JUDGE["LATENCY_MS"] 模拟接口延迟，
+MOCK_JUDGE["FAILURE_RATE"] 按比例模拟调用失败（同一答案结果固定）。
+返回的 usage 以字符数代替 token 数。
+只有 MOCK_JUDGE["ENABLED"] 开启时才可选用（默认随 DEBUG）。
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+
+from django.conf import settings
+
+from .rubric import parse_rubric
+
+MOCK_JUDGE_DEFAULTS = {
+    "ENABLED": False,
+    "LATENCY_MS": 0,
+    "FAILURE_RATE": 0.0,
+}
+COVERAGE_THRESHOLD = 0.5
+
+_CRITERIA_SECTION_RE = re.compile(
+    r"\*\*评分标准\*\*\s*\n(.*?)(?:\n\s*\n|\n\s*\*\*|\Z)", re.S
+)
+_IGNORED_RE = re.compile(r"[\W_]+")
+
+
+def mock_settings():
+    return {**MOCK_JUDGE_DEFAULTS, **getattr(settings, "MOCK_JUDGE", {})}
+
+
+def _bigrams(text):
+    text = _IGNORED_RE.sub("", (text or "").lower())
+    return {text[i : i + 2] for i in range(len(text) - 1)}
+
+
+def mock_score(PROMPT, answer_content):
+    # 返回 (分数, 评分原因)，也供 users/bench/openai_stub.py 使用
+    sections = _CRITERIA_SECTION_RE.findall(PROMPT or "")
+    points = parse_rubric(sections[-1]) if sections else []
+    answer = _bigrams(answer_content)
+    score, missing = 0, []
+    for point in points:
+        expected = _bigrams(point.text)
+        if expected and len(expected & answer) / len(expected) >= COVERAGE_THRESHOLD:
+            score += point.points or 0
+        else:
+            missing.append(point.text)
+    reason = "模拟评分：" + ("未答到 " + "；".join(missing) if missing else "要点齐全")
+    return score, reason
+
+
+def get_judge_from_mock(
+    answer_content: str, PROMPT: str, API_KEY: str, MODEL: str
+) -> dict:
+    config = mock_settings()
+    start = time.perf_counter()
+    if config["LATENCY_MS"]:
+        time.sleep(config["LATENCY_MS"] / 1000)
+    meta = {"status_code": 200, "ttfb": time.perf_counter() - start}
+    return _mock_result(answer_content, PROMPT, config, meta)
+
+
+async def get_judge_from_mock_async(
+    answer_content: str, PROMPT: str, API_KEY: str, MODEL: str
+) -> dict:
+    config = mock_settings()
+    start = time.perf_counter()
+    if config["LATENCY_MS"]:
+        await asyncio.sleep(config["LATENCY_MS"] / 1000)
+    meta = {"status_code": 200, "ttfb": time.perf_counter() - start}
+    return _mock_result(answer_content, PROMPT, config, meta)
+
+
+def _mock_result(answer_content, PROMPT, config, meta):
+    digest = hashlib.md5(f"{PROMPT}\0{answer_content}".encode()).digest()
+    if int.from_bytes(digest[:4], "big") / 2**32 < config["FAILURE_RATE"]:
+        # 模拟的失败结果固定，状态码不在重试范围内
+        meta["status_code"] = 500
+        return {"score": None, "reason": "AI评分失败：模拟调用失败。", "meta": meta}
+
+    score, reason = mock_score(PROMPT, answer_content)
+    prompt_tokens = len(PROMPT or "") + len(answer_content or "")
+    return {
+        "score": score,
+        "reason": reason,
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(reason),
+            "total_tokens": prompt_tokens + len(reason),
+        },
+        "meta": meta,
+    }
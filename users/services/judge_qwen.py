@@ -1,20 +1,21 @@
 # users/services/judge_qwen.py
+import asyncio
 import json
+import logging
 from http import HTTPStatus
 import dashscope
 import time
 import re
 
 SLEEP_TIME = 0.5  # 休眠时间，单位：秒
+
+logger = logging.getLogger(__name__)
 # 定义正则表达式模式以匹配中文引号
 chinese_quotes_pattern = {"single": re.compile(r"[‘’]"), "double": re.compile(r"[“”]")}
 
 
-def get_judge_from_qwen(
-    answer_content: str, PROMPT: str, API_KEY: str, MODEL: str
-) -> dict:
-
-    messages = [
+def _messages(answer_content, PROMPT):
+    return [
         {
             "role": "user",
             "content": [
@@ -25,25 +26,61 @@ def get_judge_from_qwen(
             ],
         }
     ]
+
+
+def get_judge_from_qwen(
+    answer_content: str, PROMPT: str, API_KEY: str, MODEL: str
+) -> dict:
     response = dashscope.Generation.call(
-        api_key=API_KEY, model=MODEL, messages=messages, result_format="message"
+        api_key=API_KEY,
+        model=MODEL,
+        messages=_messages(answer_content, PROMPT),
+        result_format="message",
     )
     time.sleep(SLEEP_TIME)
-    # print(response)
+    return _parse_response(response)
+
+
+async def get_judge_from_qwen_async(
+    answer_content: str, PROMPT: str, API_KEY: str, MODEL: str
+) -> dict:
+    # 异步版本，使用 dashscope 自带的异步接口（AioGeneration）
+    response = await dashscope.AioGeneration.call(
+        api_key=API_KEY,
+        model=MODEL,
+        messages=_messages(answer_content, PROMPT),
+        result_format="message",
+    )
+    await asyncio.sleep(SLEEP_TIME)
+    return _parse_response(response)
+
+
+def _parse_response(response):
+    # 解析通义千问接口的返回结果，同步和异步版本共用
     if response.output is None:
-        print("未收到响应")
-        print(f"HTTP返回码：{response.status_code}")
-        print(f"错误码：{response.code}")
-        print(f"错误信息：{response.message}")
-        print("请参考文档：https://help.aliyun.com/zh/model-studio/developer-reference/error-code")
-        return {"score": None, "reason": "AI评分失败：未收到响应。"}
+        # 错误码说明：https://help.aliyun.com/zh/model-studio/developer-reference/error-code
+        logger.warning(
+            "通义千问接口未返回结果",
+            extra={
+                "status_code": response.status_code,
+                "error_code": response.code,
+                "error": response.message,
+            },
+        )
+        return {
+            "score": None,
+            "reason": "AI评分失败：未收到响应。",
+            "meta": {"status_code": response.status_code},
+        }
+    usage = _usage(response)
+    meta = {"status_code": response.status_code}
     response_text_origin = response.output.choices[0].message.content
     # 替换中文引号为英文引号
     response_text = chinese_quotes_pattern["single"].sub("'", response_text_origin)
     response_text = chinese_quotes_pattern["double"].sub('"', response_text)
     # 去除多余的换行和缩进
     response_text = re.sub(r"\s+", " ", response_text).strip()
-    print(response_text)
+    logger.debug("通义千问接口返回内容", extra={"response_text": response_text})
     if response.status_code == HTTPStatus.OK:
         try:
             response_data = json.loads(response_text)
@@ -53,18 +90,32 @@ def get_judge_from_qwen(
                     response_data["reason"] = (
                         response_data.get("reason", "") + f"{response_data.get(key)}\n"
                     )
-            print(response_data)
         except json.JSONDecodeError:
-            print("JSON解析错误")
-            return {"score": None, "reason": "AI评分失败：JSON解析错误。"}
+            logger.warning("评分结果不是合法的 JSON", extra={"response_text": response_text})
+            meta["parse_error"] = True
+            return {"score": None, "reason": "AI评分失败：JSON解析错误。", "meta": meta}
         if isinstance(response_data, dict):
             score = response_data.get("score", None)
             reason = response_data.get("reason", "AI评分失败：未提供评分原因。")
-            print(score, reason)
-            return {"score": score, "reason": reason}
+            return {"score": score, "reason": reason, "usage": usage, "meta": meta}
         else:
-            print("格式错误")
-            return {"score": None, "reason": "AI评分失败：格式错误。"}
+            logger.warning("评分结果格式错误", extra={"response_text": response_text})
+            meta["parse_error"] = True
+            return {"score": None, "reason": "AI评分失败：格式错误。", "meta": meta}
     else:
-        print(f"错误码{response.status_code}")
-        return {"score": None, "reason": f"AI评分失败：错误码{response.status_code}。"}
+        logger.warning("通义千问接口返回错误", extra={"status_code": response.status_code})
+        return {
+            "score": None,
+            "reason": f"AI评分失败：错误码{response.status_code}。",
+            "meta": meta,
+        }
+
+
+def _usage(response):
+    # 通义千问返回 input_tokens/output_tokens，统一为 OpenAI 的字段名
+    usage = getattr(response, "usage", None) or {}
+    return {
+        "prompt_tokens": usage.get("input_tokens"),
+        "completion_tokens": usage.get("output_tokens"),
+        "total_tokens": usage.get("total_tokens"),
+    }
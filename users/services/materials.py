@@ -0,0 +1,343 @@
+# users/services/materials.py
+
+"""
+课程资料（教材）检索，为评分 Prompt 提供参考片段。
+- 资料文本按段落切分为约 CHUNK_SIZE 字的片段（MaterialChunk），过长的段落按句子切开
+- 片段按 cjk.query_tokens 切词（汉字取相邻双字），用 NumPy 一次性计算 BM25 权重，
+  按词组织为倒排表（CSC 结构）：indptr[t]:indptr[t+1] 为词 t 出现的片段下标和权重
+- 倒排表以 .npy 文件保存在 MATERIAL_RETRIEVAL["INDEX_DIR"]/course_<课程ID>/<版本>/ 下，
+  通过内存映射读取，检索时只访问查询词对应的那几段数据；重建时写入新的版本目录，
+  再原子地替换 CURRENT 文件指向新版本，正在使用旧索引的进程不受影响
+- 评分时以试题内容、评分标准、参考教材原话和答案内容为查询，取 BM25 得分最高的几个片段附在 Prompt 中
+服务器未安装 numpy 时检索不可用，评分照常进行，只是不附参考片段。
+"""
+
+import json
+import os
+import re
+import shutil
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from .cjk import query_tokens
+from .question_bank import split_sections
+
+MATERIAL_RETRIEVAL_DEFAULTS = {
+    "ENABLED": True,
+    "INDEX_DIR": "material_index",
+    "TOP_K": 3,
+    "MAX_CHARS": 1500,
+}
+MATERIAL_EXTENSIONS = (".md", ".markdown", ".txt")
+CHUNK_SIZE = 400  # 片段长度，单位：字符
+BM25_K1 = 1.2
+BM25_B = 0.75
+REFERENCE_SECTIONS = ("参考教材原话", "参考依据")
+
+_SENTENCE_RE = re.compile(r"(?<=[。！？；!?;])")
+_LOADED = {}  # 课程ID -> (版本, MaterialIndex)
+
+
+class MaterialIndexError(Exception):
+    pass
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise MaterialIndexError("服务器未安装 numpy，无法建立资料检索索引。")
+    return numpy
+
+
+def retrieval_settings():
+    return {
+        **MATERIAL_RETRIEVAL_DEFAULTS,
+        **getattr(settings, "MATERIAL_RETRIEVAL", {}),
+    }
+
+
+def course_index_dir(course_id):
+    return os.path.join(retrieval_settings()["INDEX_DIR"], f"course_{course_id}")
+
+
+# =====================
+# 切分资料
+# =====================
+
+
+def split_chunks(text, size=CHUNK_SIZE):
+    """
+    按段落把资料切成不超过 size 字的片段（单个句子超长时保留整句）。
+    相邻的短段落合并到同一片段中。
+    """
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= size:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(s for s in _SENTENCE_RE.split(paragraph) if s.strip())
+
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def add_material(course, title, content):
+    """
+    保存一份课程资料及其片段，并重建课程的检索索引，返回资料对象。
+    索引在同一事务中建立，建立失败（MaterialIndexError）时资料不会保存。
+    """
+    from ..models import CourseMaterial, MaterialChunk
+
+    _numpy()  # 未安装 numpy 时在写入前报错
+    with transaction.atomic():
+        material = CourseMaterial.objects.create(
+            CourseID=course, Title=title, Content=content
+        )
+        MaterialChunk.objects.bulk_create(
+            [
+                MaterialChunk(
+                    MaterialID=material,
+                    CourseID=course,
+                    Position=position,
+                    Text=text,
+                )
+                for position, text in enumerate(split_chunks(content))
+            ],
+            batch_size=500,
+        )
+        rebuild_material_index(course.CourseID)
+    return material
+
+
+def delete_materials(course, material_ids):
+    """
+    删除课程资料（片段随之级联删除）并重建索引，返回删除的资料数。
+    material_ids 来自表单，忽略不是整数的值；索引重建失败时不删除。
+    """
+    from ..models import CourseMaterial
+
+    material_ids = [int(value) for value in material_ids if str(value).isdigit()]
+    if not material_ids:
+        return 0
+    _numpy()
+    with transaction.atomic():
+        count = (
+            CourseMaterial.objects.filter(CourseID=course, MaterialID__in=material_ids)
+            .delete()[1]
+            .get("users.CourseMaterial", 0)
+        )
+        if count:
+            rebuild_material_index(course.CourseID)
+    return count
+
+
+# =====================
+# 建立索引
+# =====================
+
+
+def rebuild_material_index(course_id):
+    """
+    根据课程的全部资料片段重建 BM25 倒排索引，返回片段数。课程没有资料时删除索引。
+    """
+    from ..models import MaterialChunk
+
+    np = _numpy()
+    chunks = list(
+        MaterialChunk.objects.filter(CourseID_id=course_id)
+        .order_by("ChunkID")
+        .values_list("ChunkID", "Text")
+    )
+    directory = course_index_dir(course_id)
+    if not chunks:
+        shutil.rmtree(directory, ignore_errors=True)
+        _LOADED.pop(course_id, None)
+        return 0
+
+    vocabulary = {}
+    term_ids, rows, counts = [], [], []
+    for row, (_chunk_id, text) in enumerate(chunks):
+        for term, count in Counter(query_tokens(text)).items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            rows.append(row)
+            counts.append(count)
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int32)
+    tf = np.asarray(counts, dtype=np.float32)
+
+    n = len(chunks)
+    lengths = np.bincount(rows, weights=tf, minlength=n)
+    df = np.bincount(term_ids, minlength=len(vocabulary))
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / max(lengths.mean(), 1))
+    weights = (idf[term_ids] * tf * (BM25_K1 + 1) / (tf + norm)).astype(np.float32)
+
+    order = np.argsort(term_ids, kind="stable")
+    indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(df, out=indptr[1:])
+
+    version = uuid.uuid4().hex
+    target = os.path.join(directory, version)
+    os.makedirs(target)
+    np.save(os.path.join(target, "indptr.npy"), indptr)
+    np.save(os.path.join(target, "rows.npy"), rows[order])
+    np.save(os.path.join(target, "weights.npy"), weights[order])
+    np.save(
+        os.path.join(target, "chunk_ids.npy"),
+        np.asarray([chunk_id for chunk_id, _text in chunks], dtype=np.int64),
+    )
+    with open(os.path.join(target, "vocabulary.json"), "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+
+    # 原子地切换到新版本，再删除旧版本目录
+    pointer = os.path.join(directory, "CURRENT")
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+    for name in os.listdir(directory):
+        if name not in (version, "CURRENT"):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return n
+
+
+# =====================
+# 检索
+# =====================
+
+
+class MaterialIndex:
+    def __init__(self, directory):
+        np = _numpy()
+        with open(os.path.join(directory, "vocabulary.json"), encoding="utf-8") as f:
+            self.vocabulary = json.load(f)
+        self.indptr = np.load(os.path.join(directory, "indptr.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(directory, "rows.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(directory, "weights.npy"), mmap_mode="r")
+        self.chunk_ids = np.load(
+            os.path.join(directory, "chunk_ids.npy"), mmap_mode="r"
+        )
+
+    def search(self, terms, top_k):
+        """
+        terms 为 {词: 查询中出现的次数}，返回 [(片段ID, 得分), ...]，按得分从高到低排列。
+        """
+        np = _numpy()
+        scores = np.zeros(len(self.chunk_ids), dtype=np.float32)
+        for term, count in terms.items():
+            column = self.vocabulary.get(term)
+            if column is None:
+                continue
+            start, stop = self.indptr[column], self.indptr[column + 1]
+            # 同一词在每个片段中只有一条记录，可以直接按下标累加
+            scores[self.rows[start:stop]] += count * self.weights[start:stop]
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            (int(self.chunk_ids[row]), float(scores[row]))
+            for row in best
+            if scores[row] > 0
+        ]
+
+
+def load_material_index(course_id):
+    """
+    返回课程当前版本的检索索引；课程没有资料、索引未建立或未安装 numpy 时返回 None。
+    已加载的索引在 CURRENT 指向新版本前一直复用。
+    """
+    directory = course_index_dir(course_id)
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    loaded = _LOADED.get(course_id)
+    if loaded and loaded[0] == version:
+        return loaded[1]
+    try:
+        index = MaterialIndex(os.path.join(directory, version))
+    except (MaterialIndexError, OSError, ValueError):
+        return None
+    _LOADED[course_id] = (version, index)
+    return index
+
+
+class MaterialRetriever:
+    """
+    为一道试题的多份答案检索参考片段。试题部分的查询词只计算一次。
+    """
+
+    def __init__(self, index, question, config):
+        self.index = index
+        self.config = config
+        _preamble, sections = split_sections(question.Prompt)
+        references = [text for name, text in sections if name in REFERENCE_SECTIONS]
+        self.question_terms = Counter(
+            query_tokens(
+                "\n".join(
+                    [question.Content or "", question.ScoringCriteria or ""]
+                    + references
+                )
+            )
+        )
+
+    def passages(self, answer_content):
+        # 返回 [(资料标题, 片段文本), ...]，总长度不超过 MAX_CHARS
+        from ..models import MaterialChunk
+
+        terms = self.question_terms + Counter(query_tokens(answer_content))
+        hits = self.index.search(terms, self.config["TOP_K"])
+        if not hits:
+            return []
+        chunks = MaterialChunk.objects.select_related("MaterialID").in_bulk(
+            [chunk_id for chunk_id, _score in hits]
+        )
+        result, seen, budget = [], set(), self.config["MAX_CHARS"]
+        for chunk_id, _score in hits:
+            chunk = chunks.get(chunk_id)
+            if chunk is None or budget <= 0 or chunk.Text in seen:
+                continue
+            seen.add(chunk.Text)  # 资料中重复出现的内容只附一次
+            text = chunk.Text[:budget]
+            budget -= len(text)
+            result.append((chunk.MaterialID.Title, text))
+        return result
+
+
+def material_retriever(question, config=None):
+    """
+    返回试题的参考片段检索器；检索关闭或课程没有可用索引时返回 None。
+    """
+    config = config or retrieval_settings()
+    if not config["ENABLED"]:
+        return None
+    index = load_material_index(question.CourseID_id)
+    if index is None:
+        return None
+    return MaterialRetriever(index, question, config)
+
+
+def prompt_with_passages(prompt, passages):
+    # 在 Prompt 后附上检索到的参考片段
+    if not passages:
+        return prompt
+    lines = ["#### 参考教材片段（根据试题和答案检索，供评分参考）"]
+    for number, (title, text) in enumerate(passages, 1):
+        lines.append(f"[{number}]《{title}》\n{text}")
+    return f"{prompt}\n" + "\n\n".join(lines)
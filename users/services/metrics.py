@@ -0,0 +1,336 @@
+# users/services/metrics.py
+
+"""
+按视图统计的请求指标（由 users.middleware.MetricsMiddleware 记录）。
+- 每个视图（URL 名称）记录请求耗时、响应大小和状态码；按 SAMPLE_RATE 抽样的请求额外记录数据库查询数、
+  查询总耗时和最慢的一条 SQL。查询统计需要包装每条 SQL，抽样可以把开销控制在很小的比例，便于生产环境常开
+- 直方图同时保存进程启动以来的累计计数和滚动窗口（WINDOW 秒分为 SLOTS 段，过期的段整段丢弃）。
+  Prometheus 导出累计计数，只增不减，由 Prometheus 按时间范围计算速率和分位数；
+  滚动窗口用于进程内的分位数估算（如评分接口的健康状态）
+- 最慢 SQL 的原文可能很长且各不相同，不作为标签导出：指标只带 SQL 的短哈希；耗时达到 SLOW_SQL_LOG 秒的 SQL
+  把哈希和原文写入日志（每条 SQL 每个进程只写一次），按哈希即可查到原文
+- 中间件自身的耗时（记录指标、包装 SQL）单独累计，导出为 njup_metrics_overhead_seconds_total，
+  可与请求总耗时对比，确认开销可以接受
+- render_prometheus() 输出 Prometheus 文本格式，由仅管理员可访问的 /metrics/ 视图返回
+指标保存在进程内存中，多进程部署时每个进程各自统计。
+"""
+
+import hashlib
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from django.conf import settings
+
+METRICS_DEFAULTS = {
+    "ENABLED": True,
+    "SAMPLE_RATE": 0.1,  # 记录数据库查询统计的请求比例
+    "WINDOW": 600,  # 滚动窗口长度，单位：秒
+    "SLOTS": 10,  # 窗口分段数
+    "SERVER_TIMING": True,  # 在响应中添加 Server-Timing 头
+    "TOKEN": "",  # 非空时，带 “Authorization: Bearer <TOKEN>” 的请求也可读取指标（供 Prometheus 抓取）
+    "SLOW_SQL_LOG": 0.1,  # 最慢 SQL 耗时达到该值时把原文写入日志，单位：秒
+}
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNRESOLVED_VIEW = "<unresolved>"  # 未匹配到 URL 的请求（404 等）
+SQL_MAX_LENGTH = 300  # 写入日志的最慢 SQL 截断长度
+_LOGGED_SQL_SIZE = 1024  # 已写入日志的 SQL 哈希数上限，超过后清空重新记录
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+logger = logging.getLogger(__name__)
+
+
+def metrics_settings():
+    return {**METRICS_DEFAULTS, **getattr(settings, "METRICS", {})}
+
+
+class RollingHistogram:
+    """
+    滚动窗口直方图。每段保存 [段序号, 各桶计数, 总和, 次数]，只保留最近 slots 段；
+    另外累计进程启动以来的各桶计数、总和和次数（见 totals()）。
+    不加锁，由调用方（MetricsRegistry 等）持锁调用。
+    """
+
+    def __init__(self, buckets, window, slots):
+        self.buckets = buckets
+        self.slots = slots
+        self.slot_seconds = window / slots
+        self._segments = deque()
+        self._counts = [0] * (len(buckets) + 1)
+        self._total = 0.0
+        self._count = 0
+
+    def _expire(self, current):
+        while self._segments and self._segments[0][0] <= current - self.slots:
+            self._segments.popleft()
+
+    def observe(self, value, now):
+        current = int(now // self.slot_seconds)
+        self._expire(current)
+        if not self._segments or self._segments[-1][0] != current:
+            self._segments.append([current, [0] * (len(self.buckets) + 1), 0.0, 0])
+        segment = self._segments[-1]
+        index = bisect_left(self.buckets, value)
+        segment[1][index] += 1
+        segment[2] += value
+        segment[3] += 1
+        self._counts[index] += 1
+        self._total += value
+        self._count += 1
+
+    def _cumulative(self, counts):
+        # 各桶计数 -> [(上界, 不大于该上界的次数), ...]，最后一项上界为 "+Inf"
+        cumulative, running = [], 0
+        for bound, value in zip((*self.buckets, "+Inf"), counts):
+            running += value
+            cumulative.append((bound, running))
+        return cumulative
+
+    def snapshot(self, now):
+        # 最近窗口内的分布：([(上界, 累计次数), ...], 总和, 次数)
+        self._expire(int(now // self.slot_seconds))
+        counts = [0] * (len(self.buckets) + 1)
+        total, count = 0.0, 0
+        for _index, segment_counts, segment_total, segment_count in self._segments:
+            for i, value in enumerate(segment_counts):
+                counts[i] += value
+            total += segment_total
+            count += segment_count
+        return self._cumulative(counts), total, count
+
+    def totals(self):
+        # 进程启动以来的分布，格式同 snapshot()；只增不减，用于导出 Prometheus histogram
+        return self._cumulative(self._counts), self._total, self._count
+
+    def quantile(self, q, now):
+        # 按桶内线性插值估算分位数；没有数据时返回 None，落在最后一个桶时返回最大上界
+        buckets, _total, count = self.snapshot(now)
+        if not count:
+            return None
+        rank = q * count
+        lower, previous = 0.0, 0
+        for bound, running in buckets:
+            if running >= rank:
+                if bound == "+Inf":
+                    return self.buckets[-1]
+                share = (rank - previous) / (running - previous) if running > previous else 1
+                return lower + (bound - lower) * share
+            lower, previous = bound, running
+        return self.buckets[-1]
+
+
+class ViewMetrics:
+    def __init__(self, window, slots):
+        self.latency = RollingHistogram(LATENCY_BUCKETS, window, slots)
+        self.size = RollingHistogram(SIZE_BUCKETS, window, slots)
+        self.queries = RollingHistogram(QUERY_BUCKETS, window, slots)
+        self.db_time = RollingHistogram(DB_TIME_BUCKETS, window, slots)
+        self.statuses = {}  # 状态码类别（"2xx" 等）-> 进程启动以来的请求数
+        self.slowest_sql = None  # (耗时, SQL 哈希, 记录时间)，超过窗口后被新的记录替换
+
+
+class QueryRecorder:
+    """
+    作为 connection.execute_wrapper 使用，统计一个请求的查询数、查询耗时和最慢的 SQL。
+    只在处理请求的线程中使用，不需要加锁。
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.slowest = (0.0, "")
+        self.overhead = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            elapsed = end - start
+            self.count += 1
+            self.time += elapsed
+            if elapsed > self.slowest[0]:
+                self.slowest = (elapsed, sql)
+            self.overhead += time.perf_counter() - end
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self.requests = 0
+        self.sampled = 0
+        self.overhead = 0.0  # 中间件自身的累计耗时，单位：秒
+        self.request_time = 0.0  # 请求的累计耗时，单位：秒
+        self._logged_sql = set()  # 已写入日志的最慢 SQL 哈希
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._logged_sql.clear()
+            self.requests = self.sampled = 0
+            self.overhead = self.request_time = 0.0
+
+    def should_sample(self, config):
+        return random.random() < config["SAMPLE_RATE"]
+
+    def observe(self, view, status, latency, size, recorder=None, config=None):
+        """
+        记录一个请求。size 为 None 表示流式响应（不记录大小）；recorder 为抽样请求的 QueryRecorder。
+        """
+        config = config or metrics_settings()
+        now = time.monotonic()
+        logged_sql = None
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = ViewMetrics(
+                    config["WINDOW"], config["SLOTS"]
+                )
+            metrics.latency.observe(latency, now)
+            if size is not None:
+                metrics.size.observe(size, now)
+            status_class = f"{status // 100}xx"
+            metrics.statuses[status_class] = metrics.statuses.get(status_class, 0) + 1
+            self.requests += 1
+            self.request_time += latency
+            if recorder is not None:
+                self.sampled += 1
+                metrics.queries.observe(recorder.count, now)
+                metrics.db_time.observe(recorder.time, now)
+                duration, sql = recorder.slowest
+                slowest = metrics.slowest_sql
+                if sql and (
+                    slowest is None
+                    or duration > slowest[0]
+                    or now - slowest[2] > config["WINDOW"]
+                ):
+                    sql = " ".join(sql.split())
+                    digest = sql_hash(sql)
+                    metrics.slowest_sql = (duration, digest, now)
+                    if (
+                        duration >= config["SLOW_SQL_LOG"]
+                        and digest not in self._logged_sql
+                    ):
+                        if len(self._logged_sql) >= _LOGGED_SQL_SIZE:
+                            self._logged_sql.clear()
+                        self._logged_sql.add(digest)
+                        logged_sql = (digest, sql[:SQL_MAX_LENGTH])
+        # SQL 原文只写入日志，在锁外写出
+        if logged_sql is not None:
+            logger.info(
+                "视图最慢 SQL",
+                extra={
+                    "view": view,
+                    "sql_hash": logged_sql[0],
+                    "sql": logged_sql[1],
+                    "duration_ms": round(duration * 1000, 3),
+                },
+            )
+
+    def add_overhead(self, seconds):
+        with self._lock:
+            self.overhead += seconds
+
+    def render_prometheus(self, config=None):
+        config = config or metrics_settings()
+        now = time.monotonic()
+        window = config["WINDOW"]
+        lines = []
+        with self._lock:
+            views = sorted(self._views.items())
+            histograms = (
+                ("njup_view_latency_seconds", "latency", "视图请求耗时"),
+                ("njup_view_response_bytes", "size", "响应大小（不含流式响应）"),
+                ("njup_view_db_queries", "queries", "每个请求的数据库查询数（抽样）"),
+                ("njup_view_db_seconds", "db_time", "每个请求的数据库查询耗时（抽样）"),
+            )
+            for name, attribute, help_text in histograms:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for view, metrics in views:
+                    buckets, total, count = getattr(metrics, attribute).totals()
+                    if not count:
+                        continue
+                    label = f'view="{escape_label(view)}"'
+                    for bound, value in buckets:
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {value}')
+                    lines.append(f"{name}_sum{{{label}}} {total:.6f}")
+                    lines.append(f"{name}_count{{{label}}} {count}")
+
+            lines.append("# HELP njup_view_requests_total 进程启动以来各视图的请求数（按状态码类别）")
+            lines.append("# TYPE njup_view_requests_total counter")
+            for view, metrics in views:
+                for status_class, count in sorted(metrics.statuses.items()):
+                    lines.append(
+                        f'njup_view_requests_total{{view="{escape_label(view)}",'
+                        f'status="{status_class}"}} {count}'
+                    )
+
+            lines.append(
+                f"# HELP njup_view_slowest_sql_seconds 最近 {window} 秒内抽样到的最慢 SQL"
+                "（sql_hash 对应日志中的 SQL 原文）"
+            )
+            lines.append("# TYPE njup_view_slowest_sql_seconds gauge")
+            for view, metrics in views:
+                slowest = metrics.slowest_sql
+                if slowest is None or now - slowest[2] > window:
+                    continue
+                lines.append(
+                    f'njup_view_slowest_sql_seconds{{view="{escape_label(view)}",'
+                    f'sql_hash="{slowest[1]}"}} {slowest[0]:.6f}'
+                )
+
+            lines.extend(
+                [
+                    "# HELP njup_metrics_requests_total 记录的请求数",
+                    "# TYPE njup_metrics_requests_total counter",
+                    f"njup_metrics_requests_total {self.requests}",
+                    "# HELP njup_metrics_sampled_requests_total 记录了数据库查询统计的请求数",
+                    "# TYPE njup_metrics_sampled_requests_total counter",
+                    f"njup_metrics_sampled_requests_total {self.sampled}",
+                    "# HELP njup_metrics_sample_rate 数据库查询统计的抽样比例",
+                    "# TYPE njup_metrics_sample_rate gauge",
+                    f"njup_metrics_sample_rate {config['SAMPLE_RATE']}",
+                    "# HELP njup_metrics_request_seconds_total 记录的请求累计耗时",
+                    "# TYPE njup_metrics_request_seconds_total counter",
+                    f"njup_metrics_request_seconds_total {self.request_time:.6f}",
+                    "# HELP njup_metrics_overhead_seconds_total 指标记录自身的累计耗时",
+                    "# TYPE njup_metrics_overhead_seconds_total counter",
+                    f"njup_metrics_overhead_seconds_total {self.overhead:.6f}",
+                ]
+            )
+        return "\n".join(lines) + "\n"
+
+
+def sql_hash(sql):
+    # 最慢 SQL 的短哈希，作为标签值时取值有限，可在日志中按哈希找到 SQL 原文
+    return hashlib.sha1(sql.encode()).hexdigest()[:12]
+
+
+def escape_label(value):
+    # Prometheus 标签值转义
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def server_timing(latency, recorder=None):
+    # 生成 Server-Timing 头，耗时单位为毫秒
+    parts = [f"app;dur={latency * 1000:.1f}"]
+    if recorder is not None:
+        parts.append(
+            f'db;dur={recorder.time * 1000:.1f};desc="{recorder.count} queries"'
+        )
+    return ", ".join(parts)
+
+
+METRICS = MetricsRegistry()
@@ -0,0 +1,305 @@
+# users/services/near_duplicates.py
+
+"""
+近似重复答案检测（MinHash + LSH）。
+- 答案内容去掉空白和标点后按 3 字符切片（shingle），对切片集合计算 64 维 MinHash 签名，
+  两个签名相同位置取值相等的比例即为两个切片集合 Jaccard 相似度的估计
+- 签名分为 8 段、每段 8 个值，每段计算一个哈希写入 AnswerLSHBucket；
+  同一试题中至少有一段哈希相同的答案才作为候选，再用签名估计相似度，达到 SIMILARITY_THRESHOLD 视为近似重复
+- 近似重复关系按传递闭包合并为簇，簇ID为簇内最小的 AnswerID
+答案提交或修改时调用 index_answer_fingerprint() 增量更新，只查询与该答案分桶相同的候选，
+与该题答案总数无关。答案修改/删除后原簇可能应被拆分（它曾连接两组答案），增量更新不做拆分，
+需要时可运行 rebuild_answer_clusters 命令重新计算。
+"""
+
+import hashlib
+import random
+import re
+import zlib
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 8
+ROWS_PER_BAND = NUM_PERM // BANDS
+SIMILARITY_THRESHOLD = 0.8
+REBUILD_BATCH_SIZE = 500
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# 固定种子，保证不同进程、不同时间计算的签名可以比较
+_rng = random.Random(20240901)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_IGNORED_RE = re.compile(r"[\W_]+")
+
+
+# =====================
+# 签名与分桶
+# =====================
+
+
+def shingles(text):
+    normalized = _IGNORED_RE.sub("", (text or "").lower())
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {
+        normalized[i : i + SHINGLE_SIZE]
+        for i in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash_signature(text):
+    """
+    返回答案内容的 MinHash 签名（NUM_PERM 个整数）；内容为空时返回 None。
+    """
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingles(text)]
+    if not hashes:
+        return None
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_hashes(signature):
+    result = []
+    for band in range(BANDS):
+        values = signature[band * ROWS_PER_BAND : (band + 1) * ROWS_PER_BAND]
+        raw = f"{band}:{','.join(map(str, values))}".encode()
+        digest = hashlib.blake2b(raw, digest_size=8).digest()
+        result.append(int.from_bytes(digest, "big", signed=True))
+    return result
+
+
+def estimated_similarity(left, right):
+    return sum(1 for a, b in zip(left, right) if a == b) / NUM_PERM
+
+
+# =====================
+# 增量维护
+# =====================
+
+
+def release_answer_cluster(answer_id, question_id):
+    """
+    答案离开所在的簇（内容修改或删除）时调用：若它是其他答案的簇ID，为剩余成员改用新的最小ID。
+    """
+    from ..models import AnswerFingerprint
+
+    members = AnswerFingerprint.objects.filter(
+        QuestionID_id=question_id, ClusterID=answer_id
+    ).exclude(AnswerID_id=answer_id)
+    new_cluster_id = min(members.values_list("AnswerID_id", flat=True), default=None)
+    if new_cluster_id is not None:
+        members.update(ClusterID=new_cluster_id)
+
+
+def index_answer_fingerprint(answer_id, question_id, content):
+    """
+    计算答案的签名和分桶，并把它并入近似答案所在的簇（可能因此合并多个簇）。
+    返回答案所属的簇ID；内容为空时不建立签名，返回 None。
+    """
+    from ..models import AnswerFingerprint, AnswerLSHBucket
+
+    signature = minhash_signature(content)
+    with transaction.atomic():
+        release_answer_cluster(answer_id, question_id)
+        AnswerLSHBucket.objects.filter(AnswerID_id=answer_id).delete()
+        if signature is None:
+            AnswerFingerprint.objects.filter(AnswerID_id=answer_id).delete()
+            return None
+
+        buckets = band_hashes(signature)
+        candidate_ids = set(
+            AnswerLSHBucket.objects.filter(
+                QuestionID_id=question_id, BucketHash__in=buckets
+            ).values_list("AnswerID_id", flat=True)
+        )
+        candidate_ids.discard(answer_id)
+        cluster_ids = {
+            cluster_id
+            for other_signature, cluster_id in AnswerFingerprint.objects.filter(
+                AnswerID_id__in=candidate_ids
+            ).values_list("Signature", "ClusterID")
+            if estimated_similarity(signature, other_signature) >= SIMILARITY_THRESHOLD
+        }
+
+        cluster_id = min(cluster_ids | {answer_id})
+        if cluster_ids - {cluster_id}:
+            # 该答案把多个簇连接在一起，全部并入最小的簇ID
+            AnswerFingerprint.objects.filter(
+                QuestionID_id=question_id, ClusterID__in=cluster_ids
+            ).update(ClusterID=cluster_id)
+
+        AnswerFingerprint.objects.update_or_create(
+            AnswerID_id=answer_id,
+            defaults={
+                "QuestionID_id": question_id,
+                "Signature": signature,
+                "ClusterID": cluster_id,
+            },
+        )
+        AnswerLSHBucket.objects.bulk_create(
+            [
+                AnswerLSHBucket(
+                    AnswerID_id=answer_id, QuestionID_id=question_id, BucketHash=bucket
+                )
+                for bucket in buckets
+            ]
+        )
+    return cluster_id
+
+
+def rebuild_answer_clusters(question_ids=None, apps=global_apps):
+    """
+    重新计算全部答案的签名、分桶和簇，返回处理的答案数。
+    question_ids 为 None 时重建全部试题。apps 供数据迁移传入历史模型。
+    """
+    Question = apps.get_model("users", "Question")
+    StudentAnswer = apps.get_model("users", "StudentAnswer")
+    AnswerFingerprint = apps.get_model("users", "AnswerFingerprint")
+    AnswerLSHBucket = apps.get_model("users", "AnswerLSHBucket")
+
+    questions = Question.objects.order_by("QuestionID")
+    if question_ids is not None:
+        questions = questions.filter(QuestionID__in=question_ids)
+
+    count = 0
+    for question_id in questions.values_list("QuestionID", flat=True):
+        signatures = {}
+        buckets = {}  # 分桶哈希 -> [AnswerID, ...]
+        parent = {}  # 并查集，根为簇内最小的 AnswerID
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        answers = (
+            StudentAnswer.objects.filter(QuestionID_id=question_id)
+            .order_by("AnswerID")
+            .values_list("AnswerID", "Content")
+        )
+        for answer_id, content in answers.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            signature = minhash_signature(content)
+            if signature is None:
+                continue
+            signatures[answer_id] = signature
+            parent[answer_id] = answer_id
+            for bucket in band_hashes(signature):
+                for other_id in buckets.setdefault(bucket, []):
+                    root, other_root = find(answer_id), find(other_id)
+                    if root != other_root and (
+                        estimated_similarity(signature, signatures[other_id])
+                        >= SIMILARITY_THRESHOLD
+                    ):
+                        parent[max(root, other_root)] = min(root, other_root)
+                buckets[bucket].append(answer_id)
+
+        with transaction.atomic():
+            AnswerLSHBucket.objects.filter(QuestionID_id=question_id).delete()
+            AnswerFingerprint.objects.filter(QuestionID_id=question_id).delete()
+            AnswerFingerprint.objects.bulk_create(
+                [
+                    AnswerFingerprint(
+                        AnswerID_id=answer_id,
+                        QuestionID_id=question_id,
+                        Signature=signature,
+                        ClusterID=find(answer_id),
+                    )
+                    for answer_id, signature in signatures.items()
+                ],
+                batch_size=REBUILD_BATCH_SIZE,
+            )
+            AnswerLSHBucket.objects.bulk_create(
+                [
+                    AnswerLSHBucket(
+                        AnswerID_id=answer_id,
+                        QuestionID_id=question_id,
+                        BucketHash=bucket,
+                    )
+                    for bucket, answer_ids in buckets.items()
+                    for answer_id in answer_ids
+                ],
+                batch_size=REBUILD_BATCH_SIZE,
+            )
+        count += len(signatures)
+    return count
+
+
+# =====================
+# 查询与按簇评分
+# =====================
+
+
+def answer_clusters(question_id):
+    """
+    返回 {AnswerID: (簇ID, 簇大小)}，只包含有近似答案（簇大小 > 1）的答案。
+    """
+    from ..models import AnswerFingerprint
+
+    fingerprints = AnswerFingerprint.objects.filter(QuestionID_id=question_id)
+    sizes = dict(
+        fingerprints.values("ClusterID")
+        .annotate(size=Count("AnswerID"))
+        .filter(size__gt=1)
+        .values_list("ClusterID", "size")
+    )
+    if not sizes:
+        return {}
+    return {
+        answer_id: (cluster_id, sizes[cluster_id])
+        for answer_id, cluster_id in fingerprints.filter(
+            ClusterID__in=sizes
+        ).values_list("AnswerID_id", "ClusterID")
+    }
+
+
+def cluster_member_ids(answer_id):
+    # 与该答案同簇的其他答案ID（不含自身）
+    from ..models import AnswerFingerprint
+
+    fingerprint = (
+        AnswerFingerprint.objects.filter(AnswerID_id=answer_id)
+        .values("QuestionID_id", "ClusterID")
+        .first()
+    )
+    if fingerprint is None:
+        return []
+    return list(
+        AnswerFingerprint.objects.filter(
+            QuestionID_id=fingerprint["QuestionID_id"],
+            ClusterID=fingerprint["ClusterID"],
+        )
+        .exclude(AnswerID_id=answer_id)
+        .order_by("AnswerID_id")
+        .values_list("AnswerID_id", flat=True)
+    )
+
+
+def apply_grade_to_cluster(answer, overwrite=False):
+    """
+    把答案最新的最终评分应用到同簇的其他答案，返回应用的答案数。
+    默认跳过已有最终评分的答案；overwrite=True 时一并覆盖。答案没有最终评分时返回 0。
+    """
+    from .grading import confirm_grades
+
+    source = (
+        answer.feedbacks.filter(IsFinal=True).order_by("-CreatedAt", "-FeedbackID").first()
+    )
+    if source is None:
+        return 0
+    return confirm_grades(
+        cluster_member_ids(answer.AnswerID),
+        source.Score,
+        source.Feedback,
+        overwrite=overwrite,
+    )
@@ -0,0 +1,195 @@
+# users/services/operation_logs.py
+
+"""
+操作日志的查询与归档。
+- 查看页面使用基于 (Timestamp, LogID) 的键集分页：翻页条件是“早于/晚于上一页最后一条”，
+  走 (Timestamp, LogID) 及 (AdminID/Operation, Timestamp, LogID) 索引，翻到多深都只读取一页的数据，
+  也不再执行 COUNT(*)
+- 超过保留期限的日志按月写入压缩归档文件 operation_logs_YYYY-MM.jsonl.gz（每行一条 JSON），
+  写入并落盘后再从数据库删除
+"""
+
+import base64
+import gzip
+import json
+import os
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import OperationLog
+
+LOG_PAGE_SIZE = 20
+ARCHIVE_BATCH_SIZE = 1000
+OPERATION_TYPES_CACHE_KEY = "operation-log:types"
+OPERATION_TYPES_CACHE_TIMEOUT = 300  # 单位：秒
+
+
+# =====================
+# 键集分页
+# =====================
+
+
+def encode_cursor(log):
+    raw = f"{log.Timestamp.isoformat()}|{log.LogID}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    # 返回 (时间, 日志ID)；游标无效时返回 None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, log_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def page_operation_logs(
+    admin_id=None, operation=None, after=None, before=None, per_page=LOG_PAGE_SIZE
+):
+    """
+    按时间倒序返回一页日志：{"logs", "next_cursor", "prev_cursor"}。
+    after 为游标时返回比它更早的一页（下一页），before 为游标时返回比它更新的一页（上一页）。
+    """
+    queryset = OperationLog.objects.select_related("AdminID")
+    if admin_id:
+        queryset = queryset.filter(AdminID_id=admin_id)
+    if operation:
+        queryset = queryset.filter(Operation=operation)
+
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+    if before:
+        timestamp, log_id = before
+        queryset = queryset.filter(
+            Q(Timestamp__gt=timestamp) | Q(Timestamp=timestamp, LogID__gt=log_id)
+        ).order_by("Timestamp", "LogID")
+    else:
+        if after:
+            timestamp, log_id = after
+            queryset = queryset.filter(
+                Q(Timestamp__lt=timestamp) | Q(Timestamp=timestamp, LogID__lt=log_id)
+            )
+        queryset = queryset.order_by("-Timestamp", "-LogID")
+
+    # 多取一条判断该方向上是否还有更多数据
+    logs = list(queryset[: per_page + 1])
+    has_more = len(logs) > per_page
+    logs = logs[:per_page]
+    if before:
+        logs.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = after is not None, has_more
+
+    return {
+        "logs": logs,
+        "next_cursor": encode_cursor(logs[-1]) if logs and has_older else None,
+        "prev_cursor": encode_cursor(logs[0]) if logs and has_newer else None,
+    }
+
+
+def operation_types():
+    # 日志中出现过的操作类型，用于筛选下拉框（走 Operation 索引，结果短时间缓存）
+    types = cache.get(OPERATION_TYPES_CACHE_KEY)
+    if types is None:
+        types = list(
+            OperationLog.objects.order_by("Operation")
+            .values_list("Operation", flat=True)
+            .distinct()
+        )
+        cache.set(OPERATION_TYPES_CACHE_KEY, types, OPERATION_TYPES_CACHE_TIMEOUT)
+    return types
+
+
+# =====================
+# 归档
+# =====================
+
+
+def archive_path(directory, month):
+    return os.path.join(directory, f"operation_logs_{month}.jsonl.gz")
+
+
+def _archive_record(log):
+    return {
+        "LogID": log.LogID,
+        "AdminID": log.AdminID_id,
+        "AdminName": log.AdminID.Name,
+        "Operation": log.Operation,
+        "Details": log.Details,
+        "Timestamp": log.Timestamp.isoformat(),
+    }
+
+
+def _append_archive(path, records):
+    # gzip 支持多个压缩流首尾相接，追加写入的文件仍可被 gzip.open 完整读取
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+            for record in records:
+                archive.write(json.dumps(record, ensure_ascii=False).encode())
+                archive.write(b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archive_operation_logs(
+    cutoff, directory, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False
+):
+    """
+    将 cutoff 之前的日志按月（本地时区）追加到归档文件并从数据库删除。
+    返回 {月份: 归档条数}。
+    每批先写入并落盘归档文件，再删除对应的日志；若中途中断，已写入但未删除的日志
+    在下次运行时会再次写入归档（可按 LogID 去重），不会丢失。
+    """
+    if not dry_run:
+        os.makedirs(directory, exist_ok=True)
+    counts = {}
+    last = None  # 上一批最后一条的 (Timestamp, LogID)，dry_run 时用于翻页
+    while True:
+        queryset = (
+            OperationLog.objects.select_related("AdminID")
+            .filter(Timestamp__lt=cutoff)
+            .order_by("Timestamp", "LogID")
+        )
+        if last:
+            queryset = queryset.filter(
+                Q(Timestamp__gt=last[0]) | Q(Timestamp=last[0], LogID__gt=last[1])
+            )
+        batch = list(queryset[:batch_size])
+        if not batch:
+            break
+        last = (batch[-1].Timestamp, batch[-1].LogID)
+
+        by_month = {}
+        for log in batch:
+            month = timezone.localtime(log.Timestamp).strftime("%Y-%m")
+            by_month.setdefault(month, []).append(log)
+        for month, logs in by_month.items():
+            counts[month] = counts.get(month, 0) + len(logs)
+            if not dry_run:
+                _append_archive(
+                    archive_path(directory, month), map(_archive_record, logs)
+                )
+
+        if not dry_run:
+            with transaction.atomic():
+                OperationLog.objects.filter(
+                    LogID__in=[log.LogID for log in batch]
+                ).delete()
+
+    if counts and not dry_run:
+        cache.delete(OPERATION_TYPES_CACHE_KEY)
+    return counts
+
+
+def read_archive(path):
+    # 逐行读取归档文件中的日志记录
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            if line.strip():
+                yield json.loads(line)
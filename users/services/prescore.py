@@ -0,0 +1,188 @@
+# users/services/prescore.py
+
+"""
+调用大模型前的本地预评分。
+根据评分标准中的得分点（ScoringCriteria）和 Prompt 中的“提示词”构建关键词表，
+用 Aho-Corasick 自动机扫描一遍答案，统计每个得分点的关键词命中情况：
+- 空白答案（去掉空白和标点后不足 MIN_LENGTH 个字符）：直接判 0 分
+- 离题答案：一个关键词都没有命中，判 0 分
+- 完整答案：每个得分点的关键词全部命中且没有否定词，判满分（得分点分值之和）
+其余答案交给大模型评分，并可在 Prompt 后附上各得分点的命中情况作为参考。
+空白答案总是直接判定；离题和完整答案只有在 PRESCORE["SKIP_LLM"] 开启时才跳过大模型，
+否则仅把判定结果作为提示附在 Prompt 中。
+"""
+
+import hashlib
+import re
+
+from django.conf import settings
+
+from .aho_corasick import AhoCorasick
+from .rubric import parse_rubric
+
+PRESCORE_DEFAULTS = {
+    "ENABLED": True,
+    "SKIP_LLM": False,  # 离题/完整答案是否直接采用预评分结果，不再调用大模型
+    "DECIDE_OFF_TOPIC": True,
+    "DECIDE_FULL": True,
+    "ATTACH_HINTS": True,  # 是否在 Prompt 中附上得分点命中情况
+    "COVERAGE_THRESHOLD": 0.5,  # 得分点关键词命中比例达到该值视为已覆盖
+    "MIN_LENGTH": 2,
+}
+
+# 出现这些词时答案可能是在否定某个要点，不判为完整答案
+NEGATION_TERMS = ("不是", "并非", "并不", "不会", "没有", "不能", "不属于", "错误")
+
+BLANK, OFF_TOPIC, FULL, UNDECIDED = "blank", "off_topic", "full", "undecided"
+
+_IGNORED_RE = re.compile(r"[\W_]+")
+_HINT_SECTION_RE = re.compile(r"\*\*提示词\*\*\s*\n(.*?)(?:\n\s*\n|\n\s*\*\*|\Z)", re.S)
+_KEYWORD_SPLIT_RE = re.compile(r"[、，,；;。\s]+|和|或|及|与")
+_PHRASE_MIN, _PHRASE_MAX = 2, 6
+
+_PRESCORER_CACHE = {}
+_PRESCORER_CACHE_SIZE = 256
+
+
+def prescore_settings():
+    return {**PRESCORE_DEFAULTS, **getattr(settings, "PRESCORE", {})}
+
+
+def normalize(text):
+    return _IGNORED_RE.sub("", (text or "").lower())
+
+
+def hint_keywords(prompt):
+    """
+    从 Prompt 的“提示词”段落中提取关键词。
+    Prompt 开头的系统提示中可能带有示例题目，只取最后一个“提示词”段落。
+    """
+    sections = _HINT_SECTION_RE.findall(prompt or "")
+    if not sections:
+        return []
+    keywords = (normalize(word) for word in _KEYWORD_SPLIT_RE.split(sections[-1]))
+    return list(dict.fromkeys(word for word in keywords if len(word) >= _PHRASE_MIN))
+
+
+def point_keywords(point_text, hints):
+    """
+    得分点的关键词：得分点中出现的提示词，以及得分点按标点和连词切分后长度适中的短语；
+    都没有时退回得分点的全部双字片段。
+    """
+    text = normalize(point_text)
+    keywords = [hint for hint in hints if hint in text]
+    for phrase in _KEYWORD_SPLIT_RE.split(point_text):
+        phrase = normalize(phrase)
+        if _PHRASE_MIN <= len(phrase) <= _PHRASE_MAX:
+            keywords.append(phrase)
+    if not keywords:
+        keywords = [text[i : i + 2] for i in range(len(text) - 1)]
+    return list(dict.fromkeys(keywords))
+
+
+class PrescoreResult:
+    def __init__(self, decision, score=None, reason="", covered=(), missing=()):
+        self.decision = decision
+        self.score = score
+        self.reason = reason
+        self.covered = list(covered)  # 已覆盖的得分点文本
+        self.missing = list(missing)  # 未覆盖的得分点文本
+
+    @property
+    def decided(self):
+        return self.decision != UNDECIDED
+
+    def hint_text(self):
+        # 附在 Prompt 中的预评分提示
+        lines = ["#### 关键词预检（仅供参考，请以答案实际含义为准）"]
+        if self.reason:
+            lines.append(self.reason)
+        if self.covered:
+            lines.append("可能已答到的得分点：" + "；".join(self.covered))
+        if self.missing:
+            lines.append("未检测到关键词的得分点：" + "；".join(self.missing))
+        return "\n".join(lines)
+
+
+class Prescorer:
+    def __init__(self, criteria, prompt):
+        self.points = parse_rubric(criteria)
+        hints = hint_keywords(prompt)
+        self.point_keywords = [point_keywords(point.text, hints) for point in self.points]
+        self.keywords = set(hints).union(*self.point_keywords)
+        self.full_score = (
+            sum(point.points for point in self.points)
+            if self.points and all(point.points is not None for point in self.points)
+            else None
+        )
+        self._matcher = AhoCorasick(list(self.keywords) + list(NEGATION_TERMS))
+
+    def prescore(self, content, config=None):
+        config = config or prescore_settings()
+        text = normalize(content)
+        if len(text) < config["MIN_LENGTH"]:
+            return PrescoreResult(BLANK, 0, "答案为空或过短，预评分判为 0 分。")
+        if not self.keywords:
+            return PrescoreResult(UNDECIDED)
+
+        found = self._matcher.find_all(text)
+        negated = any(term in found for term in NEGATION_TERMS)
+        covered, missing, complete = [], [], True
+        for point, keywords in zip(self.points, self.point_keywords):
+            hits = sum(1 for keyword in keywords if keyword in found)
+            ratio = hits / len(keywords) if keywords else 0
+            (covered if ratio >= config["COVERAGE_THRESHOLD"] else missing).append(
+                point.text
+            )
+            complete = complete and hits == len(keywords)
+
+        if config["DECIDE_OFF_TOPIC"] and not (found & self.keywords):
+            return PrescoreResult(
+                OFF_TOPIC,
+                0,
+                "答案未涉及任何得分点关键词，预评分判为 0 分。",
+                covered,
+                missing,
+            )
+        if (
+            config["DECIDE_FULL"]
+            and self.points
+            and complete
+            and not negated
+            and self.full_score is not None
+        ):
+            return PrescoreResult(
+                FULL,
+                self.full_score,
+                "答案包含全部得分点的关键词，预评分判为满分。",
+                covered,
+                missing,
+            )
+        return PrescoreResult(UNDECIDED, None, "", covered, missing)
+
+
+def prescorer_for(question):
+    """
+    返回试题的预评分器。自动机按评分标准和 Prompt 的内容缓存，修改后自动重建。
+    """
+    digest = hashlib.md5(
+        f"{question.ScoringCriteria or ''}\0{question.Prompt or ''}".encode()
+    ).hexdigest()
+    prescorer = _PRESCORER_CACHE.get(digest)
+    if prescorer is None:
+        if len(_PRESCORER_CACHE) >= _PRESCORER_CACHE_SIZE:
+            _PRESCORER_CACHE.clear()
+        prescorer = _PRESCORER_CACHE[digest] = Prescorer(
+            question.ScoringCriteria, question.Prompt
+        )
+    return prescorer
+
+
+def grading_prompt(prompt, result, config=None):
+    # 在试题 Prompt 后附上预评分提示（配置关闭或没有得分点时原样返回）
+    config = config or prescore_settings()
+    if not config["ATTACH_HINTS"] or result is None:
+        return prompt
+    if not (result.covered or result.missing or result.reason):
+        return prompt
+    return f"{prompt}\n{result.hint_text()}"
@@ -0,0 +1,161 @@
+# users/services/prompt_templates.py
+
+"""
+试题评分 Prompt 的模板渲染。
+- 课程有 PromptTemplate 时，评分 Prompt 由课程模板（共用的系统提示 + 排版）套入试题的标题、内容、
+  评分标准和试题自己的 Prompt（提示词、参考教材原话等）渲染得到；没有模板的课程沿用试题 Prompt 原文
+- 模板 Body 用不转义 HTML 的模板引擎编译，编译结果按 (课程ID, Version) 缓存在进程内，每个版本只编译一次
+- 渲染结果按 (试题ID, Version) 写入缓存：修改课程模板时 Version 加一，依赖它的 Prompt 全部失效；
+  修改试题时由信号删除该题的缓存（见 users/signals.py）
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.template import Context, Engine
+
+from .question_bank import CONTENT_SECTION, CRITERIA_SECTION, split_sections
+
+PROMPT_CACHE_TIMEOUT = 3600  # 单位：秒
+# 影响渲染结果的试题字段
+PROMPT_FIELDS = {"CourseID", "Title", "Content", "ScoringCriteria", "Prompt"}
+
+_ENGINE = Engine(autoescape=False)
+_COMPILED = {}
+_COMPILED_SIZE = 256
+_UNSET = object()
+
+
+def compile_body(body):
+    # 编译模板 Body，语法错误时抛出 django.template.TemplateSyntaxError
+    return _ENGINE.from_string(body)
+
+
+def compiled_template(template):
+    key = (template.CourseID_id, template.Version)
+    compiled = _COMPILED.get(key)
+    if compiled is None:
+        if len(_COMPILED) >= _COMPILED_SIZE:
+            _COMPILED.clear()
+        compiled = _COMPILED[key] = compile_body(template.Body)
+    return compiled
+
+
+def prompt_cache_key(question_id, version):
+    return f"prompt:{question_id}:v{version}"
+
+
+def course_prompt_template(course_id):
+    from ..models import PromptTemplate
+
+    return PromptTemplate.objects.filter(CourseID_id=course_id).first()
+
+
+def render_question_prompt(question, template=_UNSET):
+    """
+    返回试题用于评分的完整 Prompt。
+    template 为课程的 PromptTemplate（None 表示课程没有模板）；批量评分同一课程的试题时可由调用方先查出传入。
+    """
+    if template is _UNSET:
+        template = course_prompt_template(question.CourseID_id)
+    if template is None:
+        return question.Prompt or ""
+
+    key = prompt_cache_key(question.QuestionID, template.Version)
+    prompt = cache.get(key)
+    if prompt is None:
+        prompt = (
+            compiled_template(template)
+            .render(
+                Context(
+                    {
+                        "system_prompt": template.SystemPrompt,
+                        "title": question.Title,
+                        "content": question.Content,
+                        "criteria": question.ScoringCriteria or "",
+                        "prompt": question.Prompt or "",
+                    }
+                )
+            )
+            .strip()
+        )
+        cache.set(key, prompt, PROMPT_CACHE_TIMEOUT)
+    return prompt
+
+
+def invalidate_question_prompt(question_id, course_id):
+    from ..models import PromptTemplate
+
+    version = (
+        PromptTemplate.objects.filter(CourseID_id=course_id)
+        .values_list("Version", flat=True)
+        .first()
+    )
+    if version is not None:
+        cache.delete(prompt_cache_key(question_id, version))
+
+
+def invalidate_course_prompts(course_id, version):
+    # 删除模板时调用：之后重建的模板 Version 会从 1 开始，需清掉旧版本的渲染结果
+    from ..models import Question
+
+    question_ids = Question.objects.filter(CourseID_id=course_id).values_list(
+        "QuestionID", flat=True
+    )
+    cache.delete_many([prompt_cache_key(pk, version) for pk in question_ids])
+
+
+def question_prompt(prompt, system_prompt):
+    """
+    把包含系统提示的完整 Prompt 转为模板下的试题 Prompt：
+    去掉开头的系统提示，以及与试题内容、评分标准字段重复的小节。
+    """
+    prompt = (prompt or "")[len(system_prompt) :] if system_prompt else prompt or ""
+    preamble, sections = split_sections(prompt)
+    parts = [preamble] if preamble else []
+    parts.extend(
+        f"**{name}**\n{text}"
+        for name, text in sections
+        if name not in (CONTENT_SECTION, CRITERIA_SECTION)
+    )
+    return "\n\n".join(parts)
+
+
+def save_prompt_template(course, system_prompt, body=None):
+    """
+    创建或修改课程的评分模板，内容有变化时 Version 加一，返回 (模板, 是否有变化)。
+    课程中仍以该系统提示开头的试题 Prompt（模板启用前录入的完整 Prompt）会一并转为试题 Prompt，
+    避免渲染后系统提示重复出现。
+    """
+    from ..models import PromptTemplate, Question
+
+    with transaction.atomic():
+        template = (
+            PromptTemplate.objects.select_for_update().filter(CourseID=course).first()
+        )
+        if template is None:
+            template = PromptTemplate(CourseID=course, SystemPrompt=system_prompt)
+            if body is not None:
+                template.Body = body
+            template.save()
+        else:
+            body = template.Body if body is None else body
+            if template.SystemPrompt == system_prompt and template.Body == body:
+                return template, False
+            template.SystemPrompt = system_prompt
+            template.Body = body
+            template.Version = F("Version") + 1
+            template.save()
+            template.refresh_from_db(fields=["Version"])
+
+        if system_prompt:
+            legacy = list(
+                Question.objects.filter(
+                    CourseID=course, Prompt__startswith=system_prompt
+                ).only("QuestionID", "Prompt")
+            )
+            for question in legacy:
+                question.Prompt = question_prompt(question.Prompt, system_prompt)
+            # Version 已变化，bulk_update 不触发信号也不会留下过期的渲染缓存
+            Question.objects.bulk_update(legacy, ["Prompt"], batch_size=500)
+    return template, True
@@ -0,0 +1,254 @@
+# users/services/provider_telemetry.py
+
+"""
+评分接口（大模型 API）的调用统计。
+judge_answer 每调用一次评分接口记录一条：所用 API Key、接口名、模型版本、总耗时、首字节时间（TTFB）、
+HTTP 状态码（连接失败记为 0）、重试次数，以及返回内容是否无法解析。
+- 按 API Key 统计，模型和版本作为标签；健康面板另按“接口 + 版本”汇总，便于区分是某个 Key 的问题还是整个接口变慢
+- OpenAI 兼容接口另按接口地址记录每一次请求（不含重试），供地址路由判断健康状况（见 users/services/judge_endpoints.py）
+- 耗时和 TTFB 为滚动窗口直方图（窗口长度与 METRICS 相同），API Key 管理页面据此估算 p50/p95 并判断健康状态；
+  导出到 Prometheus 的是进程启动以来的累计分布，不随窗口滚动减少
+- render_prometheus() 的结果附加在 /metrics/ 的输出之后
+与 users/services/metrics.py 一样，统计保存在进程内存中，多进程部署时每个进程各自统计。
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+
+from .metrics import LATENCY_BUCKETS, RollingHistogram, escape_label, metrics_settings
+
+# 健康状态判断：最近窗口内的错误率和 p95 耗时
+DEGRADED_ERROR_RATE = 0.1
+UNHEALTHY_ERROR_RATE = 0.5
+MIN_UNHEALTHY_CALLS = 5  # 调用次数太少时最多判为 degraded，避免偶然的一两次失败就停用接口地址
+SLOW_P95 = 30.0  # 单位：秒
+
+HEALTH_LABELS = {
+    "healthy": "正常",
+    "degraded": "较慢或偶有失败",
+    "unhealthy": "异常",
+    "unknown": "暂无调用",
+}
+TTFB_BUCKETS = LATENCY_BUCKETS
+# 评分接口的耗时通常在秒级，额外增加更大的桶
+PROVIDER_LATENCY_BUCKETS = LATENCY_BUCKETS + (20, 30, 60, 120)
+
+
+class CallStats:
+    def __init__(self, window, slots):
+        self.latency = RollingHistogram(PROVIDER_LATENCY_BUCKETS, window, slots)
+        self.ttfb = RollingHistogram(TTFB_BUCKETS, window, slots)
+        self.errors = RollingHistogram((0.5,), window, slots)  # 值为 0/1，计数即调用数
+        self.statuses = {}  # 状态码 -> 进程启动以来的次数
+        self.retries = 0
+        self.parse_failures = 0
+        self.last_status = None
+        self.last_called = None  # time.time()
+
+    def health(self, now):
+        _buckets, failures, calls = self.errors.snapshot(now)
+        if not calls:
+            return {"status": "unknown", "label": HEALTH_LABELS["unknown"], "calls": 0}
+        error_rate = failures / calls
+        p95 = self.latency.quantile(0.95, now)
+        if error_rate >= UNHEALTHY_ERROR_RATE and calls >= MIN_UNHEALTHY_CALLS:
+            status = "unhealthy"
+        elif error_rate >= DEGRADED_ERROR_RATE or (p95 or 0) >= SLOW_P95:
+            status = "degraded"
+        else:
+            status = "healthy"
+        ttfb = self.ttfb.quantile(0.5, now)
+        return {
+            "status": status,
+            "label": HEALTH_LABELS[status],
+            "calls": calls,
+            "error_rate": error_rate,
+            "p50_ms": self.latency.quantile(0.5, now) * 1000,
+            "p95_ms": p95 * 1000,
+            "ttfb_p50_ms": ttfb * 1000 if ttfb is not None else None,
+            "retries": self.retries,
+            "parse_failures": self.parse_failures,
+            "last_status": self.last_status,
+            "last_called": datetime.fromtimestamp(self.last_called, timezone.utc),
+        }
+
+
+class ProviderTelemetry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_key = {}  # API Key ID -> (接口名, 版本, CallStats)
+        self._by_version = {}  # (接口名, 版本) -> CallStats
+        self._by_endpoint = {}  # 地址名称 -> (接口名, CallStats)
+
+    def reset(self):
+        with self._lock:
+            self._by_key.clear()
+            self._by_version.clear()
+            self._by_endpoint.clear()
+
+    def record(
+        self,
+        key_id,
+        provider,
+        version,
+        latency,
+        status_code,
+        ttfb=None,
+        retries=0,
+        parse_error=False,
+        failed=False,
+    ):
+        """
+        记录一次评分接口调用（含重试在内的整次调用）。latency、ttfb 单位为秒，
+        failed 表示最终没有得到分数。
+        """
+        config = metrics_settings()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._by_key.get(key_id)
+            if entry is None or entry[:2] != (provider, version):
+                # 管理员修改了 Key 的模型或版本，重新统计
+                entry = self._by_key[key_id] = (
+                    provider,
+                    version,
+                    CallStats(config["WINDOW"], config["SLOTS"]),
+                )
+            version_stats = self._by_version.get((provider, version))
+            if version_stats is None:
+                version_stats = self._by_version[(provider, version)] = CallStats(
+                    config["WINDOW"], config["SLOTS"]
+                )
+            for stats in (entry[2], version_stats):
+                stats.latency.observe(latency, now)
+                if ttfb is not None:
+                    stats.ttfb.observe(ttfb, now)
+                stats.errors.observe(1 if failed else 0, now)
+                status = str(status_code)
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+                stats.retries += retries
+                stats.parse_failures += 1 if parse_error else 0
+                stats.last_status = status_code
+                stats.last_called = time.time()
+
+    def record_endpoint(
+        self, endpoint, provider, latency, status_code, ttfb=None, failed=False
+    ):
+        # 记录对某个接口地址的一次请求，latency、ttfb 单位为秒
+        config = metrics_settings()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._by_endpoint.get(endpoint)
+            if entry is None:
+                entry = self._by_endpoint[endpoint] = (
+                    provider,
+                    CallStats(config["WINDOW"], config["SLOTS"]),
+                )
+            stats = entry[1]
+            stats.latency.observe(latency, now)
+            if ttfb is not None:
+                stats.ttfb.observe(ttfb, now)
+            stats.errors.observe(1 if failed else 0, now)
+            status = str(status_code)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.last_status = status_code
+            stats.last_called = time.time()
+
+    def key_health(self):
+        # {API Key ID: 健康信息}
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key_id: {"provider": provider, "version": version, **stats.health(now)}
+                for key_id, (provider, version, stats) in self._by_key.items()
+            }
+
+    def version_health(self):
+        # [健康信息, ...]，按接口名和版本排序
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {"provider": provider, "version": version, **stats.health(now)}
+                for (provider, version), stats in sorted(self._by_version.items())
+            ]
+
+    def endpoint_health(self):
+        # {地址名称: 健康信息}
+        now = time.monotonic()
+        with self._lock:
+            return {
+                endpoint: {"endpoint": endpoint, "provider": provider, **stats.health(now)}
+                for endpoint, (provider, stats) in self._by_endpoint.items()
+            }
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            entries = sorted(self._by_key.items())
+            for name, attribute, help_text in (
+                ("njup_provider_latency_seconds", "latency", "评分接口调用耗时（含重试）"),
+                ("njup_provider_ttfb_seconds", "ttfb", "评分接口首字节时间"),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for key_id, (provider, version, stats) in entries:
+                    buckets, total, count = getattr(stats, attribute).totals()
+                    if not count:
+                        continue
+                    label = _labels(key_id, provider, version)
+                    for bound, value in buckets:
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {value}')
+                    lines.append(f"{name}_sum{{{label}}} {total:.6f}")
+                    lines.append(f"{name}_count{{{label}}} {count}")
+
+            lines.append("# HELP njup_provider_responses_total 评分接口响应数（按 HTTP 状态码，0 表示连接失败）")
+            lines.append("# TYPE njup_provider_responses_total counter")
+            for key_id, (provider, version, stats) in entries:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(
+                        f'njup_provider_responses_total{{{_labels(key_id, provider, version)},'
+                        f'status="{status}"}} {count}'
+                    )
+            for name, attribute, help_text in (
+                ("njup_provider_retries_total", "retries", "评分接口的重试次数"),
+                ("njup_provider_parse_failures_total", "parse_failures", "无法解析的评分接口返回内容数"),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for key_id, (provider, version, stats) in entries:
+                    lines.append(
+                        f"{name}{{{_labels(key_id, provider, version)}}} "
+                        f"{getattr(stats, attribute)}"
+                    )
+
+            endpoints = sorted(self._by_endpoint.items())
+            name = "njup_provider_endpoint_latency_seconds"
+            lines.append(f"# HELP {name} 对各接口地址的单次请求耗时")
+            lines.append(f"# TYPE {name} histogram")
+            for endpoint, (provider, stats) in endpoints:
+                buckets, total, count = stats.latency.totals()
+                if not count:
+                    continue
+                label = f'endpoint="{escape_label(endpoint)}",provider="{escape_label(provider)}"'
+                for bound, value in buckets:
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {value}')
+                lines.append(f"{name}_sum{{{label}}} {total:.6f}")
+                lines.append(f"{name}_count{{{label}}} {count}")
+            lines.append(
+                "# HELP njup_provider_endpoint_responses_total 各接口地址的响应数（按 HTTP 状态码，0 表示连接失败）"
+            )
+            lines.append("# TYPE njup_provider_endpoint_responses_total counter")
+            for endpoint, (provider, stats) in endpoints:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(
+                        f'njup_provider_endpoint_responses_total{{endpoint="{escape_label(endpoint)}",'
+                        f'provider="{escape_label(provider)}",status="{status}"}} {count}'
+                    )
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key_id, provider, version):
+    return f'key_id="{key_id}",provider="{escape_label(provider)}",version="{escape_label(version)}"'
+
+
+PROVIDER_TELEMETRY = ProviderTelemetry()
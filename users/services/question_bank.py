@@ -0,0 +1,245 @@
+# users/services/question_bank.py
+
+"""
+题库文件（Markdown）的解析与导入。
+文件格式（参见仓库中的“第5章 变质作用与变质岩 习题及答案.markdown”）：
+- 开头 “# system prompt:” 之后、第一条 “---” 之前为评分用的系统提示
+- “## 一、名词解释” 等二级标题为题型分节，各节题号从 1 重新开始；标题括号中的说明附在该节各题的 Prompt 中
+- “### N. 标题” 为一道题，其下 “**试题内容**”、“**评分标准**”、“**提示词**”、
+  “**参考教材原话**” 等加粗行为小节标题，题与题之间以 “---” 分隔
+解析器逐行读取，读完一道题就产出一道题，不需要把整个文件读入内存。
+系统提示写入课程的评分模板（PromptTemplate），试题内容、评分标准写入对应字段，
+试题 Prompt 只保存其余小节（提示词、参考教材原话等），评分时由模板渲染出完整 Prompt；
+文件没有系统提示且课程还没有模板时不建模板，试题 Prompt 保存全部小节，按原文评分。
+导入时以 (课程, 标题) 识别已有试题：先一次查出课程中已有的试题，新题 bulk_create，
+内容有变化的题 bulk_update，未变化的不写数据库，因此重复导入同一文件不会产生重复试题。
+"""
+
+import re
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+CONTENT_SECTION = "试题内容"
+CRITERIA_SECTION = "评分标准"
+TITLE_MAX_LENGTH = 100  # 与 Question.Title 一致
+IMPORT_BATCH_SIZE = 500
+
+_SYSTEM_PROMPT_RE = re.compile(r"^#\s*system prompt\s*[:：]?\s*$", re.I)
+_PART_RE = re.compile(
+    r"^##\s+(?:[一二三四五六七八九十]+、)?\s*([^（(\s]+)\s*(?:[（(](.*)[）)])?\s*$"
+)
+_ITEM_RE = re.compile(r"^###\s+(\d+)[.、．]\s*(.+?)\s*$")
+_SECTION_RE = re.compile(r"^\*\*(.+?)\*\*\s*$")
+_SEPARATOR_RE = re.compile(r"^-{3,}\s*$")
+
+
+class QuestionItem:
+    def __init__(self, part, number, heading, note=""):
+        self.part = part  # 题型分节，如“名词解释”
+        self.note = note  # 分节标题括号中对评分的说明
+        self.number = number
+        self.heading = heading
+        self.sections = []  # [(小节标题, 文本), ...]，保持文件中的顺序
+
+    def section(self, name):
+        for section_name, text in self.sections:
+            if section_name == name:
+                return text
+        return ""
+
+    @property
+    def title(self):
+        title = f"{self.part} {self.number}. {self.heading}" if self.part else self.heading
+        return title[:TITLE_MAX_LENGTH]
+
+    def prompt(self, templated=True):
+        # 试题自己的 Prompt：分节说明 + 试题内容、评分标准以外的小节（提示词段落供预评分使用）；
+        # 课程没有评分模板时 Prompt 原样用于评分，保留全部小节
+        parts = [self.note] if self.note else []
+        parts.extend(
+            f"**{name}**\n{text}"
+            for name, text in self.sections
+            if not templated or name not in (CONTENT_SECTION, CRITERIA_SECTION)
+        )
+        return "\n\n".join(parts)
+
+
+class QuestionBankParser:
+    """
+    逐行解析题库文件，迭代产出 QuestionItem。
+    system_prompt 在产出第一道题之前即已读出。
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.system_prompt = ""
+
+    def __iter__(self):
+        lines = iter(self.lines)
+        part, note = "", ""
+        item = None
+        section_name, section_lines = None, []
+        prompt_lines, in_prompt = [], False
+
+        def close_section():
+            if item is not None and section_name is not None:
+                item.sections.append((section_name, "\n".join(section_lines).strip()))
+
+        for raw in lines:
+            line = raw.rstrip()
+            if in_prompt:
+                if _SEPARATOR_RE.match(line):
+                    in_prompt = False
+                    self.system_prompt = _strip_braces("\n".join(prompt_lines).strip())
+                else:
+                    prompt_lines.append(line)
+                continue
+            if _SYSTEM_PROMPT_RE.match(line):
+                in_prompt = True
+                continue
+
+            match = _ITEM_RE.match(line)
+            if match or line.startswith("## ") or _SEPARATOR_RE.match(line):
+                close_section()
+                if item is not None and item.sections:
+                    yield item
+                item, section_name, section_lines = None, None, []
+                if match:
+                    item = QuestionItem(part, int(match.group(1)), match.group(2), note)
+                elif line.startswith("## "):
+                    part_match = _PART_RE.match(line)
+                    if part_match:
+                        part, note = part_match.group(1), part_match.group(2) or ""
+                    else:
+                        part, note = line[3:].strip(), ""
+                continue
+
+            if item is None:
+                continue
+            match = _SECTION_RE.match(line)
+            if match:
+                close_section()
+                section_name, section_lines = match.group(1).strip(), []
+            elif section_name is not None:
+                section_lines.append(line)
+
+        if in_prompt:
+            self.system_prompt = _strip_braces("\n".join(prompt_lines).strip())
+        close_section()
+        if item is not None and item.sections:
+            yield item
+
+
+def _strip_braces(text):
+    # 系统提示整体包在一对花括号中，去掉最外层的括号
+    if text.startswith("{") and text.endswith("}"):
+        return text[1:-1].strip()
+    return text
+
+
+def split_sections(text):
+    """
+    把 Prompt 文本按加粗的小节标题切分，返回 (第一个小节之前的文本, [(小节标题, 文本), ...])。
+    """
+    preamble, sections = [], []
+    name, lines = None, []
+    for line in (text or "").splitlines():
+        match = _SECTION_RE.match(line.rstrip())
+        if match:
+            if name is not None:
+                sections.append((name, "\n".join(lines).strip()))
+            name, lines = match.group(1).strip(), []
+        elif name is None:
+            preamble.append(line)
+        else:
+            lines.append(line)
+    if name is not None:
+        sections.append((name, "\n".join(lines).strip()))
+    return "\n".join(preamble).strip(), sections
+
+
+def question_values(item, templated=True):
+    return {
+        "Content": item.section(CONTENT_SECTION),
+        "ScoringCriteria": item.section(CRITERIA_SECTION),
+        "Prompt": item.prompt(templated),
+    }
+
+
+def import_question_bank(course, lines, is_open=False, dry_run=False):
+    """
+    把题库文件的全部试题导入课程，返回 {"created": 新建数, "updated": 更新数, "unchanged": 未变化数}。
+    同一文件中标题重复的题以后出现的为准；文件中的系统提示写入课程的评分模板（有变化时版本加一）。
+    文件没有系统提示且课程没有模板时不建模板，试题 Prompt 保存包括试题内容、评分标准在内的全部小节。
+    bulk_create/bulk_update 不触发 post_save 信号，新建试题的统计行、管理员主页计数缓存
+    和更新试题的 Prompt 渲染缓存在这里处理。
+    """
+    from ..models import Question
+    from .admin_tables import invalidate_dashboard_counts
+    from .prompt_templates import (
+        course_prompt_template,
+        prompt_cache_key,
+        save_prompt_template,
+    )
+    from .question_stats import ensure_question_stats
+
+    parser = QuestionBankParser(lines)
+    items = {}
+    for item in parser:
+        items[item.title] = item
+
+    # 文件没有系统提示时不新建模板：没有模板的课程按试题 Prompt 原文评分
+    template = course_prompt_template(course.CourseID)
+    templated = template is not None or bool(parser.system_prompt)
+    existing = {
+        question.Title: question
+        for question in Question.objects.filter(CourseID=course).only(
+            "QuestionID", "Title", "Content", "ScoringCriteria", "Prompt"
+        )
+    }
+    fields = ["Content", "ScoringCriteria", "Prompt"]
+    to_create, to_update = [], []
+    now = timezone.now()
+    for title, item in items.items():
+        values = question_values(item, templated)
+        question = existing.get(title)
+        if question is None:
+            to_create.append(
+                Question(
+                    CourseID=course,
+                    Title=title,
+                    CreatedAt=now,
+                    IsOpen=is_open,
+                    OpenAt=now if is_open else None,
+                    **values,
+                )
+            )
+        elif any(getattr(question, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(question, field, value)
+            to_update.append(question)
+
+    result = {
+        "created": len(to_create),
+        "updated": len(to_update),
+        "unchanged": len(items) - len(to_create) - len(to_update),
+    }
+    if dry_run:
+        return result
+
+    with transaction.atomic():
+        # 先写入模板：模板启用前录入的完整 Prompt 会在这里转为试题 Prompt
+        if parser.system_prompt:
+            template, _changed = save_prompt_template(course, parser.system_prompt)
+        created = Question.objects.bulk_create(to_create, batch_size=IMPORT_BATCH_SIZE)
+        Question.objects.bulk_update(to_update, fields, batch_size=IMPORT_BATCH_SIZE)
+        ensure_question_stats([question.QuestionID for question in created])
+    if created:
+        invalidate_dashboard_counts()
+    if to_update and template is not None:
+        cache.delete_many(
+            [prompt_cache_key(q.QuestionID, template.Version) for q in to_update]
+        )
+    return result
@@ -0,0 +1,206 @@
+# users/services/question_stats.py
+
+"""
+试题评分统计（QuestionStats）的增量维护与重建。
+每个答案计入统计的是它的“分数快照”：
+- 最终评分：最新一条 IsFinal=True 的评分反馈的 Score
+- AI 评分：最新一条带 AIScore 的评分反馈的 AIScore
+快照保存在 StudentAnswer.FinalScore / AIScore 中。评分反馈变化时重新计算该答案的快照，
+从统计中减去旧快照、加上新快照，因此每次更新只涉及一个答案的评分记录，与答案总数无关。
+QuestionStats 行在创建试题时建立，信号处理中只更新已有的行，不会新建；
+缺失或不一致时可通过 rebuild_question_stats 命令从评分记录重新计算。
+"""
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import F
+
+HISTOGRAM_BIN_WIDTH = 10  # 每档 10 分
+HISTOGRAM_BINS = 20  # 评分范围 0~200（见 GradeAnswerForm），200 分计入最后一档
+REBUILD_BATCH_SIZE = 200  # 重建时每批处理的试题数
+
+
+def histogram_bin(score):
+    return max(0, min(int(score // HISTOGRAM_BIN_WIDTH), HISTOGRAM_BINS - 1))
+
+
+def snapshot_from_feedbacks(rows):
+    """
+    根据一个答案的评分记录计算分数快照，返回 (最终评分, AI 评分)。
+    rows 为 (Score, AIScore, IsFinal) 序列，按时间从新到旧排列。
+    """
+    final_score = next((score for score, _, is_final in rows if is_final), None)
+    ai_score = next((ai for _, ai, _ in rows if ai is not None), None)
+    return final_score, ai_score
+
+
+def _apply_snapshot(stats, final_score, ai_score, sign):
+    # sign 为 1 时把快照计入统计，为 -1 时从统计中移除
+    histogram = list(stats.Histogram) or [0] * HISTOGRAM_BINS
+    if ai_score is not None:
+        stats.AIGradedCount += sign
+    if final_score is not None:
+        stats.ConfirmedCount += sign
+        stats.ScoreSum += sign * final_score
+        stats.ScoreSumSq += sign * final_score * final_score
+        histogram[histogram_bin(final_score)] += sign
+        if ai_score is not None:
+            delta = final_score - ai_score
+            stats.DeltaCount += sign
+            stats.DeltaSum += sign * delta
+            stats.DeltaAbsSum += sign * abs(delta)
+    stats.Histogram = histogram
+
+
+def _feedback_rows(ScoringFeedback, answer_filter):
+    return ScoringFeedback.objects.filter(**answer_filter).order_by(
+        "AnswerID", "-CreatedAt", "-FeedbackID"
+    )
+
+
+def refresh_answer_stats(answer_id):
+    """
+    重新计算一个答案的分数快照，并把变化量计入所属试题的统计。
+    在评分反馈保存或删除所在的事务提交后调用（见 users/signals.py）。
+    """
+    from ..models import QuestionStats, ScoringFeedback, StudentAnswer
+
+    with transaction.atomic():
+        answer = (
+            StudentAnswer.objects.filter(AnswerID=answer_id)
+            .values("QuestionID_id", "FinalScore", "AIScore")
+            .first()
+        )
+        if answer is None:  # 答案已被删除（级联删除过程中）
+            return
+
+        rows = _feedback_rows(ScoringFeedback, {"AnswerID_id": answer_id}).values_list(
+            "Score", "AIScore", "IsFinal"
+        )
+        final_score, ai_score = snapshot_from_feedbacks(rows)
+        if (final_score, ai_score) == (answer["FinalScore"], answer["AIScore"]):
+            return
+
+        StudentAnswer.objects.filter(AnswerID=answer_id).update(
+            FinalScore=final_score, AIScore=ai_score
+        )
+        stats = (
+            QuestionStats.objects.select_for_update()
+            .filter(QuestionID_id=answer["QuestionID_id"])
+            .first()
+        )
+        if stats is None:  # 试题正在被删除，或统计尚未建立（需运行 rebuild_question_stats）
+            return
+        _apply_snapshot(stats, answer["FinalScore"], answer["AIScore"], -1)
+        _apply_snapshot(stats, final_score, ai_score, 1)
+        stats.save()
+
+
+def change_answer_count(question_id, delta):
+    # 答案新增时只需调整答案数（新答案还没有评分记录）
+    from ..models import QuestionStats
+
+    QuestionStats.objects.filter(QuestionID_id=question_id).update(
+        AnswerCount=F("AnswerCount") + delta
+    )
+
+
+def remove_answer_stats(question_id, final_score, ai_score):
+    """
+    把已删除答案的分数快照移出统计，并减少答案数。
+    答案的评分记录随答案级联删除，提交后执行的 refresh_answer_stats 已找不到答案，
+    因此由答案删除的信号传入删除时的快照（级联删除时 Django 从数据库读取被删除的答案）。
+    """
+    from ..models import QuestionStats
+
+    with transaction.atomic():
+        stats = (
+            QuestionStats.objects.select_for_update()
+            .filter(QuestionID_id=question_id)
+            .first()
+        )
+        if stats is None:  # 试题已被删除
+            return
+        stats.AnswerCount -= 1
+        _apply_snapshot(stats, final_score, ai_score, -1)
+        stats.save()
+
+
+def ensure_question_stats(question_ids):
+    # 为新建的试题建立空的统计行（批量创建试题时也需调用）
+    from ..models import QuestionStats
+
+    QuestionStats.objects.bulk_create(
+        [QuestionStats(QuestionID_id=question_id) for question_id in question_ids],
+        ignore_conflicts=True,
+    )
+
+
+def rebuild_question_stats(question_ids=None, apps=global_apps):
+    """
+    根据评分记录重新计算试题统计和答案快照，返回处理的试题数。
+    question_ids 为 None 时重建全部试题。apps 供数据迁移传入历史模型。
+    """
+    Question = apps.get_model("users", "Question")
+    StudentAnswer = apps.get_model("users", "StudentAnswer")
+    ScoringFeedback = apps.get_model("users", "ScoringFeedback")
+    QuestionStats = apps.get_model("users", "QuestionStats")
+
+    questions = Question.objects.order_by("QuestionID")
+    if question_ids is not None:
+        questions = questions.filter(QuestionID__in=question_ids)
+    all_ids = list(questions.values_list("QuestionID", flat=True))
+
+    for start in range(0, len(all_ids), REBUILD_BATCH_SIZE):
+        chunk = all_ids[start : start + REBUILD_BATCH_SIZE]
+        with transaction.atomic():
+            stats = {
+                question_id: QuestionStats(QuestionID_id=question_id)
+                for question_id in chunk
+            }
+            answers = {}
+            for answer_id, question_id in StudentAnswer.objects.filter(
+                QuestionID_id__in=chunk
+            ).values_list("AnswerID", "QuestionID_id"):
+                answers[answer_id] = (question_id, [])
+                stats[question_id].AnswerCount += 1
+
+            for answer_id, score, ai_score, is_final in _feedback_rows(
+                ScoringFeedback, {"AnswerID__QuestionID_id__in": chunk}
+            ).values_list("AnswerID_id", "Score", "AIScore", "IsFinal"):
+                answers[answer_id][1].append((score, ai_score, is_final))
+
+            updated = []
+            for answer_id, (question_id, rows) in answers.items():
+                final_score, ai_score = snapshot_from_feedbacks(rows)
+                _apply_snapshot(stats[question_id], final_score, ai_score, 1)
+                updated.append(
+                    StudentAnswer(
+                        AnswerID=answer_id, FinalScore=final_score, AIScore=ai_score
+                    )
+                )
+
+            StudentAnswer.objects.bulk_update(
+                updated, ["FinalScore", "AIScore"], batch_size=REBUILD_BATCH_SIZE
+            )
+            QuestionStats.objects.filter(QuestionID_id__in=chunk).delete()
+            for question_stats in stats.values():
+                question_stats.Histogram = (
+                    question_stats.Histogram or [0] * HISTOGRAM_BINS
+                )
+            QuestionStats.objects.bulk_create(stats.values())
+    return len(all_ids)
+
+
+def histogram_rows(stats):
+    # 分布直方图的展示数据：[{"label": "0-10", "count": 答案数, "percent": 占比}, ...]
+    histogram = stats.Histogram or [0] * HISTOGRAM_BINS
+    total = sum(histogram)
+    return [
+        {
+            "label": f"{i * HISTOGRAM_BIN_WIDTH}-{(i + 1) * HISTOGRAM_BIN_WIDTH}",
+            "count": count,
+            "percent": 100 * count / total if total else 0,
+        }
+        for i, count in enumerate(histogram)
+    ]
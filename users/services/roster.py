@@ -0,0 +1,245 @@
+# users/services/roster.py
+
+"""
+学生名单批量导入。
+支持 CSV 和 XLSX 文件：先逐行流式读取并校验，再用少量集合操作写入数据库——
+按邮箱查询已有学生、bulk_create 新学生、再按邮箱取回学生ID、bulk_create 选课记录，
+查询次数只与名单行数/批次大小有关，而不是每个学生两次以上的查询。
+"""
+
+import csv
+import io
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from ..models import Student, StudentCourse
+from ..passwords import default_password_hash
+from ..principal import invalidate_principals
+from .admin_tables import invalidate_dashboard_counts
+
+# SQLite 单条语句的参数个数有限，IN 查询和批量插入按该大小分批
+ROSTER_BATCH_SIZE = 500
+
+# 表头识别：第一行包含以下任一列名时视为表头，否则按“姓名, 邮箱”两列处理
+NAME_HEADERS = {"name", "姓名", "学生姓名"}
+EMAIL_HEADERS = {"email", "邮箱", "电子邮箱", "e-mail"}
+
+# 每行的导入结果
+STATUS_CREATED = "created"  # 新建学生并加入课程
+STATUS_ENROLLED = "enrolled"  # 已有学生，新加入课程
+STATUS_ALREADY_ENROLLED = "already_enrolled"  # 已在课程中
+STATUS_DUPLICATE = "duplicate"  # 与文件中前面的行邮箱重复
+STATUS_INVALID = "invalid"  # 校验失败
+
+STATUS_LABELS = {
+    STATUS_CREATED: "新建并加入",
+    STATUS_ENROLLED: "已有学生，加入课程",
+    STATUS_ALREADY_ENROLLED: "已在课程中",
+    STATUS_DUPLICATE: "重复行",
+    STATUS_INVALID: "无效",
+}
+
+
+class RosterImportError(Exception):
+    pass
+
+
+def _chunks(items, size=ROSTER_BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _open_text(binary_file):
+    # 优先按 UTF-8（兼容 BOM）解码；Excel 导出的中文 CSV 常为 GBK，解码失败时按 GB18030 处理
+    sample = binary_file.read(64 * 1024)
+    binary_file.seek(0)
+    try:
+        sample.decode("utf-8-sig")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # 采样可能恰好截断在多字节字符中间，只有错误不在末尾时才判定为非 UTF-8
+        encoding = "utf-8-sig" if e.start >= len(sample) - 3 else "gb18030"
+    return io.TextIOWrapper(binary_file, encoding=encoding, newline="")
+
+
+def _iter_csv(uploaded_file):
+    for row in csv.reader(_open_text(uploaded_file.file)):
+        yield row
+
+
+def _iter_xlsx(uploaded_file):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RosterImportError("服务器未安装 openpyxl，无法导入 xlsx 文件，请改用 csv 格式。")
+    # read_only 模式按行流式读取，不会把整个工作簿加载到内存
+    workbook = load_workbook(uploaded_file.file, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ["" if cell is None else str(cell) for cell in row]
+    finally:
+        workbook.close()
+
+
+def iter_roster_file(uploaded_file):
+    """
+    流式读取名单文件，逐行生成 (行号, 姓名, 邮箱)。
+    """
+    ext = os.path.splitext(uploaded_file.name)[1].lower()
+    if ext == ".csv":
+        rows = _iter_csv(uploaded_file)
+    elif ext == ".xlsx":
+        rows = _iter_xlsx(uploaded_file)
+    else:
+        raise RosterImportError("仅支持 csv、xlsx 格式的名单文件。")
+
+    name_col, email_col = 0, 1
+    for row_number, row in enumerate(rows, start=1):
+        cells = [cell.strip() for cell in row]
+        if row_number == 1:
+            lowered = [cell.lower() for cell in cells]
+            name_idx = [i for i, cell in enumerate(lowered) if cell in NAME_HEADERS]
+            email_idx = [i for i, cell in enumerate(lowered) if cell in EMAIL_HEADERS]
+            if name_idx or email_idx:  # 表头行
+                if not (name_idx and email_idx):
+                    raise RosterImportError("表头必须同时包含姓名列和邮箱列。")
+                name_col, email_col = name_idx[0], email_idx[0]
+                continue
+        if not any(cells):  # 跳过空行
+            continue
+        name = cells[name_col] if name_col < len(cells) else ""
+        email = cells[email_col] if email_col < len(cells) else ""
+        yield row_number, name, email
+
+
+def _validate_row(name, email):
+    if not name:
+        return "姓名为空"
+    if len(name) > Student._meta.get_field("Name").max_length:
+        return "姓名过长"
+    try:
+        validate_email(email)
+    except ValidationError:
+        return "邮箱格式无效"
+    if len(email) > Student._meta.get_field("Email").max_length:
+        return "邮箱过长"
+    return None
+
+
+def import_roster(course, rows):
+    """
+    将名单导入课程。
+    rows 为 (行号, 姓名, 邮箱) 的可迭代对象，返回每行的导入结果列表，
+    每项为 {"row", "name", "email", "status", "label", "message"}。
+    已存在的学生按邮箱匹配，姓名以数据库中已有记录为准。
+    """
+    report = []
+    valid = {}  # 邮箱 -> 该行的结果
+
+    # 第一遍：流式校验，只在内存中保留通过校验的行
+    for row_number, name, email in rows:
+        entry = {
+            "row": row_number,
+            "name": name,
+            "email": email,
+            "status": None,
+            "message": "",
+        }
+        report.append(entry)
+        error = _validate_row(name, email)
+        if error:
+            entry.update(status=STATUS_INVALID, message=error)
+        elif email in valid:
+            entry.update(
+                status=STATUS_DUPLICATE,
+                message=f"与第 {valid[email]['row']} 行邮箱重复",
+            )
+        else:
+            valid[email] = entry
+
+    if not valid:
+        return _label(report)
+
+    emails = list(valid)
+    existing = {}  # 邮箱 -> (学生ID, 姓名)
+    for chunk in _chunks(emails):
+        existing.update(
+            (email, (student_id, name))
+            for email, student_id, name in Student.objects.filter(
+                Email__in=chunk
+            ).values_list("Email", "StudentID", "Name")
+        )
+
+    password_hash = default_password_hash()  # 在事务外计算（每个进程只计算一次）
+    with transaction.atomic():
+        # ignore_conflicts：并发导入时邮箱已被其他请求插入也不会失败
+        Student.objects.bulk_create(
+            [
+                Student(Name=valid[email]["name"], Email=email, Password=password_hash)
+                for email in emails
+                if email not in existing
+            ],
+            batch_size=ROSTER_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+        # ignore_conflicts 模式下 bulk_create 不返回主键，按邮箱查询一次取回新学生的ID
+        student_ids = {email: student_id for email, (student_id, _) in existing.items()}
+        for chunk in _chunks(email for email in emails if email not in existing):
+            student_ids.update(
+                Student.objects.filter(Email__in=chunk).values_list(
+                    "Email", "StudentID"
+                )
+            )
+
+        enrolled = set()
+        for chunk in _chunks(student_ids.values()):
+            enrolled.update(
+                StudentCourse.objects.filter(
+                    CourseID=course, StudentID__in=chunk
+                ).values_list("StudentID_id", flat=True)
+            )
+
+        StudentCourse.objects.bulk_create(
+            [
+                StudentCourse(StudentID_id=student_id, CourseID=course)
+                for student_id in student_ids.values()
+                if student_id not in enrolled
+            ],
+            batch_size=ROSTER_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    for email, entry in valid.items():
+        if email not in existing:
+            entry["status"] = STATUS_CREATED
+        elif existing[email][0] in enrolled:
+            entry["status"] = STATUS_ALREADY_ENROLLED
+        else:
+            entry["status"] = STATUS_ENROLLED
+        if email in existing and existing[email][1] != entry["name"]:
+            entry["message"] = f"姓名与已有记录不一致，沿用“{existing[email][1]}”"
+
+    # bulk_create 不会触发信号，手动失效相关学生的登录主体缓存
+    invalidate_principals("student", student_ids.values())
+    if len(student_ids) > len(existing):
+        invalidate_dashboard_counts()
+    return _label(report)
+
+
+def _label(report):
+    for entry in report:
+        entry["label"] = STATUS_LABELS[entry["status"]]
+    return report
+
+
+def summarize_report(report):
+    # 按状态统计导入结果
+    summary = {status: 0 for status in STATUS_LABELS}
+    for entry in report:
+        summary[entry["status"]] += 1
+    return summary
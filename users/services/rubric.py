@@ -0,0 +1,37 @@
+# users/services/rubric.py
+
+"""
+评分标准（Question.ScoringCriteria）的解析。
+评分标准通常每行一个得分点，例如：
+    - 由火成岩变质形成（1分）
+    - 常保留火成岩的部分特征（1分）
+解析为得分点列表，供答案聚类判断每个答案覆盖了哪些得分点。
+"""
+
+import re
+from collections import namedtuple
+
+RubricPoint = namedtuple("RubricPoint", ["text", "points"])
+
+# 行首的列表符号或编号：- * • 1. 1、 1) (1) （1）
+_BULLET_RE = re.compile(r"^\s*(?:[-*•·]|\d+\s*[.、)）]|[（(]\s*\d+\s*[)）])\s*")
+# 行尾的分值：（1分） (0.5 分)
+_POINTS_RE = re.compile(r"[（(]\s*(\d+(?:\.\d+)?)\s*分\s*[)）]\s*[。；;，,]?\s*$")
+
+
+def parse_rubric(criteria):
+    """
+    返回 [RubricPoint(得分点文本, 分值), ...]；没有标注分值的得分点分值为 None。
+    只有带列表符号/编号或标注了分值的行才视为得分点。
+    """
+    points = []
+    for line in (criteria or "").splitlines():
+        bullet = _BULLET_RE.match(line)
+        value = _POINTS_RE.search(line)
+        if not bullet and not value:
+            continue
+        text = line[bullet.end() if bullet else 0 : value.start() if value else None]
+        text = text.strip(" \t：:。；;，,")
+        if text:
+            points.append(RubricPoint(text, float(value.group(1)) if value else None))
+    return points
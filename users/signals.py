@@ -1,9 +1,49 @@
 # users/signals.py
 
-from django.db.models.signals import post_migrate
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import Administrator
-from django.contrib.auth.hashers import make_password
+from .models import (
+    Administrator,
+    Teacher,
+    Student,
+    Course,
+    StudentCourse,
+    Question,
+    StudentAnswer,
+    ScoringFeedback,
+    PromptTemplate,
+)
+from .principal import invalidate_principal
+from .services.admin_tables import invalidate_dashboard_counts
+from .services.answer_search import (
+    index_answer,
+    index_feedback,
+    unindex_answer,
+    unindex_feedback,
+)
+from .services.course_search import index_course, unindex_course
+from .services.near_duplicates import index_answer_fingerprint, release_answer_cluster
+from .services.prompt_templates import (
+    PROMPT_FIELDS,
+    invalidate_course_prompts,
+    invalidate_question_prompt,
+)
+from .services.question_stats import (
+    change_answer_count,
+    ensure_question_stats,
+    refresh_answer_stats,
+    remove_answer_stats,
+)
+from .passwords import default_password_hash
+
+
+def after_commit(func, *args):
+    # 全文索引、近似答案索引和评分统计在事务提交后各自用短事务更新，不延长提交答案、评分等事务持有写锁的时间；
+    # 事务回滚时不更新。更新失败只记录日志（可运行对应的 rebuild 命令修复），不影响已提交的数据
+    transaction.on_commit(partial(func, *args), robust=True)
 
 
 @receiver(post_migrate)
@@ -13,7 +53,194 @@ def create_default_admin(sender, **kwargs):
             Administrator.objects.create(
                 Name="ADMIN",
                 Email="admin@example.com",
-                Password=make_password("123456"),  # 使用加密存储密码
-                # make_password()函数使用默认的PBKDF2算法，迭代数为150000，生成一个128字节的哈希值
+                Password=default_password_hash(),  # 使用加密存储密码，算法由 PASSWORD_HASHERS 配置
             )
             print("默认管理员已创建")
+
+
+# =====================
+# 登录主体缓存失效
+# =====================
+# 主体的姓名、拥有/加入的课程发生变化时，删除对应的缓存，下次请求重新加载
+
+
+@receiver([post_save, post_delete], sender=Administrator)
+def invalidate_admin_principal(sender, instance, **kwargs):
+    invalidate_principal("admin", instance.AdminID)
+
+
+@receiver([post_save, post_delete], sender=Teacher)
+def invalidate_teacher_principal(sender, instance, **kwargs):
+    invalidate_principal("teacher", instance.TeacherID)
+
+
+@receiver([post_save, post_delete], sender=Student)
+def invalidate_student_principal(sender, instance, **kwargs):
+    invalidate_principal("student", instance.StudentID)
+
+
+@receiver(pre_save, sender=Course)
+def remember_course_owner(sender, instance, **kwargs):
+    # 记录保存前的授课教师，课程转给其他教师时原教师的缓存也需失效
+    instance._previous_teacher_id = (
+        Course.objects.filter(pk=instance.pk)
+        .values_list("TeacherID_id", flat=True)
+        .first()
+        if instance.pk is not None
+        else None
+    )
+
+
+@receiver([post_save, post_delete], sender=Course)
+def invalidate_course_owner_principal(sender, instance, **kwargs):
+    invalidate_principal("teacher", instance.TeacherID_id)
+    previous_teacher_id = getattr(instance, "_previous_teacher_id", None)
+    if previous_teacher_id != instance.TeacherID_id:
+        invalidate_principal("teacher", previous_teacher_id)
+
+
+@receiver([post_save, post_delete], sender=StudentCourse)
+def invalidate_enrolled_student_principal(sender, instance, **kwargs):
+    invalidate_principal("student", instance.StudentID_id)
+
+
+# =====================
+# 全文索引同步
+# =====================
+
+
+@receiver(post_save, sender=Course)
+def update_course_index(sender, instance, **kwargs):
+    after_commit(index_course, instance)
+
+
+@receiver(post_delete, sender=Course)
+def remove_course_index(sender, instance, **kwargs):
+    after_commit(unindex_course, instance.CourseID)
+
+
+@receiver(post_save, sender=StudentAnswer)
+def update_answer_index(sender, instance, update_fields=None, **kwargs):
+    # 只修改确认时间等字段时答案内容不变，无需重建索引
+    if update_fields is None or "Content" in update_fields:
+        after_commit(index_answer, instance)
+
+
+@receiver(post_delete, sender=StudentAnswer)
+def remove_answer_index(sender, instance, **kwargs):
+    after_commit(unindex_answer, instance.AnswerID)
+
+
+@receiver(post_save, sender=ScoringFeedback)
+def update_feedback_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "Feedback" in update_fields:
+        after_commit(index_feedback, instance)
+
+
+@receiver(post_delete, sender=ScoringFeedback)
+def remove_feedback_index(sender, instance, **kwargs):
+    after_commit(unindex_feedback, instance.FeedbackID)
+
+
+# =====================
+# 管理员主页统计数字缓存失效
+# =====================
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Question)
+def invalidate_counts_on_create(sender, instance, created, **kwargs):
+    if created:  # 修改记录不影响总数
+        invalidate_dashboard_counts()
+
+
+@receiver(post_delete, sender=Teacher)
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Question)
+def invalidate_counts_on_delete(sender, instance, **kwargs):
+    invalidate_dashboard_counts()
+
+
+# =====================
+# 试题评分统计
+# =====================
+
+
+@receiver(pre_save, sender=ScoringFeedback)
+def remember_ai_score(sender, instance, **kwargs):
+    # 未确认的评分反馈都来自 AI 评分，记录原始分数；教师确认后 Score 被修改，AIScore 保持不变
+    if not instance.IsFinal and instance.AIScore is None:
+        instance.AIScore = instance.Score
+
+
+@receiver([post_save, post_delete], sender=ScoringFeedback)
+def update_question_stats(sender, instance, **kwargs):
+    after_commit(refresh_answer_stats, instance.AnswerID_id)
+
+
+@receiver(post_save, sender=Question)
+def create_question_stats(sender, instance, created, **kwargs):
+    if created:
+        ensure_question_stats([instance.QuestionID])
+
+
+@receiver(post_save, sender=StudentAnswer)
+def count_new_answer(sender, instance, created, **kwargs):
+    if created:
+        after_commit(change_answer_count, instance.QuestionID_id, 1)
+
+
+@receiver(post_delete, sender=StudentAnswer)
+def count_deleted_answer(sender, instance, **kwargs):
+    after_commit(
+        remove_answer_stats,
+        instance.QuestionID_id,
+        instance.FinalScore,
+        instance.AIScore,
+    )
+
+
+# =====================
+# 近似重复答案索引
+# =====================
+
+
+@receiver(post_save, sender=StudentAnswer)
+def update_answer_fingerprint(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "Content" in update_fields:
+        after_commit(
+            index_answer_fingerprint,
+            instance.AnswerID,
+            instance.QuestionID_id,
+            instance.Content,
+        )
+
+
+@receiver(post_delete, sender=StudentAnswer)
+def release_deleted_answer_cluster(sender, instance, **kwargs):
+    # 签名和分桶随答案级联删除，这里只需为同簇的其他答案更换簇ID
+    after_commit(release_answer_cluster, instance.AnswerID, instance.QuestionID_id)
+
+
+# =====================
+# 评分 Prompt 渲染缓存
+# =====================
+
+
+@receiver(post_save, sender=Question)
+def invalidate_saved_question_prompt(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    if not created and (update_fields is None or PROMPT_FIELDS & set(update_fields)):
+        invalidate_question_prompt(instance.QuestionID, instance.CourseID_id)
+
+
+@receiver(post_delete, sender=Question)
+def invalidate_deleted_question_prompt(sender, instance, **kwargs):
+    invalidate_question_prompt(instance.QuestionID, instance.CourseID_id)
+
+
+@receiver(post_delete, sender=PromptTemplate)
+def invalidate_deleted_template_prompts(sender, instance, **kwargs):
+    invalidate_course_prompts(instance.CourseID_id, instance.Version)
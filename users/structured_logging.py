@@ -0,0 +1,156 @@
+# users/structured_logging.py
+
+"""
+结构化（JSON）日志。
+- log_context(**fields) 在当前上下文中附加关联字段（请求 ID、评分批次 ID、答案 ID 等），
+  其间记录的每条日志都带上这些字段；RequestIDMiddleware 为每个请求设置 request_id
+- JsonFormatter 把日志输出为一行 JSON；logger 调用时通过 extra 传入的字段（如评分接口的耗时、token 数）
+  原样写入该行
+- AsyncHandler 是非阻塞的队列处理器：调用方只把日志放入有界队列，JSON 序列化和写出由后台线程完成；
+  队列写满时丢弃日志并计数，不会拖慢请求
+配置见 settings.LOGGING，日志级别由环境变量 NJUP_LOG_LEVEL 控制。
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_REQUEST_ID_RE = re.compile(r"^[\w.-]{1,64}$")
+_CONTEXT = contextvars.ContextVar("log_context", default={})
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的字段
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def new_id():
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    在 with 块内为日志附加关联字段，可以嵌套，内层字段覆盖外层同名字段。
+    """
+    token = _CONTEXT.set({**_CONTEXT.get(), **fields})
+    try:
+        yield
+    finally:
+        _CONTEXT.reset(token)
+
+
+def current_context():
+    return _CONTEXT.get()
+
+
+def request_id_from(request):
+    # 沿用上游（反向代理）传入的请求 ID，格式不合法时重新生成
+    incoming = request.headers.get(REQUEST_ID_HEADER, "")
+    return incoming if _REQUEST_ID_RE.match(incoming) else new_id()
+
+
+class ContextFilter(logging.Filter):
+    """
+    把当前上下文中的关联字段写入日志记录。
+    须在产生日志的线程中执行（挂在处理器上），不能放到后台线程。
+    """
+
+    def filter(self, record):
+        for key, value in _CONTEXT.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    """
+    非阻塞的队列日志处理器。后台线程（QueueListener）在首次记录日志时启动，进程 fork 后在子进程中重新创建。
+    处理器上配置的 formatter 由后台线程使用，stream 为写出目标（默认标准错误）。
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.stream = stream
+        self.dropped = 0  # 队列写满时丢弃的日志条数
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # fork 出的子进程：父进程的队列和后台线程不可用
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            target = logging.StreamHandler(self.stream)
+            target.setFormatter(self.formatter or JsonFormatter())
+            self._listener = logging.handlers.QueueListener(self.queue, target)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def prepare(self, record):
+        # 调用线程中只合并消息参数、格式化异常，JSON 序列化留给后台线程
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def stop(self):
+        # 写出队列中剩余的日志并停止后台线程（进程退出时自动调用）
+        listener, self._listener = self._listener, None
+        if listener is not None and self._pid == os.getpid():
+            try:
+                listener.stop()
+            except queue.Full:
+                pass
+
+    def close(self):
+        self.stop()
+        super().close()
@@ -1,3 +1,2029 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import logging
+import math
+import os
+import runpy
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.bench.openai_stub import openai_stub
+from users.models import (
+    Administrator,
+    AnswerCoverage,
+    APIKey,
+    Course,
+    CourseMaterial,
+    MaterialChunk,
+    OperationLog,
+    PromptTemplate,
+    Question,
+    QuestionClustering,
+    QuestionStats,
+    ScoringFeedback,
+    Student,
+    StudentAnswer,
+    StudentCourse,
+    Teacher,
+)
+from users.principal import load_principal
+from users.services import answer_clustering
+from users.services.admin_tables import admin_table_page, dashboard_counts
+from users.services.aho_corasick import AhoCorasick
+from users.services.answer_clustering import (
+    assign_new_answers,
+    fit_question_clusters,
+    group_member_ids,
+    pending_answer_count,
+    question_groups,
+    rubric_changed,
+)
+from users.services.answer_search import (
+    rebuild_search_indexes,
+    search_answers,
+    search_feedback,
+)
+from users.services.audit import (
+    WRITE_RETRIES,
+    compact_diff,
+    format_changes,
+    log_operation,
+)
+from users.services.batch_grading import (
+    BatchItem,
+    GradingProgress,
+    get_progress,
+    grade_batch,
+    prepare_batch,
+)
+from users.services.cjk import build_match_query, index_text, query_tokens
+from users.services.course_search import autocomplete_courses, search_courses
+from users.services.gradebook import load_gradebook
+from users.services.grading import confirm_grades
+from users.services.judge import judge_answer, judge_answer_async
+from users.services.materials import (
+    BM25_B,
+    BM25_K1,
+    MATERIAL_RETRIEVAL_DEFAULTS,
+    MaterialIndexError,
+    add_material,
+    delete_materials,
+    load_material_index,
+    material_retriever,
+    prompt_with_passages,
+    split_chunks,
+)
+from users.services.metrics import (
+    METRICS,
+    PROMETHEUS_CONTENT_TYPE,
+    QueryRecorder,
+    RollingHistogram,
+)
+from users.services.near_duplicates import (
+    answer_clusters,
+    apply_grade_to_cluster,
+    cluster_member_ids,
+    rebuild_answer_clusters,
+)
+from users.services.operation_logs import (
+    archive_operation_logs,
+    archive_path,
+    page_operation_logs,
+    read_archive,
+)
+from users.services.prescore import (
+    PRESCORE_DEFAULTS,
+    Prescorer,
+    grading_prompt,
+    prescorer_for,
+)
+from users.services.prompt_templates import (
+    prompt_cache_key,
+    render_question_prompt,
+    save_prompt_template,
+)
+from users.services.provider_telemetry import (
+    HEALTH_LABELS,
+    MIN_UNHEALTHY_CALLS,
+    PROVIDER_TELEMETRY,
+    SLOW_P95,
+)
+from users.services.question_bank import (
+    QuestionBankParser,
+    import_question_bank,
+    question_values,
+)
+from users.services.question_stats import histogram_bin, rebuild_question_stats
+from users.services.roster import import_roster, iter_roster_file, summarize_report
+from users.services.rubric import RubricPoint, parse_rubric
+from users.structured_logging import (
+    REQUEST_ID_HEADER,
+    AsyncHandler,
+    ContextFilter,
+    JsonFormatter,
+    log_context,
+)
+from users.throttling import LOGIN_THROTTLE
+
+
+class StudentPageQueryTests(TestCase):
+    """
+    学生主页和课程详情页的查询次数不随课程、试题、答案数量增长。
+    """
+
+    COURSES = 5
+    QUESTIONS = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        password = make_password("pw")
+        cls.teacher = Teacher.objects.create(
+            Name="teacher", Email="teacher@example.com", Password=password
+        )
+        cls.student = Student.objects.create(
+            Name="student", Email="student@example.com", Password=password
+        )
+        cls.courses = [
+            Course.objects.create(TeacherID=cls.teacher, Name=f"课程{i}")
+            for i in range(cls.COURSES)
+        ]
+        for course in cls.courses:
+            StudentCourse.objects.create(StudentID=cls.student, CourseID=course)
+
+        course = cls.courses[0]
+        cls.questions = [
+            Question.objects.create(
+                CourseID=course, Title=f"试题{i}", Content="内容", IsOpen=True
+            )
+            for i in range(cls.QUESTIONS)
+        ]
+        # 前两题已评分，第三题已提交未评分，其余未提交；
+        # 分数快照在事务提交后更新（见 users/signals.py），测试事务不会提交，需手动执行
+        with cls.captureOnCommitCallbacks(execute=True):
+            for question, score in zip(cls.questions[:3], (90, 75, None)):
+                answer = StudentAnswer.objects.create(
+                    QuestionID=question, StudentID=cls.student, Content="答案"
+                )
+                if score is not None:
+                    ScoringFeedback.objects.create(
+                        AnswerID=answer, Score=score, IsFinal=True
+                    )
+
+    def setUp(self):
+        cache.clear()  # 登录主体缓存按主键保存，避免其他测试留下的缓存
+        self.client.post(
+            "/login/",
+            {"role": "student", "email": "student@example.com", "password": "pw"},
+        )
+        # 预热会话和登录主体缓存，使计数只包含页面本身的查询
+        self.client.get("/student_dashboard/")
+
+    def test_student_dashboard_query_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/student_dashboard/")
+        self.assertEqual(len(response.context["enrolled_courses"]), self.COURSES)
+        self.assertContains(response, "teacher", count=self.COURSES)
+
+    def test_student_course_detail_query_count(self):
+        url = f"/student_course/{self.courses[0].CourseID}/"
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+
+        statuses = {
+            row["question"].Title: (row["status"], row["answer"])
+            for row in response.context["question_rows"]
+        }
+        self.assertEqual(statuses["试题0"][0], "graded")
+        self.assertEqual(statuses["试题0"][1].FinalScore, 90)
+        self.assertEqual(statuses["试题1"][0], "graded")
+        self.assertEqual(statuses["试题2"][0], "submitted")
+        self.assertEqual(statuses["试题3"], ("unanswered", None))
+        self.assertEqual(len(response.context["student_answers"]), 3)
+
+
+class BatchAIGradeViewTests(TestCase):
+    """
+    批量智能评分视图（异步视图）在 WSGI 下的行为。
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        password = make_password("pw")
+        cls.teacher = Teacher.objects.create(
+            Name="teacher", Email="teacher@example.com", Password=password
+        )
+        student = Student.objects.create(
+            Name="student", Email="student@example.com", Password=password
+        )
+        cls.course = Course.objects.create(TeacherID=cls.teacher, Name="课程")
+        cls.question = Question.objects.create(
+            CourseID=cls.course, Title="试题", Content="简述变质作用", IsOpen=True
+        )
+        cls.answer = StudentAnswer.objects.create(
+            QuestionID=cls.question,
+            StudentID=student,
+            Content="变质作用是岩石在高温高压下的变化",
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.post(
+            "/login/",
+            {"role": "teacher", "email": "teacher@example.com", "password": "pw"},
+        )
+
+    def test_wsgi_request_closes_async_http_client(self):
+        # WSGI 下视图在 async_to_sync 的临时事件循环中运行，返回前须关闭该事件循环的 HTTP 客户端
+        url = (
+            f"/teacher_course/{self.course.CourseID}/question/"
+            f"{self.question.QuestionID}/batch_ai_grade/"
+        )
+        aclose = httpx.AsyncClient.aclose
+        with openai_stub() as (base_url, stats), mock.patch.dict(
+            "users.services.judge_endpoints.ENDPOINT_DEFAULTS", {"DELAY": 0}
+        ), mock.patch.object(
+            httpx.AsyncClient, "aclose", autospec=True, side_effect=aclose
+        ) as closed:
+            api_key = APIKey.objects.create(
+                TeacherID=self.teacher,
+                Model="openai",
+                Version="stub",
+                KeyValue="key",
+                Endpoint=base_url,
+            )
+            with self.assertLogs("users", "INFO"):
+                response = self.client.post(
+                    url,
+                    {
+                        "answer_ids[]": [self.answer.AnswerID],
+                        "model_choice": api_key.KeyID,
+                    },
+                )
+
+        self.assertEqual(response.json()["status"], "success")
+        self.assertEqual(
+            response.json()["results"][str(self.answer.AnswerID)]["status"], "success"
+        )
+        self.assertEqual(stats.requests, 1)
+        self.assertEqual(closed.call_count, 1)
+
+
+class GradingProgressTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def test_progress_is_scoped_per_teacher(self):
+        # 批次 ID 由前端生成，其他教师使用相同的 ID 不会覆盖或读到该批次的进度
+        mine = GradingProgress("job-1", 1, 10, [BatchItem("1"), BatchItem("2")])
+        await mine.save(force=True)
+        other = GradingProgress("job-1", 2, 20, [BatchItem("3")])
+        await other.finish()
+
+        progress = await get_progress(1, "job-1")
+        self.assertEqual(
+            (progress["teacher_id"], progress["total"], progress["state"]),
+            (1, 2, "running"),
+        )
+        self.assertEqual((await get_progress(2, "job-1"))["state"], "finished")
+        self.assertIsNone(await get_progress(3, "job-1"))
+
+
+class PrincipalCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        password = make_password("pw")
+        self.old_owner, self.new_owner = (
+            Teacher.objects.create(
+                Name=name, Email=f"{name}@example.com", Password=password
+            )
+            for name in ("old", "new")
+        )
+        self.course = Course.objects.create(TeacherID=self.old_owner, Name="课程")
+
+    def test_reassigning_course_invalidates_both_owners(self):
+        # 先缓存两位教师的主体
+        self.assertTrue(
+            load_principal("teacher", self.old_owner.pk).has_course(self.course.pk)
+        )
+        self.assertFalse(
+            load_principal("teacher", self.new_owner.pk).has_course(self.course.pk)
+        )
+
+        self.course.TeacherID = self.new_owner
+        self.course.save()
+
+        self.assertFalse(
+            load_principal("teacher", self.old_owner.pk).has_course(self.course.pk)
+        )
+        self.assertTrue(
+            load_principal("teacher", self.new_owner.pk).has_course(self.course.pk)
+        )
+
+
+class CacheSettingsTests(SimpleTestCase):
+    def load_settings(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            return runpy.run_path(str(settings.BASE_DIR / "NJUP" / "settings.py"))
+
+    def test_cache_backend_from_environment(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop("NJUP_CACHE_BACKEND", None)
+            default = self.load_settings()["CACHES"]["default"]
+        self.assertEqual(
+            default["BACKEND"], "django.core.cache.backends.locmem.LocMemCache"
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            caches = self.load_settings(
+                NJUP_CACHE_BACKEND="file", NJUP_CACHE_LOCATION=tmp
+            )["CACHES"]
+        self.assertEqual(
+            caches["default"]["BACKEND"],
+            "django.core.cache.backends.filebased.FileBasedCache",
+        )
+        self.assertEqual(caches["default"]["LOCATION"], tmp)
+
+        caches = self.load_settings(
+            NJUP_CACHE_BACKEND="memcached", NJUP_CACHE_LOCATION="127.0.0.1:11211"
+        )["CACHES"]
+        self.assertEqual(
+            caches["default"]["BACKEND"],
+            "django.core.cache.backends.memcached.PyMemcacheCache",
+        )
+        self.assertEqual(caches["default"]["LOCATION"], "127.0.0.1:11211")
+        self.assertEqual(caches["default"]["KEY_PREFIX"], "njup")
+
+    def test_principal_cache_timeout_follows_backend(self):
+        # locmem 无法跨进程失效，缩短登录主体缓存的有效期
+        self.assertEqual(
+            self.load_settings(NJUP_CACHE_BACKEND="locmem")["PRINCIPAL_CACHE_TIMEOUT"],
+            30,
+        )
+        self.assertEqual(
+            self.load_settings(NJUP_CACHE_BACKEND="memcached")[
+                "PRINCIPAL_CACHE_TIMEOUT"
+            ],
+            300,
+        )
+
+    def test_unknown_cache_backend(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "redis"):
+            self.load_settings(NJUP_CACHE_BACKEND="redis")
+
+
+class CachedSessionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_session_is_read_from_cache(self):
+        self.assertEqual(
+            settings.SESSION_ENGINE, "django.contrib.sessions.backends.cached_db"
+        )
+        self.client.post(
+            "/login/",
+            {"role": "admin", "email": "admin@example.com", "password": "123456"},
+        )
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        # 登录时会话同时写入数据库和缓存
+        self.assertTrue(Session.objects.filter(session_key=session_key).exists())
+        self.assertIsNotNone(cache.get(SessionStore(session_key).cache_key))
+
+        # 之后的请求只从缓存读取会话
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                self.client.get(reverse("admin_dashboard")).status_code, 200
+            )
+        self.assertFalse([q["sql"] for q in queries if "django_session" in q["sql"]])
+
+        # 缓存被清空后回退到数据库
+        cache.clear()
+        self.assertEqual(self.client.get(reverse("admin_dashboard")).status_code, 200)
+
+
+class GradingFixtureMixin:
+    """
+    一名教师、一门课程、一道试题和若干学生答案。
+    """
+
+    ANSWERS = ()  # 各答案的内容
+
+    @classmethod
+    def setUpTestData(cls):
+        password = make_password("pw")
+        cls.teacher = Teacher.objects.create(
+            Name="teacher", Email="teacher@example.com", Password=password
+        )
+        cls.course = Course.objects.create(TeacherID=cls.teacher, Name="地质学")
+        cls.question = Question.objects.create(
+            CourseID=cls.course, Title="变质作用", Content="简述变质作用的类型"
+        )
+        cls.answers = []
+        # 统计、索引和近似答案簇在事务提交后更新（见 users/signals.py）
+        with cls.captureOnCommitCallbacks(execute=True):
+            for i, content in enumerate(cls.ANSWERS):
+                student = Student.objects.create(
+                    Name=f"学生{i}", Email=f"s{i}@example.com", Password=password
+                )
+                cls.answers.append(
+                    StudentAnswer.objects.create(
+                        QuestionID=cls.question, StudentID=student, Content=content
+                    )
+                )
+
+
+class ConfirmGradesTests(GradingFixtureMixin, TestCase):
+    ANSWERS = ("答案一", "答案二")
+
+    def finals(self, answer):
+        return list(
+            answer.feedbacks.filter(IsFinal=True).values_list("Score", "Feedback")
+        )
+
+    def test_overwrite_replaces_existing_final_grade(self):
+        first, second = self.answers
+        ScoringFeedback.objects.create(AnswerID=first, Score=5, Feedback="AI")
+        with self.captureOnCommitCallbacks(execute=True):
+            confirm_grades([first.AnswerID], 8, "初评")
+        with self.captureOnCommitCallbacks(execute=True):
+            count = confirm_grades(
+                [first.AnswerID, second.AnswerID], 9, "复核", overwrite=True
+            )
+
+        self.assertEqual(count, 2)
+        self.assertEqual(self.finals(first), [(9, "复核")])
+        self.assertEqual(self.finals(second), [(9, "复核")])
+        # AI 评分记录保留，分数快照为最新的最终评分
+        self.assertEqual(first.feedbacks.filter(IsFinal=False).count(), 1)
+        first.refresh_from_db()
+        self.assertEqual((first.FinalScore, first.AIScore), (9, 5))
+
+    def test_without_overwrite_skips_graded_answers(self):
+        first, second = self.answers
+        with self.captureOnCommitCallbacks(execute=True):
+            confirm_grades([first.AnswerID], 8, "初评")
+        with self.captureOnCommitCallbacks(execute=True):
+            count = confirm_grades([first.AnswerID, second.AnswerID], 6, "批量")
+
+        self.assertEqual(count, 1)
+        self.assertEqual(self.finals(first), [(8, "初评")])
+        self.assertEqual(self.finals(second), [(6, "批量")])
+
+
+class MaterialIndexDirMixin:
+    """
+    资料检索索引写入临时目录。
+    """
+
+    def setUp(self):
+        super().setUp()
+        index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(index_dir.cleanup)
+        settings_override = override_settings(
+            MATERIAL_RETRIEVAL={"INDEX_DIR": index_dir.name}
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class CourseMaterialViewTests(MaterialIndexDirMixin, GradingFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.url = reverse("course_materials", args=[self.course.CourseID])
+        self.client.post(
+            "/login/",
+            {"role": "teacher", "email": "teacher@example.com", "password": "pw"},
+        )
+
+    def test_delete_ignores_invalid_ids(self):
+        material = add_material(self.course, "教材", "变质作用。\n\n接触变质。")
+        response = self.client.post(
+            self.url, {"action": "delete", "material_ids": ["abc", material.MaterialID]}
+        )
+        self.assertRedirects(response, self.url)
+        self.assertFalse(CourseMaterial.objects.exists())
+
+    def test_upload_is_not_saved_when_index_cannot_be_built(self):
+        upload = SimpleUploadedFile("教材.md", "变质作用。".encode())
+        with mock.patch(
+            "users.services.materials._numpy",
+            side_effect=MaterialIndexError(
+                "服务器未安装 numpy，无法建立资料检索索引。"
+            ),
+        ):
+            response = self.client.post(self.url, {"Title": "教材", "File": upload})
+        self.assertContains(response, "服务器未安装 numpy")
+        self.assertFalse(CourseMaterial.objects.exists())
+
+
+class LoginThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Teacher.objects.create(
+            Name="teacher", Email="teacher@example.com", Password=make_password("pw")
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, password, email="teacher@example.com"):
+        return self.client.post(
+            "/login/", {"role": "teacher", "email": email, "password": password}
+        )
+
+    def test_account_is_locked_after_repeated_failures(self):
+        for _ in range(LOGIN_THROTTLE["ACCOUNT_LIMIT"]):
+            self.login("wrong")
+        # 达到阈值后正确的密码也被拒绝，且不再进行密码校验
+        with mock.patch("users.views.check_account_password") as check:
+            response = self.login("pw")
+        check.assert_not_called()
+        self.assertContains(response, "登录失败次数过多")
+        self.assertNotIn("teacher_id", self.client.session)
+
+        # 邮箱大小写和首尾空格不同仍计为同一账号
+        self.assertContains(
+            self.login("pw", " Teacher@Example.com"), "登录失败次数过多"
+        )
+
+    def test_successful_login_resets_account_failures(self):
+        for _ in range(LOGIN_THROTTLE["ACCOUNT_LIMIT"] - 1):
+            self.login("wrong")
+        self.assertRedirects(
+            self.login("pw"),
+            reverse("teacher_dashboard"),
+            fetch_redirect_response=False,
+        )
+        self.login("wrong")
+        self.assertRedirects(
+            self.login("pw"),
+            reverse("teacher_dashboard"),
+            fetch_redirect_response=False,
+        )
+
+
+class RosterImportTests(GradingFixtureMixin, TestCase):
+    ANSWERS = ("答案",)  # 学生0 已在课程中
+    ROSTER_SIZE = 300
+
+    def setUp(self):
+        cache.clear()
+
+    def test_import_reports_each_row(self):
+        enrolled = self.answers[0].StudentID
+        StudentCourse.objects.create(StudentID=enrolled, CourseID=self.course)
+        Student.objects.create(
+            Name="王五", Email="wang@example.com", Password=make_password("pw")
+        )
+        # Excel 导出的中文 CSV 常为 GBK 编码，表头列顺序与默认不同
+        content = "\n".join(
+            [
+                "邮箱,姓名",
+                "zhang@example.com,张三",
+                "wang@example.com,王五五",
+                f"{enrolled.Email},{enrolled.Name}",
+                ",",
+                "zhang@example.com,张三",
+                "not-an-email,李四",
+            ]
+        ).encode("gbk")
+        rows = iter_roster_file(SimpleUploadedFile("名单.csv", content))
+
+        report = import_roster(self.course, rows)
+
+        self.assertEqual(
+            [(entry["row"], entry["status"]) for entry in report],
+            [
+                (2, "created"),
+                (3, "enrolled"),
+                (4, "already_enrolled"),
+                (6, "duplicate"),
+                (7, "invalid"),
+            ],
+        )
+        self.assertIn("沿用“王五”", report[1]["message"])
+        self.assertEqual(
+            set(
+                StudentCourse.objects.filter(CourseID=self.course).values_list(
+                    "StudentID__Email", flat=True
+                )
+            ),
+            {"zhang@example.com", "wang@example.com", enrolled.Email},
+        )
+        self.assertEqual(Student.objects.get(Email="wang@example.com").Name, "王五")
+
+    def test_query_count_does_not_grow_with_roster_size(self):
+        rows = [
+            (i, f"学生{i}", f"new{i}@example.com")
+            for i in range(2, self.ROSTER_SIZE + 2)
+        ]
+        # 查询已有学生、插入学生、取回学生ID、查询已有选课、插入选课，外加事务的保存点
+        with self.assertNumQueries(7):
+            report = import_roster(self.course, rows)
+        self.assertEqual(summarize_report(report)["created"], self.ROSTER_SIZE)
+        self.assertEqual(
+            StudentCourse.objects.filter(CourseID=self.course).count(), self.ROSTER_SIZE
+        )
+
+
+class CJKTokenizeTests(SimpleTestCase):
+    def test_index_text_splits_cjk_into_unigrams_and_bigrams(self):
+        self.assertEqual(index_text("岩石Rock 101"), "岩 石 岩石 rock 101")
+
+    def test_match_query_requires_all_bigrams(self):
+        self.assertEqual(build_match_query("变质岩"), '"变质" AND "质岩"')
+        self.assertEqual(build_match_query("岩 SiO2"), '"岩" AND "sio2"')
+        self.assertEqual(
+            build_match_query("地质", prefix=True, column="name"), 'name : ("地质"*)'
+        )
+        self.assertIsNone(build_match_query("！？"))
+
+
+class CourseSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = Teacher.objects.create(
+            Name="teacher", Email="teacher@example.com", Password=make_password("pw")
+        )
+        # 课程索引在事务提交后更新（见 users/signals.py）
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.in_description, cls.in_name, cls.other = (
+                Course.objects.create(TeacherID=teacher, Name=name, Description=text)
+                for name, text in (
+                    ("普通地质学", "介绍变质岩与火成岩"),
+                    ("变质岩石学", "岩石的成因"),
+                    ("大学物理", "力学与热学"),
+                )
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_name_matches_rank_before_description_matches(self):
+        result = search_courses("变质岩")
+        self.assertEqual(result["courses"], [self.in_name, self.in_description])
+        self.assertFalse(result["has_next"])
+
+    def test_numeric_query_puts_exact_course_first(self):
+        result = search_courses(str(self.other.CourseID))
+        self.assertEqual(result["courses"][0], self.other)
+
+    def test_index_follows_course_updates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.Name = "地球物理"
+            self.other.save()
+        self.assertCountEqual(
+            autocomplete_courses("地"),
+            [
+                {"id": course.CourseID, "name": course.Name}
+                for course in (self.in_description, self.other)
+            ],
+        )
+        self.assertEqual(search_courses("大学物理")["courses"], [])
+
+
+class AdminTableTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        password = make_password("pw")
+        cls.teachers = [
+            Teacher.objects.create(
+                Name=f"教师{i}", Email=f"t{i}@example.com", Password=password
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.post(
+            "/login/",
+            {"role": "admin", "email": "admin@example.com", "password": "123456"},
+        )
+
+    def page(self, **params):
+        response = self.client.get(reverse("admin_table", args=["teachers"]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_has_next_is_read_from_one_extra_row(self):
+        ids = [teacher.pk for teacher in self.teachers]
+        with self.assertNumQueries(1):  # 不执行 COUNT 查询
+            first = admin_table_page("teachers", page=1, per_page=2)
+        self.assertEqual([row["id"] for row in first["results"]], ids[:2])
+        self.assertTrue(first["has_next"])
+        last = self.page(page=2, per_page=2)
+        self.assertEqual([row["id"] for row in last["results"]], ids[2:])
+        self.assertFalse(last["has_next"])
+        self.assertFalse(self.page(per_page=3)["has_next"])
+        self.assertEqual([row["id"] for row in self.page(q="t1@")["results"]], [ids[1]])
+
+    def test_out_of_range_paging_parameters_are_clamped(self):
+        ids = [teacher.pk for teacher in self.teachers]
+        self.assertEqual(self.page(page=0, per_page=2)["page"], 1)
+        clamped = self.page(page=-3, per_page=-1)
+        self.assertEqual(
+            (clamped["page"], [row["id"] for row in clamped["results"]]), (1, ids[:1])
+        )
+        self.assertEqual(len(self.page(per_page=10**6)["results"]), len(ids))
+        for params in ({"page": "abc"}, {"per_page": "1.5"}):
+            response = self.client.get(
+                reverse("admin_table", args=["teachers"]), params
+            )
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("admin_table", args=["courses"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_counts_are_cached_until_records_change(self):
+        self.assertEqual(dashboard_counts()["teachers"], 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard_counts()["teachers"], 3)
+        Teacher.objects.create(
+            Name="新教师", Email="new@example.com", Password=make_password("pw")
+        )
+        self.assertEqual(dashboard_counts()["teachers"], 4)
+
+    def test_only_admins_can_read_tables(self):
+        url = reverse("admin_table", args=["teachers"])
+        self.client.post(reverse("logout"))
+        self.assertRedirects(
+            self.client.get(url), reverse("login"), fetch_redirect_response=False
+        )
+        self.client.post(
+            "/login/",
+            {"role": "teacher", "email": "t0@example.com", "password": "pw"},
+        )
+        self.assertRedirects(
+            self.client.get(url), reverse("login"), fetch_redirect_response=False
+        )
+
+
+class QuestionStatsTests(GradingFixtureMixin, TestCase):
+    ANSWERS = ("答案一", "答案二", "答案三")
+
+    STAT_FIELDS = (
+        "AnswerCount",
+        "AIGradedCount",
+        "ConfirmedCount",
+        "ScoreSum",
+        "ScoreSumSq",
+        "Histogram",
+        "DeltaCount",
+        "DeltaSum",
+        "DeltaAbsSum",
+    )
+
+    def stats(self):
+        return QuestionStats.objects.filter(QuestionID=self.question).values(
+            *self.STAT_FIELDS
+        )[0]
+
+    def test_incremental_updates_match_rebuild(self):
+        first, second, third = self.answers
+        with self.captureOnCommitCallbacks(execute=True):
+            ScoringFeedback.objects.create(AnswerID=first, Score=70, AIScore=70)
+            ScoringFeedback.objects.create(AnswerID=second, Score=85, AIScore=85)
+        with self.captureOnCommitCallbacks(execute=True):
+            # 教师确认并修改分数，随后删除一条评分，再删除一个答案
+            ScoringFeedback.objects.create(
+                AnswerID=first, Score=78, AIScore=70, IsFinal=True
+            )
+            final = ScoringFeedback.objects.create(
+                AnswerID=second, Score=200, AIScore=85, IsFinal=True
+            )
+            ScoringFeedback.objects.create(AnswerID=third, Score=40, IsFinal=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            final.delete()
+            StudentAnswer.objects.filter(pk=third.pk).delete()
+
+        incremental = self.stats()
+        self.assertEqual(incremental["AnswerCount"], 2)
+        self.assertEqual(incremental["ConfirmedCount"], 1)
+        self.assertEqual(incremental["DeltaSum"], 8)
+        self.assertEqual(incremental["Histogram"][7], 1)
+
+        self.assertEqual(rebuild_question_stats([self.question.QuestionID]), 1)
+        self.assertEqual(self.stats(), incremental)
+        second.refresh_from_db()
+        self.assertEqual((second.FinalScore, second.AIScore), (None, 85))
+
+    def test_histogram_bins_are_clamped(self):
+        self.assertEqual(
+            [histogram_bin(score) for score in (-5, 0, 9.9, 10, 199, 200)],
+            [0, 0, 0, 1, 19, 19],
+        )
+
+
+class GradebookTests(GradingFixtureMixin, TestCase):
+    ANSWERS = ("答案一", "答案二", "答案三")
+
+    def test_scores_are_pivoted_by_student_and_question(self):
+        first, second, dropped = self.answers
+        later = Question.objects.create(CourseID=self.course, Title="沉积作用")
+        for answer in (first, second):
+            StudentCourse.objects.create(
+                StudentID=answer.StudentID, CourseID=self.course
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            # 学生1 的第二题只有 AI 评分；学生2 已退出课程，答案不计入
+            ScoringFeedback.objects.create(AnswerID=first, Score=80, IsFinal=True)
+            ScoringFeedback.objects.create(AnswerID=second, Score=60, IsFinal=True)
+            ScoringFeedback.objects.create(AnswerID=dropped, Score=99, IsFinal=True)
+            for answer, score, is_final in ((first, 90, True), (second, 50, False)):
+                ScoringFeedback.objects.create(
+                    AnswerID=StudentAnswer.objects.create(
+                        QuestionID=later, StudentID=answer.StudentID, Content="答案"
+                    ),
+                    Score=score,
+                    IsFinal=is_final,
+                )
+
+        gradebook = load_gradebook(self.course)
+        self.assertEqual(
+            gradebook.header()[3:5],
+            [f"变质作用（{self.question.pk}）", f"沉积作用（{later.pk}）"],
+        )
+        rows = [row[1:] for row in gradebook.rows()]
+        self.assertEqual(
+            rows,
+            [
+                ["学生0", "s0@example.com", 80.0, 90.0, 2, 170.0],
+                ["学生1", "s1@example.com", 60.0, None, 1, 60.0],
+                ["平均分", "", 70.0, 90.0, "", ""],
+            ],
+        )
+
+    def test_csv_export(self):
+        StudentCourse.objects.create(
+            StudentID=self.answers[0].StudentID, CourseID=self.course
+        )
+        self.client.post(
+            "/login/",
+            {"role": "teacher", "email": "teacher@example.com", "password": "pw"},
+        )
+        response = self.client.get(
+            reverse("export_gradebook", args=[self.course.CourseID]), {"format": "csv"}
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines[0],
+            f"\ufeff学生ID,姓名,邮箱,变质作用（{self.question.pk}）,已评分题数,总分",
+        )
+        self.assertEqual(
+            lines[1].split(",")[1:], ["学生0", "s0@example.com", "", "0", "0.0"]
+        )
+
+
+class AuditDiffTests(SimpleTestCase):
+    def test_single_line_diff_keeps_context_around_changes(self):
+        old = "请简述变质作用的三种主要类型，并各举一例说明其形成条件和典型岩石"
+        self.assertEqual(
+            compact_diff(old, old.replace("三", "四")),
+            "请简述变质作用的[-三-]{+四+}种主要类型，并各举一例说明其形…",
+        )
+
+    def test_multi_line_diff_is_unified(self):
+        self.assertEqual(
+            compact_diff("a\nb\nc\nd\ne", "a\nb\nX\nd\ne"),
+            "@@ -2,3 +2,3 @@\n b\n-c\n+X\n d",
+        )
+
+    def test_format_changes_skips_unchanged_fields_and_diffs_long_values(self):
+        prompt = "一" * 150
+        self.assertEqual(
+            format_changes(
+                {
+                    "Name": ("a", "b"),
+                    "Email": ("x", "x"),
+                    "Prompt": (prompt + "甲", prompt + "乙"),
+                }
+            ),
+            'Name："a" -> "b"\nPrompt（差异）：\n…' + "一" * 15 + "[-甲-]{+乙+}",
+        )
+        self.assertEqual(format_changes({"Name": (None, "")}), "无字段变化")
+
+
+@override_settings(AUDIT_LOG={"ASYNC": False})
+class OperationLogWriteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Administrator.objects.get(Name="ADMIN")
+
+    def test_log_is_written_only_when_transaction_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                log_operation(self.admin.pk, "回滚", changes={"Name": ("a", "b")})
+                transaction.set_rollback(True)
+            log_operation(self.admin.pk, "修改课程", "课程ID 1", {"Name": ("a", "b")})
+
+        self.assertEqual(
+            list(OperationLog.objects.values_list("Operation", "Details")),
+            [("修改课程", '课程ID 1\nName："a" -> "b"')],
+        )
+
+    def test_unwritten_logs_are_reported_after_retries(self):
+        with mock.patch(
+            "users.models.OperationLog.objects.bulk_create",
+            side_effect=OperationalError("database is locked"),
+        ) as bulk_create, mock.patch(
+            "users.services.audit.RETRY_DELAY", 0
+        ), self.assertLogs(
+            "users.services.audit", "ERROR"
+        ) as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                log_operation(self.admin.pk, "删除学生", "学生ID 1")
+
+        self.assertEqual(bulk_create.call_count, WRITE_RETRIES)
+        self.assertEqual(
+            [entry["operation"] for entry in logs.records[0].unwritten_logs],
+            ["删除学生"],
+        )
+        self.assertFalse(OperationLog.objects.exists())
+
+
+class OperationLogPagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        admin = Administrator.objects.get(Name="ADMIN")
+        start = timezone.make_aware(datetime(2024, 1, 30, 12))
+        # 相邻两条日志时间相同，翻页需按 LogID 区分
+        cls.logs = [
+            OperationLog.objects.create(
+                AdminID=admin,
+                Operation="删除学生" if i % 2 else "修改课程",
+                Details=f"日志{i}",
+                Timestamp=start + timedelta(days=i // 2),
+            )
+            for i in range(7)
+        ]
+
+    def ids(self, page):
+        return [log.LogID for log in page["logs"]]
+
+    def test_keyset_pages_forward_and_back(self):
+        newest_first = [log.LogID for log in reversed(self.logs)]
+        pages = [page_operation_logs(per_page=3)]
+        while pages[-1]["next_cursor"]:
+            pages.append(
+                page_operation_logs(after=pages[-1]["next_cursor"], per_page=3)
+            )
+        self.assertEqual(
+            [self.ids(page) for page in pages],
+            [newest_first[:3], newest_first[3:6], newest_first[6:]],
+        )
+        self.assertIsNone(pages[0]["prev_cursor"])
+
+        previous = page_operation_logs(before=pages[2]["prev_cursor"], per_page=3)
+        self.assertEqual(self.ids(previous), newest_first[3:6])
+        first = page_operation_logs(before=previous["prev_cursor"], per_page=3)
+        self.assertEqual(self.ids(first), newest_first[:3])
+        self.assertIsNone(first["prev_cursor"])
+
+    def test_filters_and_invalid_cursor(self):
+        page = page_operation_logs(operation="删除学生", after="无效游标")
+        self.assertEqual(
+            self.ids(page),
+            [log.LogID for log in reversed(self.logs) if log.Operation == "删除学生"],
+        )
+        self.assertIsNone(page["next_cursor"])
+
+    def test_archive_round_trip(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # 第一次归档 1 月 30 日的日志，第二次归档到 2 月 1 日，1 月的日志追加到同一文件
+        cutoff = timezone.make_aware(datetime(2024, 1, 31))
+        self.assertEqual(
+            archive_operation_logs(cutoff, directory.name, batch_size=1), {"2024-01": 2}
+        )
+        cutoff = timezone.make_aware(datetime(2024, 2, 2))
+        self.assertEqual(
+            archive_operation_logs(cutoff, directory.name, batch_size=3),
+            {"2024-01": 2, "2024-02": 2},
+        )
+
+        january = list(read_archive(archive_path(directory.name, "2024-01")))
+        self.assertEqual(
+            [record["LogID"] for record in january],
+            [log.LogID for log in self.logs[:4]],
+        )
+        self.assertEqual(
+            (january[1]["AdminName"], january[1]["Operation"], january[1]["Details"]),
+            ("ADMIN", "删除学生", "日志1"),
+        )
+        self.assertEqual(
+            datetime.fromisoformat(january[3]["Timestamp"]), self.logs[3].Timestamp
+        )
+        self.assertEqual(
+            list(
+                OperationLog.objects.order_by("LogID").values_list("LogID", flat=True)
+            ),
+            [log.LogID for log in self.logs[6:]],
+        )
+
+
+class AnswerSearchTests(GradingFixtureMixin, TestCase):
+    ANSWERS = (
+        "区域变质作用发生在造山带",
+        "接触变质作用由岩浆侵入引起",
+        "沉积岩由风化产物堆积而成",
+    )
+
+    def test_search_is_scoped_and_highlighted(self):
+        regional, contact, sedimentary = self.answers
+        other_course = Course.objects.create(TeacherID=self.teacher, Name="其他课程")
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentAnswer.objects.create(
+                QuestionID=Question.objects.create(CourseID=other_course, Title="试题"),
+                StudentID=regional.StudentID,
+                Content="变质作用",
+            )
+
+        result = search_answers("变质作用", [self.course.CourseID])
+        self.assertCountEqual(
+            [answer for answer, _ in result["results"]], [regional, contact]
+        )
+        snippet = dict(result["results"])[contact]
+        self.assertEqual(snippet, "接触<mark>变质作用</mark>由岩浆侵入引起")
+        self.assertEqual(
+            search_answers("变质", [self.course.CourseID], per_page=1)["has_next"], True
+        )
+        self.assertEqual(
+            search_answers("变质", []), {"results": [], "page": 1, "has_next": False}
+        )
+
+    def test_index_follows_edits_and_matches_rebuild(self):
+        regional, contact, sedimentary = self.answers
+        with self.captureOnCommitCallbacks(execute=True):
+            sedimentary.Content = "沉积岩经区域变质形成片岩"
+            sedimentary.save()
+            contact.delete()
+            feedback = ScoringFeedback.objects.create(
+                AnswerID=regional, Score=80, Feedback="未说明温压条件"
+            )
+
+        def results():
+            return (
+                [
+                    a.pk
+                    for a, _ in search_answers("区域变质", [self.course.CourseID])[
+                        "results"
+                    ]
+                ],
+                [f.pk for f, _ in search_feedback("温压")["results"]],
+            )
+
+        incremental = results()
+        self.assertCountEqual(incremental[0], [regional.pk, sedimentary.pk])
+        self.assertEqual(incremental[1], [feedback.pk])
+        self.assertEqual(rebuild_search_indexes(), (2, 1))
+        self.assertEqual(results(), incremental)
+
+
+class NearDuplicateTests(GradingFixtureMixin, TestCase):
+    DEFINITION = (
+        "变质作用是指岩石在温度、压力和化学活动性流体的作用下，"
+        "矿物成分和结构构造发生变化的地质作用。"
+    )
+    # 第三份答案只在标点和空白上与第一份不同
+    ANSWERS = (
+        DEFINITION,
+        "沉积岩由风化产物经搬运、沉积和成岩作用形成。",
+        DEFINITION.replace("、", "，").replace("，矿物", " 矿物").rstrip("。"),
+    )
+
+    def clusters(self):
+        return {
+            answer_id: cluster_id
+            for answer_id, (cluster_id, _) in answer_clusters(
+                self.question.QuestionID
+            ).items()
+        }
+
+    def test_similar_answers_share_a_cluster(self):
+        original, other, punctuated = self.answers
+        self.assertEqual(
+            self.clusters(), {original.pk: original.pk, punctuated.pk: original.pk}
+        )
+        self.assertEqual(cluster_member_ids(punctuated.pk), [original.pk])
+        self.assertEqual(cluster_member_ids(other.pk), [])
+
+    def test_deleting_cluster_head_renames_cluster_like_rebuild(self):
+        original, other, punctuated = self.answers
+        with self.captureOnCommitCallbacks(execute=True):
+            edited = StudentAnswer.objects.create(
+                QuestionID=self.question,
+                StudentID=other.StudentID,
+                Content=self.DEFINITION.replace("发生变化", "发生改变"),
+            )
+        self.assertEqual(len(set(self.clusters().values())), 1)
+        self.assertEqual(len(self.clusters()), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentAnswer.objects.filter(pk=original.pk).delete()
+        incremental = self.clusters()
+        self.assertEqual(
+            incremental, {punctuated.pk: punctuated.pk, edited.pk: punctuated.pk}
+        )
+        self.assertEqual(rebuild_answer_clusters([self.question.QuestionID]), 3)
+        self.assertEqual(self.clusters(), incremental)
+
+    def test_grade_is_applied_to_cluster_members(self):
+        original, other, punctuated = self.answers
+        with self.captureOnCommitCallbacks(execute=True):
+            confirm_grades([original.pk], 9, "要点完整")
+            self.assertEqual(apply_grade_to_cluster(original), 1)
+        self.assertEqual(
+            list(
+                ScoringFeedback.objects.filter(IsFinal=True)
+                .order_by("AnswerID")
+                .values_list("AnswerID", "Score")
+            ),
+            [(original.pk, 9), (punctuated.pk, 9)],
+        )
+
+
+class RubricClusteringTests(GradingFixtureMixin, TestCase):
+    RUBRIC = "- 由火成岩变质形成（1分）\n- 常保留火成岩的部分特征（1分）"
+    ANSWERS = (
+        "正变质岩由火成岩变质形成，常保留火成岩的部分特征。",
+        "它由火成岩变质形成，并常保留火成岩的部分特征",
+        "这种岩石由火成岩变质形成。",
+        "不知道",
+    )
+
+    def test_parse_rubric_points(self):
+        self.assertEqual(
+            parse_rubric(
+                "评分标准：\n1. 由火成岩变质形成（1分）\n"
+                "（2）常保留火成岩的部分特征 (0.5 分)。\n* 结构说明\n"
+            ),
+            [
+                RubricPoint("由火成岩变质形成", 1.0),
+                RubricPoint("常保留火成岩的部分特征", 0.5),
+                RubricPoint("结构说明", None),
+            ],
+        )
+
+    def test_answers_are_grouped_by_covered_points(self):
+        both, both_too, first_only, blank = self.answers
+        self.question.ScoringCriteria = self.RUBRIC
+        self.question.save()
+        self.assertEqual(fit_question_clusters(self.question), 4)
+
+        clustering = QuestionClustering.objects.get(QuestionID=self.question)
+        self.assertFalse(rubric_changed(self.question, clustering))
+        groups = {
+            group["key"]: group for group in question_groups(self.question, clustering)
+        }
+        self.assertCountEqual(groups["0,1"]["member_ids"], [both.pk, both_too.pk])
+        self.assertEqual(groups["0,1"]["suggested_score"], 2)
+        self.assertEqual(groups["0"]["member_ids"], [first_only.pk])
+        self.assertEqual(groups[""]["member_ids"], [blank.pk])
+
+        # 拟合后提交的答案用保存的词表增量归类
+        with self.captureOnCommitCallbacks(execute=True):
+            late = StudentAnswer.objects.create(
+                QuestionID=self.question,
+                StudentID=blank.StudentID,
+                Content="常保留火成岩的部分特征，由火成岩变质形成",
+            )
+        self.assertEqual(assign_new_answers(self.question), 1)
+        self.assertIn(late.pk, group_member_ids(self.question, "0,1"))
+
+        self.question.ScoringCriteria += "\n- 片理发育（1分）"
+        self.assertTrue(rubric_changed(self.question, clustering))
+
+    def test_viewing_groups_does_not_assign_new_answers(self):
+        both, both_too, first_only, blank = self.answers
+        fit_question_clusters(self.question)
+        with self.captureOnCommitCallbacks(execute=True):
+            late = StudentAnswer.objects.create(
+                QuestionID=self.question,
+                StudentID=blank.StudentID,
+                Content="由火成岩变质形成",
+            )
+        url = reverse(
+            "grade_by_group", args=[self.course.CourseID, self.question.QuestionID]
+        )
+        self.client.post(
+            "/login/",
+            {"role": "teacher", "email": "teacher@example.com", "password": "pw"},
+        )
+        fitted_at = QuestionClustering.objects.get(QuestionID=self.question).FittedAt
+
+        response = self.client.get(url)
+        self.assertEqual(response.context["pending_count"], 1)
+        self.assertFalse(AnswerCoverage.objects.filter(AnswerID=late).exists())
+        self.assertEqual(
+            QuestionClustering.objects.get(QuestionID=self.question).FittedAt,
+            fitted_at,
+        )
+
+        response = self.client.post(url, {"action": "assign"})
+        self.assertRedirects(response, url)
+        self.assertTrue(AnswerCoverage.objects.filter(AnswerID=late).exists())
+        self.assertEqual(self.client.get(url).context["pending_count"], 0)
+
+    def test_answer_edited_during_fit_stays_pending(self):
+        both = self.answers[0]
+        read_rows = answer_clustering._answer_rows
+
+        def read_then_edit(*args, **kwargs):
+            rows = read_rows(*args, **kwargs)
+            # 读取答案后、保存拟合结果前，学生修改了答案
+            StudentAnswer.objects.filter(pk=both.pk).update(
+                Content="修改后的答案", SubmittedAt=timezone.now()
+            )
+            return rows
+
+        with mock.patch.object(answer_clustering, "_answer_rows", read_then_edit):
+            fit_question_clusters(self.question)
+        clustering = QuestionClustering.objects.get(QuestionID=self.question)
+        self.assertEqual(pending_answer_count(self.question, clustering), 1)
+        self.assertEqual(assign_new_answers(self.question), 1)
+
+    def test_text_similarity_groups_without_rubric(self):
+        fit_question_clusters(self.question)
+        keys = dict(AnswerCoverage.objects.values_list("AnswerID", "ClusterKey"))
+        both, both_too, first_only, blank = self.answers
+        self.assertEqual(keys[both.pk], keys[both_too.pk])
+        self.assertNotEqual(keys[both.pk], keys[blank.pk])
+
+
+class PrescoreTests(SimpleTestCase):
+    CRITERIA = "- 温度和压力升高（1分）\n- 矿物重结晶（2分）"
+    PROMPT = "**题目**\n简述变质作用\n\n**提示词**\n温度、重结晶\n"
+
+    def test_aho_corasick_finds_overlapping_patterns(self):
+        matcher = AhoCorasick(["he", "she", "his", "hers", ""])
+        self.assertEqual(
+            list(matcher.iter("ushers")), [(4, "she"), (4, "he"), (6, "hers")]
+        )
+        self.assertEqual(matcher.find_all("this"), {"his"})
+
+    def test_decisions(self):
+        prescorer = Prescorer(self.CRITERIA, self.PROMPT)
+        self.assertEqual(prescorer.full_score, 3)
+
+        def decide(content):
+            result = prescorer.prescore(content, PRESCORE_DEFAULTS)
+            return result.decision, result.score
+
+        self.assertEqual(decide("。 "), ("blank", 0))
+        self.assertEqual(decide("沉积岩由风化产物堆积而成"), ("off_topic", 0))
+        self.assertEqual(decide("温度、压力升高使矿物重结晶。"), ("full", 3))
+        # 含否定词时不判满分，交给大模型
+        self.assertEqual(decide("温度和压力升高不会使矿物重结晶"), ("undecided", None))
+
+    def test_partial_answer_hints_are_attached_to_prompt(self):
+        result = Prescorer(self.CRITERIA, self.PROMPT).prescore(
+            "温度与压力升高", PRESCORE_DEFAULTS
+        )
+        self.assertFalse(result.decided)
+        self.assertEqual(
+            grading_prompt("Prompt", result, PRESCORE_DEFAULTS).splitlines()[2:],
+            [
+                "可能已答到的得分点：温度和压力升高",
+                "未检测到关键词的得分点：矿物重结晶",
+            ],
+        )
+
+    def test_prescorer_is_rebuilt_when_question_changes(self):
+        question = Question(ScoringCriteria=self.CRITERIA, Prompt=self.PROMPT)
+        prescorer = prescorer_for(question)
+        self.assertIs(prescorer_for(question), prescorer)
+        question.ScoringCriteria += "\n- 形成片理（1分）"
+        self.assertEqual(prescorer_for(question).full_score, 4)
+
+
+class QuestionBankImportTests(GradingFixtureMixin, TestCase):
+    BANK = """# system prompt:
+{
+你是地质学课程的阅卷老师。
+}
+---
+## 一、名词解释（每题 2 分）
+
+### 1. 正变质岩
+**试题内容**
+什么是正变质岩？
+**评分标准**
+- 由火成岩变质形成（1分）
+- 常保留火成岩的部分特征（1分）
+**提示词**
+火成岩、变质
+
+---
+### 2. 副变质岩
+**试题内容**
+什么是副变质岩？
+**评分标准**
+- 由沉积岩变质形成（2分）
+
+---
+## 二、简答题
+
+### 1. 变质作用的类型
+**试题内容**
+简述变质作用的类型。
+"""
+
+    def test_parser_reads_system_prompt_parts_and_sections(self):
+        parser = QuestionBankParser(self.BANK.splitlines())
+        items = list(parser)
+        self.assertEqual(parser.system_prompt, "你是地质学课程的阅卷老师。")
+        self.assertEqual(
+            [item.title for item in items],
+            [
+                "名词解释 1. 正变质岩",
+                "名词解释 2. 副变质岩",
+                "简答题 1. 变质作用的类型",
+            ],
+        )
+        self.assertEqual(
+            question_values(items[0]),
+            {
+                "Content": "什么是正变质岩？",
+                "ScoringCriteria": "- 由火成岩变质形成（1分）\n- 常保留火成岩的部分特征（1分）",
+                "Prompt": "每题 2 分\n\n**提示词**\n火成岩、变质",
+            },
+        )
+        self.assertEqual(items[2].prompt(), "")
+
+    def test_reimport_is_idempotent(self):
+        lines = self.BANK.splitlines()
+        self.assertEqual(
+            import_question_bank(self.course, lines),
+            {"created": 3, "updated": 0, "unchanged": 0},
+        )
+        self.assertEqual(
+            import_question_bank(self.course, lines),
+            {"created": 0, "updated": 0, "unchanged": 3},
+        )
+        edited = self.BANK.replace("由沉积岩变质形成（2分）", "由沉积岩变质形成（3分）")
+        self.assertEqual(
+            import_question_bank(self.course, edited.splitlines()),
+            {"created": 0, "updated": 1, "unchanged": 2},
+        )
+
+        questions = Question.objects.filter(CourseID=self.course)
+        self.assertEqual(questions.count(), 4)  # 含测试数据中原有的一道题
+        self.assertEqual(
+            questions.get(Title="名词解释 2. 副变质岩").ScoringCriteria,
+            "- 由沉积岩变质形成（3分）",
+        )
+        self.assertEqual(
+            QuestionStats.objects.filter(QuestionID__in=questions).count(), 4
+        )
+        template = PromptTemplate.objects.get(CourseID=self.course)
+        self.assertEqual(
+            (template.SystemPrompt, template.Version), ("你是地质学课程的阅卷老师。", 1)
+        )
+
+    def test_import_without_system_prompt_keeps_question_prompts(self):
+        # 模板启用前录入的完整 Prompt
+        legacy = "**试题内容**\n简述变质作用的类型\n\n**评分标准**\n- 接触变质（1分）"
+        self.question.Prompt = legacy
+        self.question.save()
+        bank = self.BANK.split("---\n", 1)[1]  # 去掉系统提示
+
+        import_question_bank(self.course, bank.splitlines())
+        self.assertFalse(PromptTemplate.objects.filter(CourseID=self.course).exists())
+        self.assertEqual(render_question_prompt(self.question), legacy)
+        imported = Question.objects.get(Title="名词解释 1. 正变质岩")
+        self.assertEqual(
+            render_question_prompt(imported),
+            "每题 2 分\n\n**试题内容**\n什么是正变质岩？\n\n"
+            "**评分标准**\n- 由火成岩变质形成（1分）\n- 常保留火成岩的部分特征（1分）\n\n"
+            "**提示词**\n火成岩、变质",
+        )
+        self.assertEqual(
+            import_question_bank(self.course, bank.splitlines()),
+            {"created": 0, "updated": 0, "unchanged": 3},
+        )
+
+
+class PromptTemplateTests(GradingFixtureMixin, TestCase):
+    SYSTEM_PROMPT = "你是地质学课程的阅卷老师。"
+
+    def setUp(self):
+        cache.clear()
+        self.question.Content = "什么是正变质岩？"
+        self.question.ScoringCriteria = "- 由火成岩变质形成（1分）"
+        # 模板启用前录入的完整 Prompt，以系统提示开头
+        self.question.Prompt = f"{self.SYSTEM_PROMPT}\n\n**试题内容**\n什么是正变质岩？\n\n**提示词**\n火成岩"
+        self.question.save()
+
+    def render(self):
+        return render_question_prompt(Question.objects.get(pk=self.question.pk))
+
+    def test_course_without_template_uses_question_prompt(self):
+        self.assertEqual(self.render(), self.question.Prompt)
+
+    def test_rendered_prompt_follows_question_and_template_changes(self):
+        template, changed = save_prompt_template(self.course, self.SYSTEM_PROMPT)
+        self.assertTrue(changed)
+        self.assertEqual(
+            self.render(),
+            f"{self.SYSTEM_PROMPT}\n\n**试题内容**\n什么是正变质岩？\n\n"
+            "**评分标准**\n- 由火成岩变质形成（1分）\n\n**提示词**\n火成岩",
+        )
+        # 渲染结果已缓存，传入模板时不再查询数据库
+        with self.assertNumQueries(0):
+            render_question_prompt(self.question, template)
+
+        # 修改与 Prompt 无关的字段不清除缓存，修改试题内容时清除
+        self.question.IsOpen = True
+        self.question.save(update_fields=["IsOpen"])
+        self.assertIsNotNone(cache.get(prompt_cache_key(self.question.pk, 1)))
+        self.question.Content = "简述正变质岩的特征。"
+        self.question.save()
+        self.assertIn("简述正变质岩的特征。", self.render())
+
+        # 模板内容不变时 Version 不变；修改排版后 Version 加一，旧版本的渲染结果不再使用
+        self.assertEqual(
+            save_prompt_template(self.course, self.SYSTEM_PROMPT)[1], False
+        )
+        template, _ = save_prompt_template(
+            self.course, self.SYSTEM_PROMPT, "{{ title }}：{{ content }}"
+        )
+        self.assertEqual(template.Version, 2)
+        self.assertEqual(self.render(), "变质作用：简述正变质岩的特征。")
+
+    def test_deleting_template_clears_rendered_prompts(self):
+        template, _ = save_prompt_template(self.course, self.SYSTEM_PROMPT)
+        self.render()
+        template.delete()
+        self.assertIsNone(cache.get(prompt_cache_key(self.question.pk, 1)))
+        self.assertEqual(self.render(), "**提示词**\n火成岩")
+
+
+class MaterialRetrievalTests(MaterialIndexDirMixin, GradingFixtureMixin, TestCase):
+    # 每段 200 多字，相邻两段合并会超过片段长度，各成一个片段
+    PARAGRAPHS = (
+        "变质作用是岩石在温度和压力作用下发生的变化。" * 10,
+        "接触变质作用发生在岩浆侵入体周围，以热为主。" * 10,
+        "区域变质作用范围广，与造山运动有关，温度和压力都升高。" * 8,
+    )
+
+    def bm25(self, texts, query):
+        # 按定义逐个片段计算 BM25 得分，与倒排索引的结果对照
+        docs = [Counter(query_tokens(text)) for text in texts]
+        average = max(sum(sum(doc.values()) for doc in docs) / len(docs), 1)
+        scores = []
+        for doc in docs:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * sum(doc.values()) / average)
+            score = 0.0
+            for term, count in Counter(query_tokens(query)).items():
+                if term in doc:
+                    df = sum(1 for other in docs if term in other)
+                    idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+                    score += (
+                        count * idf * doc[term] * (BM25_K1 + 1) / (doc[term] + norm)
+                    )
+            scores.append(score)
+        return scores
+
+    def test_split_chunks_merges_short_paragraphs(self):
+        self.assertEqual(
+            split_chunks("甲。\n\n乙。\n\n" + "丙丁。" * 4, size=8),
+            ["甲。\n乙。", "丙丁。\n丙丁。", "丙丁。\n丙丁。"],
+        )
+
+    def test_index_scores_match_bm25(self):
+        add_material(self.course, "教材", "\n\n".join(self.PARAGRAPHS))
+        add_material(self.course, "讲义", "片麻岩是区域变质作用的产物。")
+        chunks = dict(MaterialChunk.objects.values_list("ChunkID", "Text"))
+        self.assertEqual(len(chunks), 4)
+
+        query = "区域变质作用的温度和压力"
+        expected = dict(zip(chunks, self.bm25(list(chunks.values()), query)))
+        hits = load_material_index(self.course.CourseID).search(
+            Counter(query_tokens(query)), len(chunks)
+        )
+        self.assertEqual(len(hits), len(chunks))
+        for chunk_id, score in hits:
+            self.assertAlmostEqual(score, expected[chunk_id], places=4)
+        self.assertEqual(
+            [chunk_id for chunk_id, _ in hits],
+            sorted(expected, key=expected.get, reverse=True),
+        )
+
+    def test_passages_for_answer(self):
+        self.question.Content = "简述变质作用"
+        add_material(self.course, "教材", "\n\n".join(self.PARAGRAPHS))
+        retriever = material_retriever(
+            self.question, {**MATERIAL_RETRIEVAL_DEFAULTS, "TOP_K": 1}
+        )
+        passages = retriever.passages("与造山运动有关")
+        self.assertEqual(passages, [("教材", self.PARAGRAPHS[2])])
+        self.assertIn(
+            f"[1]《教材》\n{self.PARAGRAPHS[2]}",
+            prompt_with_passages("Prompt", passages),
+        )
+
+        # 删除全部资料后索引随之删除
+        self.assertEqual(
+            delete_materials(self.course, [CourseMaterial.objects.get().pk]), 1
+        )
+        self.assertIsNone(material_retriever(self.question))
+
+
+@contextmanager
+def _test_database():
+    # 测试中已在测试数据库里运行，基准命令无需再创建临时数据库
+    yield None
+
+
+@mock.patch.dict("users.services.judge_endpoints.ENDPOINT_DEFAULTS", {"DELAY": 0})
+class BenchCommandTests(TransactionTestCase):
+    # 冒烟测试：用极小的数据集跑通基准命令（模拟评分接口，不访问网络）
+    def call(self, name, *args):
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/result.json"
+            with mock.patch(
+                f"users.management.commands.{name}.isolated_database", _test_database
+            ):
+                call_command(name, *args, "--json", path, stdout=out)
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+        return out.getvalue(), result
+
+    def test_bench_grading_with_mock_judge(self):
+        with self.assertLogs("users", "INFO"):
+            out, result = self.call(
+                "bench_grading",
+                "--students",
+                "4",
+                "--questions",
+                "2",
+                "--batch-size",
+                "3",
+            )
+        self.assertIn("吞吐量", out)
+        self.assertEqual(result["answers"], 8)
+        self.assertEqual(result["requests"], 4)
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(result["golden"]["missing"], 0)
+
+    def test_bench_grading_with_stub_endpoints(self):
+        with self.assertLogs("users", "INFO"):
+            out, result = self.call(
+                "bench_grading",
+                "--students",
+                "3",
+                "--questions",
+                "1",
+                "--endpoints",
+                "0",
+                "0",
+            )
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(
+            sum(endpoint["requests"] for endpoint in result["endpoints"]), 3
+        )
+        self.assertIn("stub-1", out)
+
+    def test_bench_pages_scenarios(self):
+        out, result = self.call(
+            "bench_pages",
+            "--students",
+            "3",
+            "--questions",
+            "2",
+            "--workers",
+            "1",
+            "--graders",
+            "1",
+            "--reviews",
+            "2",
+        )
+        for scenario in ("deadline_burst", "grading_session"):
+            views = result["scenarios"][scenario]["views"]
+            self.assertTrue(views)
+            self.assertEqual(sum(view["errors"] for view in views.values()), 0, views)
+            self.assertIn(f"{scenario}：用时", out)
+
+
+@override_settings(METRICS={"SAMPLE_RATE": 1.0, "TOKEN": "secret"})
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        METRICS.reset()
+        self.addCleanup(METRICS.reset)
+
+    def test_metrics_view_requires_admin_or_token(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.get(url, headers={"Authorization": "Bearer wrong"})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(url, headers={"Authorization": "Bearer secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], PROMETHEUS_CONTENT_TYPE)
+
+        self.client.post(
+            "/login/",
+            {"role": "admin", "email": "admin@example.com", "password": "123456"},
+        )
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_sampled_requests_report_queries(self):
+        url = reverse("metrics")
+        self.client.post(
+            "/login/",
+            {"role": "admin", "email": "admin@example.com", "password": "123456"},
+        )
+        METRICS.reset()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertGreater(len(queries), 0)  # 读取会话和管理员
+        self.assertRegex(
+            response["Server-Timing"],
+            rf'^app;dur=[\d.]+, db;dur=[\d.]+;desc="{len(queries)} queries"$',
+        )
+        with override_settings(METRICS={"SAMPLE_RATE": 0.0}):
+            response = self.client.get(url)
+        self.assertRegex(response["Server-Timing"], r"^app;dur=[\d.]+$")
+
+        output = METRICS.render_prometheus()
+        self.assertIn('njup_view_latency_seconds_count{view="metrics"} 2', output)
+        self.assertIn('njup_view_db_queries_count{view="metrics"} 1', output)
+        self.assertIn("njup_metrics_sampled_requests_total 1", output)
+
+    def test_slowest_sql_is_exported_by_hash(self):
+        recorder = QueryRecorder()
+        recorder.count, recorder.slowest = 1, (0.2, 'SELECT "Name"\n FROM "Teacher"')
+        with self.assertLogs("users.services", "INFO") as logs:
+            METRICS.observe("view", 200, 0.5, 10, recorder)
+        self.assertEqual(logs.records[0].sql, 'SELECT "Name" FROM "Teacher"')
+        recorder.slowest = (0.3, recorder.slowest[1])
+        with self.assertNoLogs("users.services", "INFO"):  # 每条 SQL 只写一次日志
+            METRICS.observe("view", 200, 0.5, 10, recorder)
+        output = METRICS.render_prometheus()
+        self.assertNotIn("SELECT", output)
+        self.assertIn(
+            'njup_view_slowest_sql_seconds{view="view",'
+            f'sql_hash="{logs.records[0].sql_hash}"}} 0.300000',
+            output,
+        )
+
+    def test_exported_histograms_do_not_drop_when_window_expires(self):
+        histogram = RollingHistogram((1, 2), window=60, slots=6)
+        histogram.observe(0.5, now=0)
+        histogram.observe(1.5, now=30)
+        self.assertEqual(histogram.snapshot(now=65)[2], 1)  # 第一次观测已移出窗口
+        self.assertEqual(histogram.totals(), ([(1, 1), (2, 2), ("+Inf", 2)], 2.0, 2))
+
+
+class StructuredLoggingTests(SimpleTestCase):
+    def logger(self, handler):
+        # 独立的 logger，不经过 settings.LOGGING 中的处理器
+        logger = logging.getLogger(f"users.tests.{self._testMethodName}")
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def test_context_and_extra_fields_reach_json_line(self):
+        stream = io.StringIO()
+        handler = AsyncHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(ContextFilter())
+        logger = self.logger(handler)
+        with log_context(request_id="r1", job_id="j1"):
+            with log_context(job_id="j2"):
+                logger.warning("评分 %s 完成", "甲", extra={"answer_id": 3})
+        logger.warning("无上下文")
+        handler.close()  # 等待后台线程写出
+
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(
+            {key: first[key] for key in ("level", "message", "request_id", "job_id")},
+            {
+                "level": "WARNING",
+                "message": "评分 甲 完成",
+                "request_id": "r1",
+                "job_id": "j2",
+            },
+        )
+        self.assertEqual(first["answer_id"], 3)
+        self.assertNotIn("request_id", second)
+
+    def test_full_queue_drops_records(self):
+        handler = AsyncHandler(io.StringIO(), maxsize=2)
+        logger = self.logger(handler)
+        # 不启动后台线程，队列不会被取走
+        with mock.patch.object(handler, "_ensure_listener"):
+            for i in range(5):
+                logger.warning("日志 %d", i)
+        self.assertEqual((handler.queue.qsize(), handler.dropped), (2, 3))
+
+    def test_request_id_header_is_kept_or_replaced(self):
+        response = self.client.get("/login/", headers={"X-Request-ID": "req-1.a"})
+        self.assertEqual(response[REQUEST_ID_HEADER], "req-1.a")
+        for incoming in ("bad id!", "x" * 65, ""):
+            response = self.client.get("/login/", headers={"X-Request-ID": incoming})
+            self.assertRegex(response[REQUEST_ID_HEADER], r"^[0-9a-f]{16}$")
+
+
+class ProviderTelemetryTests(TestCase):
+    def setUp(self):
+        PROVIDER_TELEMETRY.reset()
+        self.addCleanup(PROVIDER_TELEMETRY.reset)
+
+    def test_calls_are_aggregated_per_key_and_per_version(self):
+        record = PROVIDER_TELEMETRY.record
+        record(1, "openai", "v1", 1.0, 200, ttfb=0.2)
+        record(1, "openai", "v1", 3.0, 500, retries=2, failed=True)
+        record(2, "openai", "v1", 2.0, 200, parse_error=True, failed=True)
+        record(3, "openai", "v2", 1.0, 200)
+
+        keys = PROVIDER_TELEMETRY.key_health()
+        self.assertEqual(
+            {key_id: (row["calls"], row["error_rate"]) for key_id, row in keys.items()},
+            {1: (2, 0.5), 2: (1, 1.0), 3: (1, 0.0)},
+        )
+        self.assertEqual((keys[1]["retries"], keys[1]["last_status"]), (2, 500))
+        versions = {row["version"]: row for row in PROVIDER_TELEMETRY.version_health()}
+        self.assertEqual(
+            (versions["v1"]["calls"], versions["v1"]["parse_failures"]), (3, 1)
+        )
+        self.assertEqual(versions["v2"]["status"], "healthy")
+
+        # Key 改用其他版本后重新统计
+        record(3, "openai", "v3", 1.0, 200)
+        key = PROVIDER_TELEMETRY.key_health()[3]
+        self.assertEqual((key["version"], key["calls"]), ("v3", 1))
+
+        output = PROVIDER_TELEMETRY.render_prometheus()
+        self.assertIn(
+            'njup_provider_latency_seconds_count{key_id="1",provider="openai",'
+            'version="v1"} 2',
+            output,
+        )
+        self.assertIn(
+            'njup_provider_responses_total{key_id="1",provider="openai",'
+            'version="v1",status="500"} 1',
+            output,
+        )
+
+    def test_endpoint_health_thresholds(self):
+        def health(calls, failures=0, latency=1.0):
+            PROVIDER_TELEMETRY.reset()
+            for i in range(calls):
+                PROVIDER_TELEMETRY.record_endpoint(
+                    "ep", "openai", latency, 200, failed=i < failures
+                )
+            return PROVIDER_TELEMETRY.endpoint_health()["ep"]["status"]
+
+        self.assertEqual(health(10), "healthy")
+        self.assertEqual(health(10, failures=1), "degraded")
+        self.assertEqual(health(10, latency=SLOW_P95 * 2), "degraded")
+        # 调用次数不足 MIN_UNHEALTHY_CALLS 时全部失败也只判为 degraded
+        self.assertEqual(health(MIN_UNHEALTHY_CALLS - 1, failures=4), "degraded")
+        self.assertEqual(health(MIN_UNHEALTHY_CALLS, failures=3), "unhealthy")
+        self.assertEqual(health(MIN_UNHEALTHY_CALLS, failures=2), "degraded")
+
+    def test_api_key_management_shows_health(self):
+        teacher = Teacher.objects.create(
+            Name="teacher", Email="teacher@example.com", Password=make_password("pw")
+        )
+        used, unused = (
+            APIKey.objects.create(
+                TeacherID=teacher, Model="openai", Version="v1", KeyValue=value
+            )
+            for value in ("k1", "k2")
+        )
+        PROVIDER_TELEMETRY.record(used.KeyID, "openai", "v1", 1.0, 200)
+        for name in ("b", "a"):
+            PROVIDER_TELEMETRY.record_endpoint(name, "openai", 1.0, 200)
+        self.client.post(
+            "/login/",
+            {"role": "admin", "email": "admin@example.com", "password": "123456"},
+        )
+
+        response = self.client.get(reverse("api_key_management"))
+        health = {key.KeyID: key.health for key in response.context["api_keys"]}
+        self.assertEqual(health[used.KeyID]["calls"], 1)
+        self.assertIsNone(health[unused.KeyID])
+        self.assertEqual(
+            [row["version"] for row in response.context["version_health"]], ["v1"]
+        )
+        self.assertEqual(
+            [row["endpoint"] for row in response.context["endpoint_health"]],
+            ["a", "b"],
+        )
+        self.assertContains(response, HEALTH_LABELS["healthy"])
+
+
+class JudgeEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create(
+            Name="teacher", Email="teacher@example.com", Password=make_password("pw")
+        )
+
+    def setUp(self):
+        PROVIDER_TELEMETRY.reset()
+        self.addCleanup(PROVIDER_TELEMETRY.reset)
+
+    def api_key(self, endpoint=""):
+        return APIKey.objects.create(
+            TeacherID=self.teacher,
+            Model="openai",
+            Version="stub",
+            KeyValue="key",
+            Endpoint=endpoint,
+        )
+
+    def test_failed_endpoint_is_replaced_and_then_skipped(self):
+        with openai_stub(failure_rate=1.0) as (bad_url, bad), openai_stub() as (
+            good_url,
+            good,
+        ):
+            endpoints = {
+                "openai": [
+                    {"NAME": "bad", "BASE_URL": bad_url, "DELAY": 0},
+                    {"NAME": "good", "BASE_URL": good_url, "DELAY": 0},
+                ]
+            }
+            api_key = self.api_key()
+            # 总是优先选择列表中的第一个可用地址，使故障转移的过程可以预期
+            with override_settings(JUDGE={"ENDPOINTS": endpoints}), mock.patch(
+                "users.services.judge_endpoints.random.choices",
+                side_effect=lambda population, weights: population[:1],
+            ), self.assertLogs("users.services", "INFO"):
+                results = [
+                    judge_answer(api_key, "变质作用", "简述变质作用") for _ in range(8)
+                ]
+
+        self.assertTrue(all(result["score"] is not None for result in results))
+        # 失败的地址立即换用另一个，连续失败达到 MIN_UNHEALTHY_CALLS 次后不再选择
+        self.assertEqual((bad.requests, good.requests), (MIN_UNHEALTHY_CALLS, 8))
+        health = PROVIDER_TELEMETRY.endpoint_health()
+        self.assertEqual(health["bad"]["status"], "unhealthy")
+        self.assertEqual(health["good"]["status"], "healthy")
+
+    def test_single_endpoint_is_retried_with_backoff(self):
+        timer = mock.Mock(wraps=time, sleep=mock.Mock())
+        with openai_stub(failure_rate=1.0) as (base_url, stats), mock.patch.dict(
+            "users.services.judge_endpoints.ENDPOINT_DEFAULTS", {"DELAY": 0}
+        ), override_settings(
+            JUDGE={"MAX_RETRIES": 2, "RETRY_BACKOFF": 1.0}
+        ), mock.patch(
+            "users.services.judge.time", timer
+        ), self.assertLogs(
+            "users.services", "INFO"
+        ) as logs:
+            result = judge_answer(self.api_key(base_url), "变质作用", "简述变质作用")
+
+        self.assertIsNone(result["score"])
+        self.assertEqual(stats.requests, 3)
+        self.assertEqual(
+            [call.args for call in timer.sleep.call_args_list], [(1.0,), (2.0,)]
+        )
+        self.assertEqual(logs.records[-1].retries, 2)
+
+    def test_async_judge_reports_missing_httpx(self):
+        # httpx 是可选依赖：未安装时异步评分返回失败原因，不影响导入和同步评分
+        with openai_stub() as (base_url, stats), mock.patch.dict(
+            "sys.modules", {"httpx": None}
+        ), self.assertLogs("users.services", "INFO"):
+            result = asyncio.run(
+                judge_answer_async(self.api_key(base_url), "变质作用", "简述变质作用")
+            )
+        self.assertIsNone(result["score"])
+        self.assertIn("未安装 httpx", result["reason"])
+        self.assertEqual(stats.requests, 0)
+
+
+class GradeBatchTests(GradingFixtureMixin, TestCase):
+    ANSWERS = ("答案一", "答案二", "答案三", "答案四", "答案五")
+
+    def setUp(self):
+        cache.clear()
+
+    def items(self, clusters):
+        items = []
+        for answer, cluster in zip(self.answers, clusters):
+            item = BatchItem(str(answer.AnswerID), answer)
+            item.content, item.prompt, item.cluster = answer.Content, "Prompt", cluster
+            items.append(item)
+        return items
+
+    def test_prepare_batch_resolves_local_results_and_reads_clusters(self):
+        first, second, third, fourth, fifth = self.answers
+        with self.captureOnCommitCallbacks(execute=True):
+            for answer, content in (
+                (first, "变质作用是岩石在高温高压下的变化"),
+                (second, "变质作用是岩石在高温高压下的变化"),
+                (third, ""),
+            ):
+                answer.Content = content
+                answer.save()
+
+        def prescore_for(content):
+            # 模拟本地预评分：“答案四”直接判定
+            decided = content == fourth.Content
+            return SimpleNamespace(score=0, reason="离题"), decided
+
+        keys = [str(answer.pk) for answer in self.answers] + ["999", "abc"]
+        items = prepare_batch(
+            self.question, keys, lambda content, prescore: f"P:{content}", prescore_for
+        )
+
+        self.assertEqual([item.key for item in items], keys)
+        self.assertEqual((items[0].cluster, items[1].cluster), (first.pk, first.pk))
+        self.assertIsNone(items[4].cluster)
+        self.assertEqual(items[0].prompt, f"P:{items[0].content}")
+        self.assertEqual(items[2].feedback, (0, "无法读取答案内容。"))
+        self.assertEqual(items[3].result, {"status": "success", "message": "离题"})
+        self.assertEqual(
+            [item.result for item in items[5:]],
+            [{"status": "error", "message": "答案不存在。"}] * 2,
+        )
+
+    async def test_cluster_members_share_first_successful_grade(self):
+        first, second, third, fourth, fifth = self.answers
+        calls = []
+
+        async def judge(api_key, content, prompt):
+            calls.append(content)
+            if content == first.Content:
+                return {"score": None, "reason": "接口返回错误"}
+            return {"score": len(calls), "reason": f"评分{len(calls)}"}
+
+        # 前三份答案为同一簇；第一份评分失败，第二份成功后第三份沿用其结果
+        items = self.items([first.pk, first.pk, first.pk, None, None])
+        items[4].resolve("success", "预评分", (0, "空白答案"))
+        progress = GradingProgress("job-1", self.teacher.pk, self.question.pk, items)
+        with mock.patch("users.services.batch_grading.judge_answer_async", judge):
+            await grade_batch(None, items, progress)
+            await progress.finish()
+
+        self.assertCountEqual(calls, [first.Content, second.Content, fourth.Content])
+        self.assertEqual(items[0].result["status"], "error")
+        self.assertEqual(items[2].feedback, items[1].feedback)
+        self.assertEqual(
+            items[2].result["message"], f"与答案 {second.pk} 近似，沿用其评分。"
+        )
+        self.assertEqual(
+            await get_progress(self.teacher.pk, "job-1"),
+            {
+                "job_id": "job-1",
+                "teacher_id": self.teacher.pk,
+                "question_id": self.question.pk,
+                "state": "finished",
+                "total": 5,
+                "done": 5,
+                "succeeded": 4,
+                "failed": 1,
+            },
+        )
+
+    async def test_concurrent_calls_are_limited(self):
+        running, peak = 0, 0
+
+        async def judge(api_key, content, prompt):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {"score": 1, "reason": ""}
+
+        items = self.items([None] * 5)
+        progress = GradingProgress("job-2", self.teacher.pk, self.question.pk, items)
+        with mock.patch(
+            "users.services.batch_grading.judge_answer_async", judge
+        ), override_settings(JUDGE={"CONCURRENCY": 2}):
+            await grade_batch(None, items, progress)
+
+        self.assertEqual(peak, 2)
+        self.assertTrue(all(item.result["status"] == "success" for item in items))
@@ -0,0 +1,47 @@
+# users/throttling.py
+
+"""
+登录限流。
+失败次数记录在缓存中，同时按账号（角色+邮箱）和客户端 IP 计数；
+超过阈值后在校验密码之前直接拒绝，避免暴力破解占满 CPU 做密码哈希。
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOGIN_THROTTLE = {
+    "ACCOUNT_LIMIT": 5,  # 同一账号在时间窗口内允许的失败次数
+    "IP_LIMIT": 20,  # 同一 IP 在时间窗口内允许的失败次数
+    "WINDOW": 300,  # 时间窗口，单位：秒
+    **getattr(settings, "LOGIN_THROTTLE", {}),
+}
+
+
+def _throttle_keys(request, role, email):
+    ip = request.META.get("REMOTE_ADDR", "")
+    account = f"{role}:{(email or '').strip().lower()}"
+    return (
+        (f"login-fail:account:{account}", LOGIN_THROTTLE["ACCOUNT_LIMIT"]),
+        (f"login-fail:ip:{ip}", LOGIN_THROTTLE["IP_LIMIT"]),
+    )
+
+
+def is_login_throttled(request, role, email):
+    keys = _throttle_keys(request, role, email)
+    counts = cache.get_many([key for key, _ in keys])
+    return any(counts.get(key, 0) >= limit for key, limit in keys)
+
+
+def record_login_failure(request, role, email):
+    for key, _ in _throttle_keys(request, role, email):
+        # add 仅在键不存在时设置，保证时间窗口从第一次失败开始计算
+        cache.add(key, 0, LOGIN_THROTTLE["WINDOW"])
+        try:
+            cache.incr(key)
+        except ValueError:  # 键恰好过期
+            cache.set(key, 1, LOGIN_THROTTLE["WINDOW"])
+
+
+def reset_login_failures(request, role, email):
+    account_key = _throttle_keys(request, role, email)[0][0]
+    cache.delete(account_key)
@@ -7,6 +7,7 @@ urlpatterns = [
     path("admin_dashboard/", views.admin_dashboard, name="admin_dashboard"),
     # admin相关URL
     path("admin_dashboard/", views.admin_dashboard, name="admin_dashboard"),
+    path("admin_dashboard/<str:table>/", views.admin_table, name="admin_table"),
     path("add_teacher/", views.add_teacher, name="add_teacher"),
     path("edit_teacher/<int:teacher_id>/", views.edit_teacher, name="edit_teacher"),
     path("delete_teachers/", views.delete_teachers, name="delete_teachers"),
@@ -24,11 +25,18 @@ urlpatterns = [
     ),
     path("delete_api_keys/", views.delete_api_keys, name="delete_api_keys"),
     path("view_operation_logs/", views.view_operation_logs, name="view_operation_logs"),
+    path("search_feedback/", views.search_feedback_view, name="search_feedback"),
+    path("metrics/", views.metrics_view, name="metrics"),
     path(
         "edit_question_prompt/<int:question_id>/",
         views.edit_question_prompt,
         name="edit_question_prompt",
     ),
+    path(
+        "edit_prompt_template/<int:course_id>/",
+        views.edit_prompt_template,
+        name="edit_prompt_template",
+    ),
     path("add_question/", views.add_question, name="add_question"),
     # teacher相关URL
     path("teacher_dashboard/", views.teacher_dashboard, name="teacher_dashboard"),
@@ -39,6 +47,26 @@ urlpatterns = [
     path(
         "course/<int:course_id>/add_students/", views.add_students, name="add_students"
     ),
+    path(
+        "course/<int:course_id>/export_gradebook/",
+        views.export_gradebook,
+        name="export_gradebook",
+    ),
+    path(
+        "course/<int:course_id>/search_answers/",
+        views.search_answers_view,
+        name="search_answers",
+    ),
+    path(
+        "course/<int:course_id>/materials/",
+        views.course_materials,
+        name="course_materials",
+    ),
+    path(
+        "course/<int:course_id>/import_students/",
+        views.import_students,
+        name="import_students",
+    ),
     path(
         "course/<int:course_id>/remove_students/",
         views.remove_students,
@@ -74,19 +102,47 @@ urlpatterns = [
         views.view_and_grade_answer,
         name="view_and_grade_answer",
     ),
+    path(
+        "teacher_course/<int:course_id>/question/<int:question_id>/answer/<int:answer_id>/apply_cluster_grade/",
+        views.apply_cluster_grade,
+        name="apply_cluster_grade",
+    ),
     path(
         "teacher_course/<int:course_id>/question/<int:question_id>/answer/<int:answer_id>/import_ai_feedback/",
         views.import_ai_feedback,
         name="import_ai_feedback",
     ),
+    path(
+        "teacher_course/<int:course_id>/question/<int:question_id>/grade_by_group/",
+        views.grade_by_group,
+        name="grade_by_group",
+    ),
+    path(
+        "teacher_course/<int:course_id>/question/<int:question_id>/confirm_group_grades/",
+        views.confirm_group_grades,
+        name="confirm_group_grades",
+    ),
     path(
         "teacher_course/<int:course_id>/question/<int:question_id>/batch_ai_grade/",
         views.batch_ai_grade,
         name="batch_ai_grade",
     ),
+    path(
+        "grading_jobs/<str:job_id>/",
+        views.grading_job_progress,
+        name="grading_job_progress",
+    ),
+    path(
+        "grading_jobs/<str:job_id>/events/",
+        views.grading_job_events,
+        name="grading_job_events",
+    ),
     # student相关URL
     path("student_dashboard/", views.student_dashboard, name="student_dashboard"),
     path("join_course/", views.join_course, name="join_course"),
+    path(
+        "course_autocomplete/", views.course_autocomplete, name="course_autocomplete"
+    ),
     path(
         "confirm_join_course/<int:course_id>/",
         views.confirm_join_course,
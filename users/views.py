@@ -11,15 +11,15 @@
 """
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib import messages
 from django.contrib.auth.hashers import make_password
-from django.contrib.auth.hashers import check_password
 from django.utils import timezone
-from django.db.models import Q, Prefetch
-from django.core.paginator import Paginator
+from django.utils.http import urlencode
 from django.db import transaction
+from django.db.models import Count
 from .models import (
     User,
     Administrator,
@@ -32,6 +32,9 @@ from .models import (
     Question,
     StudentAnswer,
     ScoringFeedback,
+    QuestionStats,
+    QuestionClustering,
+    PromptTemplate,
 )
 from .forms import (
     AddTeacherForm,
@@ -45,17 +48,131 @@ from .forms import (
     SubmitAnswerForm,
     GradeAnswerForm,
     EditPromptForm,
+    PromptTemplateForm,
     AddQuestionForm,
+    RosterImportForm,
+    MaterialUploadForm,
 )
 from django.contrib.auth.decorators import user_passes_test
 from django.shortcuts import redirect
 from functools import wraps
 
+import asyncio
 import json
-from django.http import JsonResponse
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.http import require_POST
-from .services.judge_gpt import get_judge_from_gpt
-from .services.judge_qwen import get_judge_from_qwen
+from .services.admin_tables import (
+    ADMIN_TABLE_PAGE_SIZE,
+    ADMIN_TABLES,
+    admin_table_page,
+    dashboard_counts,
+)
+from .services.answer_clustering import (
+    ClusteringError,
+    assign_new_answers,
+    fit_question_clusters,
+    group_member_ids,
+    pending_answer_count,
+    question_groups,
+    rubric_changed,
+)
+from .services.answer_search import search_answers, search_feedback
+from .services.async_http import async_http_scope
+from .services.audit import AUDIT_LOGGER, log_operation
+from .services.batch_grading import (
+    PROGRESS_EVENTS_INTERVAL,
+    PROGRESS_EVENTS_TIMEOUT,
+    GradingProgress,
+    get_progress,
+    grade_batch,
+    job_id_from,
+    prepare_batch,
+    save_batch,
+)
+from .services.course_search import autocomplete_courses, search_courses
+from .services.operation_logs import operation_types, page_operation_logs
+from .services.gradebook import (
+    GRADEBOOK_FORMATS,
+    GradebookExportError,
+    iter_gradebook_csv,
+    load_gradebook,
+    write_gradebook_xlsx,
+)
+from .services.grading import confirm_grades
+from .services.materials import (
+    MaterialIndexError,
+    add_material,
+    delete_materials,
+    material_retriever,
+    prompt_with_passages,
+)
+from .services.metrics import METRICS, PROMETHEUS_CONTENT_TYPE, metrics_settings
+from .services.near_duplicates import (
+    answer_clusters,
+    apply_grade_to_cluster,
+    cluster_member_ids,
+)
+from .services.prescore import (
+    BLANK,
+    grading_prompt,
+    prescore_settings,
+    prescorer_for,
+)
+from .services.prompt_templates import (
+    course_prompt_template,
+    render_question_prompt,
+    save_prompt_template,
+)
+from .services.provider_telemetry import PROVIDER_TELEMETRY
+from .services.question_stats import histogram_rows
+from .services.roster import (
+    RosterImportError,
+    STATUS_LABELS,
+    import_roster,
+    iter_roster_file,
+    summarize_report,
+)
+from .principal import role_required
+from .structured_logging import log_context
+from .passwords import check_account_password
+from .throttling import (
+    is_login_throttled,
+    record_login_failure,
+    reset_login_failures,
+)
+
+logger = logging.getLogger(__name__)
+
+# =====================
+# 公共函数
+# =====================
+
+
+# 获取当前教师拥有的课程
+# 课程归属由 request.principal 中缓存的课程ID判断，不再单独查询教师表；
+# 查询时仍限定 TeacherID，并通过 select_related 一并取出教师信息
+def get_teacher_course(request, course_id):
+    if not request.principal.has_course(course_id):
+        raise Http404("课程不存在")
+    return get_object_or_404(
+        Course.objects.select_related("TeacherID"),
+        CourseID=course_id,
+        TeacherID_id=request.principal.pk,
+    )
+
 
 # =====================
 # 公共视图
@@ -107,6 +224,14 @@ def register(request):
 
 
 # 登录视图
+# 角色 -> (模型, 会话键, 主页)
+LOGIN_ROLES = {
+    "admin": (Administrator, "admin_id", "admin_dashboard"),
+    "teacher": (Teacher, "teacher_id", "teacher_dashboard"),
+    "student": (Student, "student_id", "student_dashboard"),
+}
+
+
 def login_view(request):
     if request.method == "POST":
         role = request.POST.get("role")
@@ -118,53 +243,24 @@ def login_view(request):
             if key in request.session:
                 del request.session[key]
 
-        if role == "admin":
-            try:
-                admin = Administrator.objects.get(Email=email)
-                if (
-                    admin
-                    and admin.Password
-                    and check_password(password, admin.Password)
-                ):
-                    request.session["admin_id"] = admin.AdminID
-                    return redirect("admin_dashboard")
-                else:
-                    messages.error(request, "邮箱或密码错误，请重新输入")
-            except Administrator.DoesNotExist:
-                messages.error(request, "邮箱或密码错误，请重新输入")
-
-        elif role == "teacher":
-            try:
-                teacher = Teacher.objects.get(Email=email)
-                if (
-                    teacher
-                    and teacher.Password
-                    and check_password(password, teacher.Password)
-                ):
-                    request.session["teacher_id"] = teacher.TeacherID
-                    return redirect("teacher_dashboard")
-                else:
-                    messages.error(request, "邮箱或密码错误，请重新输入")
-            except Teacher.DoesNotExist:
-                messages.error(request, "邮箱或密码错误，请重新输入")
+        if role not in LOGIN_ROLES:
+            messages.error(request, "无效的登录类型")
+            return render(request, "login.html")
 
-        elif role == "student":
-            try:
-                student = Student.objects.get(Email=email)
-                if (
-                    student
-                    and student.Password
-                    and check_password(password, student.Password)
-                ):
-                    request.session["student_id"] = student.StudentID
-                    return redirect("student_dashboard")
-                else:
-                    messages.error(request, "邮箱或密码错误，请重新输入")
-            except Student.DoesNotExist:
-                messages.error(request, "邮箱或密码错误，请重新输入")
+        # 失败次数过多时直接拒绝，不再进行密码哈希校验
+        if is_login_throttled(request, role, email):
+            messages.error(request, "登录失败次数过多，请稍后再试")
+            return render(request, "login.html")
 
-        else:
-            messages.error(request, "无效的登录类型")
+        model, session_key, dashboard = LOGIN_ROLES[role]
+        account = model.objects.filter(Email=email).first()
+        if account and check_account_password(account, password):
+            reset_login_failures(request, role, email)
+            request.session[session_key] = account.pk
+            return redirect(dashboard)
+
+        record_login_failure(request, role, email)
+        messages.error(request, "邮箱或密码错误，请重新输入")
 
     return render(request, "login.html")
 
@@ -186,60 +282,61 @@ def logout_view(request):
 
 
 # 教师主页
+@role_required("teacher", "无权限访问教师主页")
 def teacher_dashboard(request):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问教师主页")
-        return redirect("login")
-
-    teacher = Teacher.objects.get(TeacherID=request.session["teacher_id"])
-    courses = Course.objects.filter(TeacherID=teacher)
+    courses = Course.objects.filter(TeacherID_id=request.principal.pk)
 
     context = {
-        "teacher": teacher,
+        "teacher": request.principal,
         "courses": courses,
     }
     return render(request, "teacher_dashboard.html", context)
 
 
 # 学生主页
+@role_required("student", "无权限访问学生主页")
 def student_dashboard(request):
-    student_id = request.session.get("student_id")
-    if not student_id:
-        messages.error(request, "无权限访问学生主页")
-        return redirect("login")
-
-    student = Student.objects.get(StudentID=request.session["student_id"])
-    enrolled_courses = StudentCourse.objects.filter(StudentID=student)
+    # 课程和授课教师随选课记录一次查询取出，模板中访问 CourseID.TeacherID.Name 不再额外查询
+    enrolled_courses = (
+        StudentCourse.objects.filter(StudentID_id=request.principal.pk)
+        .select_related("CourseID__TeacherID")
+        .order_by("CourseID_id")
+    )
 
     context = {
-        "student": student,
+        "student": request.principal,
         "enrolled_courses": enrolled_courses,
     }
     return render(request, "student_dashboard.html", context)
 
 
 # 管理员主页
+@role_required("admin", "无权限访问管理员主页")
 def admin_dashboard(request):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问管理员主页")
-        return redirect("login")
-
-    admin = get_object_or_404(Administrator, AdminID=admin_id)
-    teachers = Teacher.objects.all()
-    students = Student.objects.all()
-    questions = Question.objects.all().order_by("-CreatedAt")  # 新增试题列表
-
+    # 表格数据由前端通过 admin_table 按页加载，这里只提供缓存的统计数字
     context = {
-        "admin": admin,
-        "teachers": teachers,
-        "students": students,
-        "questions": questions,
+        "admin": request.principal,
+        "counts": dashboard_counts(),
+        "page_size": ADMIN_TABLE_PAGE_SIZE,
     }
     return render(request, "admin_dashboard.html", context)
 
 
+# 管理员主页表格数据（教师/学生/试题），支持 q 搜索和 page 分页
+@role_required("admin")
+def admin_table(request, table):
+    if table not in ADMIN_TABLES:
+        raise Http404("表格不存在")
+    try:
+        page = int(request.GET.get("page", 1))
+        per_page = int(request.GET.get("per_page", ADMIN_TABLE_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "分页参数无效"}, status=400)
+    return JsonResponse(
+        admin_table_page(table, request.GET.get("q", ""), page, per_page)
+    )
+
+
 # =====================
 # 管理员相关视图
 # =====================
@@ -247,12 +344,8 @@ def admin_dashboard(request):
 
 
 # 添加教师视图
+@role_required("admin")
 def add_teacher(request):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     if request.method == "POST":
         form = AddTeacherForm(request.POST)
         if form.is_valid():
@@ -260,11 +353,10 @@ def add_teacher(request):
                 with transaction.atomic():
                     teacher = form.save()
                     messages.success(request, f"成功添加教师：{teacher.Name}")
-                    OperationLog.objects.create(
-                        AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                        Operation="新增教师",
-                        Details=f"新增教师：{teacher.Name}，邮箱：{teacher.Email}，密码：{teacher.Password}",
-                        Timestamp=timezone.now(),
+                    log_operation(
+                        request.principal.pk,
+                        "新增教师",
+                        f"新增教师：{teacher.Name}，邮箱：{teacher.Email}，密码：{teacher.Password}",
                     )
                 return redirect("admin_dashboard")
             except Exception as e:
@@ -277,32 +369,29 @@ def add_teacher(request):
 
 
 # 编辑教师信息视图
+@role_required("admin")
 def edit_teacher(request, teacher_id):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
 
     if request.method == "POST":
+        # is_valid() 会把表单数据写入 instance，修改前的值需在校验之前读取
+        old_name = teacher.Name
+        old_email = teacher.Email
+        old_pw = teacher.Password
         form = EditTeacherForm(request.POST, instance=teacher)
         if form.is_valid():
             try:
                 with transaction.atomic():  # 确保修改和操作日志记录为原子操作
-                    old_name = teacher.Name
-                    old_email = teacher.Email
-                    old_pw = teacher.Password
                     form.save()  # 保存修改
-                    # form.cleaned_data是一个字典，包含了表单中所有字段的值
-                    new_name = form.cleaned_data.get("Name")
-                    new_email = form.cleaned_data.get("Email")
-                    new_pw = form.cleaned_data.get("Password")
-                    OperationLog.objects.create(
-                        AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                        Operation="编辑教师信息",
-                        Details=f'编辑教师ID {teacher.TeacherID}：从姓名 "{old_name}" 、邮箱 "{old_email}"、密码 "{old_pw}" 修改为姓名 "{new_name}" 、邮箱 "{new_email}、密码 "{new_pw}"',
-                        Timestamp=timezone.now(),
+                    log_operation(
+                        request.principal.pk,
+                        "编辑教师信息",
+                        f"编辑教师ID {teacher.TeacherID}",
+                        changes={
+                            "姓名": (old_name, teacher.Name),
+                            "邮箱": (old_email, teacher.Email),
+                            "密码": (old_pw, teacher.Password),
+                        },
                     )
                     messages.success(request, f"成功修改教师信息：{teacher.Name}")
                 return redirect("admin_dashboard")
@@ -315,24 +404,15 @@ def edit_teacher(request, teacher_id):
 
 
 # 删除教师视图
+@role_required("admin")
 def delete_teachers(request):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     if request.method == "POST":
         teacher_ids = request.POST.getlist("teacher_ids")
         try:
             with transaction.atomic():
                 cnt = Teacher.objects.filter(TeacherID__in=teacher_ids).delete()[0]
                 count = len(teacher_ids) if len(teacher_ids) <= cnt else cnt
-                OperationLog.objects.create(
-                    AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                    Operation="删除教师",
-                    Details=f"删除 {count} 名教师",
-                    Timestamp=timezone.now(),
-                )
+                log_operation(request.principal.pk, "删除教师", f"删除 {count} 名教师")
                 messages.success(request, f"成功删除 {count} 名教师")
             return redirect("admin_dashboard")
         except Exception as e:
@@ -342,12 +422,8 @@ def delete_teachers(request):
 
 
 # 添加学生视图
+@role_required("admin")
 def add_student(request):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     if request.method == "POST":
         form = AddStudentForm(request.POST)
         if form.is_valid():
@@ -355,11 +431,10 @@ def add_student(request):
                 with transaction.atomic():
                     student = form.save()
                     # 该学生是否已存在
-                    OperationLog.objects.create(
-                        AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                        Operation="新增学生",
-                        Details=f"新增学生：{student.Name}，邮箱：{student.Email}，密码：{student.Password}",
-                        Timestamp=timezone.now(),
+                    log_operation(
+                        request.principal.pk,
+                        "新增学生",
+                        f"新增学生：{student.Name}，邮箱：{student.Email}，密码：{student.Password}",
                     )
                     messages.success(request, f"成功添加学生：{student.Name}")
                 return redirect("admin_dashboard")
@@ -372,31 +447,28 @@ def add_student(request):
 
 
 # 编辑学生信息视图
+@role_required("admin")
 def edit_student(request, student_id):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     student = get_object_or_404(Student, StudentID=student_id)
 
     if request.method == "POST":
+        old_name = student.Name
+        old_email = student.Email
+        old_pw = student.Password
         form = EditStudentForm(request.POST, instance=student)
         if form.is_valid():
             try:
                 with transaction.atomic():
-                    old_name = student.Name
-                    old_email = student.Email
-                    old_pw = student.Password
                     form.save()
-                    new_name = form.cleaned_data.get("Name")
-                    new_email = form.cleaned_data.get("Email")
-                    new_pw = form.cleaned_data.get("Password")
-                    OperationLog.objects.create(
-                        AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                        Operation="编辑学生信息",
-                        Details=f'编辑学生ID {student.StudentID}：从姓名 "{old_name}" 、邮箱 "{old_email}"、密码 "{old_pw}" 修改为姓名 "{new_name}" 、邮箱 "{new_email}、密码 "{new_pw}"',
-                        Timestamp=timezone.now(),
+                    log_operation(
+                        request.principal.pk,
+                        "编辑学生信息",
+                        f"编辑学生ID {student.StudentID}",
+                        changes={
+                            "姓名": (old_name, student.Name),
+                            "邮箱": (old_email, student.Email),
+                            "密码": (old_pw, student.Password),
+                        },
                     )
                     messages.success(request, f"成功修改学生信息：{student.Name}")
                 return redirect("admin_dashboard")
@@ -409,12 +481,8 @@ def edit_student(request, student_id):
 
 
 # 删除学生视图
+@role_required("admin")
 def delete_students(request):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     if request.method == "POST":
         student_ids = request.POST.getlist("student_ids")
         try:
@@ -423,12 +491,7 @@ def delete_students(request):
                     0
                 ]  # 返回删除的数量
                 count = len(student_ids) if len(student_ids) <= cnt else cnt
-                OperationLog.objects.create(
-                    AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                    Operation="删除学生",
-                    Details=f"删除 {count} 名学生",
-                    Timestamp=timezone.now(),
-                )
+                log_operation(request.principal.pk, "删除学生", f"删除 {count} 名学生")
                 messages.success(request, f"成功删除 {count} 名学生")
             return redirect("admin_dashboard")
         except Exception as e:
@@ -438,38 +501,37 @@ def delete_students(request):
 
 
 # API KEY 管理视图
+@role_required("admin", "无权限访问 API KEY 管理模块")
 def api_key_management(request):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问 API KEY 管理模块")
-        return redirect("login")
-
-    api_keys = APIKey.objects.all()
+    api_keys = list(APIKey.objects.select_related("TeacherID"))
+    # 最近一段时间的调用统计（进程内存中，见 users/services/provider_telemetry.py）
+    key_health = PROVIDER_TELEMETRY.key_health()
+    for key in api_keys:
+        key.health = key_health.get(key.KeyID)
 
     context = {
         "api_keys": api_keys,
+        "version_health": PROVIDER_TELEMETRY.version_health(),
+        "endpoint_health": sorted(
+            PROVIDER_TELEMETRY.endpoint_health().values(), key=lambda row: row["endpoint"]
+        ),
     }
     return render(request, "api_key_management.html", context)
 
 
 # 添加 API KEY 视图
+@role_required("admin")
 def add_api_key(request):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     if request.method == "POST":
         form = AddAPIKeyForm(request.POST)
         if form.is_valid():
             try:
                 with transaction.atomic():
                     api_key = form.save()
-                    OperationLog.objects.create(
-                        AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                        Operation="新增 API Key 分配",
-                        Details=f'为教师 "{api_key.TeacherID.Name}" 新增 API Key：模型 "{api_key.Model}"，版本 "{api_key.Version}"，KeyValue "{api_key.KeyValue}"，状态 {"启用" if api_key.Status else "禁用"}',
-                        Timestamp=timezone.now(),
+                    log_operation(
+                        request.principal.pk,
+                        "新增 API Key 分配",
+                        f'为教师 "{api_key.TeacherID.Name}" 新增 API Key：模型 "{api_key.Model}"，版本 "{api_key.Version}"，KeyValue "{api_key.KeyValue}"，接口地址 "{api_key.Endpoint or "默认"}"，状态 {"启用" if api_key.Status else "禁用"}',
                     )
                     messages.success(
                         request,
@@ -485,33 +547,32 @@ def add_api_key(request):
 
 
 # 编辑 API KEY 视图
+@role_required("admin")
 def edit_api_key(request, key_id):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    api_key = get_object_or_404(APIKey, KeyID=key_id)
+    api_key = get_object_or_404(APIKey.objects.select_related("TeacherID"), KeyID=key_id)
 
     if request.method == "POST":
+        old_teacher = api_key.TeacherID.Name
+        old_model = api_key.Model
+        old_version = api_key.Version
+        old_key_value = api_key.KeyValue
+        old_endpoint = api_key.Endpoint
         form = EditAPIKeyForm(request.POST, instance=api_key)
         if form.is_valid():
             try:
                 with transaction.atomic():  # 确保API Key更新和操作日志记录为原子操作
-                    old_teacher = api_key.TeacherID.Name
-                    old_model = api_key.Model
-                    old_version = api_key.Version
-                    old_key_value = api_key.KeyValue
                     form.save()
-                    new_teacher = form.cleaned_data.get("TeacherID").Name
-                    new_model = form.cleaned_data.get("Model")
-                    new_version = form.cleaned_data.get("Version")
-                    new_key_value = form.cleaned_data.get("KeyValue")
-                    OperationLog.objects.create(
-                        AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                        Operation="编辑 API Key 信息",
-                        Details=f'将 API Key ID {api_key.KeyID} 从教师 "{old_teacher}" 修改为教师 "{new_teacher}"，模型 "{old_model}" -> "{new_model}"，版本 "{old_version}" -> "{new_version}"，KeyValue "{old_key_value}" -> "{new_key_value}"',
-                        Timestamp=timezone.now(),
+                    log_operation(
+                        request.principal.pk,
+                        "编辑 API Key 信息",
+                        f"编辑 API Key ID {api_key.KeyID}",
+                        changes={
+                            "教师": (old_teacher, api_key.TeacherID.Name),
+                            "模型": (old_model, api_key.Model),
+                            "版本": (old_version, api_key.Version),
+                            "KeyValue": (old_key_value, api_key.KeyValue),
+                            "接口地址": (old_endpoint, api_key.Endpoint),
+                        },
                     )
                     messages.success(
                         request,
@@ -528,23 +589,18 @@ def edit_api_key(request, key_id):
 
 
 # 切换 API KEY 状态视图
+@role_required("admin")
 def toggle_api_key_status(request, key_id):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     api_key = get_object_or_404(APIKey, KeyID=key_id)
     api_key.Status = not api_key.Status
     try:
         with transaction.atomic():
             api_key.save()
             status = "启用" if api_key.Status else "禁用"
-            OperationLog.objects.create(
-                AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                Operation="切换 API Key 状态",
-                Details=f'将 API Key ID {api_key.KeyID} 的状态切换为 {"启用" if api_key.Status else "禁用"}，教师 "{api_key.TeacherID.Name}"，KeyValue "{api_key.KeyValue}"',
-                Timestamp=timezone.now(),
+            log_operation(
+                request.principal.pk,
+                "切换 API Key 状态",
+                f'将 API Key ID {api_key.KeyID} 的状态切换为 {status}，教师 "{api_key.TeacherID.Name}"，KeyValue "{api_key.KeyValue}"',
             )
             messages.success(
                 request,
@@ -556,24 +612,20 @@ def toggle_api_key_status(request, key_id):
 
 
 # 删除 API KEY 视图
+@role_required("admin")
 def delete_api_keys(request):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     if request.method == "POST":
         key_ids = request.POST.getlist("key_ids")
         api_keys = APIKey.objects.filter(KeyID__in=key_ids)
-        cnt = api_keys.count()
         try:
             with transaction.atomic():
-                for api_key in api_keys:
-                    OperationLog.objects.create(
-                        AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                        Operation="删除 API Key 分配",
-                        Details=f'删除 API Key ID {api_key.KeyID}，教师 "{api_key.TeacherID.Name}"，模型 "{api_key.Model}"，版本 "{api_key.Version}"，KeyValue "{api_key.KeyValue}"',
-                        Timestamp=timezone.now(),
+                deleted = list(api_keys.select_related("TeacherID"))
+                cnt = len(deleted)
+                for api_key in deleted:  # 每个 Key 一条日志，提交后批量写入
+                    log_operation(
+                        request.principal.pk,
+                        "删除 API Key 分配",
+                        f'删除 API Key ID {api_key.KeyID}，教师 "{api_key.TeacherID.Name}"，模型 "{api_key.Model}"，版本 "{api_key.Version}"，KeyValue "{api_key.KeyValue}"',
                     )
                 api_keys.delete()
                 count = len(key_ids) if len(key_ids) <= cnt else cnt
@@ -586,50 +638,87 @@ def delete_api_keys(request):
 
 
 # 查看操作日志视图
+@role_required("admin", "无权限访问操作日志")
 def view_operation_logs(request):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问操作日志")
-        return redirect("login")
-
-    admin = get_object_or_404(Administrator, AdminID=admin_id)
-    logs = OperationLog.objects.all().order_by("-Timestamp")
-
-    # 添加分页，每页50条
-    paginator = Paginator(logs, 20)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    AUDIT_LOGGER.flush()  # 先写入本进程缓冲区中尚未写入的日志
+
+    # 键集分页：after/before 为上一页最后一条/第一条的游标，可按管理员和操作类型筛选
+    admin_id = request.GET.get("admin", "")
+    operation = request.GET.get("operation", "")
+    page = page_operation_logs(
+        admin_id=int(admin_id) if admin_id.isdigit() else None,
+        operation=operation or None,
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
 
+    filters = {"admin": admin_id, "operation": operation}
     context = {
-        "logs": page_obj,
+        "logs": page["logs"],
+        "next_query": urlencode({**filters, "after": page["next_cursor"]})
+        if page["next_cursor"]
+        else None,
+        "prev_query": urlencode({**filters, "before": page["prev_cursor"]})
+        if page["prev_cursor"]
+        else None,
+        "admins": Administrator.objects.order_by("AdminID").values_list(
+            "AdminID", "Name"
+        ),
+        "operations": operation_types(),
+        "selected_admin": admin_id,
+        "selected_operation": operation,
     }
     return render(request, "view_operation_logs.html", context)
 
 
+# 按视图统计的请求指标（Prometheus 文本格式）
+# 登录的管理员可直接访问；Prometheus 抓取时使用 METRICS["TOKEN"] 作为 Bearer 令牌
+def metrics_view(request):
+    config = metrics_settings()
+    token = config["TOKEN"]
+    authorized = bool(token) and constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    )
+    if not authorized and not request.principal.is_admin:
+        return HttpResponseForbidden("无权限访问")
+    return HttpResponse(
+        METRICS.render_prometheus(config) + PROVIDER_TELEMETRY.render_prometheus(),
+        content_type=PROMETHEUS_CONTENT_TYPE,
+    )
+
+
+# 检索评分反馈文本
+@role_required("admin", "无权限访问")
+def search_feedback_view(request):
+    query = request.GET.get("q", "").strip()
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 1
+    result = search_feedback(query, page) if query else None
+    context = {"query": query, "result": result}
+    return render(request, "search_feedback.html", context)
+
+
 # 编辑试题prompt视图
+@role_required("admin")
 def edit_question_prompt(request, question_id):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     question = get_object_or_404(Question, QuestionID=question_id)
 
     if request.method == "POST":
+        old_prompt = question.Prompt
         form = EditPromptForm(request.POST, instance=question)
         if form.is_valid():
             try:
                 with transaction.atomic():
-                    old_prompt = question.Prompt
                     form.save()
-                    new_prompt = form.cleaned_data.get("Prompt")
 
-                    # 记录操作日志
-                    OperationLog.objects.create(
-                        AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                        Operation="编辑试题 Prompt",
-                        Details=f'编辑试题 ID {question.QuestionID} "{question.Title}" 的 Prompt，从 "{old_prompt}" 修改为 "{new_prompt}"',
-                        Timestamp=timezone.now(),
+                    # 记录操作日志，Prompt 较长时只记录差异
+                    log_operation(
+                        request.principal.pk,
+                        "编辑试题 Prompt",
+                        f'编辑试题 ID {question.QuestionID} "{question.Title}" 的 Prompt',
+                        changes={"Prompt": (old_prompt, question.Prompt)},
                     )
 
                     messages.success(request, f"成功编辑 prompt：{question.Title}")
@@ -641,20 +730,67 @@ def edit_question_prompt(request, question_id):
     else:
         form = EditPromptForm(instance=question)
 
+    template = course_prompt_template(question.CourseID_id)
     context = {
         "form": form,
         "question": question,
+        "prompt_template": template,
+        "rendered_prompt": render_question_prompt(question, template)
+        if template
+        else None,
     }
     return render(request, "edit_prompt.html", context)
 
 
+# 编辑课程评分模板视图
+@role_required("admin")
+def edit_prompt_template(request, course_id):
+    course = get_object_or_404(Course, CourseID=course_id)
+    template = course_prompt_template(course.CourseID) or PromptTemplate(
+        CourseID=course
+    )
+
+    if request.method == "POST":
+        old_system_prompt, old_body = template.SystemPrompt, template.Body
+        form = PromptTemplateForm(request.POST, instance=template)
+        if form.is_valid():
+            template, changed = save_prompt_template(
+                course,
+                form.cleaned_data["SystemPrompt"],
+                form.cleaned_data["Body"],
+            )
+            if changed:
+                log_operation(
+                    request.principal.pk,
+                    "编辑评分模板",
+                    f'编辑课程 "{course.Name}" 的评分模板（版本 {template.Version}）',
+                    changes={
+                        "SystemPrompt": (old_system_prompt, template.SystemPrompt),
+                        "Body": (old_body, template.Body),
+                    },
+                )
+            messages.success(request, f"成功保存评分模板：{course.Name}")
+            return redirect("edit_prompt_template", course_id=course.CourseID)
+        messages.error(request, "保存失败，请检查输入内容。")
+    else:
+        form = PromptTemplateForm(instance=template)
+
+    question = course.questions.order_by("QuestionID").first()
+    context = {
+        "form": form,
+        "course": course,
+        "prompt_template": template,
+        "preview_question": question,
+        "rendered_prompt": render_question_prompt(question, template)
+        if question and template.pk
+        else None,
+    }
+    return render(request, "edit_prompt_template.html", context)
+
+
 # 添加试题视图
+@role_required("admin")
 def add_question(request):
-    admin_id = request.session.get("admin_id")
-    if not admin_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     if request.method == "POST":
         form = AddQuestionForm(request.POST)
         if form.is_valid():
@@ -662,11 +798,10 @@ def add_question(request):
                 with transaction.atomic():
                     question = form.save()
                     # 记录操作日志
-                    OperationLog.objects.create(
-                        AdminID=get_object_or_404(Administrator, AdminID=admin_id),
-                        Operation="添加试题",
-                        Details=f'添加试题 ID {question.QuestionID} "{question.Title}" 至课程 "{question.CourseID.Name}"',
-                        Timestamp=timezone.now(),
+                    log_operation(
+                        request.principal.pk,
+                        "添加试题",
+                        f'添加试题 ID {question.QuestionID} "{question.Title}" 至课程 "{question.CourseID.Name}"',
                     )
                     messages.success(request, f"成功添加试题：{question.Title}")
                 return redirect("admin_dashboard")
@@ -687,21 +822,15 @@ def add_question(request):
 
 
 # 课程创建视图
+@role_required("teacher")
 def create_course(request):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     if request.method == "POST":
         form = CourseForm(request.POST)
         if form.is_valid():
             try:
                 with transaction.atomic():
                     course = form.save(commit=False)
-                    course.TeacherID = Teacher.objects.get(
-                        TeacherID=request.session["teacher_id"]
-                    )
+                    course.TeacherID_id = request.principal.pk
                     course.save()
                     messages.success(request, f"成功添加课程：{course.Name}")
                 return redirect("teacher_dashboard")
@@ -714,19 +843,15 @@ def create_course(request):
 
 
 # 课程删除视图
+@role_required("teacher")
 def delete_courses(request):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
     if request.method == "POST":
         course_ids = request.POST.getlist("course_ids")
         try:
             with transaction.atomic():
                 cnt = Course.objects.filter(
                     CourseID__in=course_ids,
-                    TeacherID__TeacherID=request.session["teacher_id"],
+                    TeacherID_id=request.principal.pk,
                 ).delete()[0]
                 count = len(course_ids) if len(course_ids) <= cnt else cnt
                 messages.success(request, f"成功删除 {count} 门课程")
@@ -738,17 +863,17 @@ def delete_courses(request):
 
 
 # 课程详情视图
+@role_required("teacher")
 def course_detail(request, course_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=request.session["teacher_id"])
-    courseid = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
-    students = StudentCourse.objects.filter(CourseID=courseid)
-    # 获取该课程的所有试题
-    questions = Question.objects.filter(CourseID=courseid).order_by("-CreatedAt")
+    courseid = get_teacher_course(request, course_id)
+    teacher = courseid.TeacherID
+    students = StudentCourse.objects.filter(CourseID=courseid).select_related("StudentID")
+    # 获取该课程的所有试题，连同评分统计一起查询
+    questions = (
+        Question.objects.filter(CourseID=courseid)
+        .select_related("stats")
+        .order_by("-CreatedAt")
+    )
 
     context = {
         "teacher": teacher,
@@ -759,15 +884,71 @@ def course_detail(request, course_id):
     return render(request, "course_detail.html", context)
 
 
+# 导出课程成绩册（学生 × 试题的最终评分），format 为 csv 或 xlsx
+@role_required("teacher")
+def export_gradebook(request, course_id):
+    course = get_teacher_course(request, course_id)
+    export_format = request.GET.get("format", "csv")
+    if export_format not in GRADEBOOK_FORMATS:
+        messages.error(request, "不支持的导出格式。")
+        return redirect("course_detail", course_id=course_id)
+
+    filename = f"gradebook_{course.CourseID}.{export_format}"
+    try:
+        gradebook = load_gradebook(course)
+        if export_format == "csv":
+            response = StreamingHttpResponse(
+                iter_gradebook_csv(gradebook), content_type="text/csv; charset=utf-8"
+            )
+        else:
+            response = FileResponse(
+                write_gradebook_xlsx(gradebook),
+                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            )
+    except GradebookExportError as e:
+        messages.error(request, str(e))
+        return redirect("course_detail", course_id=course_id)
+
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+# 在课程内按关键词检索学生答案，可限定试题
+@role_required("teacher")
+def search_answers_view(request, course_id):
+    course = get_teacher_course(request, course_id)
+    query = request.GET.get("q", "").strip()
+    question_id = request.GET.get("question", "")
+    question_id = int(question_id) if question_id.isdigit() else None
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 1
+
+    result = (
+        search_answers(query, [course.CourseID], question_id=question_id, page=page)
+        if query
+        else None
+    )
+    filters = {"q": query, "question": question_id or ""}
+    context = {
+        "course": course,
+        "questions": Question.objects.filter(CourseID=course)
+        .order_by("-CreatedAt")
+        .values_list("QuestionID", "Title"),
+        "query": query,
+        "selected_question": question_id,
+        "result": result,
+        "filter_query": urlencode(filters),
+    }
+    return render(request, "search_answers.html", context)
+
+
 # 试题详情视图
+@role_required("teacher")
 def grade_answers(request, course_id, question_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
-    course = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
+    course = get_teacher_course(request, course_id)
+    teacher = course.TeacherID
     question = get_object_or_404(Question, QuestionID=question_id, CourseID=course)
 
     # 获取教师拥有的有效 API Key，按模型和版本排序
@@ -782,6 +963,9 @@ def grade_answers(request, course_id, question_id):
     # 通过 select_related("StudentID") 获取学生信息
     # answers是一个 QuerySet 对象，可以用于迭代
 
+    # 近似重复答案：{答案ID: (簇ID, 簇大小)}，只包含有近似答案的答案
+    clusters = answer_clusters(question.QuestionID)
+
     answer_feedbacks = []
     for answer in answers:  # 遍历所有答案
         # 检查是否有评分
@@ -808,9 +992,13 @@ def grade_answers(request, course_id, question_id):
                 "latest_feedback": latest_feedback,
                 "cur_feedback": final_feedback or latest_feedback,
                 "has_feedback": has_feedback,
+                "cluster": clusters.get(answer.AnswerID),
             }
         )
 
+    # 评分统计直接读取物化表中的一行
+    stats = QuestionStats.objects.filter(QuestionID=question).first()
+
     context = {
         "teacher": teacher,
         "course": course,
@@ -818,146 +1006,141 @@ def grade_answers(request, course_id, question_id):
         "answers": answers,
         "teacher_api_keys": teacher_api_keys,
         "answer_feedbacks": answer_feedbacks,
+        "stats": stats,
+        "histogram": histogram_rows(stats) if stats else [],
     }
     return render(request, "grade_answers.html", context)
 
 
-# 智能批量打分视图
-@require_POST
-def batch_ai_grade(request, course_id, question_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
-    course = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
+def _prepare_batch_grading(request, course_id, question_id, model_choice, answer_ids):
+    # batch_ai_grade 的同步部分：权限检查、读取 API Key 和答案、预评分和生成 Prompt
+    course = get_teacher_course(request, course_id)
+    teacher = course.TeacherID
     question = get_object_or_404(Question, QuestionID=question_id, CourseID=course)
 
-    selected_answer_ids = request.POST.getlist("answer_ids[]")
-    model_choice = request.POST.get("model_choice")
-
     if not model_choice:
-        return JsonResponse(
-            {"status": "error", "message": "请选择一个大模型进行评分。"}
-        )
+        return question, None, "请选择一个大模型进行评分。"
 
     # 获取教师选择的 API Key
     try:
         api_key = APIKey.objects.get(KeyID=model_choice, TeacherID=teacher, Status=True)
     except APIKey.DoesNotExist:
-        return JsonResponse(
-            {"status": "error", "message": "未找到指定的有效 API Key。"}
+        return question, None, "未找到指定的有效 API Key。"
+
+    prescore_config = prescore_settings()
+    question_prompt = render_question_prompt(
+        question, course_prompt_template(course.CourseID)
+    )
+    retriever = material_retriever(question)
+
+    def prescore_for(answer_content):
+        if not prescore_config["ENABLED"]:
+            return None, False
+        prescore = prescorer_for(question).prescore(answer_content, prescore_config)
+        decided = prescore.decided and (
+            prescore.decision == BLANK or prescore_config["SKIP_LLM"]
         )
+        return prescore, decided
 
-    results = {}
+    def prompt_for(answer_content, prescore):
+        # 附上从课程资料中检索到的参考片段和预评分提示
+        prompt = question_prompt
+        if retriever:
+            prompt = prompt_with_passages(prompt, retriever.passages(answer_content))
+        return grading_prompt(prompt, prescore, prescore_config)
 
-    # 使用事务处理整个批量评分逻辑
-    with transaction.atomic():
-        for answer_id in selected_answer_ids:
-            try:
-                answer = StudentAnswer.objects.get(
-                    AnswerID=answer_id, QuestionID=question
-                )
-            except StudentAnswer.DoesNotExist:
-                results[answer_id] = {"status": "error", "message": "答案不存在。"}
-                continue  # 跳过不存在的答案
-
-            # 检查是否已经有未发布的自动评分
-            # if answer.feedbacks.filter(IsFinal=False).exists():
-            #     results[answer_id] = {"status": "warning", "message": "已在评价中。"}
-            #     continue  # 跳过已在评分中的答案
-
-            # 获取答案内容
-            if answer.Content:
-                answer_content = answer.Content
-            else:
-                answer_content = ""
-
-            if not answer_content:
-                # 答案内容为空或无法读取
-                ScoringFeedback.objects.create(
-                    AnswerID=answer,
-                    Score=0,
-                    Feedback="无法读取答案内容。",
-                    CreatedAt=timezone.now(),
-                    IsFinal=False,
-                )
-                results[answer_id] = {
-                    "status": "error",
-                    "message": "无法读取答案内容。",
-                }
-                continue
+    items = prepare_batch(question, answer_ids, prompt_for, prescore_for)
+    return question, (api_key, items), None
 
-            # 调用相应的大模型进行评分
-            try:
-                if api_key.Model.lower().startswith("gpt"):
-                    judge_result = get_judge_from_gpt(
-                        answer_content,
-                        question.Prompt,
-                        api_key.KeyValue,
-                        api_key.Version,
-                    )
-                elif api_key.Model.lower().startswith("qwen"):
-                    judge_result = get_judge_from_qwen(
-                        answer_content,
-                        question.Prompt,
-                        api_key.KeyValue,
-                        api_key.Version,
-                    )
-                    print("judge_result", judge_result)
-                else:
-                    judge_result = {
-                        "score": None,
-                        "reason": "无效的大模型选择(仅支持GPT和Qwen)",
-                    }
-
-                if judge_result.get("score") is not None:
-                    # 保存评分结果和反馈
-                    ScoringFeedback.objects.create(
-                        AnswerID=answer,
-                        Score=judge_result["score"],
-                        Feedback=judge_result["reason"],
-                        CreatedAt=timezone.now(),
-                        IsFinal=False,
-                    )
-                    results[answer_id] = {"status": "success", "message": "评分完成。"}
-                else:
-                    # API 调用失败
-                    ScoringFeedback.objects.create(
-                        AnswerID=answer,
-                        Score=0,
-                        Feedback=judge_result.get("reason", "AI评分失败。"),
-                        CreatedAt=timezone.now(),
-                        IsFinal=False,
-                    )
-                    results[answer_id] = {"status": "error", "message": "AI评分失败。"}
-            except Exception as e:  # 记录异常
-                ScoringFeedback.objects.create(
-                    AnswerID=answer,
-                    Score=0,
-                    Feedback="AI评分过程中发生错误。",
-                    CreatedAt=timezone.now(),
-                    IsFinal=False,
-                )
-                results[answer_id] = {
-                    "status": "error",
-                    "message": "AI评分过程中发生错误。",
-                }
 
-    print("results", results)
-    return JsonResponse({"status": "success", "results": results})
+# 智能批量打分视图
+@require_POST
+@role_required("teacher")
+async def batch_ai_grade(request, course_id, question_id):
+    # 异步视图：评分接口的调用在事件循环中并发进行（ASGI 下不占用线程），数据库读写在线程中执行，
+    # 流程见 users/services/batch_grading.py
+    selected_answer_ids = request.POST.getlist("answer_ids[]")
+    model_choice = request.POST.get("model_choice")
+    # 每个批次分配一个批次 ID，批次内记录的日志（含各次评分接口调用）都带有该 ID；
+    # 前端可以自行生成，以便在请求返回前查询进度
+    job_id = job_id_from(request.POST.get("job_id", ""))
+    batch_start = time.perf_counter()
+
+    with log_context(job_id=job_id, question_id=question_id):
+        question, batch, error = await sync_to_async(_prepare_batch_grading)(
+            request, course_id, question_id, model_choice, selected_answer_ids
+        )
+        if error:
+            return JsonResponse({"status": "error", "message": error})
+        api_key, items = batch
+        progress = GradingProgress(
+            job_id, request.principal.pk, question.QuestionID, items
+        )
+        # WSGI 下本视图在 async_to_sync 的临时事件循环中运行，评分结束后关闭该事件循环的 HTTP 客户端
+        async with async_http_scope(long_lived=isinstance(request, ASGIRequest)):
+            await grade_batch(api_key, items, progress)
+        await sync_to_async(save_batch)(items)
+        await progress.finish()
+
+        statuses = Counter(item.result["status"] for item in items)
+        logger.info(
+            "批量评分完成",
+            extra={
+                "answers": len(selected_answer_ids),
+                "succeeded": statuses["success"],
+                "failed": statuses["error"],
+                "elapsed_ms": round((time.perf_counter() - batch_start) * 1000, 1),
+            },
+        )
+    results = {item.key: item.result for item in items}
+    return JsonResponse({"status": "success", "results": results, "job_id": job_id})
+
+
+def _job_progress(progress):
+    # 返回给前端的进度；批次尚未开始或不存在时为 pending
+    if progress is None:
+        return {"state": "pending"}
+    return {
+        key: progress[key]
+        for key in ("job_id", "state", "total", "done", "succeeded", "failed")
+    }
+
+
+# 批量评分进度（轮询）
+@role_required("teacher")
+async def grading_job_progress(request, job_id):
+    progress = await get_progress(request.principal.pk, job_id)
+    return JsonResponse({"status": "success", "job": _job_progress(progress)})
+
+
+# 批量评分进度（Server-Sent Events），在 ASGI 服务器下逐条推送，进度不变时不发送
+@role_required("teacher")
+async def grading_job_events(request, job_id):
+    teacher_id = request.principal.pk
+
+    async def events():
+        deadline = time.monotonic() + PROGRESS_EVENTS_TIMEOUT
+        last = None
+        while time.monotonic() < deadline:
+            job = _job_progress(await get_progress(teacher_id, job_id))
+            if job != last:
+                yield f"data: {json.dumps(job)}\n\n"
+                last = job
+            if job["state"] == "finished":
+                return
+            await asyncio.sleep(PROGRESS_EVENTS_INTERVAL)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # 关闭 nginx 的响应缓冲
+    return response
 
 
 # 查看和评分答案
+@role_required("teacher")
 def view_and_grade_answer(request, course_id, question_id, answer_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
-    course = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
+    course = get_teacher_course(request, course_id)
+    teacher = course.TeacherID
     question = get_object_or_404(Question, QuestionID=question_id, CourseID=course)
     answer = get_object_or_404(StudentAnswer, AnswerID=answer_id, QuestionID=question)
 
@@ -1010,7 +1193,8 @@ def view_and_grade_answer(request, course_id, question_id, answer_id):
                         )
                     # 更新答案确认时间
                     answer.ConfirmedAt = timezone.now()
-                    answer.save()
+                    # 只保存确认时间，避免覆盖信号中刚更新的分数快照
+                    answer.save(update_fields=["ConfirmedAt"])
                     messages.success(request, "成功确认并发布评价。")
                 return redirect(
                     # "grade_answers", course_id=course_id, question_id=question_id
@@ -1035,18 +1219,97 @@ def view_and_grade_answer(request, course_id, question_id, answer_id):
         "previous_id": previous_id,
         "next_id": next_id,
         "scoring_feedback": scoring_feedback,
+        "cluster_member_ids": cluster_member_ids(answer.AnswerID),
     }
     return render(request, "view_and_grade_answer.html", context)
 
 
+# 将答案的最终评分应用到同簇的近似重复答案
+@require_POST
+@role_required("teacher")
+def apply_cluster_grade(request, course_id, question_id, answer_id):
+    course = get_teacher_course(request, course_id)
+    question = get_object_or_404(Question, QuestionID=question_id, CourseID=course)
+    answer = get_object_or_404(StudentAnswer, AnswerID=answer_id, QuestionID=question)
+
+    if answer.FinalScore is None:
+        messages.error(request, "请先确认并发布本答案的评价，再应用到近似答案。")
+    else:
+        count = apply_grade_to_cluster(
+            answer, overwrite=request.POST.get("overwrite") == "1"
+        )
+        messages.success(request, f"已将评价应用到 {count} 份近似答案。")
+    return redirect(
+        "view_and_grade_answer",
+        course_id=course_id,
+        question_id=question_id,
+        answer_id=answer_id,
+    )
+
+
+# 按得分点分组评阅：每组展示代表答案，可为整组确认评分
+@role_required("teacher")
+def grade_by_group(request, course_id, question_id):
+    course = get_teacher_course(request, course_id)
+    question = get_object_or_404(Question, QuestionID=question_id, CourseID=course)
+
+    if request.method == "POST":
+        try:
+            if request.POST.get("action") == "assign":  # 拟合后新提交的答案增量归组
+                count = assign_new_answers(question)
+                messages.success(request, f"已将 {count} 份新答案归入现有分组。")
+            else:  # 重新分组
+                count = fit_question_clusters(question)
+                messages.success(request, f"已对 {count} 份答案重新分组。")
+        except ClusteringError as e:
+            messages.error(request, str(e))
+            return redirect(
+                "grade_answers", course_id=course_id, question_id=question_id
+            )
+        return redirect("grade_by_group", course_id=course_id, question_id=question_id)
+
+    # 查看页面只读：新答案由教师点击“归入新答案”或 cluster_answers --incremental 归类
+    clustering = QuestionClustering.objects.filter(QuestionID=question).first()
+    context = {
+        "course": course,
+        "question": question,
+        "clustering": clustering,
+        "pending_count": pending_answer_count(question, clustering)
+        if clustering
+        else 0,
+        "groups": question_groups(question, clustering) if clustering else [],
+        "rubric_changed": clustering is not None
+        and rubric_changed(question, clustering),
+    }
+    return render(request, "grade_by_group.html", context)
+
+
+# 为一组答案确认并发布同一评价
+@require_POST
+@role_required("teacher")
+def confirm_group_grades(request, course_id, question_id):
+    course = get_teacher_course(request, course_id)
+    question = get_object_or_404(Question, QuestionID=question_id, CourseID=course)
+
+    form = GradeAnswerForm(request.POST)
+    if not form.is_valid() or form.cleaned_data.get("Score") is None:
+        messages.error(request, "提交失败，请检查您的输入。")
+    else:
+        count = confirm_grades(
+            group_member_ids(question, request.POST.get("group_key", "")),
+            form.cleaned_data["Score"],
+            form.cleaned_data.get("Feedback"),
+            overwrite=request.POST.get("overwrite") == "1",
+        )
+        messages.success(request, f"已为 {count} 份答案确认并发布评价。")
+    return redirect("grade_by_group", course_id=course_id, question_id=question_id)
+
+
 # 导入评价视图
+@role_required("teacher")
 def import_ai_feedback(request, course_id, question_id, answer_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    # teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
+    if not request.principal.has_course(course_id):
+        raise Http404("课程不存在")
     answer = get_object_or_404(
         StudentAnswer, AnswerID=answer_id, QuestionID__CourseID=course_id
     )
@@ -1072,14 +1335,9 @@ def import_ai_feedback(request, course_id, question_id, answer_id):
 
 
 # 修改课程信息视图
+@role_required("teacher")
 def edit_course(request, course_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
-    course = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
+    course = get_teacher_course(request, course_id)
 
     if request.method == "POST":
         form = CourseForm(request.POST, instance=course)
@@ -1098,38 +1356,29 @@ def edit_course(request, course_id):
 
 
 # 往课程里添加学生视图
+@role_required("teacher")
 def add_students(request, course_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
-    course = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
+    course = get_teacher_course(request, course_id)
 
     if request.method == "POST":
         student_names = request.POST.getlist("name")
         student_emails = request.POST.getlist("email")
-        added_count = 0
+        rows = (
+            (row_number, name.strip(), email.strip())
+            for row_number, (name, email) in enumerate(
+                zip(student_names, student_emails), start=1
+            )
+            if name and email
+        )
         try:
-            with transaction.atomic():
-                for name, email in zip(student_names, student_emails):
-                    if name and email:
-                        student, created = Student.objects.get_or_create(
-                            Name=name, Email=email
-                        )
-                        if created:
-                            student.Password = make_password(
-                                "123456"
-                            )  # 默认密码，可后续通知学生更改
-                            student.save()
-                        StudentCourse.objects.get_or_create(
-                            StudentID=student, CourseID=course
-                        )
-                added_count = len(set(student_emails))
-                messages.success(
-                    request, f"成功往 {course.Name} 添加 {added_count} 名学生"
-                )
+            report = import_roster(course, rows)
+            summary = summarize_report(report)
+            added_count = (
+                summary["created"] + summary["enrolled"] + summary["already_enrolled"]
+            )
+            messages.success(request, f"成功往 {course.Name} 添加 {added_count} 名学生")
+            if summary["invalid"]:
+                messages.error(request, f"{summary['invalid']} 名学生的信息无效，未添加")
         except Exception as e:
             messages.error(request, "添加学生失败，请检查输入内容。")
         return redirect("course_detail", course_id=course.CourseID)
@@ -1137,15 +1386,85 @@ def add_students(request, course_id):
     return render(request, "add_students.html", {"course": course})
 
 
+# 从文件批量导入学生名单视图
+@role_required("teacher")
+def import_students(request, course_id):
+    course = get_teacher_course(request, course_id)
+    report = None
+    summary = None
+
+    if request.method == "POST":
+        form = RosterImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                report = import_roster(course, iter_roster_file(form.cleaned_data["File"]))
+                summary = summarize_report(report)
+                messages.success(
+                    request,
+                    f"导入完成：新建 {summary['created']} 名学生，"
+                    f"已有学生加入 {summary['enrolled']} 名，"
+                    f"无效或重复 {summary['invalid'] + summary['duplicate']} 行",
+                )
+            except RosterImportError as e:
+                messages.error(request, str(e))
+            except Exception as e:
+                messages.error(request, "导入失败，请检查文件内容。")
+    else:
+        form = RosterImportForm()
+
+    context = {
+        "course": course,
+        "form": form,
+        "report": report,
+        "summary": summary
+        and [(STATUS_LABELS[status], count) for status, count in summary.items()],
+    }
+    return render(request, "import_students.html", context)
+
+
+# 课程资料管理视图：上传/删除教材等参考资料，评分时检索相关片段附在 Prompt 中
+@role_required("teacher")
+def course_materials(request, course_id):
+    course = get_teacher_course(request, course_id)
+
+    if request.method == "POST" and request.POST.get("action") == "delete":
+        try:
+            count = delete_materials(course, request.POST.getlist("material_ids"))
+            messages.success(request, f"成功删除 {count} 份资料")
+        except MaterialIndexError as e:
+            messages.error(request, str(e))
+        return redirect("course_materials", course_id=course.CourseID)
+
+    if request.method == "POST":
+        form = MaterialUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            file = form.cleaned_data["File"]
+            title = form.cleaned_data["Title"] or file.name
+            try:
+                material = add_material(course, title, form.cleaned_data["Content"])
+                messages.success(
+                    request,
+                    f"成功上传资料：{material.Title}（{material.chunks.count()} 个片段）",
+                )
+                return redirect("course_materials", course_id=course.CourseID)
+            except MaterialIndexError as e:
+                messages.error(request, str(e))
+        else:
+            messages.error(request, "上传失败，请检查文件。")
+    else:
+        form = MaterialUploadForm()
+
+    materials = course.materials.annotate(chunk_count=Count("chunks")).order_by(
+        "-UploadedAt"
+    )
+    context = {"course": course, "form": form, "materials": materials}
+    return render(request, "course_materials.html", context)
+
+
 # 从课程里删除学生视图
+@role_required("teacher")
 def remove_students(request, course_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
-    course = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
+    course = get_teacher_course(request, course_id)
 
     if request.method == "POST":
         student_ids = request.POST.getlist("student_ids")
@@ -1164,14 +1483,9 @@ def remove_students(request, course_id):
 
 
 # 创建试题视图
+@role_required("teacher")
 def create_question(request, course_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
-    course = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
+    course = get_teacher_course(request, course_id)
 
     if request.method == "POST":
         form = QuestionForm(request.POST)
@@ -1194,14 +1508,9 @@ def create_question(request, course_id):
 
 
 # 删除试题视图
+@role_required("teacher")
 def delete_questions(request, course_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
-    course = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
+    course = get_teacher_course(request, course_id)
 
     if request.method == "POST":
         question_ids = request.POST.getlist("question_ids")
@@ -1220,14 +1529,9 @@ def delete_questions(request, course_id):
 
 
 # 编辑试题信息视图
+@role_required("teacher")
 def edit_question(request, course_id, question_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
-    course = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
+    course = get_teacher_course(request, course_id)
     question = get_object_or_404(Question, QuestionID=question_id, CourseID=course)
 
     if request.method == "POST":
@@ -1254,14 +1558,9 @@ def edit_question(request, course_id, question_id):
 
 
 # 公开/封闭试题视图
+@role_required("teacher")
 def toggle_question_visibility(request, course_id, question_id):
-    teacher_id = request.session.get("teacher_id")
-    if not teacher_id:
-        messages.error(request, "无权限访问")
-        return redirect("login")
-
-    teacher = get_object_or_404(Teacher, TeacherID=teacher_id)
-    course = get_object_or_404(Course, CourseID=course_id, TeacherID=teacher)
+    course = get_teacher_course(request, course_id)
     question = get_object_or_404(Question, QuestionID=question_id, CourseID=course)
 
     try:
@@ -1287,68 +1586,67 @@ def toggle_question_visibility(request, course_id, question_id):
 
 
 # 通过课程ID或名称搜索并加入课程
+@role_required("student", "无权限访问学生主页")
 def join_course(request):
-    student_id = request.session.get("student_id")
-    if not student_id:
-        messages.error(request, "无权限访问学生主页")
-        return redirect("login")
+    course_search = (
+        request.GET.get("course_search") or request.POST.get("course_search") or ""
+    ).strip()
+    if not course_search:
+        return render(request, "join_course.html")
 
-    # student = Student.objects.get(StudentID=student_id)
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 1
+    # 课程ID精确匹配 + 全文索引检索，按相关度排序并分页
+    result = search_courses(course_search, page)
+    context = {
+        "courses": result["courses"],
+        "course_search": course_search,
+        "page": result["page"],
+        "has_next": result["has_next"],
+    }
+    return render(request, "join_course.html", context)
 
-    if request.method == "POST":
-        course_search = request.POST.get("course_search")
-        # 搜索课程ID或名称
-        courses = Course.objects.filter(
-            Q(CourseID__icontains=course_search) | Q(Name__icontains=course_search)
-        )
-        return render(
-            request,
-            "join_course.html",
-            {"courses": courses, "course_search": course_search},
-        )
 
-    return render(request, "join_course.html")
+# 课程名称输入联想
+@role_required("student", "无权限访问学生主页")
+def course_autocomplete(request):
+    return JsonResponse({"results": autocomplete_courses(request.GET.get("q", ""))})
 
 
 # 确认加入课程
+@role_required("student", "无权限访问学生主页")
 def confirm_join_course(request, course_id):
-    student_id = request.session.get("student_id")
-    if not student_id:
-        messages.error(request, "无权限访问学生主页")
-        return redirect("login")
-
-    student = Student.objects.get(StudentID=student_id)
-    course = Course.objects.get(CourseID=course_id)
+    course = get_object_or_404(Course, CourseID=course_id)
 
     # 检查是否已加入
-    if StudentCourse.objects.filter(StudentID=student, CourseID=course).exists():
+    if request.principal.has_course(course.CourseID):
         messages.info(request, f"您已加入课程：{course.CourseID} - {course.Name}")
     else:
-        StudentCourse.objects.create(StudentID=student, CourseID=course)
+        StudentCourse.objects.get_or_create(
+            StudentID_id=request.principal.pk, CourseID=course
+        )
         messages.success(request, f"成功加入课程：{course.CourseID} - {course.Name}")
 
     return redirect("student_dashboard")
 
 
 # 退出课程视图
+@role_required("student", "无权限访问学生主页")
 def leave_course(request):
-    student_id = request.session.get("student_id")
-    if not student_id:
-        messages.error(request, "无权限访问学生主页")
-        return redirect("login")
-
-    student = Student.objects.get(StudentID=student_id)
+    student_id = request.principal.pk
 
     if request.method == "POST":
         course_ids = request.POST.getlist("course_ids")
         try:
             with transaction.atomic():
                 courses = Course.objects.filter(
-                    CourseID__in=course_ids, student_courses__StudentID=student
+                    CourseID__in=course_ids, student_courses__StudentID=student_id
                 )
                 cnt = courses.count()
                 StudentCourse.objects.filter(
-                    StudentID=student, CourseID__in=courses
+                    StudentID=student_id, CourseID__in=courses
                 ).delete()
                 count = len(course_ids) if len(course_ids) <= cnt else cnt
                 messages.success(request, f"成功退出 {count} 门课程")
@@ -1356,79 +1654,76 @@ def leave_course(request):
         except Exception as e:
             messages.error(request, "退出失败，请检查输入内容。")
     # 获取学生已加入的课程
-    enrolled_courses = StudentCourse.objects.filter(StudentID=student)
+    enrolled_courses = StudentCourse.objects.filter(StudentID=student_id)
     return render(request, "leave_course.html", {"enrolled_courses": enrolled_courses})
 
 
 # 查看公开试题视图
+@role_required("student", "无权限访问学生主页")
 def student_course_detail(request, course_id):
-    student_id = request.session.get("student_id")
-    if not student_id:
-        messages.error(request, "无权限访问学生主页")
-        return redirect("login")
-
-    student = Student.objects.get(StudentID=student_id)
-    course = Course.objects.get(CourseID=course_id)
-    # 授课老师
-    teacher = Teacher.objects.get(TeacherID=course.TeacherID.TeacherID)
+    student_id = request.principal.pk
 
     # 检查学生是否已加入该课程
-    if not StudentCourse.objects.filter(StudentID=student, CourseID=course).exists():
+    if not request.principal.has_course(course_id):
         messages.error(request, "您未加入该课程")
         return redirect("student_dashboard")
 
+    course = get_object_or_404(Course.objects.select_related("TeacherID"), CourseID=course_id)
+    # 授课老师
+    teacher = course.TeacherID
+
     # 获取公开的试题
     questions = Question.objects.filter(CourseID=course, IsOpen=True).order_by(
         "-CreatedAt"
     )
 
-    # 获取学生的历史记录，并预加载最终评分反馈
-    student_answers = StudentAnswer.objects.filter(
-        StudentID=student, QuestionID__CourseID=course
-    ).prefetch_related(
-        Prefetch(
-            "feedbacks",
-            queryset=ScoringFeedback.objects.filter(IsFinal=True),
-            to_attr="final_feedbacks",
-        )
+    # 获取学生的历史记录（连同试题标题一起查询），最终评分直接读取答案上的 FinalScore 快照
+    student_answers = list(
+        StudentAnswer.objects.filter(StudentID=student_id, QuestionID__CourseID=course)
+        .select_related("QuestionID")
+        .order_by("-SubmittedAt")
     )
 
-    # 用于显示试题提交状态
-    answered_question_ids = student_answers.values_list(
-        "QuestionID__QuestionID", flat=True
-    )  # .values_list() 返回一个元组列表，表示每个对象的指定字段的值
+    # 一次遍历得出每道试题的状态：未提交 / 已提交（待评分）/ 已评分
+    answers_by_question = {answer.QuestionID_id: answer for answer in student_answers}
+    question_rows = []
+    for question in questions:
+        answer = answers_by_question.get(question.QuestionID)
+        if answer is None:
+            status = "unanswered"
+        elif answer.FinalScore is None:
+            status = "submitted"
+        else:
+            status = "graded"
+        question_rows.append({"question": question, "answer": answer, "status": status})
 
     context = {
         "course": course,
-        "questions": questions,
+        "question_rows": question_rows,
         "student_answers": student_answers,
-        "answered_question_ids": answered_question_ids,
         "teacher": teacher,
     }
     return render(request, "student_course_detail.html", context)
 
 
 # 查看试题视图+提交答案
+@role_required("student", "无权限访问学生主页")
 def view_question(request, course_id, question_id):
-    student_id = request.session.get("student_id")
-    if not student_id:
-        messages.error(request, "无权限访问学生主页")
-        return redirect("login")
-
-    student = Student.objects.get(StudentID=student_id)
-    course = Course.objects.get(CourseID=course_id)
+    student_id = request.principal.pk
 
     # 检查学生是否已加入该课程
-    if not StudentCourse.objects.filter(StudentID=student, CourseID=course).exists():
+    if not request.principal.has_course(course_id):
         messages.error(request, "您未加入该课程")
         return redirect("student_dashboard")
 
+    course = get_object_or_404(Course, CourseID=course_id)
+
     question = get_object_or_404(
         Question, QuestionID=question_id, CourseID=course, IsOpen=True
     )  # 检查试题是否公开
     student_answer = (
         StudentAnswer.objects.filter(
-            QuestionID=question.QuestionID, StudentID=student.StudentID
+            QuestionID=question.QuestionID, StudentID=student_id
         )
         .order_by("-SubmittedAt")  # 按提交时间降序排列
         .first()
@@ -1436,7 +1731,7 @@ def view_question(request, course_id, question_id):
 
     # 检查此前是否已提交答案
     existing_answer = (
-        StudentAnswer.objects.filter(StudentID=student, QuestionID=question)
+        StudentAnswer.objects.filter(StudentID=student_id, QuestionID=question)
         .order_by("-SubmittedAt")  # 按提交时间降序排列
         .first()
     )  # 获取学生最新提交的答案
@@ -1462,7 +1757,7 @@ def view_question(request, course_id, question_id):
                     # 创建或获取学生答案，如果已有答案则更新内容和提交时间，否则创建新答案
                     student_answer, created = StudentAnswer.objects.get_or_create(
                         QuestionID=question,
-                        StudentID=student,
+                        StudentID_id=student_id,
                         defaults={
                             "Content": content,
                             "SubmittedAt": timezone.now(),
@@ -1476,12 +1771,15 @@ def view_question(request, course_id, question_id):
                         ScoringFeedback.objects.filter(
                             AnswerID=student_answer
                         ).delete()  # 删除之前的所有评分记录
-                        student_answer.save()
+                        student_answer.save(
+                            update_fields=["Content", "SubmittedAt", "ConfirmedAt"]
+                        )
                         messages.success(request, "成功更新答案")
                     else:
                         messages.success(request, "成功提交答案")
                 return redirect("student_course_detail", course_id=course_id)
-            except Exception as e:
+            except Exception:
+                logger.exception("提交答案失败", extra={"question_id": question_id})
                 messages.error(request, "提交失败，请检查您的答案。")
         else:
             messages.error(request, "提交失败，请检查您的答案。")
@@ -1503,17 +1801,12 @@ def view_question(request, course_id, question_id):
 
 
 # 查看历史记录视图
+@role_required("student", "无权限访问学生主页")
 def student_history_detail(request, course_id, answer_id):
-    student_id = request.session.get("student_id")
-    if not student_id:
-        messages.error(request, "无权限访问学生主页")
-        return redirect("login")
-
-    student = get_object_or_404(Student, StudentID=student_id)
     answer = get_object_or_404(
-        StudentAnswer,
+        StudentAnswer.objects.select_related("QuestionID"),
         AnswerID=answer_id,
-        StudentID=student,
+        StudentID=request.principal.pk,
         QuestionID__CourseID=course_id,
     )
     question = answer.QuestionID